@@ -0,0 +1,100 @@
+"""
+Measure the cost of the events that are fired for each log and check of a test: how many LogEvent/CheckEvent
+can be created (and queued) per second, and how much memory each queued event takes.
+
+For reference, the same measures are done on event classes built the way they were before
+lemoncheesecake.events used __slots__ (instances with a __dict__, constructed through the chain
+of parent constructors).
+
+Usage: python benchmarks/events.py [NB_EVENTS ...]
+"""
+
+from __future__ import print_function
+
+import gc
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from lemoncheesecake.events import LogEvent, CheckEvent
+from lemoncheesecake.testtree import TreeLocation
+
+
+class LegacyEvent(object):
+    def __init__(self, event_time=None):
+        self.time = event_time or time.time()
+
+
+class LegacyRuntimeEvent(LegacyEvent):
+    def __init__(self, location, event_time=None):
+        super(LegacyRuntimeEvent, self).__init__(event_time)
+        self.location = location
+
+
+class LegacySteppedEvent(LegacyRuntimeEvent):
+    def __init__(self, location, step, event_time=None):
+        super(LegacySteppedEvent, self).__init__(location, event_time)
+        self.step = step
+
+
+class LegacyLogEvent(LegacySteppedEvent):
+    def __init__(self, location, step, level, message, event_time=None):
+        super(LegacyLogEvent, self).__init__(location, step, event_time)
+        self.log_level = level
+        self.log_message = message
+
+
+class LegacyCheckEvent(LegacySteppedEvent):
+    def __init__(self, location, step, description, outcome, details=None, event_time=None):
+        super(LegacyCheckEvent, self).__init__(location, step, event_time)
+        self.check_description = description
+        self.check_outcome = outcome
+        self.check_details = details
+
+
+def create_events(log_event_class, check_event_class, nb_events):
+    location = TreeLocation.in_test("suite.test")
+    events = []
+    for i in range(nb_events // 2):
+        events.append(log_event_class(location, "step", "info", "message"))
+        events.append(check_event_class(location, "step", "description", True, "details"))
+    return events
+
+
+def measure_rate(log_event_class, check_event_class, nb_events):
+    gc.collect()
+    start = time.time()
+    create_events(log_event_class, check_event_class, nb_events)
+    return nb_events / (time.time() - start)
+
+
+def measure_memory(log_event_class, check_event_class, nb_events):
+    # the event attributes values are shared by all events, only the events themselves are measured
+    if not tracemalloc:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        events = create_events(log_event_class, check_event_class, nb_events)
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return float(size) / len(events)
+
+
+def main(sizes):
+    print("%10s %10s %18s %22s" % ("events", "classes", "events per second", "bytes per queued event"))
+    for size in sizes:
+        for label, log_event_class, check_event_class in (
+                ("legacy", LegacyLogEvent, LegacyCheckEvent), ("slots", LogEvent, CheckEvent)):
+            rate = measure_rate(log_event_class, check_event_class, size)
+            memory = measure_memory(log_event_class, check_event_class, size)
+            print("%10d %10s %18d %22s" % (size, label, rate, "%.1f" % memory if memory else "n/a"))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100000, 1000000])
@@ -0,0 +1,100 @@
+"""
+Measure the time and the memory (peak) taken to load a JSON report and to get the statuses and durations
+of its tests (what commands such as "lcc top-tests" need), with the steps of the tests being built
+while loading the report (as the JSON loader did before lazy steps) and only on access.
+
+Usage: python benchmarks/json_loading.py [NB_TESTS ...]
+"""
+
+from __future__ import print_function
+
+import gc
+import os
+import re
+import sys
+import json
+import time
+import tempfile
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from lemoncheesecake.reporting.report import Report, SuiteResult, TestResult, Step, Log, Check
+from lemoncheesecake.reporting.backends.json_ import save_report_into_file, load_report_from_file, \
+    _unserialize_suite_data, JS_PREFIX
+
+TESTS_PER_SUITE = 50
+ENTRIES_PER_TEST = 20
+
+
+def make_report(nb_tests):
+    report = Report()
+    now = report.start_time = time.time()
+    for i in range(nb_tests):
+        if i % TESTS_PER_SUITE == 0:
+            suite = SuiteResult("suite_%d" % (i // TESTS_PER_SUITE), "Suite")
+            suite.start_time = now
+            report.add_suite(suite)
+        test = TestResult("test_%d" % i, "Test %d" % i)
+        test.start_time = now
+        step = Step("step")
+        step.start_time = now
+        for j in range(ENTRIES_PER_TEST // 2):
+            step.entries.append(Log("info", "Some log message #%d" % j, now))
+            step.entries.append(Check("Expect value #%d to be equal to 42" % j, True, "Got 42", now))
+        step.end_time = test.end_time = suite.end_time = now + 1
+        test.steps.append(step)
+        test.status = "passed"
+        suite.add_test(test)
+    report.end_time = now + 1
+    return report
+
+
+def legacy_load(filename):
+    with open(filename, "r") as fh:
+        js = json.loads(re.sub("^" + JS_PREFIX, "", fh.read()))
+    report = Report()
+    for js_suite in js["suites"]:
+        report.add_suite(_unserialize_suite_data(js_suite, lazy_steps=False))
+    return report
+
+
+def lazy_load(filename):
+    return load_report_from_file(filename)
+
+
+def measure(load, filename):
+    gc.collect()
+    if tracemalloc:
+        tracemalloc.start()
+    try:
+        start = time.time()
+        report = load(filename)
+        durations = [(test.status, test.duration) for test in report.all_tests()]
+        elapsed = time.time() - start
+        peak = tracemalloc.get_traced_memory()[1] if tracemalloc else 0
+    finally:
+        if tracemalloc:
+            tracemalloc.stop()
+    return elapsed, peak, len(durations)
+
+
+def main(sizes):
+    fd, filename = tempfile.mkstemp(suffix=".js")
+    os.close(fd)
+    print("%10s %10s %12s %10s %16s" % ("tests", "size (MB)", "loading", "time (s)", "peak memory (MB)"))
+    try:
+        for size in sizes:
+            save_report_into_file(make_report(size), filename)
+            file_size = os.path.getsize(filename) / 1024.0 / 1024
+            for label, load in ("legacy", legacy_load), ("lazy", lazy_load):
+                elapsed, peak, _ = measure(load, filename)
+                print("%10d %10.1f %12s %10.3f %16.1f" % (size, file_size, label, elapsed, peak / 1024.0 / 1024))
+    finally:
+        os.unlink(filename)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 50000])
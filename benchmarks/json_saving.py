@@ -0,0 +1,92 @@
+"""
+Measure the cost of saving a JSON report during a test run, the report being saved each time a test fails
+(the default "at_each_failed_test" strategy): the legacy way (the whole report is serialized at each save)
+is compared to the incremental way (only the tests and suites that changed since the previous save are).
+
+Usage: python benchmarks/json_saving.py [NB_TESTS ...]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import tempfile
+
+from lemoncheesecake.reporting.report import Report, SuiteResult, TestResult, Step, Log, Check
+from lemoncheesecake.reporting.backends.json_ import save_report_into_file, IncrementalJsonReportSession, \
+    JsonBackend
+
+TESTS_PER_SUITE = 50
+FAILED_TEST_EVERY = 25
+ENTRIES_PER_TEST = 10
+
+
+def make_test(name, failed, now):
+    test = TestResult(name, name)
+    test.start_time = now
+    step = Step("step")
+    step.start_time = now
+    for i in range(ENTRIES_PER_TEST // 2):
+        step.entries.append(Log("info", "Some log message #%d" % i, now))
+        step.entries.append(Check("Expect value #%d to be equal to 42" % i, not failed, "Got 42", now))
+    step.end_time = now
+    test.steps.append(step)
+    test.status = "failed" if failed else "passed"
+    test.end_time = now
+    return test
+
+
+def run(nb_tests, save):
+    report = Report()
+    report.start_time = time.time()
+    suite = None
+    nb_saves = 0
+    start = time.time()
+    for i in range(nb_tests):
+        if i % TESTS_PER_SUITE == 0:
+            if suite:
+                suite.end_time = time.time()
+            suite = SuiteResult("suite_%d" % (i // TESTS_PER_SUITE), "Suite")
+            suite.start_time = time.time()
+            report.add_suite(suite)
+        failed = i % FAILED_TEST_EVERY == 0
+        suite.add_test(make_test("test_%d" % i, failed, time.time()))
+        if failed:
+            save(report)
+            nb_saves += 1
+    suite.end_time = report.end_time = time.time()
+    save(report)
+    return time.time() - start, nb_saves + 1
+
+
+def save_legacy(report, filename):
+    save_report_into_file(report, filename)
+
+
+def make_incremental_saver():
+    sessions = {}
+
+    def save(report, filename):
+        if report not in sessions:
+            sessions[report] = IncrementalJsonReportSession(filename, report, JsonBackend(), None)
+        sessions[report]._save()
+
+    return save
+
+
+def main(sizes):
+    fd, filename = tempfile.mkstemp(suffix=".js")
+    os.close(fd)
+    print("%10s %10s %14s %12s %14s" % ("tests", "saves", "saving", "total (s)", "per save (ms)"))
+    try:
+        for size in sizes:
+            for label, save in ("legacy", save_legacy), ("incremental", make_incremental_saver()):
+                elapsed, nb_saves = run(size, lambda report: save(report, filename))
+                print("%10d %10d %14s %12.3f %14.2f" % (size, nb_saves, label, elapsed, elapsed / nb_saves * 1000))
+    finally:
+        os.unlink(filename)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [2000, 5000])
@@ -0,0 +1,78 @@
+"""
+Measure the memory taken by the entries (logs and checks) of the steps of a report, when they are stored
+as a list of Log/Check objects (the default) and as CompactStepEntries (lcc run --compact-report).
+
+The entries mimic those of a real test run: check descriptions come from a small set of distinct
+descriptions, log messages and check details are distinct strings. The strings are built before the
+measure, only the memory taken by the entries storage is measured.
+
+Usage: python benchmarks/step_entries.py [NB_ENTRIES ...]
+"""
+
+from __future__ import print_function
+
+import gc
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from lemoncheesecake.reporting.report import Step, Log, Check
+
+ENTRIES_PER_STEP = 20
+NB_CHECK_DESCRIPTIONS = 100
+
+
+def build_entries_data(nb_entries):
+    descriptions = ["Expect value #%d to be equal to 42" % i for i in range(NB_CHECK_DESCRIPTIONS)]
+    return [
+        (
+            # check descriptions are built at runtime, they are equal but distinct strings
+            "".join(descriptions[i % NB_CHECK_DESCRIPTIONS]), "Got %d" % i, "Some log message #%d" % i
+        )
+        for i in range(nb_entries // 2)
+    ]
+
+
+def fill_steps(entries_data, compact):
+    steps = []
+    now = time.time()
+    for i, (check_description, check_details, log_message) in enumerate(entries_data):
+        if i % (ENTRIES_PER_STEP // 2) == 0:
+            steps.append(Step("step", compact=compact))
+        steps[-1].entries.append(Log("info", log_message, now))
+        steps[-1].entries.append(Check(check_description, True, check_details, now))
+    return steps
+
+
+def measure(entries_data, compact):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = time.time()
+        steps = fill_steps(entries_data, compact)
+        elapsed = time.time() - start
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    nb_entries = sum(len(step.entries) for step in steps)
+    return float(size) / nb_entries, nb_entries / elapsed
+
+
+def main(sizes):
+    if not tracemalloc:
+        print("This benchmark requires tracemalloc (Python 3)")
+        return
+    print("%10s %10s %18s %20s" % ("entries", "storage", "bytes per entry", "appends per second"))
+    for size in sizes:
+        entries_data = build_entries_data(size)
+        for label, compact in ("list", False), ("compact", True):
+            memory, rate = measure(entries_data, compact)
+            print("%10d %10s %18.1f %20d" % (size, label, memory, rate))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100000, 1000000])
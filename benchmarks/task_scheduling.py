@@ -0,0 +1,105 @@
+"""
+Measure the scheduling overhead of lemoncheesecake.task.TaskScheduler on synthetic task graphs.
+
+The graphs mimic what build_tasks produces: a session setup task, then suites made of
+a beginning task, a setup task, N test tasks, a teardown task and an ending task.
+
+For reference, the scheduling approach used before TaskScheduler (rescanning all remaining tasks
+after each completion) is also measured on graphs small enough for it to complete in reasonable time.
+
+Usage: python benchmarks/task_scheduling.py [NB_TASKS ...]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+from collections import deque
+
+from lemoncheesecake.task import BaseTask, TaskScheduler
+
+TESTS_PER_SUITE = 50
+LEGACY_MAX_TASKS = 2000
+NB_THREADS = 8
+
+
+class SyntheticTask(BaseTask):
+    def __init__(self, on_success_dependencies=(), on_completion_dependencies=()):
+        BaseTask.__init__(self)
+        self._on_success_dependencies = list(on_success_dependencies)
+        self._on_completion_dependencies = list(on_completion_dependencies)
+
+    def get_on_success_dependencies(self):
+        return self._on_success_dependencies
+
+    def get_on_completion_dependencies(self):
+        return self._on_completion_dependencies
+
+
+def build_synthetic_tasks(nb_tasks):
+    session_setup = SyntheticTask()
+    tasks = [session_setup]
+    suite_endings = []
+    while len(tasks) < nb_tasks:
+        beginning = SyntheticTask([session_setup])
+        setup = SyntheticTask([beginning])
+        tests = [SyntheticTask([setup]) for _ in range(TESTS_PER_SUITE)]
+        teardown = SyntheticTask(on_completion_dependencies=tests)
+        ending = SyntheticTask(tests + [teardown])
+        tasks.extend([beginning, setup] + tests + [teardown, ending])
+        suite_endings.append(ending)
+    tasks.append(SyntheticTask(on_completion_dependencies=suite_endings))
+    return tasks
+
+
+def run_scheduling(tasks):
+    # simulate run_tasks: tasks are completed in FIFO order, scheduling new ones after each completion
+    scheduler = TaskScheduler(tasks)
+    in_progress = deque(scheduler.pop_ready_tasks(NB_THREADS))
+    nb_completed = 0
+    while in_progress:
+        task = in_progress.popleft()
+        nb_completed += 1
+        scheduler.mark_task_as_completed(task)
+        in_progress.extend(scheduler.pop_ready_tasks(NB_THREADS))
+    assert nb_completed == len(tasks)
+
+
+def run_legacy_scheduling(tasks):
+    def pop_runnable_tasks(remaining_tasks, completed_tasks):
+        runnable_tasks = [
+            task for task in remaining_tasks if set(task.get_all_dependencies()).issubset(completed_tasks)
+        ]
+        for task in runnable_tasks[:NB_THREADS]:
+            remaining_tasks.remove(task)
+            yield task
+
+    remaining_tasks = list(tasks)
+    completed_tasks = []
+    in_progress = deque(pop_runnable_tasks(remaining_tasks, completed_tasks))
+    while in_progress:
+        completed_tasks.append(in_progress.popleft())
+        in_progress.extend(pop_runnable_tasks(remaining_tasks, completed_tasks))
+    assert len(completed_tasks) == len(tasks)
+
+
+def measure(func, tasks):
+    start = time.time()
+    func(tasks)
+    return time.time() - start
+
+
+def main(sizes):
+    print("%10s %16s %16s %18s" % ("tasks", "scheduler (s)", "legacy (s)", "per task (us)"))
+    for size in sizes:
+        tasks = build_synthetic_tasks(size)
+        elapsed = measure(run_scheduling, tasks)
+        if len(tasks) <= LEGACY_MAX_TASKS:
+            legacy = "%.3f" % measure(run_legacy_scheduling, tasks)
+        else:
+            legacy = "n/a"
+        print("%10d %16.3f %16s %18.2f" % (len(tasks), elapsed, legacy, elapsed / len(tasks) * 1000000))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,119 @@
+"""
+Measure the cost of filtering the tests of a deep tree and of building the TreeLocation of each of them,
+which both rely on the path, tags and properties the tests inherit from their suites.
+
+For reference, the same measures are done on tree nodes that compute these data by walking
+their ancestors on each access (as lemoncheesecake.testtree did before caching them).
+
+Usage: python benchmarks/testtree.py [NB_TESTS ...]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+import lemoncheesecake.reporting  # must be imported before lemoncheesecake.filter (circular imports)
+from lemoncheesecake.helpers.orderedset import OrderedSet
+from lemoncheesecake.suite.core import Test, Suite
+from lemoncheesecake.testtree import TreeLocation, flatten_tests
+from lemoncheesecake.filter import RunFilter
+
+DEPTH = 6
+TESTS_PER_SUITE = 10
+SUB_SUITES_PER_SUITE = 5
+
+
+class LegacyNodeMixin(object):
+    @property
+    def path(self):
+        return ".".join(s.name for s in self.hierarchy)
+
+    @property
+    def path_tuple(self):
+        return tuple(node.name for node in self.hierarchy)
+
+    @property
+    def hierarchy_depth(self):
+        return len(list(self.hierarchy)) - 1
+
+    @property
+    def hierarchy_paths(self):
+        return (node.path for node in self.hierarchy)
+
+    @property
+    def hierarchy_tags(self):
+        tags = OrderedSet()
+        for node in self.hierarchy:
+            tags.update(node.tags)
+        return tags
+
+    @property
+    def hierarchy_properties(self):
+        properties = {}
+        for node in self.hierarchy:
+            properties.update(node.properties)
+        return properties
+
+
+class LegacyTest(LegacyNodeMixin, Test):
+    pass
+
+
+class LegacySuite(LegacyNodeMixin, Suite):
+    pass
+
+
+def build_tree(nb_tests, test_class, suite_class):
+    counter = [0]
+
+    def build_suite(name, depth):
+        suite = suite_class(None, name, name)
+        suite.tags.append("depth_%d" % depth)
+        suite.properties["level_%d" % depth] = name
+        if depth == DEPTH or counter[0] >= nb_tests:
+            for i in range(TESTS_PER_SUITE):
+                test = test_class("test_%d" % i, "Test %d" % i, None)
+                test.tags.append("tag_%d" % (i % 3))
+                suite.add_test(test)
+                counter[0] += 1
+        else:
+            for i in range(SUB_SUITES_PER_SUITE):
+                if counter[0] < nb_tests:
+                    suite.add_suite(build_suite("suite_%d" % i, depth + 1))
+        return suite
+
+    suites = []
+    while counter[0] < nb_tests:
+        suites.append(build_suite("root_%d" % len(suites), 1))
+    return suites
+
+
+def measure_filter(tests):
+    filtr = RunFilter(paths=["root_0.suite_1.*"], tags=[["tag_1"]], properties=[[("level_2", "suite_*")]])
+    start = time.time()
+    matching = sum(1 for test in tests if filtr.match_test(test))
+    return time.time() - start, matching
+
+
+def measure_locations(tests):
+    start = time.time()
+    for test in tests:
+        TreeLocation.in_test(test)
+    return time.time() - start
+
+
+def main(sizes):
+    print("%10s %8s %10s %16s %16s" % ("tests", "depth", "nodes", "filter (s)", "locations (s)"))
+    for size in sizes:
+        for label, test_class, suite_class in ("legacy", LegacyTest, LegacySuite), ("cached", Test, Suite):
+            tests = list(flatten_tests(build_tree(size, test_class, suite_class)))
+            filter_elapsed, _ = measure_filter(tests)
+            locations_elapsed = measure_locations(tests)
+            print("%10d %8d %10s %16.3f %16.3f" % (
+                len(tests), tests[0].hierarchy_depth, label, filter_elapsed, locations_elapsed
+            ))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100000])
@@ -0,0 +1,75 @@
+"""
+Measure the cost of formatting and parsing the timestamps of a report, which are formatted each time
+the report is saved and parsed each time it is loaded.
+
+The timestamps mimic those of a real report: they are increasing, several of them share the same second.
+For reference, the same measures are done with the implementations of format_timestamp/parse_timestamp
+that call strftime/strptime for each timestamp (as lemoncheesecake.reporting.report did before
+the timestamp codec), and with the report format that stores the timestamps as seconds since epoch.
+
+Usage: python benchmarks/timestamps.py [NB_TIMESTAMPS ...]
+"""
+
+from __future__ import print_function
+
+import re
+import sys
+import time
+from decimal import Decimal
+
+from lemoncheesecake.reporting.report import format_timestamp, parse_timestamp
+from lemoncheesecake.reporting.backends.json_ import _serialize_time, _unserialize_time
+
+TIMESTAMPS_PER_SECOND = 50
+
+
+def legacy_format_timestamp(ts):
+    ts = round(ts, 3)
+    result = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+    result += ".%03d" % (Decimal(repr(ts)) % 1 * 1000)
+    return result
+
+
+def legacy_parse_timestamp(s):
+    m = re.compile(r"(.+)\.(\d+)").match(s)
+    dt, milliseconds = m.group(1), int(m.group(2))
+    return time.mktime(time.strptime(dt, "%Y-%m-%d %H:%M:%S")) + float(milliseconds) / 1000
+
+
+def epoch_format_timestamp(ts):
+    return _serialize_time(ts, epoch_timestamps=True)
+
+
+def build_timestamps(nb_timestamps):
+    start = time.time()
+    return [start + float(i) / TIMESTAMPS_PER_SECOND for i in range(nb_timestamps)]
+
+
+def measure(timestamps, format_func, parse_func):
+    start = time.time()
+    formatted = [format_func(ts) for ts in timestamps]
+    format_elapsed = time.time() - start
+
+    start = time.time()
+    for value in formatted:
+        parse_func(value)
+    parse_elapsed = time.time() - start
+
+    return format_elapsed, parse_elapsed
+
+
+def main(sizes):
+    print("%12s %10s %12s %12s" % ("timestamps", "codec", "format (s)", "parse (s)"))
+    for size in sizes:
+        timestamps = build_timestamps(size)
+        for label, format_func, parse_func in (
+            ("legacy", legacy_format_timestamp, legacy_parse_timestamp),
+            ("cached", format_timestamp, parse_timestamp),
+            ("epoch", epoch_format_timestamp, _unserialize_time)
+        ):
+            format_elapsed, parse_elapsed = measure(timestamps, format_func, parse_func)
+            print("%12d %10s %12.3f %12.3f" % (size, label, format_elapsed, parse_elapsed))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100000, 1000000])
@@ -0,0 +1,129 @@
+"""
+Measure the time and the memory (peak RSS) taken to save and to load an XML report, with the XML tree
+of the whole report being built (as the XML backend did before streaming) and with the XML elements being
+written/parsed incrementally.
+
+Each measure is made in its own process, the memory being mostly allocated by libxml2 (which tracemalloc
+does not see). The peak RSS is given relatively to the RSS of the process before saving/loading the report.
+
+Usage: python benchmarks/xml_report.py [NB_ENTRIES ...]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import resource
+import tempfile
+import subprocess
+
+from lxml import etree
+
+from lemoncheesecake.reporting.report import Report, SuiteResult, TestResult, Step, Log, Check
+from lemoncheesecake.reporting.backends.xml import save_report_into_file, load_report_from_file, \
+    serialize_report_as_tree, indent_xml, _unserialize_suite_attributes, _unserialize_metadata, \
+    _unserialize_test_data, _unserialize_hook_data
+
+TESTS_PER_SUITE = 50
+ENTRIES_PER_TEST = 20
+
+
+def make_report(nb_entries):
+    report = Report()
+    now = report.start_time = time.time()
+    for i in range(nb_entries // ENTRIES_PER_TEST):
+        if i % TESTS_PER_SUITE == 0:
+            suite = SuiteResult("suite_%d" % (i // TESTS_PER_SUITE), "Suite")
+            suite.start_time = now
+            report.add_suite(suite)
+        test = TestResult("test_%d" % i, "Test %d" % i)
+        test.start_time = now
+        step = Step("step")
+        step.start_time = now
+        for j in range(ENTRIES_PER_TEST // 2):
+            step.entries.append(Log("info", "Some log message #%d" % j, now))
+            step.entries.append(Check("Expect value #%d to be equal to 42" % j, True, "Got 42", now))
+        step.end_time = test.end_time = suite.end_time = now + 1
+        test.steps.append(step)
+        test.status = "passed"
+        suite.add_test(test)
+    report.end_time = now + 1
+    return report
+
+
+def tree_save(report, filename):
+    xml = serialize_report_as_tree(report)
+    indent_xml(xml)
+    with open(filename, "wb") as fh:
+        fh.write(etree.tostring(xml, pretty_print=True, encoding="utf-8"))
+
+
+def _tree_load_suite(xml):
+    suite = _unserialize_suite_attributes(xml)
+    for node in xml:
+        if node.tag == "test":
+            suite.add_test(_unserialize_test_data(node))
+        elif node.tag == "suite":
+            suite.add_suite(_tree_load_suite(node))
+        elif node.tag in ("suite-setup", "suite-teardown"):
+            setattr(suite, node.tag.replace("-", "_"), _unserialize_hook_data(node))
+        else:
+            _unserialize_metadata(suite, node)
+    return suite
+
+
+def tree_load(filename):
+    report = Report()
+    for xml_suite in etree.parse(filename).getroot().xpath("suite"):
+        report.add_suite(_tree_load_suite(xml_suite))
+    return report
+
+
+def get_max_rss():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def measure(operation, mode, nb_entries, filename):
+    if operation == "save":
+        report = make_report(nb_entries)
+        save = tree_save if mode == "tree" else save_report_into_file
+        rss = get_max_rss()
+        start = time.time()
+        save(report, filename)
+    else:
+        load = tree_load if mode == "tree" else load_report_from_file
+        rss = get_max_rss()
+        start = time.time()
+        load(filename)
+    print("%f %f" % (time.time() - start, get_max_rss() - rss))
+
+
+def run_measure(operation, mode, nb_entries, filename):
+    output = subprocess.check_output(
+        [sys.executable, __file__, "--measure", operation, mode, str(nb_entries), filename]
+    )
+    elapsed, rss = output.split()
+    return float(elapsed), float(rss)
+
+
+def main(sizes):
+    fd, filename = tempfile.mkstemp(suffix=".xml")
+    os.close(fd)
+    print("%10s %10s %10s %10s %14s" % ("entries", "operation", "mode", "time (s)", "peak RSS (MB)"))
+    try:
+        for size in sizes:
+            for operation in "save", "load":
+                for mode in "tree", "streaming":
+                    elapsed, rss = run_measure(operation, mode, size, filename)
+                    print("%10d %10s %10s %10.3f %14.1f" % (size, operation, mode, elapsed, rss))
+    finally:
+        os.unlink(filename)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--measure"]:
+        measure(sys.argv[2], sys.argv[3], int(sys.argv[4]), sys.argv[5])
+    else:
+        main([int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000])
@@ -5,7 +5,8 @@ import lemoncheesecake.api as lcc
 """
 
 from lemoncheesecake.suite import Test, add_test_into_suite, add_test_in_suite, add_tests_in_suite, \
-    get_metadata, suite, test, tags, prop, link, disabled, conditional, hidden, depends_on, inject_fixture
+    get_metadata, suite, test, tags, prop, link, disabled, conditional, hidden, depends_on, uses_resource, \
+    inject_fixture
 from lemoncheesecake.runtime import *
 from lemoncheesecake.matching import *
 from lemoncheesecake.fixtures import fixture
@@ -5,15 +5,19 @@ from .fixtures import FixturesCommand
 from .stats import StatsCommand
 from .report import ReportCommand
 from .diff import DiffCommand
+from .merge import MergeReportsCommand
+from .rebuild import RebuildReportCommand
+from .trace import TraceCommand
+from .worker import WorkerCommand
 from .version import VersionCommand
 from .top import TopTests, TopSuites, TopSteps
 
 
 def get_commands():
     return [
-        RunCommand(), BootstrapCommand(),
+        RunCommand(), WorkerCommand(), BootstrapCommand(),
         ShowCommand(), FixturesCommand(), StatsCommand(),
-        ReportCommand(), DiffCommand(),
+        ReportCommand(), DiffCommand(), MergeReportsCommand(), RebuildReportCommand(), TraceCommand(),
         TopTests(), TopSuites(), TopSteps(),
         VersionCommand()
     ]
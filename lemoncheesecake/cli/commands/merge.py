@@ -0,0 +1,80 @@
+import os
+import os.path as osp
+import shutil
+
+from lemoncheesecake.cli.command import Command
+from lemoncheesecake.cli.utils import auto_detect_reporting_backends
+from lemoncheesecake.consts import ATTACHEMENT_DIR
+from lemoncheesecake.reporting import load_report, filter_reporting_backends_by_capabilities, save_report, \
+    CAPABILITY_SAVE_REPORT
+from lemoncheesecake.reporting.report import Attachment
+from lemoncheesecake.sharding import merge_reports
+from lemoncheesecake.exceptions import UserError, InvalidReportFile
+
+
+def _copy_attachments(report, report_num, output_dir):
+    # attachments of the different shards have the same names, they are prefixed by the report number
+    report_dir = osp.dirname(report.path)
+    for result in report.all_results():
+        for step in result.steps:
+            for entry in step.entries:
+                if isinstance(entry, Attachment):
+                    filename = "%s/s%d_%s" % (ATTACHEMENT_DIR, report_num, osp.basename(entry.filename))
+                    src = osp.join(report_dir, entry.filename)
+                    if osp.exists(src):
+                        if not osp.exists(osp.join(output_dir, ATTACHEMENT_DIR)):
+                            os.mkdir(osp.join(output_dir, ATTACHEMENT_DIR))
+                        shutil.copy(src, osp.join(output_dir, filename))
+                    entry.filename = filename
+
+
+class MergeReportsCommand(Command):
+    def get_name(self):
+        return "merge-reports"
+
+    def get_description(self):
+        return "Merge the reports of several shards (lcc run --shard) into a single report"
+
+    def add_cli_args(self, cli_parser):
+        group = cli_parser.add_argument_group("Merge reports")
+        group.add_argument("report_paths", nargs="+", help="Report files or directories")
+        group.add_argument(
+            "--output", "-o", required=True,
+            help="Directory where the merged report (and its attachments) will be stored"
+        )
+        group.add_argument(
+            "--format", "-f", nargs="+", default=["json"],
+            help="The reporting backends used to save the merged report (default: json)"
+        )
+
+    def run_cmd(self, cli_args):
+        available_backends = {
+            backend.name: backend for backend in
+            filter_reporting_backends_by_capabilities(auto_detect_reporting_backends(), CAPABILITY_SAVE_REPORT)
+        }
+        try:
+            backends = [available_backends[name] for name in cli_args.format]
+        except KeyError as excp:
+            raise UserError("Unknown reporting backend %s" % excp)
+
+        reports = []
+        for report_path in cli_args.report_paths:
+            try:
+                reports.append(load_report(report_path, auto_detect_reporting_backends()))
+            except InvalidReportFile as excp:
+                raise UserError("Cannot load report '%s': %s" % (report_path, excp))
+
+        if not osp.exists(cli_args.output):
+            try:
+                os.mkdir(cli_args.output)
+            except OSError as excp:
+                raise UserError("Cannot create output directory: %s" % excp)
+
+        for report_num, report in enumerate(reports, start=1):
+            _copy_attachments(report, report_num, cli_args.output)
+
+        merged_report = merge_reports(reports)
+        for backend in backends:
+            save_report(osp.join(cli_args.output, backend.get_report_filename()), merged_report, backend)
+
+        return 0
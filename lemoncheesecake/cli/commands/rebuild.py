@@ -0,0 +1,52 @@
+from __future__ import print_function
+
+import os.path as osp
+
+from lemoncheesecake.cli.command import Command
+from lemoncheesecake.cli.utils import auto_detect_reporting_backends, add_report_path_cli_arg, get_report_path
+from lemoncheesecake.reporting import filter_reporting_backends_by_capabilities, save_report, CAPABILITY_SAVE_REPORT
+from lemoncheesecake.reporting.journal import load_report_from_journal, get_journal_path, JOURNAL_FILENAME
+from lemoncheesecake.exceptions import UserError, InvalidReportFile
+
+
+class RebuildReportCommand(Command):
+    def get_name(self):
+        return "rebuild-report"
+
+    def get_description(self):
+        return "Rebuild a report from its events journal (lcc run --journal)"
+
+    def add_cli_args(self, cli_parser):
+        group = cli_parser.add_argument_group("Rebuild report")
+        add_report_path_cli_arg(group)
+        group.add_argument(
+            "--format", "-f", nargs="+", default=["json"],
+            help="The reporting backends used to save the rebuilt report (default: json)"
+        )
+
+    def run_cmd(self, cli_args):
+        available_backends = {
+            backend.name: backend for backend in
+            filter_reporting_backends_by_capabilities(auto_detect_reporting_backends(), CAPABILITY_SAVE_REPORT)
+        }
+        try:
+            backends = [available_backends[name] for name in cli_args.format]
+        except KeyError as excp:
+            raise UserError("Unknown reporting backend %s" % excp)
+
+        report_dir = get_report_path(cli_args)
+        journal_path = get_journal_path(report_dir)
+        if not journal_path:
+            raise UserError("Cannot find %s in %s" % (JOURNAL_FILENAME, report_dir))
+
+        try:
+            report = load_report_from_journal(journal_path)
+        except InvalidReportFile as excp:
+            raise UserError("Cannot load journal: %s" % excp)
+
+        for backend in backends:
+            report_filename = osp.join(report_dir, backend.get_report_filename())
+            save_report(report_filename, report, backend)
+            print("Report has been written into %s" % report_filename)
+
+        return 0
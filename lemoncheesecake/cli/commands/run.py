@@ -4,18 +4,27 @@ Created on Dec 31, 2016
 @author: nicolas
 '''
 
+from __future__ import print_function
+
 import os
+import socket
 
 from lemoncheesecake.cli.command import Command
 from lemoncheesecake.cli.utils import get_suites_from_project
 from lemoncheesecake.exceptions import LemonCheesecakeException, ProgrammingError, UserError, \
-    serialize_current_exception
+    InvalidReportFile, serialize_current_exception
 from lemoncheesecake.filter import add_run_filter_cli_args
 from lemoncheesecake.fixtures import FixtureRegistry, BuiltinFixture
 from lemoncheesecake.project import find_project_file, load_project_from_file, load_project
-from lemoncheesecake.reporting import filter_reporting_backends_by_capabilities, CAPABILITY_REPORTING_SESSION
+from lemoncheesecake.reporting import filter_reporting_backends_by_capabilities, load_report, \
+    CAPABILITY_REPORTING_SESSION
+from lemoncheesecake.reporting.reportdir import get_last_report_dir
 from lemoncheesecake.reporting.savingstrategy import make_report_saving_strategy
 from lemoncheesecake.runner import initialize_event_manager, run_suites
+from lemoncheesecake.processes import is_multiprocessing_available
+from lemoncheesecake.distributed import Coordinator, parse_address
+from lemoncheesecake.sharding import parse_shard, get_shard_suites
+from lemoncheesecake.coroutines import set_max_concurrency, DEFAULT_MAX_CONCURRENCY
 
 
 def build_fixture_registry(project, cli_args):
@@ -42,6 +51,79 @@ def get_nb_threads(cli_args):
         return 1
 
 
+def get_nb_processes(cli_args):
+    if cli_args.processes is not None:
+        return max(cli_args.processes, 1)
+    elif "LCC_PROCESSES" in os.environ:
+        try:
+            return max(int(os.environ["LCC_PROCESSES"]), 1)
+        except ValueError:
+            raise LemonCheesecakeException(
+                "Invalid value '%s' for $LCC_PROCESSES environment variable (expect integer)" % os.environ["LCC_PROCESSES"]
+            )
+    else:
+        return 1
+
+
+def get_async_concurrency(cli_args):
+    if cli_args.async_concurrency is not None:
+        return max(cli_args.async_concurrency, 1)
+    elif "LCC_ASYNC_CONCURRENCY" in os.environ:
+        try:
+            return max(int(os.environ["LCC_ASYNC_CONCURRENCY"]), 1)
+        except ValueError:
+            raise LemonCheesecakeException(
+                "Invalid value '%s' for $LCC_ASYNC_CONCURRENCY environment variable (expect integer)" % \
+                os.environ["LCC_ASYNC_CONCURRENCY"]
+            )
+    else:
+        return DEFAULT_MAX_CONCURRENCY
+
+
+def get_max_open_suites(cli_args):
+    if cli_args.max_open_suites is None:
+        return None
+    if cli_args.max_open_suites < 1:
+        raise LemonCheesecakeException(
+            "Invalid value '%d' for --max-open-suites (expect integer >= 1)" % cli_args.max_open_suites
+        )
+    return cli_args.max_open_suites
+
+
+def get_coordinator_address(cli_args):
+    if cli_args.coordinator is None:
+        if cli_args.workers is not None:
+            raise LemonCheesecakeException("--workers requires --coordinator")
+        return None
+
+    try:
+        address = parse_address(cli_args.coordinator, default_host="127.0.0.1")
+    except ValueError:
+        raise LemonCheesecakeException(
+            "Invalid value '%s' for --coordinator (expect [HOST:]PORT)" % cli_args.coordinator
+        )
+    if cli_args.workers is None or cli_args.workers < 1:
+        raise LemonCheesecakeException("--coordinator requires --workers N (with N >= 1)")
+    if cli_args.processes is not None and cli_args.processes > 1:
+        raise LemonCheesecakeException("--coordinator cannot be used along with --processes")
+    return address
+
+
+def get_distributed_secret():
+    secret = os.environ.get("LCC_DISTRIBUTED_SECRET")
+    return secret.encode("utf-8") if secret else None
+
+
+def get_shard(cli_args):
+    if cli_args.shard is None:
+        return None
+
+    try:
+        return parse_shard(cli_args.shard)
+    except ValueError:
+        raise LemonCheesecakeException("Invalid value '%s' for --shard (expect K/N with 1 <= K <= N)" % cli_args.shard)
+
+
 def get_report_saving_strategy(cli_args):
     saving_strategy_expression = cli_args.save_report or os.environ.get("LCC_SAVE_REPORT") or "at_each_failed_test"
 
@@ -51,11 +133,44 @@ def get_report_saving_strategy(cli_args):
         raise LemonCheesecakeException("Invalid expression '%s' for report saving strategy" % saving_strategy_expression)
 
 
+def get_durations_report(project, cli_args):
+    if not (cli_args.longest_first or cli_args.shard):
+        return None
+
+    if cli_args.durations_from:
+        try:
+            return load_report(cli_args.durations_from)
+        except InvalidReportFile as excp:
+            raise LemonCheesecakeException("Cannot load durations report: %s" % excp)
+
+    # by default, use the report of the previous run if any
+    report_dir = get_last_report_dir(project.get_project_dir())
+    if not report_dir:
+        return None
+    try:
+        return load_report(report_dir)
+    except InvalidReportFile:
+        return None
+
+
 def run_project(project, cli_args):
     nb_threads = get_nb_threads(cli_args)
     if nb_threads > 1 and not project.is_threaded():
         raise LemonCheesecakeException("Project does not support multi-threading")
 
+    nb_processes = get_nb_processes(cli_args)
+    if nb_processes > 1 and not is_multiprocessing_available():
+        raise LemonCheesecakeException("Running tests in several processes is not supported on this platform")
+
+    coordinator_address = get_coordinator_address(cli_args)
+    nb_workers = cli_args.workers if coordinator_address else 1
+
+    shard = get_shard(cli_args)
+
+    max_open_suites = get_max_open_suites(cli_args)
+
+    set_max_concurrency(get_async_concurrency(cli_args))
+
     suites = get_suites_from_project(project, cli_args)
 
     # Build fixture registry
@@ -84,6 +199,13 @@ def run_project(project, cli_args):
     # Get report save mode
     report_saving_strategy = get_report_saving_strategy(cli_args)
 
+    # Get previous tests durations (must be done before the creation of the new report dir)
+    durations_report = get_durations_report(project, cli_args)
+
+    # Only keep the tests of the shard to be run
+    if shard:
+        suites = get_shard_suites(suites, shard[0], shard[1], durations_report)
+
     # Create report dir
     if cli_args.report_dir:
         report_dir = cli_args.report_dir
@@ -113,18 +235,46 @@ def run_project(project, cli_args):
             serialize_current_exception(show_stacktrace=True)
         )
 
+    # Wait for the workers (in distributed mode)
+    if coordinator_address:
+        try:
+            coordinator = Coordinator(
+                coordinator_address[0], coordinator_address[1], nb_workers, get_distributed_secret()
+            )
+        except socket.error as excp:
+            raise LemonCheesecakeException("Cannot listen on %s: %s" % (cli_args.coordinator, excp))
+        if coordinator.secret is None and coordinator_address[0] != "localhost" and \
+                not coordinator_address[0].startswith("127."):
+            print(
+                "WARNING: $LCC_DISTRIBUTED_SECRET is not set, anyone who can connect to %s can run code "
+                "on this machine" % cli_args.coordinator
+            )
+        print("Waiting for %d worker(s) on %s:%d..." % ((nb_workers,) + tuple(coordinator.address)))
+        coordinator.wait_for_workers()
+    else:
+        coordinator = None
+
     # Initialize event manager
     event_manager = initialize_event_manager(
-        suites, active_reporting_backends, report_dir, report_saving_strategy, nb_threads
+        suites, active_reporting_backends, report_dir, report_saving_strategy, nb_threads * nb_processes * nb_workers,
+        journal=cli_args.journal, compact_report=cli_args.compact_report, spill_steps=cli_args.spill_steps
     )
     event_manager.add_listener(project)
 
     # Run tests
-    is_successful = run_suites(
-        suites, fixture_registry, event_manager,
-        force_disabled=cli_args.force_disabled, stop_on_failure=cli_args.stop_on_failure,
-        nb_threads=nb_threads
-    )
+    try:
+        is_successful = run_suites(
+            suites, fixture_registry, event_manager,
+            force_disabled=cli_args.force_disabled, stop_on_failure=cli_args.stop_on_failure,
+            nb_threads=nb_threads, nb_processes=nb_processes,
+            previous_report=durations_report if cli_args.longest_first else None,
+            resource_limits=project.get_resource_limits(),
+            suite_affinity=cli_args.suite_affinity or max_open_suites is not None, max_open_suites=max_open_suites,
+            coordinator=coordinator
+        )
+    finally:
+        if coordinator:
+            coordinator.close()
 
     # Handle after run hook
     try:
@@ -177,6 +327,53 @@ class RunCommand(Command):
             "--threads", type=int, default=None,
             help="Number of threads used to run tests (default: $LCC_THREADS or 1)"
         )
+        test_execution_group.add_argument(
+            "--processes", type=int, default=None,
+            help="Number of processes used to run tests, each process runs its own subset of suites "
+                 "(default: $LCC_PROCESSES or 1)"
+        )
+        test_execution_group.add_argument(
+            "--async-concurrency", type=int, default=None,
+            help="Maximum number of async tests, hooks and fixtures run concurrently on the shared event loop "
+                 "(default: $LCC_ASYNC_CONCURRENCY or %d)" % DEFAULT_MAX_CONCURRENCY
+        )
+        test_execution_group.add_argument(
+            "--longest-first", action="store_true",
+            help="Start first the tests that are on the longest chains of tasks (according to the durations of "
+                 "a previous report), instead of following the tests order"
+        )
+        test_execution_group.add_argument(
+            "--durations-from", required=False, metavar="REPORT",
+            help="Report used to get the tests durations (default: the report of the previous run)"
+        )
+        test_execution_group.add_argument(
+            "--suite-affinity", action="store_true",
+            help="When a thread is done with a task, prefer the next ready tests of the same suite and run "
+                 "suite teardowns as soon as possible, so that fewer suites (and their fixtures) are open at once"
+        )
+        test_execution_group.add_argument(
+            "--max-open-suites", type=int, default=None, metavar="N",
+            help="Do not set up more than N suites at once (implies --suite-affinity)"
+        )
+        test_execution_group.add_argument(
+            "--shard", required=False, metavar="K/N",
+            help="Only run the K-th of N shards of tests balanced by duration (according to a previous report, "
+                 "see --durations-from), to spread a run over several machines"
+        )
+
+        distributed_group = cli_parser.add_argument_group("Distributed execution")
+        distributed_group.add_argument(
+            "--coordinator", required=False, metavar="[HOST:]PORT",
+            help="Listen on HOST:PORT (HOST defaults to 127.0.0.1) for workers (started with "
+                 "'lcc worker --connect HOST:PORT') and hand out the tests to them. The coordinator and the workers "
+                 "authenticate each other using the $LCC_DISTRIBUTED_SECRET environment variable: without it, "
+                 "anyone who can connect to the coordinator can run code on it. The messages being unencrypted "
+                 "pickles, this must be used on a trusted network only"
+        )
+        distributed_group.add_argument(
+            "--workers", type=int, default=None, metavar="N",
+            help="Number of workers the coordinator waits for before running the tests"
+        )
 
         reporting_group = cli_parser.add_argument_group("Reporting")
         reporting_group.add_argument(
@@ -202,6 +399,22 @@ class RunCommand(Command):
                  "at_end_of_tests, at_each_suite, at_each_test, at_each_failed_test, at_each_event, every_${N}s)"
         )
 
+        reporting_group.add_argument(
+            "--journal", action="store_true",
+            help="Write each event into a journal in the report directory, so that the report can be rebuilt "
+                 "with 'lcc rebuild-report' if the test run is killed before the report could be saved"
+        )
+        reporting_group.add_argument(
+            "--compact-report", action="store_true",
+            help="Store the logs, checks, attachments and urls of the report being built in a compact form "
+                 "(this greatly reduces the memory used by test runs that log a lot)"
+        )
+        reporting_group.add_argument(
+            "--spill-steps", action="store_true",
+            help="Move the steps of the ended tests from memory to files in the report directory, they are read "
+                 "back when needed (for test runs whose report does not fit in memory)"
+        )
+
         if project:
             project.add_custom_args_to_run_cli(cli_parser)
 
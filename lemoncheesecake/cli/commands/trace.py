@@ -0,0 +1,104 @@
+from __future__ import print_function
+
+import json
+
+from lemoncheesecake.helpers.time import humanize_duration
+from lemoncheesecake.helpers.console import print_table
+from lemoncheesecake.cli.command import Command
+from lemoncheesecake.cli.utils import auto_detect_reporting_backends, add_report_path_cli_arg, get_report_path
+from lemoncheesecake.reporting import load_report
+from lemoncheesecake.reporting.trace import get_worker_utilizations, get_traces_by_queue_wait, get_critical_path, \
+    get_trace_label, get_traces_time_span, build_chrome_trace
+from lemoncheesecake.exceptions import UserError
+
+
+def _format_duration(duration):
+    return humanize_duration(duration, show_milliseconds=True)
+
+
+def _format_ratio(ratio):
+    return "%d%%" % (ratio * 100)
+
+
+class TraceCommand(Command):
+    def get_name(self):
+        return "trace"
+
+    def get_description(self):
+        return "Display how the tests have been scheduled and export the trace of the test session"
+
+    def add_cli_args(self, cli_parser):
+        group = cli_parser.add_argument_group("Trace")
+        add_report_path_cli_arg(group)
+        group.add_argument(
+            "--output", "-o", required=False,
+            help="Export the trace as a Chrome trace JSON file (to be opened with chrome://tracing or Perfetto)"
+        )
+        group.add_argument(
+            "--top", type=int, default=10, help="Number of tasks with the longest queue waits to display (default: 10)"
+        )
+
+    @staticmethod
+    def get_worker_entries(traces):
+        return [
+            [worker, str(nb_tasks), _format_duration(busy_time), _format_ratio(utilization)]
+            for worker, nb_tasks, busy_time, utilization in get_worker_utilizations(traces)
+        ]
+
+    @staticmethod
+    def get_queue_wait_entries(traces, top):
+        return [
+            [get_trace_label(trace), trace.worker, _format_duration(trace.queue_wait)]
+            for trace in get_traces_by_queue_wait(traces)[:top] if trace.queue_wait > 0
+        ]
+
+    @staticmethod
+    def get_critical_path_entries(traces):
+        return [
+            [get_trace_label(trace), trace.worker, _format_duration(trace.queue_wait), _format_duration(trace.duration)]
+            for trace in get_critical_path(traces)
+        ]
+
+    @staticmethod
+    def get_summary_entries(traces):
+        start_time, end_time = get_traces_time_span(traces)
+        span = end_time - start_time
+        workers = get_worker_utilizations(traces)
+        busy_time = sum(worker[2] for worker in workers)
+        queue_waits = [trace.queue_wait for trace in traces]
+        critical_path = get_critical_path(traces)
+        return [
+            ["Duration", _format_duration(span)],
+            ["Cumulative tasks duration", _format_duration(busy_time)],
+            ["Workers", str(len(workers))],
+            ["Workers utilization", _format_ratio(busy_time / (span * len(workers))) if span else "n/a"],
+            ["Average queue wait", _format_duration(sum(queue_waits) / len(queue_waits))],
+            ["Max queue wait", _format_duration(max(queue_waits))],
+            ["Critical path tasks duration", _format_duration(sum(trace.duration for trace in critical_path))]
+        ]
+
+    def run_cmd(self, cli_args):
+        report_path = get_report_path(cli_args)
+        report = load_report(report_path, auto_detect_reporting_backends())
+        traces = report.task_traces
+        if not traces:
+            raise UserError("The report does not contain any task trace")
+
+        print_table("Session", ("", "Value"), self.get_summary_entries(traces))
+        print_table("Workers", ("Worker", "Tasks", "Busy", "Utilization"), self.get_worker_entries(traces))
+        print_table(
+            "Longest queue waits", ("Task", "Worker", "Queue wait"), self.get_queue_wait_entries(traces, cli_args.top)
+        )
+        print_table(
+            "Critical path", ("Task", "Worker", "Queue wait", "Duration"), self.get_critical_path_entries(traces)
+        )
+
+        if cli_args.output:
+            try:
+                with open(cli_args.output, "w") as fh:
+                    json.dump(build_chrome_trace(traces), fh)
+            except IOError as excp:
+                raise UserError("Cannot write trace file: %s" % excp)
+            print("Chrome trace has been written into %s" % cli_args.output)
+
+        return 0
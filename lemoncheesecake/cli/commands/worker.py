@@ -0,0 +1,52 @@
+import socket
+
+from lemoncheesecake.cli.command import Command
+from lemoncheesecake.cli.commands.run import build_fixture_registry, get_distributed_secret
+from lemoncheesecake.distributed import run_worker, parse_address
+from lemoncheesecake.project import find_project_file, load_project_from_file, load_project
+from lemoncheesecake.exceptions import LemonCheesecakeException
+
+
+class WorkerCommand(Command):
+    def get_name(self):
+        return "worker"
+
+    def get_description(self):
+        return "Run the tests handed out by a coordinator (lcc run --coordinator)"
+
+    def add_cli_args(self, cli_parser):
+        group = cli_parser.add_argument_group("Worker")
+        group.add_argument(
+            "--connect", required=True, metavar="HOST:PORT",
+            help="Address of the coordinator. The coordinator and the worker authenticate each other using the "
+                 "$LCC_DISTRIBUTED_SECRET environment variable (which must be the same on both ends): without it, "
+                 "anyone who can pose as the coordinator can run code on the worker. The messages being "
+                 "unencrypted pickles, this must be used on a trusted network only"
+        )
+        group.add_argument(
+            "--connection-timeout", type=int, default=60, metavar="SECONDS",
+            help="How long to try to connect to the coordinator (default: 60)"
+        )
+
+        project_file = find_project_file()
+        if project_file:
+            load_project_from_file(project_file).add_custom_args_to_run_cli(cli_parser)
+
+    def run_cmd(self, cli_args):
+        try:
+            host, port = parse_address(cli_args.connect)
+        except ValueError:
+            raise LemonCheesecakeException("Invalid value '%s' for --connect (expect HOST:PORT)" % cli_args.connect)
+
+        project = load_project()
+        fixture_registry = build_fixture_registry(project, cli_args)
+
+        try:
+            run_worker(
+                host, port, project.get_suites(), fixture_registry, cli_args.connection_timeout,
+                get_distributed_secret()
+            )
+        except socket.error as excp:
+            raise LemonCheesecakeException("Cannot connect to coordinator %s: %s" % (cli_args.connect, excp))
+
+        return 0
@@ -0,0 +1,166 @@
+'''
+Run the coroutines of async tests, hooks and fixtures on an event loop shared by the whole test session.
+
+The event loop runs in a dedicated thread: the threads running the tests submit their coroutines to it and
+either wait for their completion (hooks and fixtures) or get a future to be notified of it (test coroutines, whose
+task is suspended meanwhile, see TestTask). The number of coroutines in flight is limited by the event loop itself,
+the coroutines submitted beyond this limit being queued until a running coroutine completes.
+'''
+
+import os
+import inspect
+import threading
+from collections import deque
+
+try:
+    import asyncio
+except ImportError:  # Python 2
+    asyncio = None
+
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
+DEFAULT_MAX_CONCURRENCY = 100
+
+_event_loop = None  # type: _EventLoop
+_event_loop_lock = threading.Lock()
+_max_concurrency = DEFAULT_MAX_CONCURRENCY
+
+
+def is_coroutine(obj):
+    # inspect.isawaitable is only available as of Python 3.5 (as well as "async def" functions)
+    return hasattr(inspect, "isawaitable") and inspect.isawaitable(obj)
+
+
+def is_async_generator(obj):
+    return hasattr(inspect, "isasyncgen") and inspect.isasyncgen(obj)
+
+
+class _EventLoop(object):
+    def __init__(self, max_concurrency):
+        # the runtime location and step are stored in context variables that asyncio tasks inherit from the
+        # thread that submits them, without context variables concurrent coroutines would share the same location
+        self.max_concurrency = max_concurrency if contextvars else 1
+        self.pid = os.getpid()
+        # the number of running coroutines and the submissions waiting for a running coroutine to complete,
+        # they are only accessed from the event loop thread
+        self._nb_running = 0
+        self._pending_submissions = deque()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="lcc-event-loop")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+        self._loop.close()
+
+    def _submit(self, submission):
+        if self._nb_running < self.max_concurrency:
+            self._start(*submission)
+        else:
+            self._pending_submissions.append(submission)
+
+    def _start(self, coroutine, local_state, context, result):
+        from lemoncheesecake.runtime import set_local_state
+
+        self._nb_running += 1
+        if context is None:
+            set_local_state(local_state)
+            task = asyncio.ensure_future(coroutine, loop=self._loop)
+        else:
+            # the task copies the context of the thread that submitted the coroutine
+            task = context.run(asyncio.ensure_future, coroutine, loop=self._loop)
+        task.add_done_callback(lambda task: self._on_done(task, result))
+
+    def _on_done(self, task, result):
+        self._nb_running -= 1
+        if self._pending_submissions:
+            self._start(*self._pending_submissions.popleft())
+
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())
+        else:
+            result.set_result(task.result())
+
+    def submit_coroutine(self, coroutine, local_state):
+        from concurrent.futures import Future
+
+        result = Future()
+        context = contextvars.copy_context() if contextvars else None
+        self._loop.call_soon_threadsafe(self._submit, (coroutine, local_state, context, result))
+        return result
+
+    def run_coroutine(self, coroutine, local_state):
+        return self.submit_coroutine(coroutine, local_state).result()
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def set_max_concurrency(max_concurrency):
+    """
+    Set the maximum number of coroutines that can be run concurrently on the event loop.
+    """
+    global _max_concurrency
+    shutdown_event_loop()
+    _max_concurrency = max(max_concurrency, 1)
+
+
+def _get_event_loop():
+    global _event_loop
+    with _event_loop_lock:
+        # the event loop thread does not survive a fork, a forked process needs its own event loop
+        if _event_loop is None or _event_loop.pid != os.getpid():
+            _event_loop = _EventLoop(_max_concurrency)
+        return _event_loop
+
+
+def get_max_concurrency():
+    """
+    Return the maximum number of coroutines that can be run concurrently on the event loop.
+    """
+    # see _EventLoop
+    return _max_concurrency if contextvars else 1
+
+
+def submit_coroutine(coroutine):
+    """
+    Submit the coroutine to the shared event loop (to be run within the runtime location and step of the calling
+    thread) and return a concurrent.futures.Future of its result.
+    """
+    from lemoncheesecake.runtime import get_local_state
+
+    return _get_event_loop().submit_coroutine(coroutine, get_local_state())
+
+
+def run_coroutine(coroutine):
+    """
+    Run the coroutine on the shared event loop (within the runtime location and step of the calling thread)
+    and return its result.
+    """
+    from lemoncheesecake.runtime import get_local_state
+
+    return _get_event_loop().run_coroutine(coroutine, get_local_state())
+
+
+def resolve_coroutine(value):
+    """
+    If value is a coroutine (such as the value returned by an "async def" function), run it and return its result,
+    otherwise return value as-is.
+    """
+    return run_coroutine(value) if is_coroutine(value) else value
+
+
+def shutdown_event_loop():
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is not None and _event_loop.pid == os.getpid():
+            _event_loop.stop()
+        _event_loop = None
@@ -0,0 +1,653 @@
+'''
+Run the tests of a session on several worker hosts connected over TCP to a coordinator.
+
+The coordinator (``lcc run --coordinator HOST:PORT --workers N``) waits for N workers
+(``lcc worker --connect HOST:PORT``), then hands out work units to the workers as soon as they are free.
+A work unit is a set of top-level suites linked by test dependencies, so that the suite setups and
+teardowns of a suite are always run by a single worker. Each worker runs its units with its own threads and
+streams the events it fires (and the content of the attachments it saves) back to the coordinator, which
+builds the report. The events are sent by batches from a dedicated thread of the worker, so that the threads
+running the tests do not wait for the network. When a worker reports a failure and the coordinator's watchdog
+asks to stop (--stop-on-failure), the coordinator tells every worker to stop running tests.
+
+Messages are pickled, unpickling a message allowing its sender to run code: before any message is exchanged,
+the coordinator and the worker prove each other that they know a shared secret (see _authenticate_worker),
+the messages are not encrypted though and both ends must only be used on a trusted network.
+'''
+
+import os
+import hmac
+import hashlib
+import socket
+import struct
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+
+from six.moves.queue import Queue
+
+from six.moves import cPickle as pickle
+
+from lemoncheesecake import events
+from lemoncheesecake.exceptions import UserError, TasksExecutionFailure, ProtocolError, \
+    serialize_current_exception
+from lemoncheesecake.filter import FromTestsFilter, filter_suites
+from lemoncheesecake.processes import get_linked_suites, get_used_resources, split_resource_limits, \
+    _EventForwarder, _skip_suite
+from lemoncheesecake.reporting import Report
+from lemoncheesecake.runtime import initialize_runtime, initialize_fixtures_cache, get_runtime
+from lemoncheesecake.task import BaseTask, TaskResultSuccess, run_tasks
+from lemoncheesecake.coroutines import get_max_concurrency
+from lemoncheesecake.testtree import flatten_tests
+
+# coordinator -> worker messages
+_MESSAGE_SESSION = "session"
+_MESSAGE_UNIT = "unit"
+_MESSAGE_STOP = "stop"
+_MESSAGE_END = "end"
+# worker -> coordinator messages (and _MESSAGE_END)
+_MESSAGE_EVENT = "event"
+_MESSAGE_ATTACHMENT = "attachment"
+_MESSAGE_ERROR = "error"
+_MESSAGE_UNIT_DONE = "unit_done"
+
+_HEADER = struct.Struct("!I")
+
+_CONNECTION_RETRY_INTERVAL = 1
+
+_NONCE_SIZE = 32
+_SIGNATURE_SIZE = hashlib.sha256().digest_size
+_HANDSHAKE_TIMEOUT = 10
+
+
+def parse_address(value, default_host=None):
+    """
+    Parse a "HOST:PORT" (or "PORT" if default_host is given) address into a (host, port) tuple.
+    """
+    if default_host is not None and ":" not in value:
+        return default_host, int(value)
+    host, port = value.rsplit(":", 1)  # raise ValueError if there is no port
+    return host, int(port)
+
+
+def _pack_message(message_type, payload=None):
+    data = pickle.dumps((message_type, payload), protocol=2)
+    return _HEADER.pack(len(data)) + data
+
+
+def _send_message(sock, message_type, payload=None):
+    sock.sendall(_pack_message(message_type, payload))
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise EOFError("connection closed by peer")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_message(sock):
+    size, = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return pickle.loads(_recv_exactly(sock, size))
+
+
+def _sign(secret, role, nonce):
+    return hmac.new(secret or b"", role + nonce, hashlib.sha256).digest()
+
+
+def _authenticate_worker(sock, secret):
+    """
+    Coordinator side of the handshake: return whether the worker has signed the coordinator's nonce with
+    the secret, the worker's nonce is then signed in return.
+    """
+    nonce = os.urandom(_NONCE_SIZE)
+    sock.sendall(nonce)
+    worker_nonce = _recv_exactly(sock, _NONCE_SIZE)
+    signature = _recv_exactly(sock, _SIGNATURE_SIZE)
+    if not hmac.compare_digest(signature, _sign(secret, b"worker", nonce)):
+        return False
+    sock.sendall(_sign(secret, b"coordinator", worker_nonce))
+    return True
+
+
+def _authenticate_coordinator(sock, secret):
+    """
+    Worker side of the handshake.
+    """
+    nonce = _recv_exactly(sock, _NONCE_SIZE)
+    worker_nonce = os.urandom(_NONCE_SIZE)
+    sock.sendall(worker_nonce + _sign(secret, b"worker", nonce))
+    try:
+        signature = _recv_exactly(sock, _SIGNATURE_SIZE)
+    except EOFError:
+        raise ProtocolError("The coordinator has rejected the worker, both must use the same secret")
+    if not hmac.compare_digest(signature, _sign(secret, b"coordinator", worker_nonce)):
+        raise ProtocolError("The coordinator has failed to authenticate, both must use the same secret")
+
+
+###
+# Coordinator side
+###
+
+class _PendingUnits(object):
+    def __init__(self, units):
+        self._units = deque(units)
+        self._lock = threading.Lock()
+
+    def pop(self):
+        with self._lock:
+            return self._units.popleft() if self._units else None
+
+    def push_back(self, unit):
+        with self._lock:
+            self._units.appendleft(unit)
+
+    def pop_all(self):
+        with self._lock:
+            units, self._units = list(self._units), deque()
+            return units
+
+
+class _WorkerConnection(object):
+    """
+    The coordinator's connection to a worker: the task of the worker sends and receives messages while
+    any other thread may send a stop message.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self._send_lock = threading.Lock()
+
+    def send(self, message_type, payload=None):
+        with self._send_lock:
+            _send_message(self.sock, message_type, payload)
+
+    def recv(self):
+        return _recv_message(self.sock)
+
+    def stop(self):
+        try:
+            self.send(_MESSAGE_STOP)
+        except socket.error:
+            # the worker has gone away, there is nothing to stop anymore
+            pass
+
+    def close(self):
+        self.sock.close()
+
+
+class _WorkerStopper(object):
+    """
+    Tell all the workers (once) to stop running tests.
+    """
+    def __init__(self, connections):
+        self._connections = connections
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    def stop_workers(self):
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        for connection in self._connections:
+            connection.stop()
+
+
+class RemoteWorkerTask(BaseTask):
+    def __init__(self, worker_num, connection, pending_units, test_paths, nb_threads, event_forwarder,
+                 worker_stopper, resource_limits=None, suite_affinity=False, max_open_suites=None):
+        BaseTask.__init__(self)
+        self.worker_num = worker_num
+        self.connection = connection
+        self.pending_units = pending_units
+        self.test_paths = test_paths
+        self.nb_threads = nb_threads
+        self.event_forwarder = event_forwarder
+        self.worker_stopper = worker_stopper
+        self.resource_limits = resource_limits
+        self.suite_affinity = suite_affinity
+        self.max_open_suites = max_open_suites
+        self._has_forwarded_events = False
+
+    def _handle_messages(self, context, until):
+        # return the error sent by the worker (if any)
+        error = None
+        while True:
+            message_type, payload = self.connection.recv()
+            if message_type == _MESSAGE_EVENT:
+                self.event_forwarder.forward(context.event_manager, self.worker_num, payload)
+                self._has_forwarded_events = True
+                # the failures of the worker are seen by the coordinator's watchdog (see _EventForwarder)
+                if context.watchdog(self):
+                    self.worker_stopper.stop_workers()
+            elif message_type == _MESSAGE_ATTACHMENT:
+                self._save_attachment(*payload)
+            elif message_type == _MESSAGE_ERROR:
+                error = payload
+            if message_type == until:
+                return error
+            if message_type == _MESSAGE_END:
+                return error or "worker ended unexpectedly"
+
+    @staticmethod
+    def _save_attachment(filename, content):
+        path = os.path.join(get_runtime().report_dir, filename)
+        if not os.path.exists(os.path.dirname(path)):
+            try:
+                os.mkdir(os.path.dirname(path))
+            except OSError:
+                # the directory may have been created meanwhile by another thread
+                if not os.path.isdir(os.path.dirname(path)):
+                    raise
+        with open(path, "wb") as fh:
+            fh.write(content)
+
+    def _run_units(self, context):
+        self.connection.send(_MESSAGE_SESSION, {
+            "worker_num": self.worker_num,
+            "test_paths": self.test_paths,
+            "force_disabled": context.force_disabled,
+            "stop_on_failure": context.stop_on_failure,
+            "nb_threads": self.nb_threads,
+            "resource_limits": self.resource_limits,
+            "suite_affinity": self.suite_affinity,
+            "max_open_suites": self.max_open_suites
+        })
+
+        while True:
+            unit = self.pending_units.pop()
+            if unit is None:
+                break
+            self._has_forwarded_events = False
+            try:
+                self.connection.send(_MESSAGE_UNIT, [suite.path for suite in unit])
+                error = self._handle_messages(context, until=_MESSAGE_UNIT_DONE)
+            except (EOFError, socket.error):
+                error = serialize_current_exception()
+            if error:
+                if self._has_forwarded_events:
+                    # the worker has started the unit, what it has not reported of it will never be
+                    self.event_forwarder.complete_worker_suites(
+                        context.event_manager, self.worker_num, unit, "worker #%d failed" % self.worker_num
+                    )
+                else:
+                    # let another worker run the unit
+                    self.pending_units.push_back(unit)
+                return error
+
+        self.connection.send(_MESSAGE_END)
+        return self._handle_messages(context, until=_MESSAGE_END)
+
+    def run(self, context):
+        try:
+            error = self._run_units(context)
+        except (EOFError, socket.error):
+            error = serialize_current_exception()
+        finally:
+            self.connection.close()
+            self.event_forwarder.end_worker(context.event_manager, self.worker_num)
+
+        if error:
+            raise TasksExecutionFailure("Worker #%d failed: %s" % (self.worker_num, error))
+
+    def skip(self, context, reason=""):
+        self.connection.close()
+        self.event_forwarder.end_worker(context.event_manager, self.worker_num)
+
+    def __str__(self):
+        return "<%s #%d>" % (self.__class__.__name__, self.worker_num)
+
+
+class LeftoverUnitsTask(BaseTask):
+    """
+    Skip the units that no worker has been able to run (all workers failed or have been interrupted).
+    """
+    def __init__(self, pending_units, dependencies):
+        BaseTask.__init__(self)
+        self.pending_units = pending_units
+        self._dependencies = dependencies
+
+    def get_on_completion_dependencies(self):
+        return self._dependencies
+
+    def run(self, context, reason="no worker was able to run them"):
+        for unit in self.pending_units.pop_all():
+            for suite in unit:
+                _skip_suite(suite, context.event_manager, reason)
+
+    def skip(self, context, reason=""):
+        self.run(context, reason)
+
+
+class Coordinator(object):
+    def __init__(self, host, port, nb_workers, secret=None):
+        self.nb_workers = nb_workers
+        self.secret = secret
+        self._nb_rejected_connections = 0
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(nb_workers)
+        self._connections = []
+
+    @property
+    def address(self):
+        return self._server.getsockname()[:2]
+
+    def _accept(self, connection):
+        connection.settimeout(_HANDSHAKE_TIMEOUT)
+        try:
+            accepted = _authenticate_worker(connection, self.secret)
+        except (EOFError, socket.error):
+            accepted = False
+        if not accepted:
+            self._nb_rejected_connections += 1
+            connection.close()
+            return
+        connection.settimeout(None)
+        self._connections.append(_WorkerConnection(connection))
+
+    def wait_for_workers(self, timeout=None):
+        self._server.settimeout(timeout)
+        try:
+            while len(self._connections) < self.nb_workers:
+                connection, _ = self._server.accept()
+                self._accept(connection)
+        except socket.timeout:
+            raise UserError(
+                "Only %d worker(s) out of %d connected to the coordinator (%d connection(s) rejected)" % (
+                    len(self._connections), self.nb_workers, self._nb_rejected_connections
+                )
+            )
+
+    def build_tasks(self, suites, fixture_registry, prerun_session_scheduled_fixtures, nb_threads,
+                    resource_limits=None, suite_affinity=False, max_open_suites=None):
+        # hand out the biggest units first so that the last ones to complete are short
+        suite_ranks = {suite: rank for rank, suite in enumerate(suites)}
+        units = sorted(
+            get_linked_suites(suites),
+            key=lambda unit: (-len(list(flatten_tests(unit))), suite_ranks[unit[0]])
+        )
+        pending_units = _PendingUnits(units)
+        test_paths = [test.path for test in flatten_tests(suites)]
+
+        worker_nums = list(range(1, len(self._connections) + 1))
+        if fixture_registry.get_fixtures_scheduled_for_session(suites, prerun_session_scheduled_fixtures).is_empty():
+            session_setup_worker_nums = []
+        else:
+            session_setup_worker_nums = worker_nums
+        event_forwarder = _EventForwarder(suites, session_setup_worker_nums)
+        worker_stopper = _WorkerStopper(self._connections)
+        # any worker may run any unit
+        used_resources = get_used_resources(suites)
+        worker_resource_limits = split_resource_limits(resource_limits, [used_resources for _ in worker_nums])
+
+        worker_tasks = [
+            RemoteWorkerTask(
+                worker_num, connection, pending_units, test_paths, nb_threads, event_forwarder, worker_stopper,
+                worker_limits, suite_affinity, max_open_suites
+            )
+            for worker_num, connection, worker_limits in zip(worker_nums, self._connections, worker_resource_limits)
+        ]
+        return worker_tasks + [LeftoverUnitsTask(pending_units, worker_tasks)]
+
+    def close(self):
+        for connection in self._connections:
+            connection.close()
+        self._server.close()
+
+
+###
+# Worker side
+###
+
+class _SocketEventManager(events.BaseEventManager):
+    """
+    Event manager used within workers: events are serialized and sent to the coordinator, the content of
+    attachments is sent along with their event.
+
+    The messages are queued and sent by a dedicated thread, which sends all the messages queued meanwhile
+    at once. A failure to send them is reported through get_pending_failure (the tests are then skipped by
+    the watchdog).
+    """
+    def __init__(self, connection, report_dir):
+        events.BaseEventManager.__init__(self)
+        self._connection = connection
+        self._report_dir = report_dir
+        self._pending_messages = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._pending_failure = None, None
+        self._thread = threading.Thread(target=self._send_loop, name="lcc-event-sender")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _queue_message(self, message_type, payload=None):
+        with self._condition:
+            self._pending_messages.append((message_type, payload))
+            self._condition.notify()
+
+    def _pack_messages(self, messages):
+        data = []
+        for message_type, payload in messages:
+            if message_type == _MESSAGE_ATTACHMENT:
+                # the content of the attachment is read once the attachment has been saved
+                with open(os.path.join(self._report_dir, payload), "rb") as fh:
+                    payload = payload, fh.read()
+            data.append(_pack_message(message_type, payload))
+        return b"".join(data)
+
+    def _send_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending_messages and not self._closed:
+                    self._condition.wait()
+                messages, self._pending_messages = self._pending_messages, []
+                closed = self._closed
+            if messages:
+                try:
+                    self._connection.sendall(self._pack_messages(messages))
+                except Exception as excp:
+                    self._pending_failure = excp, serialize_current_exception()
+                    return
+            if closed:
+                return
+
+    def send(self, message_type, payload=None):
+        self._queue_message(message_type, payload)
+
+    def fire(self, event):
+        if isinstance(event, events.LogAttachmentEvent):
+            self._queue_message(_MESSAGE_ATTACHMENT, event.attachment_path)
+        self._queue_message(_MESSAGE_EVENT, events.serialize_event(event))
+
+    def close(self):
+        """
+        Send the messages that are still queued and stop the sending thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def get_pending_failure(self):
+        return self._pending_failure
+
+
+def _connect(host, port, timeout):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return socket.create_connection((host, port))
+        except socket.error:
+            if time.time() >= deadline:
+                raise
+            time.sleep(_CONNECTION_RETRY_INTERVAL)
+
+
+class _Worker(object):
+    def __init__(self, connection, suites, fixture_registry, options):
+        from lemoncheesecake.runner import RunContext
+
+        self.options = options
+        self.report_dir = tempfile.mkdtemp()
+        self.event_manager = _SocketEventManager(connection, self.report_dir)
+        initialize_runtime(
+            self.event_manager, self.report_dir, Report(), attachment_prefix="w%d_" % options["worker_num"]
+        )
+
+        test_paths = set(options["test_paths"])
+        self.suites = filter_suites(
+            suites, FromTestsFilter([test for test in flatten_tests(suites) if test.path in test_paths])
+        )
+        self.fixture_registry = fixture_registry
+        self.prerun_teardowns = []
+        self.context = RunContext(
+            self.event_manager, fixture_registry, options["force_disabled"], options["stop_on_failure"]
+        )
+        self.session_scheduled_fixtures = None
+        self.test_session_setup_task = None
+        self.tasks = []
+        # set when the coordinator tells the worker to stop running tests
+        self.stop_requested = threading.Event()
+
+    def watchdog(self, task):
+        if self.stop_requested.is_set():
+            return "tests have been aborted on --stop-on-failure"
+        return self.context.watchdog(task)
+
+    def setup_prerun_fixtures(self):
+        scheduled_fixtures = self.fixture_registry.get_fixtures_scheduled_for_session_prerun(self.suites)
+        initialize_fixtures_cache(scheduled_fixtures)
+        for setup, teardown in scheduled_fixtures.get_setup_teardown_pairs():
+            setup()
+            self.prerun_teardowns.append(teardown)
+        self.session_scheduled_fixtures = self.fixture_registry.get_fixtures_scheduled_for_session(
+            self.suites, scheduled_fixtures
+        )
+
+    def teardown_prerun_fixtures(self):
+        for teardown in self.prerun_teardowns:
+            if teardown:
+                teardown()
+
+    def _run_tasks(self, tasks):
+        self.tasks.extend(tasks)
+        run_tasks(
+            tasks, self.context, self.options["nb_threads"], self.watchdog,
+            resource_limits=self.options["resource_limits"], group_affinity=self.options["suite_affinity"],
+            max_open_groups=self.options["max_open_suites"], max_suspended_tasks=get_max_concurrency()
+        )
+
+    def run_unit(self, suite_paths):
+        from lemoncheesecake.runner import build_suites_tasks, build_test_session_setup_task
+
+        suites = [suite for suite in self.suites if suite.path in suite_paths]
+        if len(suites) != len(suite_paths):
+            raise UserError(
+                "Cannot find suite(s) %s in worker project" % ", ".join(
+                    sorted(set(suite_paths) - set(suite.path for suite in suites))
+                )
+            )
+
+        # the test session setup is only run if the worker actually runs tests
+        if self.test_session_setup_task is None:
+            self.test_session_setup_task = build_test_session_setup_task(self.session_scheduled_fixtures) or False
+            if self.test_session_setup_task:
+                self._run_tasks([self.test_session_setup_task])
+
+        if self.test_session_setup_task and not isinstance(self.test_session_setup_task.result, TaskResultSuccess):
+            for suite in suites:
+                _skip_suite(suite, self.event_manager, "test session setup failed")
+        else:
+            self._run_tasks(
+                build_suites_tasks(suites, self.fixture_registry, self.session_scheduled_fixtures)
+            )
+
+    def end(self):
+        from lemoncheesecake.runner import build_test_session_teardown_task, build_task_traces
+
+        if self.test_session_setup_task:
+            self._run_tasks([build_test_session_teardown_task(self.test_session_setup_task, [])])
+        self.event_manager.fire(
+            events.TaskTracesEvent(build_task_traces(self.tasks), worker_prefix="worker-%d/" % self.options["worker_num"])
+        )
+
+    def cleanup(self):
+        shutil.rmtree(self.report_dir, ignore_errors=True)
+
+
+def _receive_messages(connection, worker, messages):
+    # the messages of the coordinator are received in a dedicated thread so that a stop message is handled
+    # while the worker runs a unit, the other messages are handed to the worker's main thread
+    try:
+        while True:
+            message_type, payload = _recv_message(connection)
+            if message_type == _MESSAGE_STOP:
+                worker.stop_requested.set()
+            else:
+                messages.put((message_type, payload))
+    except (EOFError, socket.error):
+        messages.put((None, None))
+
+
+def run_worker(host, port, suites, fixture_registry, connection_timeout=60, secret=None):
+    """
+    Connect to the coordinator listening on host:port and run the work units it hands out until it ends
+    the session.
+    """
+    from lemoncheesecake.coroutines import shutdown_event_loop
+
+    connection = _connect(host, port, connection_timeout)
+    worker = None
+    try:
+        _authenticate_coordinator(connection, secret)
+        message_type, options = _recv_message(connection)
+        if message_type != _MESSAGE_SESSION:
+            raise ProtocolError(
+                "Got message '%s' from the coordinator while expecting '%s'" % (message_type, _MESSAGE_SESSION)
+            )
+        worker = _Worker(connection, suites, fixture_registry, options)
+        messages = Queue()
+        receiver = threading.Thread(
+            target=_receive_messages, args=(connection, worker, messages), name="lcc-message-receiver"
+        )
+        receiver.daemon = True
+        receiver.start()
+        try:
+            worker.setup_prerun_fixtures()
+            while True:
+                message_type, payload = messages.get()
+                if message_type is None:
+                    # the coordinator has gone away
+                    raise EOFError("connection closed by peer")
+                if message_type == _MESSAGE_UNIT:
+                    worker.run_unit(payload)
+                    worker.event_manager.send(_MESSAGE_UNIT_DONE)
+                elif message_type == _MESSAGE_END:
+                    worker.end()
+                    break
+                else:
+                    raise ProtocolError("Got unexpected message '%s' from the coordinator" % message_type)
+            worker.teardown_prerun_fixtures()
+        except EOFError:
+            raise
+        except Exception:
+            worker.event_manager.send(_MESSAGE_ERROR, serialize_current_exception(show_stacktrace=True))
+        worker.event_manager.send(_MESSAGE_END)
+    except EOFError:
+        # the coordinator has gone away
+        pass
+    finally:
+        if worker:
+            worker.event_manager.close()
+        connection.close()
+        if worker:
+            worker.cleanup()
+        shutdown_event_loop()
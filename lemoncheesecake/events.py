@@ -3,23 +3,67 @@ import time
 import re
 import inspect
 import threading
+from collections import deque
 from contextlib import contextmanager
 
-from six.moves.queue import Queue
+from six.moves.queue import Queue, Empty
 
 from lemoncheesecake.helpers.text import camel_case_to_snake_case
+from lemoncheesecake.consts import LOG_LEVEL_DEBUG
 from lemoncheesecake.exceptions import serialize_current_exception
 
 DEBUG = False
 
+# maximum number of events handled at once by the AsyncEventManager
+MAX_EVENT_BATCH_SIZE = 1000
+
 
 class Event(object):
+    # events are declared with __slots__ since millions of them (mostly logs and checks) are created during
+    # a test session, they can still be sub-classed without __slots__
+    __slots__ = ("time",)
+
     def __init__(self, event_time=None):
         self.time = event_time or time.time()
 
+    @classmethod
+    def _get_slot_names(cls):
+        names = cls.__dict__.get("_event_slot_names")
+        if names is None:
+            names = tuple(
+                name for klass in reversed(cls.__mro__) for name in klass.__dict__.get("__slots__", ())
+            )
+            cls._event_slot_names = names
+        return names
+
+    def get_attributes(self):
+        """
+        Return the attributes of the event as a dict (what vars() does for objects that have a __dict__).
+        """
+        attributes = dict(
+            (name, getattr(self, name)) for name in self._get_slot_names() if hasattr(self, name)
+        )
+        attributes.update(getattr(self, "__dict__", {}))
+        return attributes
+
+    @classmethod
+    def from_attributes(cls, attributes):
+        """
+        Build an event from the attributes returned by get_attributes() without calling its constructor.
+        """
+        event = cls.__new__(cls)
+        for name, value in attributes.items():
+            setattr(event, name, value)
+        return event
+
     @classmethod
     def get_name(cls):
-        return re.sub(r"_event$", "", camel_case_to_snake_case(cls.__name__))
+        # the name is computed once per event class (and not inherited by sub classes)
+        name = cls.__dict__.get("_event_name")
+        if name is None:
+            name = re.sub(r"_event$", "", camel_case_to_snake_case(cls.__name__))
+            cls._event_name = name
+        return name
 
     def __str__(self):
         return "<Event type='%s'>" % self.get_name()
@@ -30,6 +74,10 @@ class EventType:
         self._event_class = event_class
         self._handlers = []
 
+    @property
+    def event_class(self):
+        return self._event_class
+
     def subscribe(self, handler):
         self._handlers.append(handler)
 
@@ -47,6 +95,11 @@ class EventType:
 class BaseEventManager(object):
     def __init__(self):
         self._event_types = {}
+        # event class => EventType, so that dispatching an event does not involve its name
+        self._event_types_by_class = {}
+        # listeners that handle events by batch through their on_events method
+        self._batch_listeners = []
+        self._channels = []
 
     @staticmethod
     def _get_event_classes():
@@ -75,7 +128,9 @@ class BaseEventManager(object):
 
     def register_event(self, *event_classes):
         for event_class in event_classes:
-            self._event_types[event_class.get_name()] = EventType(event_class)
+            event_type = EventType(event_class)
+            self._event_types[event_class.get_name()] = event_type
+            self._event_types_by_class[event_class] = event_type
 
     def subscribe_to_event(self, event, handler):
         self._event_types[self._get_event_name(event)].subscribe(handler)
@@ -84,23 +139,109 @@ class BaseEventManager(object):
         for event, handler in event_handler_pairs.items():
             self.subscribe_to_event(event, handler)
 
-    def add_listener(self, listener):
+    def _add_channel(self, channel):
+        if channel not in self._channels:
+            channel.register_event(*(event_type.event_class for event_type in self._event_types.values()))
+            self._channels.append(channel)
+            self._batch_listeners.append(channel)
+
+    def add_listener(self, listener, channel=None):
+        """
+        Subscribe the on_<event name> methods of listener to their event.
+
+        If channel (an EventChannel) is given, listener is called from the channel's own thread so that
+        it does not delay the other listeners.
+        """
+        if channel:
+            self._add_channel(channel)
+            channel.add_listener(listener)
+            return
+
         for event_name in self._event_types:
             handler_name = "on_%s" % event_name
             handler = getattr(listener, handler_name, None)
             if handler and callable(handler):
                 self.subscribe_to_event(event_name, handler)
 
+    def add_batch_listener(self, listener, channel=None):
+        """
+        Call the on_events method of listener with each batch of events (a list), see handle_event_batch.
+
+        If channel (an EventChannel) is given, listener is called from the channel's own thread so that
+        it does not delay the other listeners.
+        """
+        if channel:
+            self._add_channel(channel)
+            channel.add_batch_listener(listener)
+        else:
+            self._batch_listeners.append(listener)
+
     def unsubscribe_from_event(self, event, handler):
         self._event_types[self._get_event_name(event)].unsubscribe(handler)
 
+    def _get_event_type(self, event):
+        try:
+            return self._event_types_by_class[event.__class__]
+        except KeyError:
+            # an event class that has not been registered but shares its name with a registered one
+            return self._event_types[event.__class__.get_name()]
+
+    def handle_event_batch(self, events):
+        """
+        Handle a batch of events: the events are passed one after the other to the on_<event name> handlers
+        (each event being passed to all the handlers, in the order they have been subscribed, before the next
+        event, as if the events were handled one by one), then the whole batch is passed to the batch listeners
+        (in the order they have been added). The batch listeners thus see the effects of all the events
+        of the batch on the per-event listeners (such as the report writer).
+        """
+        for event in events:
+            self._get_event_type(event).handle(event)
+        for listener in self._batch_listeners:
+            listener.on_events(events)
+
     def handle_event(self, event):
-        self._event_types[event.__class__.get_name()].handle(event)
+        self.handle_event_batch([event])
 
     def fire(self, event):
         raise NotImplemented()
 
 
+def _get_event_class_by_name(name, _cache={}):
+    if not _cache:
+        _cache.update((event_class.get_name(), event_class) for event_class in BaseEventManager._get_event_classes())
+    return _cache[name]
+
+
+def serialize_event(event):
+    """
+    Turn an event into a picklable (event name, event attributes) pair: tree nodes (test, suite) are replaced
+    by their path and the report is dropped.
+    """
+    attributes = event.get_attributes()
+    for node_attribute in "test", "suite":
+        if node_attribute in attributes:
+            attributes[node_attribute] = attributes[node_attribute].path
+    attributes.pop("report", None)
+    return event.get_name(), attributes
+
+
+def unserialize_event(serialized_event, get_test, get_suite, report=None):
+    """
+    Rebuild an event serialized by serialize_event, get_test and get_suite are callables that take a node path
+    and return respectively the corresponding test and suite.
+    """
+    name, attributes = serialized_event
+    event_class = _get_event_class_by_name(name)
+    event = event_class.from_attributes(attributes)
+    if "test" in attributes:
+        event.test = get_test(attributes["test"])
+    if "suite" in attributes:
+        event.suite = get_suite(attributes["suite"])
+    if issubclass(event_class, _ReportEvent):
+        event.report = report
+    return event
+
+
 class AsyncEventManager(BaseEventManager):
     def __init__(self):
         BaseEventManager.__init__(self)
@@ -114,25 +255,45 @@ class AsyncEventManager(BaseEventManager):
         self._queue.put(event)
 
     def get_pending_failure(self):
+        if self._pending_failure[0] is None:
+            for channel in self._channels:
+                if channel.get_pending_failure()[0] is not None:
+                    return channel.get_pending_failure()
         return self._pending_failure
 
+    def _get_event_batch(self):
+        # wait for an event, then take the events that have been fired meanwhile
+        batch = [self._queue.get()]
+        while len(batch) < MAX_EVENT_BATCH_SIZE and batch[-1] is not None:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
     def _handler_loop(self):
         while True:
-            event = self._queue.get()
-            if event is None:
-                break
+            batch = self._get_event_batch()
+            end_of_events = batch[-1] is None
+            events = batch[:-1] if end_of_events else batch
             try:
-                self.handle_event(event)
+                if events:
+                    self.handle_event_batch(events)
             except Exception as excp:
                 self._pending_failure = excp, serialize_current_exception()
                 break
             finally:
-                self._queue.task_done()
+                for _ in batch:
+                    self._queue.task_done()
+            if end_of_events:
+                break
 
     @contextmanager
     def handle_events(self):
         self._queue = Queue()
 
+        for channel in self._channels:
+            channel.start()
         thread = threading.Thread(target=self._handler_loop)
         thread.start()
 
@@ -142,6 +303,9 @@ class AsyncEventManager(BaseEventManager):
             self._queue.put(None)
             thread.join()
             self._queue = None
+            # wait for the channels to handle the events that have been sent to them
+            for channel in self._channels:
+                channel.stop()
 
 
 class SyncEventManager(BaseEventManager):
@@ -151,38 +315,150 @@ class SyncEventManager(BaseEventManager):
         return self.handle_event(event)
 
 
+class EventChannel(object):
+    """
+    Run the listeners of the channel in a dedicated thread, fed through a queue of (at most max_size)
+    event batches. When the queue is full (the listeners are slower than the events are fired), the policy
+    tells what happens to a new batch:
+
+    - "block": the event manager waits for the channel to make room for the batch
+    - "drop_debug_logs": the debug logs of the batch are dropped, the event manager then waits for the
+      channel to make room for the remaining events
+    - "coalesce": the batch is merged into the last queued batch (the listeners then get bigger batches,
+      which is what listeners such as report savers want)
+
+    Outside AsyncEventManager.handle_events, events are passed to the listeners synchronously.
+    """
+    BLOCK = "block"
+    DROP_DEBUG_LOGS = "drop_debug_logs"
+    COALESCE = "coalesce"
+    POLICIES = BLOCK, DROP_DEBUG_LOGS, COALESCE
+
+    def __init__(self, name, max_size=100, policy=BLOCK):
+        if policy not in self.POLICIES:
+            raise ValueError("Invalid event channel policy '%s'" % policy)
+        self.name = name
+        self.max_size = max_size
+        self.policy = policy
+        self._event_manager = SyncEventManager()
+        self._batches = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pending_failure = None, None
+
+    def register_event(self, *event_classes):
+        self._event_manager.register_event(*event_classes)
+
+    def add_listener(self, listener):
+        self._event_manager.add_listener(listener)
+
+    def add_batch_listener(self, listener):
+        self._event_manager.add_batch_listener(listener)
+
+    def get_pending_failure(self):
+        return self._pending_failure
+
+    def _handle_event_batch(self, batch):
+        try:
+            self._event_manager.handle_event_batch(batch)
+        except Exception as excp:
+            self._pending_failure = excp, serialize_current_exception()
+
+    @staticmethod
+    def _is_debug_log(event):
+        return isinstance(event, LogEvent) and event.log_level == LOG_LEVEL_DEBUG
+
+    def on_events(self, batch):
+        if not self._thread:
+            self._handle_event_batch(batch)
+            return
+
+        with self._condition:
+            if self._pending_failure[0] is not None:
+                return  # the events are no longer handled
+            if len(self._batches) >= self.max_size:
+                if self.policy == self.COALESCE:
+                    self._batches[-1] = self._batches[-1] + batch
+                    return
+                if self.policy == self.DROP_DEBUG_LOGS:
+                    batch = [event for event in batch if not self._is_debug_log(event)]
+                    if not batch:
+                        return
+            while len(self._batches) >= self.max_size and self._pending_failure[0] is None:
+                self._condition.wait()
+            self._batches.append(batch)
+            self._condition.notify_all()
+
+    def _handler_loop(self):
+        while True:
+            with self._condition:
+                while not self._batches:
+                    self._condition.wait()
+                batch = self._batches.popleft()
+                self._condition.notify_all()
+            if batch is None:
+                break
+            if self._pending_failure[0] is None:
+                self._handle_event_batch(batch)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._handler_loop, name="event-channel-%s" % self.name)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._batches.append(None)
+            self._condition.notify_all()
+        self._thread.join()
+        self._thread = None
+
+
 ###
 # Events related to the test session
 ###
 
 class _ReportEvent(Event):
+    __slots__ = ("report",)
+
     def __init__(self, report, event_time=None):
         super(_ReportEvent, self).__init__(event_time)
         self.report = report
 
 
 class TestSessionStartEvent(_ReportEvent):
-    pass
+    __slots__ = ()
 
 
 class TestSessionEndEvent(_ReportEvent):
-    pass
+    __slots__ = ()
 
 
 class TestSessionSetupStartEvent(Event):
-    pass
+    __slots__ = ()
 
 
 class TestSessionSetupEndEvent(Event):
-    pass
+    __slots__ = ()
 
 
 class TestSessionTeardownStartEvent(Event):
-    pass
+    __slots__ = ()
 
 
 class TestSessionTeardownEndEvent(Event):
-    pass
+    __slots__ = ()
+
+
+class TaskTracesEvent(Event):
+    """
+    Fired once the tasks of the test session have been run, traces is a list of reporting.TaskTrace.
+    """
+    __slots__ = ("traces", "worker_prefix")
+
+    def __init__(self, traces, worker_prefix="", event_time=None):
+        super(TaskTracesEvent, self).__init__(event_time)
+        self.traces = traces
+        self.worker_prefix = worker_prefix
 
 
 ###
@@ -190,6 +466,8 @@ class TestSessionTeardownEndEvent(Event):
 ###
 
 class _SuiteEvent(Event):
+    __slots__ = ("suite",)
+
     def __init__(self, suite, event_time=None):
         super(_SuiteEvent, self).__init__(event_time)
         self.suite = suite
@@ -199,27 +477,27 @@ class _SuiteEvent(Event):
 
 
 class SuiteStartEvent(_SuiteEvent):
-    pass
+    __slots__ = ()
 
 
 class SuiteEndEvent(_SuiteEvent):
-    pass
+    __slots__ = ()
 
 
 class SuiteSetupStartEvent(_SuiteEvent):
-    pass
+    __slots__ = ()
 
 
 class SuiteSetupEndEvent(_SuiteEvent):
-    pass
+    __slots__ = ()
 
 
 class SuiteTeardownStartEvent(_SuiteEvent):
-    pass
+    __slots__ = ()
 
 
 class SuiteTeardownEndEvent(_SuiteEvent):
-    pass
+    __slots__ = ()
 
 
 ###
@@ -227,6 +505,8 @@ class SuiteTeardownEndEvent(_SuiteEvent):
 ###
 
 class _TestEvent(Event):
+    __slots__ = ("test",)
+
     def __init__(self, test, event_time=None):
         super(_TestEvent, self).__init__(event_time)
         self.test = test
@@ -236,39 +516,43 @@ class _TestEvent(Event):
 
 
 class TestStartEvent(_TestEvent):
-    pass
+    __slots__ = ()
 
 
 class TestEndEvent(_TestEvent):
-    pass
+    __slots__ = ()
 
 
 class TestSkippedEvent(_TestEvent):
+    __slots__ = ("skipped_reason",)
+
     def __init__(self, test, reason, event_time=None):
         super(TestSkippedEvent, self).__init__(test, event_time)
         self.skipped_reason = reason
 
 
 class TestDisabledEvent(_TestEvent):
+    __slots__ = ("disabled_reason",)
+
     def __init__(self, test, reason, event_time=None):
         super(TestDisabledEvent, self).__init__(test, event_time)
         self.disabled_reason = reason
 
 
 class TestSetupStartEvent(_TestEvent):
-    pass
+    __slots__ = ()
 
 
 class TestSetupEndEvent(_TestEvent):
-    pass
+    __slots__ = ()
 
 
 class TestTeardownStartEvent(_TestEvent):
-    pass
+    __slots__ = ()
 
 
 class TestTeardownEndEvent(_TestEvent):
-    pass
+    __slots__ = ()
 
 
 ###
@@ -276,12 +560,16 @@ class TestTeardownEndEvent(_TestEvent):
 ###
 
 class RuntimeEvent(Event):
+    __slots__ = ("location",)
+
     def __init__(self, location, event_time=None):
         super(RuntimeEvent, self).__init__(event_time)
         self.location = location
 
 
 class StepEvent(RuntimeEvent):
+    __slots__ = ("step_description", "detached")
+
     def __init__(self, location, description, detached=False, event_time=None):
         super(StepEvent, self).__init__(location, event_time)
         self.step_description = description
@@ -294,6 +582,8 @@ class StepEvent(RuntimeEvent):
 
 
 class StepEndEvent(RuntimeEvent):
+    __slots__ = ("step",)
+
     def __init__(self, location, step, event_time=None):
         super(StepEndEvent, self).__init__(location, event_time)
         self.step = step
@@ -303,15 +593,24 @@ class SteppedEvent(RuntimeEvent):
     """
     This event class cannot be instantiated directly and only serve has a base
     class for all events happening within a step.
+
+    These events being the most frequent ones, the sub classes set the time, location and step
+    attributes themselves instead of going through the constructors of their parent classes.
     """
+    __slots__ = ("step",)
+
     def __init__(self, location, step, event_time=None):
         super(SteppedEvent, self).__init__(location, event_time)
         self.step = step
 
 
 class LogEvent(SteppedEvent):
+    __slots__ = ("log_level", "log_message")
+
     def __init__(self, location, step, level, message, event_time=None):
-        super(LogEvent, self).__init__(location, step, event_time)
+        self.time = event_time or time.time()
+        self.location = location
+        self.step = step
         self.log_level = level
         self.log_message = message
 
@@ -322,8 +621,12 @@ class LogEvent(SteppedEvent):
 
 
 class CheckEvent(SteppedEvent):
+    __slots__ = ("check_description", "check_outcome", "check_details")
+
     def __init__(self, location, step, description, outcome, details=None, event_time=None):
-        super(CheckEvent, self).__init__(location, step, event_time)
+        self.time = event_time or time.time()
+        self.location = location
+        self.step = step
         self.check_description = description
         self.check_outcome = outcome
         self.check_details = details
@@ -336,8 +639,12 @@ class CheckEvent(SteppedEvent):
 
 
 class LogAttachmentEvent(SteppedEvent):
+    __slots__ = ("attachment_path", "attachment_description", "as_image")
+
     def __init__(self, location, step, path, description, as_image, event_time=None):
-        super(LogAttachmentEvent, self).__init__(location, step, event_time)
+        self.time = event_time or time.time()
+        self.location = location
+        self.step = step
         self.attachment_path = path
         self.attachment_description = description
         self.as_image = as_image
@@ -349,8 +656,12 @@ class LogAttachmentEvent(SteppedEvent):
 
 
 class LogUrlEvent(SteppedEvent):
+    __slots__ = ("url", "url_description")
+
     def __init__(self, location, step, url, description, event_time=None):
-        super(LogUrlEvent, self).__init__(location, step, event_time)
+        self.time = event_time or time.time()
+        self.location = location
+        self.step = step
         self.url = url
         self.url_description = description
 
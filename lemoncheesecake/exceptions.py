@@ -105,6 +105,10 @@ class TasksExecutionFailure(LemonCheesecakeException):
     pass
 
 
+class ProtocolError(LemonCheesecakeException):
+    pass
+
+
 class CircularDependencyError(LemonCheesecakeException):
     pass
 
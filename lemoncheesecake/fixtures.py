@@ -11,6 +11,7 @@ from lemoncheesecake.helpers.moduleimport import import_module, get_matching_fil
 from lemoncheesecake.exceptions import FixtureError, ProgrammingError
 from lemoncheesecake.helpers.orderedset import OrderedSet
 from lemoncheesecake.helpers.introspection import get_callable_args
+from lemoncheesecake.coroutines import is_async_generator, run_coroutine, resolve_coroutine
 
 __all__ = (
     "fixture",
@@ -47,26 +48,35 @@ def fixture(names=None, scope="test"):
 
 class FixtureResult(object):
     def __init__(self, result):
+        self._generator = None
+        self._async_generator = None
         if inspect.isgenerator(result):
             self._generator = result
             self._result = next(result)
+        elif is_async_generator(result):
+            self._async_generator = result
+            self._result = run_coroutine(result.__anext__())
         else:
-            self._generator = None
-            self._result = result
+            self._result = resolve_coroutine(result)
 
     def get(self):
         return self._result
 
     def teardown(self):
-        if not self._generator:
-            return
-
-        try:
-            next(self._generator)
-        except StopIteration:
-            pass
-        else:
-            raise FixtureError("The fixture yields more than once, only one yield is supported")
+        if self._generator:
+            try:
+                next(self._generator)
+            except StopIteration:
+                pass
+            else:
+                raise FixtureError("The fixture yields more than once, only one yield is supported")
+        elif self._async_generator:
+            try:
+                run_coroutine(self._async_generator.__anext__())
+            except StopAsyncIteration:
+                pass
+            else:
+                raise FixtureError("The fixture yields more than once, only one yield is supported")
 
 
 class BaseFixture(object):
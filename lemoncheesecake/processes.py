@@ -0,0 +1,474 @@
+'''
+Run the tests of a session within several (forked) worker processes.
+
+Each worker process runs its own subset of the top-level suites (with its own test session setup and
+teardown) and sends the events it fires back to the parent process, which feeds them to its own event manager
+so that a single report is built by the parent process.
+
+The worker processes are forked before the parent process starts any thread (see start_worker_processes): a forked
+process only gets a copy of the thread that forked it, the locks held by the other threads at that time would
+remain locked forever in the worker. The failures reported by the workers are recorded in the parent process
+so that its watchdog can tell all the workers to stop (--stop-on-failure).
+'''
+
+import os
+import multiprocessing
+import threading
+
+from six.moves.queue import Empty
+
+from lemoncheesecake import events
+from lemoncheesecake.consts import LOG_LEVEL_ERROR
+from lemoncheesecake.exceptions import UserError, TasksExecutionFailure, serialize_current_exception
+from lemoncheesecake.runtime import initialize_runtime, get_runtime, mark_location_as_failed
+from lemoncheesecake.task import BaseTask
+from lemoncheesecake.testtree import TreeLocation, flatten_suites, flatten_tests
+
+try:
+    _multiprocessing = multiprocessing.get_context("fork")
+except (AttributeError, ValueError):  # Python 2 (processes are always forked on POSIX) or no fork available
+    _multiprocessing = multiprocessing
+
+_MESSAGE_EVENT = 0
+_MESSAGE_ERROR = 1
+_MESSAGE_END = 2
+
+_PROCESS_POLLING_INTERVAL = 1
+
+
+def is_multiprocessing_available():
+    return hasattr(os, "fork")
+
+
+class _QueueEventManager(events.BaseEventManager):
+    """
+    Event manager used within worker processes: events are serialized and sent to the parent process.
+    """
+    def __init__(self, queue):
+        events.BaseEventManager.__init__(self)
+        self._queue = queue
+
+    def fire(self, event):
+        self._queue.put((_MESSAGE_EVENT, events.serialize_event(event)))
+
+    def get_pending_failure(self):
+        return None, None
+
+
+def _run_suites_in_worker(worker_num, suites, fixture_registry, prerun_session_scheduled_fixtures,
+                          force_disabled, stop_on_failure, nb_threads, previous_report, resource_limits,
+                          suite_affinity, max_open_suites, queue, stop_event):
+    # this function is called within the forked process
+    from lemoncheesecake.runner import RunContext, build_tasks, build_task_traces, get_task_durations_from_report
+    from lemoncheesecake.task import run_tasks
+    from lemoncheesecake.coroutines import get_max_concurrency
+
+    try:
+        parent_runtime = get_runtime()
+        event_manager = _QueueEventManager(queue)
+        initialize_runtime(
+            event_manager, parent_runtime.report_dir, parent_runtime.report,
+            attachment_prefix="p%d_" % worker_num
+        )
+        session_scheduled_fixtures = fixture_registry.get_fixtures_scheduled_for_session(
+            suites, prerun_session_scheduled_fixtures
+        )
+        tasks = build_tasks(suites, fixture_registry, session_scheduled_fixtures)
+        context = RunContext(event_manager, fixture_registry, force_disabled, stop_on_failure)
+        task_durations = get_task_durations_from_report(tasks, previous_report) if previous_report else None
+
+        def watchdog(task):
+            # the parent process tells the workers to stop when a test has failed in any of them
+            if stop_event.is_set():
+                return "tests have been aborted on --stop-on-failure"
+            return context.watchdog(task)
+
+        run_tasks(
+            tasks, context, nb_threads, watchdog, task_durations, resource_limits,
+            suite_affinity, max_open_suites, get_max_concurrency()
+        )
+        event_manager.fire(
+            events.TaskTracesEvent(build_task_traces(tasks), worker_prefix="process-%d/" % worker_num)
+        )
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        queue.put((_MESSAGE_ERROR, serialize_current_exception()))
+    finally:
+        queue.put((_MESSAGE_END, None))
+        queue.close()
+        queue.join_thread()
+
+
+class _MergedHookEvents(object):
+    """
+    Every worker process runs its own test session setup (or teardown): the start event of the first worker
+    and the end event of the last worker are the only ones that are forwarded to the parent event manager,
+    so that the report ends up with a single test session setup (or teardown).
+    """
+    def __init__(self, start_event_class, end_event_class, worker_nums):
+        self.start_event_class = start_event_class
+        self.end_event_class = end_event_class
+        self._pending_workers = set(worker_nums)
+        self._started = False
+        self._last_end_event = None
+
+    def _flush(self):
+        if not self._pending_workers and self._last_end_event:
+            event, self._last_end_event = self._last_end_event, None
+            return [event]
+        return []
+
+    def handle_event(self, worker_num, event):
+        if isinstance(event, self.start_event_class):
+            if self._started:
+                return []
+            self._started = True
+            return [event]
+        else:
+            self._pending_workers.discard(worker_num)
+            self._last_end_event = event
+            return self._flush()
+
+    def handle_worker_end(self, worker_num):
+        self._pending_workers.discard(worker_num)
+        return self._flush()
+
+
+class _WorkerProgress(object):
+    """
+    What a worker has reported of the suites it runs, so that the tests and suites it has left unreported
+    can be completed if the worker dies.
+    """
+    _HOOK_END_EVENT_CLASSES = {
+        events.SuiteSetupStartEvent: events.SuiteSetupEndEvent,
+        events.SuiteTeardownStartEvent: events.SuiteTeardownEndEvent
+    }
+
+    def __init__(self):
+        self._started_suites = set()
+        self._ended_suites = set()
+        self._started_tests = set()
+        self._ended_tests = set()
+        # (suite, hook end event class) of the suite setups/teardowns that have been started but not ended
+        self._open_hooks = set()
+
+    def record(self, event):
+        if isinstance(event, events.SuiteStartEvent):
+            self._started_suites.add(event.suite)
+        elif isinstance(event, events.SuiteEndEvent):
+            self._ended_suites.add(event.suite)
+        elif isinstance(event, events.TestStartEvent):
+            self._started_tests.add(event.test)
+        elif isinstance(event, (events.TestEndEvent, events.TestSkippedEvent, events.TestDisabledEvent)):
+            self._ended_tests.add(event.test)
+        elif isinstance(event, tuple(self._HOOK_END_EVENT_CLASSES)):
+            self._open_hooks.add((event.suite, self._HOOK_END_EVENT_CLASSES[event.__class__]))
+        elif isinstance(event, tuple(self._HOOK_END_EVENT_CLASSES.values())):
+            self._open_hooks.discard((event.suite, event.__class__))
+
+    @staticmethod
+    def _interrupt(location, event_manager, reason):
+        step = "Interruption"
+        event_manager.fire(events.StepEvent(location, step))
+        event_manager.fire(events.LogEvent(location, step, LOG_LEVEL_ERROR, "Interrupted because %s" % reason))
+        mark_location_as_failed(location)
+
+    def _end_hook(self, suite, location, end_event_class, event_manager, reason):
+        if (suite, end_event_class) in self._open_hooks:
+            self._interrupt(location, event_manager, reason)
+            event_manager.fire(end_event_class(suite))
+
+    def complete_suite(self, suite, event_manager, reason):
+        if suite in self._ended_suites:
+            return
+        if suite not in self._started_suites:
+            _skip_suite(suite, event_manager, reason)
+            return
+
+        self._end_hook(
+            suite, TreeLocation.in_suite_setup(suite), events.SuiteSetupEndEvent, event_manager, reason
+        )
+        for test in suite.get_tests():
+            if test in self._ended_tests:
+                continue
+            if test in self._started_tests:
+                self._interrupt(TreeLocation.in_test(test), event_manager, reason)
+                event_manager.fire(events.TestEndEvent(test))
+            else:
+                event_manager.fire(events.TestSkippedEvent(test, "Test skipped because %s" % reason))
+                mark_location_as_failed(TreeLocation.in_test(test))
+        for sub_suite in suite.get_suites():
+            self.complete_suite(sub_suite, event_manager, reason)
+        self._end_hook(
+            suite, TreeLocation.in_suite_teardown(suite), events.SuiteTeardownEndEvent, event_manager, reason
+        )
+        event_manager.fire(events.SuiteEndEvent(suite))
+
+
+class _EventForwarder(object):
+    def __init__(self, suites, session_setup_worker_nums):
+        self._tests = {test.path: test for test in flatten_tests(suites)}
+        self._suites = {suite.path: suite for suite in flatten_suites(suites)}
+        self._merged_hooks = (
+            _MergedHookEvents(
+                events.TestSessionSetupStartEvent, events.TestSessionSetupEndEvent, session_setup_worker_nums
+            ),
+            _MergedHookEvents(
+                events.TestSessionTeardownStartEvent, events.TestSessionTeardownEndEvent, session_setup_worker_nums
+            )
+        )
+        self._lock = threading.Lock()
+        # worker num => _WorkerProgress
+        self._worker_progresses = {}
+        # set to tell the workers to stop running tests, it is created before the workers are forked
+        self.stop_event = _multiprocessing.Event()
+
+    def _unserialize_event(self, serialized_event):
+        return events.unserialize_event(serialized_event, self._tests.__getitem__, self._suites.__getitem__)
+
+    @staticmethod
+    def _record_failure(event):
+        # the failures are recorded by the runtime of the worker where they happen, they are recorded as well
+        # by the parent's runtime so that they are seen by the parent's watchdog
+        if isinstance(event, events.LogEvent) and event.log_level == LOG_LEVEL_ERROR:
+            mark_location_as_failed(event.location)
+        elif isinstance(event, events.CheckEvent) and event.check_outcome is False:
+            mark_location_as_failed(event.location)
+        elif isinstance(event, events.TestSkippedEvent):
+            mark_location_as_failed(TreeLocation.in_test(event.test))
+
+    def forward(self, event_manager, worker_num, serialized_event):
+        event = self._unserialize_event(serialized_event)
+        self._record_failure(event)
+        with self._lock:
+            self._worker_progresses.setdefault(worker_num, _WorkerProgress()).record(event)
+            for merged_hook in self._merged_hooks:
+                if isinstance(event, (merged_hook.start_event_class, merged_hook.end_event_class)):
+                    for event_to_fire in merged_hook.handle_event(worker_num, event):
+                        event_manager.fire(event_to_fire)
+                    break
+            else:
+                event_manager.fire(event)
+
+    def stop_workers(self):
+        self.stop_event.set()
+
+    def complete_worker_suites(self, event_manager, worker_num, suites, reason):
+        """
+        Fire the events that the (dead) worker has not fired for the given suites: their tests that have not been
+        run are skipped, the tests and hooks that have been interrupted fail and their suites are ended.
+        """
+        with self._lock:
+            progress = self._worker_progresses.get(worker_num, _WorkerProgress())
+            for suite in suites:
+                progress.complete_suite(suite, event_manager, reason)
+
+    def end_worker(self, event_manager, worker_num):
+        with self._lock:
+            for merged_hook in self._merged_hooks:
+                for event_to_fire in merged_hook.handle_worker_end(worker_num):
+                    event_manager.fire(event_to_fire)
+
+
+def _skip_suite(suite, event_manager, reason):
+    event_manager.fire(events.SuiteStartEvent(suite))
+    for test in suite.get_tests():
+        event_manager.fire(events.TestSkippedEvent(test, "Test skipped because %s" % reason))
+        mark_location_as_failed(TreeLocation.in_test(test))
+    for sub_suite in suite.get_suites():
+        _skip_suite(sub_suite, event_manager, reason)
+    event_manager.fire(events.SuiteEndEvent(suite))
+
+
+class WorkerProcessTask(BaseTask):
+    def __init__(self, worker_num, suites, prerun_session_scheduled_fixtures, nb_threads, event_forwarder,
+                 previous_report=None, resource_limits=None, suite_affinity=False, max_open_suites=None):
+        BaseTask.__init__(self)
+        self.worker_num = worker_num
+        self.suites = suites
+        self.prerun_session_scheduled_fixtures = prerun_session_scheduled_fixtures
+        self.nb_threads = nb_threads
+        self.event_forwarder = event_forwarder
+        self.previous_report = previous_report
+        self.resource_limits = resource_limits
+        self.suite_affinity = suite_affinity
+        self.max_open_suites = max_open_suites
+        self._queue = None
+        self._process = None
+
+    def start(self, context):
+        self._queue = _multiprocessing.Queue()
+        self._process = _multiprocessing.Process(
+            target=_run_suites_in_worker,
+            args=(
+                self.worker_num, self.suites, context.fixture_registry, self.prerun_session_scheduled_fixtures,
+                context.force_disabled, context.stop_on_failure, self.nb_threads, self.previous_report,
+                self.resource_limits, self.suite_affinity, self.max_open_suites, self._queue,
+                self.event_forwarder.stop_event
+            )
+        )
+        self._process.start()
+
+    def run(self, context):
+        if self._process is None:
+            self.start(context)
+        queue, process = self._queue, self._process
+
+        error = None
+        try:
+            while True:
+                try:
+                    message_type, message = queue.get(timeout=_PROCESS_POLLING_INTERVAL)
+                except Empty:
+                    if process.is_alive():
+                        continue
+                    error = "worker process exited unexpectedly with code %s" % process.exitcode
+                    break
+                if message_type == _MESSAGE_EVENT:
+                    self.event_forwarder.forward(context.event_manager, self.worker_num, message)
+                    if context.watchdog(self):
+                        self.event_forwarder.stop_workers()
+                elif message_type == _MESSAGE_ERROR:
+                    error = message
+                else:
+                    break
+        finally:
+            process.join()
+            if error:
+                # what the worker has not reported of its suites will never be
+                self.event_forwarder.complete_worker_suites(
+                    context.event_manager, self.worker_num, self.suites,
+                    "worker process #%d failed" % self.worker_num
+                )
+            self.event_forwarder.end_worker(context.event_manager, self.worker_num)
+
+        if error:
+            raise TasksExecutionFailure("Worker process #%d failed: %s" % (self.worker_num, error))
+
+    def skip(self, context, reason=""):
+        if self._process is not None:
+            # the worker has been started beforehand, its events are no longer expected
+            self._process.terminate()
+            self._process.join()
+        for suite in self.suites:
+            _skip_suite(suite, context.event_manager, reason)
+        self.event_forwarder.end_worker(context.event_manager, self.worker_num)
+
+    def __str__(self):
+        return "<%s #%d>" % (self.__class__.__name__, self.worker_num)
+
+
+def start_worker_processes(tasks, context):
+    """
+    Fork the worker processes of the given WorkerProcessTask's, this must be done before the parent process starts
+    any thread (such as the threads of the event manager or of the task pool).
+    """
+    for task in tasks:
+        task.start(context)
+
+
+def get_linked_suites(suites):
+    """
+    Group top-level suites whose tests depend on each other (the groups and their suites follow the order
+    of suites).
+    """
+    # group suites linked by a test dependency using a union-find structure
+    suite_ranks = {suite: rank for rank, suite in enumerate(suites)}
+    parents = {suite: suite for suite in suites}
+
+    def find(suite):
+        while parents[suite] is not suite:
+            parents[suite] = parents[parents[suite]]
+            suite = parents[suite]
+        return suite
+
+    test_suites = {}
+    for suite in suites:
+        for test in flatten_tests([suite]):
+            test_suites[test.path] = suite
+
+    for test in flatten_tests(suites):
+        for dep_test_path in test.dependencies:
+            try:
+                dep_suite = test_suites[dep_test_path]
+            except KeyError:
+                raise UserError(
+                    "Cannot find dependency test '%s' for '%s', "
+                    "either the test does not exist or is not going to be run" % (dep_test_path, test.path)
+                )
+            parents[find(test_suites[test.path])] = find(dep_suite)
+
+    linked_suites = {}
+    for suite in suites:
+        linked_suites.setdefault(find(suite), []).append(suite)
+
+    return sorted(linked_suites.values(), key=lambda cluster: suite_ranks[cluster[0]])
+
+
+def split_suites(suites, nb_groups):
+    """
+    Split top-level suites into (at most) nb_groups groups having a similar number of tests. Suites
+    whose tests depend on each other are kept within the same group.
+    """
+    suite_ranks = {suite: rank for rank, suite in enumerate(suites)}
+
+    # distribute the suite "clusters" over the groups, biggest cluster first
+    clusters = sorted(
+        get_linked_suites(suites),
+        key=lambda cluster: (-len(list(flatten_tests(cluster))), suite_ranks[cluster[0]])
+    )
+    groups = [[] for _ in range(nb_groups)]
+    loads = [0] * nb_groups
+    for cluster in clusters:
+        idx = loads.index(min(loads))
+        groups[idx].extend(cluster)
+        loads[idx] += len(list(flatten_tests(cluster)))
+
+    return [sorted(group, key=suite_ranks.__getitem__) for group in groups if group]
+
+
+def get_used_resources(suites):
+    return set(name for test in flatten_tests(suites) for name in test.get_resources())
+
+
+def split_resource_limits(resource_limits, worker_resources):
+    """
+    Split the resource limits over workers enforcing their own limits, so that the workers all together do not
+    use more tokens of a resource than its limit. worker_resources gives for each worker the names of the resources
+    its tests may use, a resource is only split over the workers that may use it.
+    """
+    worker_limits = [{} for _ in worker_resources]
+    for name, limit in (resource_limits or {}).items():
+        workers = [idx for idx, resources in enumerate(worker_resources) if name in resources]
+        if not workers:
+            continue
+        if limit < len(workers):
+            raise UserError(
+                "The limit of resource '%s' (%d) cannot be split over the %d workers that may use it, "
+                "the number of workers must be lowered" % (name, limit, len(workers))
+            )
+        for rank, idx in enumerate(workers):
+            worker_limits[idx][name] = limit // len(workers) + (1 if rank < limit % len(workers) else 0)
+    return worker_limits
+
+
+def build_worker_process_tasks(suites, fixture_registry, prerun_session_scheduled_fixtures, nb_processes, nb_threads,
+                               previous_report=None, resource_limits=None, suite_affinity=False,
+                               max_open_suites=None):
+    groups = split_suites(suites, nb_processes)
+    worker_nums = list(range(1, len(groups) + 1))
+    session_setup_worker_nums = [
+        worker_num for worker_num, group in zip(worker_nums, groups)
+        if not fixture_registry.get_fixtures_scheduled_for_session(group, prerun_session_scheduled_fixtures).is_empty()
+    ]
+    event_forwarder = _EventForwarder(suites, session_setup_worker_nums)
+    worker_resource_limits = split_resource_limits(resource_limits, [get_used_resources(group) for group in groups])
+
+    return [
+        WorkerProcessTask(
+            worker_num, group, prerun_session_scheduled_fixtures, nb_threads, event_forwarder, previous_report,
+            worker_limits, suite_affinity, max_open_suites
+        )
+        for worker_num, group, worker_limits in zip(worker_nums, groups, worker_resource_limits)
+    ]
@@ -85,15 +85,23 @@ class ProjectConfiguration:
         """Indicate, whether or not if the project can be ran on multiple threads"""
         return True
 
+    def get_resource_limits(self):
+        """
+        Return a dict mapping the name of a shared resource (see ``lcc.uses_resource``) to the number of tokens
+        available, i.e the maximum number of tests using the resource that can run at the same time
+        """
+        return {}
+
 
 class SimpleProjectConfiguration(ProjectConfiguration):
     def __init__(self, suites_dir, fixtures_dir=None, report_title=None,
-                 threaded=True, hide_command_line_in_report=False):
+                 threaded=True, hide_command_line_in_report=False, resource_limits=None):
         self._suites_dir = suites_dir
         self._fixtures_dir = fixtures_dir
         self._report_title = report_title
         self._threaded = threaded
         self._hide_command_line_in_report = hide_command_line_in_report
+        self._resource_limits = resource_limits or {}
         self.console_backend = ConsoleBackend()
         self.json_backend = JsonBackend()
         self.xml_backend = XmlBackend()
@@ -127,6 +135,9 @@ class SimpleProjectConfiguration(ProjectConfiguration):
     def is_threaded(self):
         return self._threaded
 
+    def get_resource_limits(self):
+        return self._resource_limits
+
     def get_report_info(self):
         info = []
         if not self._hide_command_line_in_report:
@@ -169,6 +180,13 @@ class Project:
     def is_threaded(self):
         return self._config.is_threaded()
 
+    def get_resource_limits(self):
+        resource_limits = self._config.get_resource_limits()
+        for name, limit in resource_limits.items():
+            if limit < 1:
+                raise ProjectError("Invalid limit %s for resource '%s', it must be at least 1" % (limit, name))
+        return resource_limits
+
     def run_pre_session_hook(self, cli_args, report_dir):
         if isinstance(self._config, HasPreRunHook):
             self._config.pre_run(cli_args, report_dir)
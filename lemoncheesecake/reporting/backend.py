@@ -6,6 +6,7 @@ Created on Mar 29, 2016
 
 import os
 import os.path as osp
+import threading
 
 from lemoncheesecake.exceptions import InvalidReportFile, ProgrammingError
 from lemoncheesecake.helpers.introspection import object_has_method
@@ -25,7 +26,17 @@ CAPABILITY_LOAD_REPORT = 0x4
 
 
 class ReportingSession(object):
-    pass
+    """
+    The reporting sessions are run in their own event channel thread (see events.EventChannel) while the report
+    is being built by the report writer from another thread: a session must read the report while holding
+    the report's lock (and should do its I/O without it, so that the report writer is not delayed).
+    """
+    # whether the session handles the events by batch through its on_events method (see
+    # events.BaseEventManager.add_batch_listener) instead of through its on_<event name> methods
+    handles_event_batches = False
+    # the policy of the event channel the session is run in (see events.EventChannel), by default "coalesce"
+    # for sessions that handle events by batch and "block" for the others
+    event_channel_policy = None
 
 
 class ReportingBackend(object):
@@ -52,36 +63,162 @@ class ReportingBackend(object):
 #         method_not_implemented("unserialize_report", self)
 
 
+_SAVING_EVENT_CLASSES = (
+    events.TestSessionSetupEndEvent, events.TestSessionTeardownEndEvent,
+    events.SuiteSetupEndEvent, events.SuiteTeardownEndEvent, events.TestEndEvent, events.SuiteEndEvent,
+    events.LogEvent, events.LogAttachmentEvent, events.LogUrlEvent, events.CheckEvent
+)
+
+
+class _ReportSaver(object):
+    """
+    Save the report of a FileReportSession from a dedicated thread. Save requests are coalesced: the requests
+    made while the report is being saved result in a single new save.
+    """
+    def __init__(self, session):
+        self.session = session
+        self._condition = threading.Condition()
+        self._save_requested = False
+        self._saving = False
+        self._stopped = False
+        self._failure = None
+        self._thread = threading.Thread(target=self._save_loop, name="report-saver")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _save_loop(self):
+        while True:
+            with self._condition:
+                while not (self._save_requested or self._stopped):
+                    self._condition.wait()
+                if not self._save_requested:
+                    break
+                self._save_requested = False
+                self._saving = True
+            try:
+                self.session._save()
+            except Exception as excp:
+                self._failure = excp
+            finally:
+                with self._condition:
+                    self._saving = False
+                    self._condition.notify_all()
+
+    def _raise_failure(self):
+        if self._failure is not None:
+            failure, self._failure = self._failure, None
+            raise failure
+
+    def request_save(self):
+        self._raise_failure()
+        with self._condition:
+            self._save_requested = True
+            self._condition.notify_all()
+
+    def wait(self):
+        with self._condition:
+            while self._save_requested or self._saving:
+                self._condition.wait()
+        self._raise_failure()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._raise_failure()
+
+
+def _replace_file(src, dst):
+    # os.replace is not available on Python 2, where os.rename is atomic (but not on Windows)
+    getattr(os, "replace", os.rename)(src, dst)
+
+
 class FileReportSession(ReportingSession):
-    def __init__(self, report_filename, report, reporting_backend, report_saving_strategy):
+    """
+    Save the report according to the report saving strategy. Unless background_saving is disabled,
+    the report is saved from a dedicated thread (see _ReportSaver) and the final save of the report
+    is waited for when the test session ends.
+
+    Only a snapshot of the report is taken while holding the report's lock (and thus while the report writer
+    is locked out), the snapshot is then serialized and written into a temporary file, which replaces the report
+    file once complete, without the lock.
+    """
+    handles_event_batches = True
+
+    def __init__(self, report_filename, report, reporting_backend, report_saving_strategy, background_saving=True):
         self.report_filename = report_filename
         self.report = report
         self.reporting_backend = reporting_backend
         self.report_saving_strategy = report_saving_strategy
+        self.background_saving = background_saving
+        self._saver = None
+
+    def _snapshot_report(self):
+        """
+        Called while holding the report's lock, return what _serialize_snapshot needs to serialize the report
+        or None if the backend can only save the report into a file.
+        By default, the snapshot is the serialized report itself.
+        """
+        return self.reporting_backend.serialize_report(self.report)
+
+    def _write_snapshot(self, snapshot, fh):
+        fh.write(snapshot)
+
+    def _end(self):
+        """
+        Called once the report has been saved for the last time, when the test session ends.
+        """
+        pass
 
     def _save(self):
-        self.reporting_backend.save_report(self.report_filename, self.report)
-
-    def _handle_event(self, event):
-        report_must_be_saved = self.report_saving_strategy and self.report_saving_strategy(event, self.report)
-        if report_must_be_saved:
-            self._save()
-
-    on_test_session_setup_end = _handle_event
-    on_test_session_teardown_end = _handle_event
-    on_suite_setup_end = _handle_event
-    on_suite_teardown_end = _handle_event
-    on_test_end = _handle_event
-    on_suite_end = _handle_event
-    on_log = _handle_event
-    on_log_attachment = _handle_event
-    on_log_url = _handle_event
-    on_check = _handle_event
-
-    def on_test_session_end(self, event):
-        # no matter what is the report_saving_strategy,
-        # the report will always be saved at the end of tests
-        self._save()
+        tmp_filename = self.report_filename + ".tmp"
+        with self.report.lock:
+            snapshot = self._snapshot_report()
+            if snapshot is None:
+                # the backend does not support serialization, the report is then saved while holding the lock
+                self.reporting_backend.save_report(tmp_filename, self.report)
+        if snapshot is not None:
+            with open(tmp_filename, "w") as fh:
+                self._write_snapshot(snapshot, fh)
+        _replace_file(tmp_filename, self.report_filename)
+
+    def _must_be_saved(self, event):
+        if isinstance(event, events.TestSessionEndEvent):
+            # no matter what is the report_saving_strategy,
+            # the report will always be saved at the end of tests
+            return True
+        return bool(
+            self.report_saving_strategy and isinstance(event, _SAVING_EVENT_CLASSES) and
+            self.report_saving_strategy(event, self.report)
+        )
+
+    def on_events(self, batch):
+        # the report is saved (at most) once per batch of events
+        with self.report.lock:
+            must_be_saved = any(self._must_be_saved(event) for event in batch)
+        if not must_be_saved:
+            return
+
+        is_session_end = any(isinstance(event, events.TestSessionEndEvent) for event in batch)
+
+        if not self.background_saving:
+            try:
+                self._save()
+            finally:
+                if is_session_end:
+                    self._end()
+            return
+
+        if self._saver is None:
+            self._saver = _ReportSaver(self)
+        self._saver.request_save()
+        if is_session_end:
+            saver, self._saver = self._saver, None
+            try:
+                saver.stop()
+            finally:
+                self._end()
 
 
 class FileReportBackend(ReportingBackend):
@@ -91,6 +228,12 @@ class FileReportBackend(ReportingBackend):
     def save_report(self, filename, report):
         raise NotImplemented()
 
+    def serialize_report(self, report):
+        """
+        Return the content of the report file, or None if the backend can only save the report into a file.
+        """
+        return None
+
     def create_reporting_session(self, report_dir, report, parallel, report_saving_strategy=None):
         return FileReportSession(
             os.path.join(report_dir, self.get_report_filename()), report, self, report_saving_strategy
@@ -174,10 +174,11 @@ class SequentialConsoleReportingSession(ReportingSession):
         self.previous_obj = event.test
 
     def on_test_end(self, event):
-        test_data = self.report.get_test(event.test)
+        with self.report.lock:
+            status = self.report.get_test(event.test).status
 
         line, raw_line_len = _make_test_result_line(
-            self.get_test_label(event.test), self.current_test_idx, test_data.status
+            self.get_test_label(event.test), self.current_test_idx, status
         )
 
         self.lp.print_line(line, force_len=raw_line_len)
@@ -204,7 +205,9 @@ class SequentialConsoleReportingSession(ReportingSession):
         self.lp.print_line("%s (%s...)" % (self.step_prefix, ensure_single_line_text(event.step_description)))
 
     def on_test_session_end(self, event):
-        _print_summary(self.report.stats(), self.report.parallelized)
+        with self.report.lock:
+            stats = self.report.stats()
+        _print_summary(stats, self.report.parallelized)
 
 
 class ParallelConsoleReportingSession(ReportingSession):
@@ -216,10 +219,11 @@ class ParallelConsoleReportingSession(ReportingSession):
         self.current_test_idx = 1
 
     def on_test_end(self, event):
-        test_data = self.report.get_test(event.test)
+        with self.report.lock:
+            status = self.report.get_test(event.test).status
 
         line, _ = _make_test_result_line(
-            event.test.path, self.current_test_idx, test_data.status
+            event.test.path, self.current_test_idx, status
         )
 
         print(line)
@@ -238,7 +242,9 @@ class ParallelConsoleReportingSession(ReportingSession):
         self._bypass_test(event.test, "disabled")
 
     def on_test_session_end(self, event):
-        _print_summary(self.report.stats(), self.report.parallelized)
+        with self.report.lock:
+            stats = self.report.stats()
+        _print_summary(stats, self.report.parallelized)
 
 
 class ConsoleBackend(ReportingBackend):
@@ -4,23 +4,32 @@ Created on Mar 27, 2016
 @author: nicolas
 '''
 
-import re
+import os
 import json
 from collections import OrderedDict
 
+import six
+
 import lemoncheesecake
-from lemoncheesecake.reporting.backend import BoundReport, FileReportBackend
+from lemoncheesecake.reporting.backend import BoundReport, FileReportBackend, FileReportSession
 from lemoncheesecake.reporting.report import (
-    Log, Check, Attachment, Url, Step, TestResult, SetupResult, SuiteResult,
+    Log, Check, Attachment, Url, Step, TestResult, SetupResult, SuiteResult, TaskTrace,
     format_timestamp, parse_timestamp
 )
 from lemoncheesecake.exceptions import InvalidReportFile, ProgrammingError
 
 JS_PREFIX = "var reporting_data = "
 
+REPORT_VERSION = 1.0
+# the report version where the timestamps are stored as seconds since epoch (floats) instead of strings,
+# such reports are faster to save and load but cannot be displayed by the HTML report
+EPOCH_TIMESTAMPS_REPORT_VERSION = 1.1
+
 
-def _serialize_time(ts):
-    return format_timestamp(ts) if ts else None
+def _serialize_time(ts, epoch_timestamps=False):
+    if not ts:
+        return None
+    return ts if epoch_timestamps else format_timestamp(ts)
 
 
 def _dict(*args):
@@ -32,13 +41,13 @@ def _dict(*args):
     return d
 
 
-def _serialize_steps(steps):
+def _serialize_steps(steps, epoch_timestamps=False):
     json_steps = []
     for step in steps:
         json_step = _dict(
             "description", step.description,
-            "start_time", _serialize_time(step.start_time),
-            "end_time", _serialize_time(step.end_time),
+            "start_time", _serialize_time(step.start_time, epoch_timestamps),
+            "end_time", _serialize_time(step.end_time, epoch_timestamps),
             "entries", []
         )
         json_steps.append(json_step)
@@ -48,7 +57,7 @@ def _serialize_steps(steps):
                     "type", "log",
                     "level", entry.level,
                     "message", entry.message,
-                    "time", _serialize_time(entry.time)
+                    "time", _serialize_time(entry.time, epoch_timestamps)
                 )
             elif isinstance(entry, Attachment):
                 entry = _dict(
@@ -56,14 +65,14 @@ def _serialize_steps(steps):
                     "description", entry.description,
                     "filename", entry.filename,
                     "as_image", entry.as_image,
-                    "time", _serialize_time(entry.time)
+                    "time", _serialize_time(entry.time, epoch_timestamps)
                 )
             elif isinstance(entry, Url):
                 entry = _dict(
                     "type", "url",
                     "description", entry.description,
                     "url", entry.url,
-                    "time", _serialize_time(entry.time)
+                    "time", _serialize_time(entry.time, epoch_timestamps)
                 )
             else:  # TestCheck
                 entry = _dict(
@@ -71,7 +80,7 @@ def _serialize_steps(steps):
                     "description", entry.description,
                     "outcome", entry.outcome,
                     "details", entry.details,
-                    "time", _serialize_time(entry.time)
+                    "time", _serialize_time(entry.time, epoch_timestamps)
                 )
             json_step["entries"].append(entry)
     return json_steps
@@ -82,54 +91,73 @@ def _serialize_common_data(obj):
         "name", obj.name, "description", obj.description,
         "tags", obj.tags,
         "properties", obj.properties,
-        "links", [_dict("name", link[1], "url", link[0]) for link in obj.links]
+        "links", [_dict("name", link[1], "url", link[0]) for link in obj.links],
+        "rank", obj.rank
     )
 
 
-def _serialize_test_data(test):
+def _serialize_test_data(test, epoch_timestamps=False):
     serialized = _serialize_common_data(test)
     serialized.update(_dict(
-        "start_time", _serialize_time(test.start_time),
-        "end_time", _serialize_time(test.end_time),
-        "steps", _serialize_steps(test.steps),
+        "start_time", _serialize_time(test.start_time, epoch_timestamps),
+        "end_time", _serialize_time(test.end_time, epoch_timestamps),
+        "steps", _serialize_steps(test.steps, epoch_timestamps),
         "status", test.status,
         "status_details", test.status_details
     ))
     return serialized
 
 
-def _serialize_hook_data(hook_data):
+def _serialize_hook_data(hook_data, epoch_timestamps=False):
     return _dict(
-        "start_time", _serialize_time(hook_data.start_time),
-        "end_time", _serialize_time(hook_data.end_time),
-        "steps", _serialize_steps(hook_data.steps),
+        "start_time", _serialize_time(hook_data.start_time, epoch_timestamps),
+        "end_time", _serialize_time(hook_data.end_time, epoch_timestamps),
+        "steps", _serialize_steps(hook_data.steps, epoch_timestamps),
         "outcome", hook_data.outcome
     )
 
 
-def _serialize_suite_data(suite):
+def _serialize_suite_data(suite, serialize_test=None, serialize_suite=None, epoch_timestamps=False):
     json_suite = _serialize_common_data(suite)
     json_suite.update(_dict(
-        "start_time", _serialize_time(suite.start_time),
-        "end_time", _serialize_time(suite.end_time),
-        "tests", [_serialize_test_data(t) for t in suite.get_tests()],
-        "suites", [_serialize_suite_data(s) for s in suite.get_suites()]
+        "start_time", _serialize_time(suite.start_time, epoch_timestamps),
+        "end_time", _serialize_time(suite.end_time, epoch_timestamps),
+        "tests", [
+            serialize_test(t) if serialize_test else _serialize_test_data(t, epoch_timestamps)
+            for t in suite.get_tests()
+        ],
+        "suites", [
+            serialize_suite(s) if serialize_suite else _serialize_suite_data(s, epoch_timestamps=epoch_timestamps)
+            for s in suite.get_suites()
+        ]
     ))
     if suite.suite_setup:
-        json_suite["suite_setup"] = _serialize_hook_data(suite.suite_setup)
+        json_suite["suite_setup"] = _serialize_hook_data(suite.suite_setup, epoch_timestamps)
     if suite.suite_teardown:
-        json_suite["suite_teardown"] = _serialize_hook_data(suite.suite_teardown)
+        json_suite["suite_teardown"] = _serialize_hook_data(suite.suite_teardown, epoch_timestamps)
 
     return json_suite
 
 
-def serialize_report_into_json(report):
+def _serialize_task_trace(trace, epoch_timestamps=False):
+    return _dict(
+        "name", trace.name,
+        "category", trace.category,
+        "ready_time", _serialize_time(trace.ready_time, epoch_timestamps),
+        "start_time", _serialize_time(trace.start_time, epoch_timestamps),
+        "end_time", _serialize_time(trace.end_time, epoch_timestamps),
+        "worker", trace.worker,
+        "dependencies", trace.dependencies
+    )
+
+
+def _serialize_report(report, serialize_suite, epoch_timestamps=False):
     serialized = _dict(
         "lemoncheesecake_version", lemoncheesecake.__version__,
-        "lemoncheesecake_report_version", 1.0,
-        "start_time", _serialize_time(report.start_time),
-        "end_time", _serialize_time(report.end_time),
-        "generation_time", _serialize_time(report.report_generation_time),
+        "lemoncheesecake_report_version", EPOCH_TIMESTAMPS_REPORT_VERSION if epoch_timestamps else REPORT_VERSION,
+        "start_time", _serialize_time(report.start_time, epoch_timestamps),
+        "end_time", _serialize_time(report.end_time, epoch_timestamps),
+        "generation_time", _serialize_time(report.report_generation_time, epoch_timestamps),
         "nb_threads", report.nb_threads,
         "title", report.title,
         "info", [[n, v] for n, v in report.info],
@@ -137,47 +165,249 @@ def serialize_report_into_json(report):
     )
 
     if report.test_session_setup:
-        serialized["test_session_setup"] = _serialize_hook_data(report.test_session_setup)
+        serialized["test_session_setup"] = _serialize_hook_data(report.test_session_setup, epoch_timestamps)
 
-    serialized["suites"] = [_serialize_suite_data(s) for s in report.get_suites()]
+    serialized["suites"] = [serialize_suite(s) for s in report.get_suites()]
 
     if report.test_session_teardown:
-        serialized["test_session_teardown"] = _serialize_hook_data(report.test_session_teardown)
+        serialized["test_session_teardown"] = _serialize_hook_data(report.test_session_teardown, epoch_timestamps)
+
+    if report.task_traces:
+        serialized["task_traces"] = [
+            _serialize_task_trace(trace, epoch_timestamps) for trace in report.task_traces
+        ]
 
     return serialized
 
 
-def save_report_into_file(data, filename, javascript_compatibility=True, pretty_formatting=False):
-    report = serialize_report_into_json(data)
+def serialize_report_into_json(report, epoch_timestamps=False):
+    return _serialize_report(
+        report, lambda suite: _serialize_suite_data(suite, epoch_timestamps=epoch_timestamps), epoch_timestamps
+    )
+
+
+class _JsonFragmentStore(object):
+    """
+    A file the JSON of the ended tests is appended to, so that it does not stay in memory until the end
+    of the test session (the ended tests may also have had their steps spilled to disk, see StepSpiller).
+    The file is created upon the first append.
+    """
+    _COPY_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._fh = None
+        self._size = 0
+
+    def append(self, text):
+        # type: (str) -> tuple
+        if self._fh is None:
+            self._fh = open(self.filename, "w+b")
+        data = text.encode("utf-8")
+        self._fh.seek(0, os.SEEK_END)
+        self._fh.write(data)
+        location = self._size, len(data)
+        self._size += len(data)
+        return location
+
+    def copy(self, location, write):
+        offset, length = location
+        self._fh.flush()
+        self._fh.seek(offset)
+        while length > 0:
+            # json.dumps escapes non-ASCII characters, a chunk cannot end in the middle of a character
+            chunk = self._fh.read(min(length, self._COPY_CHUNK_SIZE))
+            length -= len(chunk)
+            write(chunk.decode("utf-8"))
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+            os.remove(self.filename)
+
+
+class _JsonValue(object):
+    """
+    A JSON object (made of plain JSON values, _JsonValue and _JsonText) that is no longer bound to the report,
+    its JSON is written every time it is needed.
+    """
+    __slots__ = ("_value",)
+
+    def __init__(self, value):
+        self._value = value
+
+    def write(self, write):
+        _write_json_object(self._value, write)
+
+    @property
+    def text(self):
+        pieces = []
+        self.write(pieces.append)
+        return "".join(pieces)
+
+
+class _JsonText(_JsonValue):
+    """
+    The JSON of an ended test: the value is dumped the first time it is written (and only once), its text is then
+    kept in the fragment store if any or in memory otherwise.
+    """
+    __slots__ = ("_text", "_store", "_location")
+
+    def __init__(self, value, store=None):
+        _JsonValue.__init__(self, value)
+        self._text = None
+        self._store = store
+        self._location = None
+
+    def write(self, write):
+        if self._location is not None:
+            self._store.copy(self._location, write)
+            return
+        if self._text is None:
+            self._text = json.dumps(self._value)
+            self._value = None
+            if self._store is not None:
+                self._location = self._store.append(self._text)
+                text, self._text = self._text, None
+                write(text)
+                return
+        write(self._text)
+
+    @property
+    def is_stored(self):
+        return self._location is not None
+
+
+def _write_json_value(value, write):
+    if isinstance(value, _JsonValue):
+        value.write(write)
+    elif isinstance(value, list) and value and isinstance(value[0], _JsonValue):
+        write("[")
+        for i, item in enumerate(value):
+            if i > 0:
+                write(", ")
+            item.write(write)
+        write("]")
+    else:
+        write(json.dumps(value))
+
+
+def _write_json_object(obj, write):
+    # the output is the same as json.dumps(obj) would give for the unserialized values
+    write("{")
+    for i, (key, value) in enumerate(obj.items()):
+        if i > 0:
+            write(", ")
+        write(json.dumps(key))
+        write(": ")
+        _write_json_value(value, write)
+    write("}")
+
+
+class IncrementalJsonSerializer(object):
+    """
+    Serialize a report that is being built into JSON (in the same way as json.dumps(serialize_report_into_json(report)))
+    while keeping the JSON of its ended tests, which are no longer modified, so that they are only
+    serialized once whatever the number of times the report is serialized.
+
+    The serialization is done in two parts: snapshot() must be called while holding the report's lock, it only
+    copies the data of the tests that are not cached yet into plain JSON values, and the returned snapshot,
+    which does the actual (and most expensive) JSON encoding, can be written without the lock.
+
+    If a fragment store is given, the JSON of the ended tests is kept in it instead of in memory.
+    """
+    def __init__(self, epoch_timestamps=False, fragment_store=None):
+        self.epoch_timestamps = epoch_timestamps
+        self.fragment_store = fragment_store
+        # ended test/suite => _JsonText/_JsonValue
+        self._cache = {}
+
+    def _serialize_test(self, test):
+        serialized = self._cache.get(test)
+        if serialized is None:
+            data = _serialize_test_data(test, self.epoch_timestamps)
+            # NB: end_time is the last attribute set by the report writer when a test ends
+            if test.end_time is not None:
+                serialized = self._cache[test] = _JsonText(data, self.fragment_store)
+            else:
+                serialized = _JsonValue(data)
+        return serialized
+
+    def _serialize_suite(self, suite):
+        serialized = self._cache.get(suite)
+        if serialized is None:
+            # the JSON of an ended suite is not stored on its own (that would duplicate its tests' JSON),
+            # it is made of its tests' cached JSON
+            serialized = _JsonValue(
+                _serialize_suite_data(
+                    suite, serialize_test=self._serialize_test, serialize_suite=self._serialize_suite,
+                    epoch_timestamps=self.epoch_timestamps
+                )
+            )
+            if suite.end_time is not None:
+                self._cache[suite] = serialized
+                # the suite's tests and sub suites are now referenced by the suite's JSON
+                for node in suite.get_tests() + suite.get_suites(include_empty_suites=True):
+                    self._cache.pop(node, None)
+        return serialized
+
+    def snapshot(self, report):
+        # type: (Report) -> _JsonValue
+        return _JsonValue(_serialize_report(report, self._serialize_suite, self.epoch_timestamps))
+
+    def serialize(self, report):
+        # type: (Report) -> str
+        return self.snapshot(report).text
+
+
+def _make_report_file_content(json_content, javascript_compatibility):
+    return (JS_PREFIX + json_content) if javascript_compatibility else json_content
+
+
+def serialize_report_into_string(report, javascript_compatibility=True, pretty_formatting=False,
+                                 epoch_timestamps=False):
+    serialized = serialize_report_into_json(report, epoch_timestamps)
+    return _make_report_file_content(
+        json.dumps(serialized, indent=4) if pretty_formatting else json.dumps(serialized), javascript_compatibility
+    )
+
+
+def save_report_into_file(data, filename, javascript_compatibility=True, pretty_formatting=False,
+                          epoch_timestamps=False):
+    content = serialize_report_into_string(data, javascript_compatibility, pretty_formatting, epoch_timestamps)
     with open(filename, "w") as fh:
-        if javascript_compatibility:
-            fh.write(JS_PREFIX)
-        if pretty_formatting:
-            fh.write(json.dumps(report, indent=4))
-        else:
-            fh.write(json.dumps(report))
+        fh.write(content)
+
+
+def _unserialize_time(value):
+    # the timestamps are strings in the 1.0 reports and seconds since epoch in the 1.1 reports
+    if isinstance(value, six.string_types):
+        return parse_timestamp(value)
+    else:
+        return float(value)
 
 
 def _unserialize_step_data(js):
     step = Step(js["description"])
-    step.start_time = parse_timestamp(js["start_time"])
-    step.end_time = parse_timestamp(js["end_time"]) if js["end_time"] else None
+    step.start_time = _unserialize_time(js["start_time"])
+    step.end_time = _unserialize_time(js["end_time"]) if js["end_time"] else None
     for js_entry in js["entries"]:
         if js_entry["type"] == "log":
             entry = Log(
-                js_entry["level"], js_entry["message"], parse_timestamp(js_entry["time"])
+                js_entry["level"], js_entry["message"], _unserialize_time(js_entry["time"])
             )
         elif js_entry["type"] == "attachment":
             entry = Attachment(
-                js_entry["description"], js_entry["filename"], js_entry["as_image"], parse_timestamp(js_entry["time"])
+                js_entry["description"], js_entry["filename"], js_entry["as_image"], _unserialize_time(js_entry["time"])
             )
         elif js_entry["type"] == "url":
             entry = Url(
-                js_entry["description"], js_entry["url"], parse_timestamp(js_entry["time"])
+                js_entry["description"], js_entry["url"], _unserialize_time(js_entry["time"])
             )
         elif js_entry["type"] == "check":
             entry = Check(
-                js_entry["description"], js_entry["outcome"], js_entry["details"], parse_timestamp(js_entry["time"])
+                js_entry["description"], js_entry["outcome"], js_entry["details"], _unserialize_time(js_entry["time"])
             )
         else:
             raise ProgrammingError("Unknown entry type '%s'" % js_entry["type"])
@@ -185,55 +415,89 @@ def _unserialize_step_data(js):
     return step
 
 
-def _unserialize_test_data(js):
+def _unserialize_steps(result, js_steps, lazy_steps):
+    if lazy_steps:
+        result.set_lazy_steps(lambda: [_unserialize_step_data(s) for s in js_steps])
+    else:
+        result.steps = [_unserialize_step_data(s) for s in js_steps]
+
+
+def _unserialize_test_data(js, lazy_steps=False):
     test = TestResult(js["name"], js["description"])
     test.status = js["status"]
     test.status_details = js["status_details"]
-    test.start_time = parse_timestamp(js["start_time"])
-    test.end_time = parse_timestamp(js["end_time"]) if js["end_time"] else None
+    test.start_time = _unserialize_time(js["start_time"])
+    test.end_time = _unserialize_time(js["end_time"]) if js["end_time"] else None
     test.tags = js["tags"]
     test.properties = js["properties"]
     test.links = [(link["url"], link["name"]) for link in js["links"]]
-    test.steps = [_unserialize_step_data(s) for s in js["steps"]]
+    test.rank = js.get("rank", 0)
+    _unserialize_steps(test, js["steps"], lazy_steps)
     return test
 
 
-def _unserialize_hook_data(js):
+def _unserialize_hook_data(js, lazy_steps=False):
     data = SetupResult()
     data.outcome = js["outcome"]
-    data.start_time = parse_timestamp(js["start_time"])
-    data.end_time = parse_timestamp(js["end_time"]) if js["end_time"] else None
-    data.steps = [_unserialize_step_data(s) for s in js["steps"]]
+    data.start_time = _unserialize_time(js["start_time"])
+    data.end_time = _unserialize_time(js["end_time"]) if js["end_time"] else None
+    _unserialize_steps(data, js["steps"], lazy_steps)
 
     return data
 
 
-def _unserialize_suite_data(js):
+def _unserialize_suite_data(js, lazy_steps=False):
     suite = SuiteResult(js["name"], js["description"])
-    suite.start_time = parse_timestamp(js["start_time"])
-    suite.end_time = parse_timestamp(js["end_time"]) if js["end_time"] else None
+    suite.start_time = _unserialize_time(js["start_time"])
+    suite.end_time = _unserialize_time(js["end_time"]) if js["end_time"] else None
     suite.tags = js["tags"]
     suite.properties = js["properties"]
     suite.links = [(link["url"], link["name"]) for link in js["links"]]
+    suite.rank = js.get("rank", 0)
 
     if "suite_setup" in js:
-        suite.suite_setup = _unserialize_hook_data(js["suite_setup"])
+        suite.suite_setup = _unserialize_hook_data(js["suite_setup"], lazy_steps)
 
     for js_test in js["tests"]:
-        test = _unserialize_test_data(js_test)
+        test = _unserialize_test_data(js_test, lazy_steps)
         suite.add_test(test)
 
     if "suite_teardown" in js:
-        suite.suite_teardown = _unserialize_hook_data(js["suite_teardown"])
+        suite.suite_teardown = _unserialize_hook_data(js["suite_teardown"], lazy_steps)
 
     for js_suite in js["suites"]:
-        sub_suite = _unserialize_suite_data(js_suite)
+        sub_suite = _unserialize_suite_data(js_suite, lazy_steps)
         suite.add_suite(sub_suite)
 
     return suite
 
 
-def load_report_from_file(filename):
+def _unserialize_task_trace(js):
+    return TaskTrace(
+        js["name"], js["category"],
+        _unserialize_time(js["ready_time"]) if js["ready_time"] else None,
+        _unserialize_time(js["start_time"]), _unserialize_time(js["end_time"]),
+        js["worker"], js["dependencies"]
+    )
+
+
+def _load_json(content):
+    # the JS prefix is skipped rather than removed, which would copy the whole content
+    offset = len(JS_PREFIX) if content.startswith(JS_PREFIX) else 0
+    try:
+        js, end = json.JSONDecoder().raw_decode(content, offset)
+    except ValueError as e:
+        raise InvalidReportFile(str(e))
+    if content[end:].strip():
+        raise InvalidReportFile("Extra data after the JSON content")
+    return js
+
+
+def load_report_from_file(filename, lazy_steps=True):
+    """
+    Load a JSON report. With lazy_steps, the steps of the tests and setup/teardown results are only
+    built when they are first accessed (which is much faster for the commands that do not need them).
+    """
     report = BoundReport()
     try:
         with open(filename, "r") as fh:
@@ -241,50 +505,96 @@ def load_report_from_file(filename):
     except IOError as e:
         raise e  # re-raise as-is
 
-    js_content = re.sub("^" + JS_PREFIX, "", js_content)
-
-    try:
-        js = json.loads(js_content)
-    except ValueError as e:
-        raise InvalidReportFile(str(e))
+    js = _load_json(js_content)
+    del js_content
 
-    if "lemoncheesecake_report_version" not in js:
+    if not isinstance(js, dict) or "lemoncheesecake_report_version" not in js:
         raise InvalidReportFile("Cannot find 'lemoncheesecake_report_version' in JSON")
 
     report.title = js["title"]
     report.info = js["info"]
-    report.start_time = parse_timestamp(js["start_time"])
-    report.end_time = parse_timestamp(js["end_time"]) if js["end_time"] else None
-    report.report_generation_time = parse_timestamp(js["generation_time"]) if js["generation_time"] else None
+    report.start_time = _unserialize_time(js["start_time"])
+    report.end_time = _unserialize_time(js["end_time"]) if js["end_time"] else None
+    report.report_generation_time = _unserialize_time(js["generation_time"]) if js["generation_time"] else None
     report.nb_threads = js["nb_threads"]
 
     if "test_session_setup" in js:
-        report.test_session_setup = _unserialize_hook_data(js["test_session_setup"])
+        report.test_session_setup = _unserialize_hook_data(js["test_session_setup"], lazy_steps)
 
     for js_suite in js["suites"]:
-        suite = _unserialize_suite_data(js_suite)
+        suite = _unserialize_suite_data(js_suite, lazy_steps)
         report.add_suite(suite)
 
     if "test_session_teardown" in js:
-        report.test_session_teardown = _unserialize_hook_data(js["test_session_teardown"])
+        report.test_session_teardown = _unserialize_hook_data(js["test_session_teardown"], lazy_steps)
+
+    if "task_traces" in js:
+        report.task_traces = [_unserialize_task_trace(js_trace) for js_trace in js["task_traces"]]
 
     return report
 
 
+class IncrementalJsonReportSession(FileReportSession):
+    """
+    Reporting session that saves the report using an IncrementalJsonSerializer: only the tests
+    that have changed since the previous save are serialized again. The JSON of the ended tests is kept
+    in a file next to the report file until the end of the test session.
+    """
+    def __init__(self, report_filename, report, reporting_backend, report_saving_strategy, background_saving=True):
+        FileReportSession.__init__(
+            self, report_filename, report, reporting_backend, report_saving_strategy, background_saving
+        )
+        self.serializer = IncrementalJsonSerializer(
+            reporting_backend.epoch_timestamps, _JsonFragmentStore(report_filename + ".fragments")
+        )
+
+    def _snapshot_report(self):
+        return self.serializer.snapshot(self.report)
+
+    def _write_snapshot(self, snapshot, fh):
+        if self.reporting_backend.javascript_compatibility:
+            fh.write(JS_PREFIX)
+        snapshot.write(fh.write)
+
+    def _end(self):
+        self.serializer.fragment_store.close()
+
+
 class JsonBackend(FileReportBackend):
     name = "json"
 
-    def __init__(self, javascript_compatibility=True, pretty_formatting=False):
+    def __init__(self, javascript_compatibility=True, pretty_formatting=False, incremental_saving=True,
+                 epoch_timestamps=False):
         self.javascript_compatibility = javascript_compatibility
         self.pretty_formatting = pretty_formatting
+        # whether the report is saved incrementally during the test run (not supported with pretty_formatting)
+        self.incremental_saving = incremental_saving
+        # whether the report is saved in the EPOCH_TIMESTAMPS_REPORT_VERSION format (not supported by the HTML report)
+        self.epoch_timestamps = epoch_timestamps
 
     def get_report_filename(self):
         return "report.js"
 
+    def create_reporting_session(self, report_dir, report, parallel, report_saving_strategy=None):
+        if self.incremental_saving and not self.pretty_formatting:
+            return IncrementalJsonReportSession(
+                os.path.join(report_dir, self.get_report_filename()), report, self, report_saving_strategy
+            )
+        else:
+            return FileReportBackend.create_reporting_session(self, report_dir, report, parallel, report_saving_strategy)
+
     def save_report(self, filename, report):
         save_report_into_file(
             report, filename,
-            javascript_compatibility=self.javascript_compatibility, pretty_formatting=self.pretty_formatting
+            javascript_compatibility=self.javascript_compatibility, pretty_formatting=self.pretty_formatting,
+            epoch_timestamps=self.epoch_timestamps
+        )
+
+    def serialize_report(self, report):
+        return serialize_report_into_string(
+            report,
+            javascript_compatibility=self.javascript_compatibility, pretty_formatting=self.pretty_formatting,
+            epoch_timestamps=self.epoch_timestamps
         )
 
     def load_report(self, filename):
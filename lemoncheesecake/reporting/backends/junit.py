@@ -125,3 +125,6 @@ class JunitBackend(FileReportBackend):
 
     def save_report(self, filename, report):
         save_report_into_file(report, filename, self.indent_level)
+
+    def serialize_report(self, report):
+        return serialize_report_as_string(report, self.indent_level)
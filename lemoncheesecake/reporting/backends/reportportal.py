@@ -108,11 +108,9 @@ class ReportPortalReportingSession(ReportingSession):
         if self._has_rp_error():
             return
 
-        self._end_test_item(
-            event.time,
-            not self.report.test_session_setup or self.report.test_session_setup.is_successful(),
-            wrapped=True
-        )
+        with self.report.lock:
+            is_successful = not self.report.test_session_setup or self.report.test_session_setup.is_successful()
+        self._end_test_item(event.time, is_successful, wrapped=True)
 
     def on_test_session_teardown_start(self, event):
         if self._has_rp_error():
@@ -128,11 +126,10 @@ class ReportPortalReportingSession(ReportingSession):
         if self._has_rp_error():
             return
 
-        self._end_test_item(
-            event.time,
-            not self.report.test_session_teardown or self.report.test_session_teardown.is_successful(),
-            wrapped=True
-        )
+        with self.report.lock:
+            is_successful = \
+                not self.report.test_session_teardown or self.report.test_session_teardown.is_successful()
+        self._end_test_item(event.time, is_successful, wrapped=True)
 
     def on_suite_start(self, event):
         if self._has_rp_error():
@@ -167,13 +164,11 @@ class ReportPortalReportingSession(ReportingSession):
         if self._has_rp_error():
             return
 
-        suite_data = self.report.get_suite(event.suite)
+        with self.report.lock:
+            suite_data = self.report.get_suite(event.suite)
+            is_successful = not suite_data.suite_setup or suite_data.suite_setup.is_successful()
 
-        self._end_test_item(
-            event.time,
-            not suite_data.suite_setup or suite_data.suite_setup.is_successful(),
-            wrapped=len(event.suite.get_suites()) > 0
-        )
+        self._end_test_item(event.time, is_successful, wrapped=len(event.suite.get_suites()) > 0)
 
     def on_suite_teardown_start(self, event):
         if self._has_rp_error():
@@ -189,13 +184,11 @@ class ReportPortalReportingSession(ReportingSession):
         if self._has_rp_error():
             return
 
-        suite_data = self.report.get_suite(event.suite)
+        with self.report.lock:
+            suite_data = self.report.get_suite(event.suite)
+            is_successful = not suite_data.suite_teardown or suite_data.suite_teardown.is_successful()
 
-        self._end_test_item(
-            event.time,
-            not suite_data.suite_teardown or suite_data.suite_teardown.is_successful(),
-            wrapped=len(event.suite.get_suites()) > 0
-        )
+        self._end_test_item(event.time, is_successful, wrapped=len(event.suite.get_suites()) > 0)
 
     def on_test_start(self, event):
         if self._has_rp_error():
@@ -214,8 +207,9 @@ class ReportPortalReportingSession(ReportingSession):
         if self._has_rp_error():
             return
 
-        test_data = self.report.get_test(event.test)
-        self._end_current_test_item(event.time, test_data.status)
+        with self.report.lock:
+            status = self.report.get_test(event.test).status
+        self._end_current_test_item(event.time, status)
 
     def _bypass_test(self, test, status, time):
         if self._has_rp_error():
@@ -93,10 +93,12 @@ class EndOfTestsNotifier(BaseSlackReportingSession):
         self.only_notify_failure = only_notify_failure
 
     def on_test_session_end(self, event):
-        if self.only_notify_failure and event.report.is_successful():
-            return
+        with event.report.lock:
+            if self.only_notify_failure and event.report.is_successful():
+                return
+            message_parameters = build_message_parameters(event.report)
 
-        message = self.message_template.format(**build_message_parameters(event.report))
+        message = self.message_template.format(**message_parameters)
         self.send_message(message)
 
         self.show_errors()
@@ -4,6 +4,9 @@ Created on Mar 27, 2016
 @author: nicolas
 '''
 
+import io
+from contextlib import contextmanager
+
 try:
     from lxml import etree as ET
     from lxml.builder import E
@@ -16,7 +19,7 @@ import six
 import lemoncheesecake
 from lemoncheesecake.reporting.backend import BoundReport, FileReportBackend
 from lemoncheesecake.reporting.report import (
-    Log, Check, Attachment, Url, Step, TestResult, SetupResult, SuiteResult,
+    Log, Check, Attachment, Url, Step, TestResult, SetupResult, SuiteResult, TaskTrace,
     format_timestamp, parse_timestamp
 )
 from lemoncheesecake.exceptions import ProgrammingError, InvalidReportFile
@@ -126,22 +129,31 @@ def _serialize_steps(steps, parent_node):
                 check_node.text = entry.details
 
 
+def _make_metadata_nodes(node_data):
+    nodes = []
+    for tag in node_data.tags:
+        tag_node = make_xml_node("tag")
+        tag_node.text = tag
+        nodes.append(tag_node)
+    for name, value in node_data.properties.items():
+        property_node = make_xml_node("property", "name", name)
+        property_node.text = value
+        nodes.append(property_node)
+    for link in node_data.links:
+        link_node = make_xml_node("link", "name", link[1])
+        link_node.text = link[0]
+        nodes.append(link_node)
+    return nodes
+
+
 def _serialize_test_data(test):
     test_node = make_xml_node(
         "test", "name", test.name, "description", test.description,
-        "status", test.status, "status-details", test.status_details
+        "status", test.status, "status-details", test.status_details, "rank", str(test.rank)
     )
     _add_time_attr(test_node, "start-time", test.start_time)
     _add_time_attr(test_node, "end-time", test.end_time)
-    for tag in test.tags:
-        tag_node = make_xml_child(test_node, "tag")
-        tag_node.text = tag
-    for name, value in test.properties.items():
-        property_node = make_xml_child(test_node, "property", "name", name)
-        property_node.text = value
-    for link in test.links:
-        link_node = make_xml_child(test_node, "link", "name", link[1])
-        link_node.text = link[0]
+    test_node.extend(_make_metadata_nodes(test))
     _serialize_steps(test.steps, test_node)
 
     return test_node
@@ -155,18 +167,12 @@ def _serialize_hook_data(data, node):
 
 
 def _serialize_suite_data(suite):
-    suite_node = make_xml_node("suite", "name", suite.name, "description", suite.description)
+    suite_node = make_xml_node(
+        "suite", "name", suite.name, "description", suite.description, "rank", str(suite.rank)
+    )
     _add_time_attr(suite_node, "start-time", suite.start_time)
     _add_time_attr(suite_node, "end-time", suite.end_time)
-    for tag in suite.tags:
-        tag_node = make_xml_child(suite_node, "tag")
-        tag_node.text = tag
-    for name, value in suite.properties.items():
-        property_node = make_xml_child(suite_node, "property", "name", name)
-        property_node.text = value
-    for link in suite.links:
-        link_node = make_xml_child(suite_node, "link", "name", link[1])
-        link_node.text = link[0]
+    suite_node.extend(_make_metadata_nodes(suite))
 
     # before suite
     if suite.suite_setup:
@@ -189,6 +195,19 @@ def _serialize_suite_data(suite):
     return suite_node
 
 
+def _serialize_task_trace(trace):
+    trace_node = make_xml_node(
+        "task-trace", "name", trace.name, "category", trace.category, "worker", trace.worker
+    )
+    _add_time_attr(trace_node, "ready-time", trace.ready_time)
+    _add_time_attr(trace_node, "start-time", trace.start_time)
+    _add_time_attr(trace_node, "end-time", trace.end_time)
+    for dependency in trace.dependencies:
+        dependency_node = make_xml_child(trace_node, "dependency")
+        dependency_node.text = str(dependency)
+    return trace_node
+
+
 def serialize_report_as_tree(report):
     xml = E("lemoncheesecake-report")
     xml.attrib["nb-threads"] = str(report.nb_threads)
@@ -219,23 +238,147 @@ def serialize_report_as_tree(report):
     if report.test_session_teardown:
         _serialize_hook_data(report.test_session_teardown, make_xml_child(xml, "test-session-teardown"))
 
+    if report.task_traces:
+        traces_node = make_xml_child(xml, "task-traces")
+        for trace in report.task_traces:
+            traces_node.append(_serialize_task_trace(trace))
+
     return xml
 
 
-def serialize_report_as_string(report, indent_level=DEFAULT_INDENT_LEVEL):
-    report = serialize_report_as_tree(report)
-    indent_xml(report, indent_level=indent_level)
+def _make_xml_attributes(*args):
+    attributes = {}
+    i = 0
+    while i < len(args):
+        attr_name, attr_value = args[i], args[i+1]
+        if attr_value is not None:
+            attributes[attr_name] = attr_value if six.PY3 or type(attr_value) is unicode else unicode(attr_value, "utf-8")
+        i += 2
+    return attributes
+
+
+def _format_time_attr(value):
+    return format_timestamp(value) if value else None
+
+
+class _XmlStreamWriter(object):
+    """
+    Write XML elements incrementally through an lxml xmlfile, indenting them the same way as indent_xml does.
+    """
+    def __init__(self, xml_file, indent_level):
+        self.xml_file = xml_file
+        self.indent_level = indent_level
+        self._level = 0
+        self._has_children = []
+
+    def _write_indentation(self, level):
+        self.xml_file.write("\n" + level * (" " * self.indent_level))
+
+    def _before_child(self):
+        if self._has_children:
+            self._has_children[-1] = True
+            self._write_indentation(self._level)
+
+    def write_node(self, node):
+        self._before_child()
+        indent_xml(node, self._level, self.indent_level)
+        node.tail = None
+        self.xml_file.write(node)
+
+    def write_nodes(self, nodes):
+        for node in nodes:
+            self.write_node(node)
+
+    @contextmanager
+    def element(self, name, attributes):
+        self._before_child()
+        with self.xml_file.element(name, attributes):
+            self._level += 1
+            self._has_children.append(False)
+            yield
+            self._level -= 1
+            if self._has_children.pop():
+                self._write_indentation(self._level)
+
+
+def _write_hook_data(writer, name, data):
+    node = make_xml_node(name)
+    _serialize_hook_data(data, node)
+    writer.write_node(node)
+
+
+def _write_suite_data(writer, suite):
+    with writer.element("suite", _make_xml_attributes(
+        "name", suite.name, "description", suite.description, "rank", str(suite.rank),
+        "start-time", _format_time_attr(suite.start_time), "end-time", _format_time_attr(suite.end_time)
+    )):
+        writer.write_nodes(_make_metadata_nodes(suite))
+        if suite.suite_setup:
+            _write_hook_data(writer, "suite-setup", suite.suite_setup)
+        for test in suite.get_tests():
+            writer.write_node(_serialize_test_data(test))
+        for sub_suite in suite.get_suites():
+            _write_suite_data(writer, sub_suite)
+        if suite.suite_teardown:
+            _write_hook_data(writer, "suite-teardown", suite.suite_teardown)
+
+
+def write_report(report, fh, indent_level=DEFAULT_INDENT_LEVEL):
+    """
+    Write the report as XML into fh (a binary file object): unlike serialize_report_as_tree, the XML elements
+    are written as they are built (the XML tree of a test at most is held in memory).
+    """
+    with ET.xmlfile(fh, encoding="utf-8") as xml_file:
+        xml_file.write_declaration()
+        writer = _XmlStreamWriter(xml_file, indent_level)
+        with writer.element("lemoncheesecake-report", _make_xml_attributes(
+            "nb-threads", str(report.nb_threads),
+            "start-time", _format_time_attr(report.start_time), "end-time", _format_time_attr(report.end_time),
+            "generation-time", _format_time_attr(report.report_generation_time)
+        )):
+            version_node = make_xml_node("lemoncheesecake-version")
+            version_node.text = lemoncheesecake.__version__
+            report_version_node = make_xml_node("lemoncheesecake-report-version")
+            report_version_node.text = str("1.0")
+            title_node = make_xml_node("title")
+            title_node.text = report.title
+            writer.write_nodes([version_node, report_version_node, title_node])
+            for name, value in report.info:
+                info_node = make_xml_node("info", "name", name)
+                info_node.text = value
+                writer.write_node(info_node)
+            for name, value in report.serialize_stats():
+                stat_node = make_xml_node("stat", "name", name)
+                stat_node.text = value
+                writer.write_node(stat_node)
+
+            if report.test_session_setup:
+                _write_hook_data(writer, "test-session-setup", report.test_session_setup)
+
+            for suite in report.get_suites():
+                _write_suite_data(writer, suite)
+
+            if report.test_session_teardown:
+                _write_hook_data(writer, "test-session-teardown", report.test_session_teardown)
+
+            if report.task_traces:
+                with writer.element("task-traces", {}):
+                    for trace in report.task_traces:
+                        writer.write_node(_serialize_task_trace(trace))
+
 
+def serialize_report_as_string(report, indent_level=DEFAULT_INDENT_LEVEL):
+    buf = io.BytesIO()
+    write_report(report, buf, indent_level)
     if six.PY3:
-        return ET.tostring(report, pretty_print=True, encoding="unicode")
+        return buf.getvalue().decode("utf-8")
     else:
-        return ET.tostring(report, pretty_print=True, xml_declaration=True, encoding="utf-8")
+        return buf.getvalue()
 
 
 def save_report_into_file(report, filename, indent_level=DEFAULT_INDENT_LEVEL):
-    content = serialize_report_as_string(report, indent_level)
-    with open(filename, "w") as fh:
-        fh.write(content)
+    with open(filename, "wb") as fh:
+        write_report(report, fh, indent_level)
 
 
 def _unserialize_datetime(value):
@@ -301,6 +444,7 @@ def _unserialize_test_data(xml):
     test.tags = [node.text for node in xml.xpath("tag")]
     test.properties = {node.attrib["name"]: node.text for node in xml.xpath("property")}
     test.links = [(link.text, link.attrib.get("name", None)) for link in xml.xpath("link")]
+    test.rank = int(xml.attrib.get("rank", 0))
     test.steps = [_unserialize_step_data(step) for step in xml.xpath("step")]
     return test
 
@@ -314,69 +458,111 @@ def _unserialize_hook_data(xml):
     return data
 
 
-def _unserialize_suite_data(xml):
+def _unserialize_suite_attributes(xml):
     suite = SuiteResult(xml.attrib["name"], xml.attrib["description"])
     suite.start_time = _unserialize_datetime(xml.attrib["start-time"])
     suite.end_time = _unserialize_datetime(xml.attrib["end-time"]) if "end-time" in xml.attrib else None
-    suite.tags = [node.text for node in xml.xpath("tag")]
-    suite.properties = {node.attrib["name"]: node.text for node in xml.xpath("property")}
-    suite.links = [(link.text, link.attrib.get("name", None)) for link in xml.xpath("link")]
+    suite.rank = int(xml.attrib.get("rank", 0))
+    return suite
 
-    suite_setup = xml.xpath("suite-setup")
-    suite_setup = suite_setup[0] if len(suite_setup) > 0 else None
-    if suite_setup is not None:
-        suite.suite_setup = _unserialize_hook_data(suite_setup)
 
-    for xml_test in xml.xpath("test"):
-        test = _unserialize_test_data(xml_test)
-        suite.add_test(test)
+def _unserialize_task_trace(xml):
+    return TaskTrace(
+        xml.attrib["name"], xml.attrib["category"],
+        _unserialize_datetime(xml.attrib["ready-time"]) if "ready-time" in xml.attrib else None,
+        _unserialize_datetime(xml.attrib["start-time"]), _unserialize_datetime(xml.attrib["end-time"]),
+        xml.attrib["worker"], [int(node.text) for node in xml.xpath("dependency")]
+    )
 
-    suite_teardown = xml.xpath("suite-teardown")
-    suite_teardown = suite_teardown[0] if len(suite_teardown) > 0 else None
-    if suite_teardown is not None:
-        suite.suite_teardown = _unserialize_hook_data(suite_teardown)
 
-    for xml_suite in xml.xpath("suite"):
-        sub_suite = _unserialize_suite_data(xml_suite)
-        suite.add_suite(sub_suite)
+def _unserialize_report_attributes(report, xml):
+    report.start_time = _unserialize_datetime(xml.attrib["start-time"]) if "start-time" in xml.attrib else None
+    report.end_time = _unserialize_datetime(xml.attrib["end-time"]) if "end-time" in xml.attrib else None
+    report.report_generation_time = \
+        _unserialize_datetime(xml.attrib["generation-time"]) if "generation-time" in xml.attrib else None
+    report.nb_threads = int(xml.attrib["nb-threads"])
 
-    return suite
+
+def _unserialize_metadata(node_data, xml):
+    if xml.tag == "tag":
+        node_data.tags.append(xml.text)
+    elif xml.tag == "property":
+        node_data.properties[xml.attrib["name"]] = xml.text
+    elif xml.tag == "link":
+        node_data.links.append((xml.text, xml.attrib.get("name", None)))
+
+
+def _free_element(xml):
+    # free the element and its previous siblings, which have all been handled
+    xml.clear()
+    parent = xml.getparent()
+    while xml.getprevious() is not None:
+        del parent[0]
+
+
+def _handle_suite_child(suite, xml):
+    if xml.tag == "test":
+        suite.add_test(_unserialize_test_data(xml))
+    elif xml.tag == "suite-setup":
+        suite.suite_setup = _unserialize_hook_data(xml)
+    elif xml.tag == "suite-teardown":
+        suite.suite_teardown = _unserialize_hook_data(xml)
+    else:
+        _unserialize_metadata(suite, xml)
+
+
+def _handle_report_child(report, xml):
+    if xml.tag == "title":
+        report.title = xml.text
+    elif xml.tag == "info":
+        report.info.append([xml.attrib["name"], xml.text])
+    elif xml.tag == "test-session-setup":
+        report.test_session_setup = _unserialize_hook_data(xml)
+    elif xml.tag == "test-session-teardown":
+        report.test_session_teardown = _unserialize_hook_data(xml)
+    elif xml.tag == "task-traces":
+        report.task_traces = [_unserialize_task_trace(node) for node in xml.xpath("task-trace")]
 
 
 def load_report_from_file(filename):
+    """
+    Load an XML report: the XML is parsed incrementally, the XML elements being freed once handled
+    (the XML tree of a test at most is held in memory).
+    """
     report = BoundReport()
+    suites = []  # the suites being loaded, from the root suite to the innermost one
     try:
-        with open(filename, "r") as fh:
-            xml = ET.parse(fh)
+        with open(filename, "rb") as fh:
+            for event, xml in ET.iterparse(fh, events=("start", "end")):
+                parent = xml.getparent()
+                if event == "start":
+                    if parent is None:
+                        if xml.tag != "lemoncheesecake-report":
+                            raise InvalidReportFile("Cannot lemoncheesecake-report element in XML")
+                        _unserialize_report_attributes(report, xml)
+                    elif xml.tag == "suite":
+                        suites.append(_unserialize_suite_attributes(xml))
+                    continue
+
+                if parent is None:
+                    continue
+                if xml.tag == "suite":
+                    suite = suites.pop()
+                    if suites:
+                        suites[-1].add_suite(suite)
+                    else:
+                        report.add_suite(suite)
+                elif parent.tag == "suite":
+                    _handle_suite_child(suites[-1], xml)
+                elif parent.getparent() is None:
+                    _handle_report_child(report, xml)
+                else:
+                    continue  # the element is handled along with its parent
+                _free_element(xml)
     except ET.LxmlError as e:
         raise InvalidReportFile(str(e))
     except IOError as e:
         raise e  # re-raise as-is
-    try:
-        root = xml.getroot().xpath("/lemoncheesecake-report")[0]
-    except IndexError:
-        raise InvalidReportFile("Cannot lemoncheesecake-report element in XML")
-
-    report.start_time = _unserialize_datetime(root.attrib["start-time"]) if "start-time" in root.attrib else None
-    report.end_time = _unserialize_datetime(root.attrib["end-time"]) if "end-time" in root.attrib else None
-    report.report_generation_time = _unserialize_datetime(root.attrib["generation-time"]) if "generation-time" in root.attrib else None
-    report.nb_threads = int(root.attrib["nb-threads"])
-    report.title = root.xpath("title")[0].text
-    report.info = [[node.attrib["name"], node.text] for node in root.xpath("info")]
-
-    test_session_setup = xml.xpath("test-session-setup")
-    test_session_setup = test_session_setup[0] if len(test_session_setup) else None
-    if test_session_setup is not None:
-        report.test_session_setup = _unserialize_hook_data(test_session_setup)
-
-    for xml_suite in root.xpath("suite"):
-        suite = _unserialize_suite_data(xml_suite)
-        report.add_suite(suite)
-
-    test_session_teardown = xml.xpath("test-session-teardown")
-    test_session_teardown = test_session_teardown[0] if len(test_session_teardown) else None
-    if test_session_teardown is not None:
-        report.test_session_teardown = _unserialize_hook_data(test_session_teardown)
 
     return report
 
@@ -396,5 +582,8 @@ class XmlBackend(FileReportBackend):
     def save_report(self, filename, report):
         save_report_into_file(report, filename, self.indent_level)
 
+    def serialize_report(self, report):
+        return serialize_report_as_string(report, self.indent_level)
+
     def load_report(self, filename):
         return load_report_from_file(filename).bind(self, filename)
@@ -0,0 +1,186 @@
+'''
+Append-only journal of the events of a test session: each event is written as a JSON line in the report
+directory as soon as it has been handled, so that the report can be rebuilt (by replaying the journal through
+a ReportWriter) if the test run has been killed before the report could be saved.
+'''
+
+import os
+import time
+import json
+
+from typing import Optional
+
+from lemoncheesecake import events
+from lemoncheesecake.testtree import TreeLocation
+from lemoncheesecake.reporting.report import Report, TestResult, SuiteResult, TaskTrace
+from lemoncheesecake.reporting.writer import ReportWriter
+from lemoncheesecake.exceptions import InvalidReportFile
+
+JOURNAL_FILENAME = "events.journal"
+
+DEFAULT_FSYNC_INTERVAL = 1
+
+# the "node" record describes a test or a suite, it is written before the first event that refers to it
+_NODE_RECORD = "node"
+
+
+def _serialize_node(node, node_type):
+    return {
+        "type": node_type, "path": node.path,
+        "parent": node.parent_suite.path if node.parent_suite else None,
+        "name": node.name, "description": node.description,
+        "tags": list(node.tags), "properties": dict(node.properties), "links": [list(link) for link in node.links],
+        "rank": getattr(node, "rank", 0)
+    }
+
+
+def _serialize_report_header(report):
+    return {"title": report.title, "info": [list(info) for info in report.info], "nb_threads": report.nb_threads}
+
+
+class EventJournal(object):
+    """
+    Event listener writing the events into the journal: the events of each batch are written at once (the file
+    being flushed after each batch) and the journal is synced to disk at most every fsync_interval seconds.
+    """
+    def __init__(self, filename, fsync_interval=DEFAULT_FSYNC_INTERVAL):
+        self.filename = filename
+        self.fsync_interval = fsync_interval
+        self._fh = None
+        self._last_fsync = None
+        self._known_nodes = set()
+
+    def _serialize_node_if_needed(self, node, node_type, lines):
+        if node.path not in self._known_nodes:
+            if node.parent_suite:
+                self._serialize_node_if_needed(node.parent_suite, "suite", lines)
+            self._known_nodes.add(node.path)
+            lines.append(json.dumps([_NODE_RECORD, _serialize_node(node, node_type)]))
+
+    def _serialize_event(self, event, lines):
+        attributes = event.get_attributes()
+        if "test" in attributes:
+            self._serialize_node_if_needed(event.test, "test", lines)
+            attributes["test"] = event.test.path
+        if "suite" in attributes:
+            self._serialize_node_if_needed(event.suite, "suite", lines)
+            attributes["suite"] = event.suite.path
+        if "report" in attributes:
+            attributes["report"] = _serialize_report_header(event.report)
+        if "location" in attributes:
+            attributes["location"] = [event.location.node_type, event.location.node_hierarchy]
+        if "traces" in attributes:
+            attributes["traces"] = [vars(trace) for trace in event.traces]
+        lines.append(json.dumps([event.get_name(), attributes]))
+
+    def _sync(self):
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._last_fsync = time.time()
+
+    def on_events(self, batch):
+        if self._fh is None:
+            self._fh = open(self.filename, "a")
+            self._last_fsync = time.time()
+
+        lines = []
+        for event in batch:
+            self._serialize_event(event, lines)
+        self._fh.write("\n".join(lines) + "\n")
+
+        if any(isinstance(event, events.TestSessionEndEvent) for event in batch):
+            self._sync()
+            self._fh.close()
+            self._fh = None
+        elif time.time() - self._last_fsync >= self.fsync_interval:
+            self._sync()
+        else:
+            self._fh.flush()
+
+
+class _JournalReplayer(object):
+    def __init__(self):
+        self.report = Report()
+        self._nodes = {}
+
+    def _add_node(self, record):
+        node_class = TestResult if record["type"] == "test" else SuiteResult
+        node = node_class(record["name"], record["description"])
+        node.tags.extend(record["tags"])
+        node.properties.update(record["properties"])
+        node.links.extend(tuple(link) for link in record["links"])
+        node.rank = record["rank"]
+        if record["parent"]:
+            parent = self._nodes[record["parent"]]
+            if record["type"] == "test":
+                parent.add_test(node)
+            else:
+                parent.add_suite(node)
+        self._nodes[record["path"]] = node
+
+    def _update_report_header(self, header):
+        self.report.title = header["title"]
+        self.report.info = header["info"]
+        self.report.nb_threads = header["nb_threads"]
+
+    def make_event(self, name, attributes):
+        if name == _NODE_RECORD:
+            self._add_node(attributes)
+            return None
+
+        event_class = events._get_event_class_by_name(name)
+        event = event_class.from_attributes(attributes)
+        if "test" in attributes:
+            event.test = self._nodes[attributes["test"]]
+        if "suite" in attributes:
+            event.suite = self._nodes[attributes["suite"]]
+        if "report" in attributes:
+            self._update_report_header(attributes["report"])
+            event.report = self.report
+        if "location" in attributes:
+            node_type, node_hierarchy = attributes["location"]
+            event.location = TreeLocation(node_type, tuple(node_hierarchy) if node_hierarchy else node_hierarchy)
+        if "traces" in attributes:
+            event.traces = [
+                TaskTrace(
+                    trace["name"], trace["category"], trace["ready_time"], trace["start_time"], trace["end_time"],
+                    trace["worker"], trace["dependencies"]
+                )
+                for trace in attributes["traces"]
+            ]
+        return event
+
+
+def load_report_from_journal(filename):
+    # type: (str) -> Report
+    """
+    Rebuild the report of a test session by replaying its journal. A journal whose last line is truncated
+    (the test run having been killed while writing it) is loaded up to its last complete line.
+    """
+    replayer = _JournalReplayer()
+    event_manager = events.SyncEventManager.load()
+    event_manager.add_listener(ReportWriter(replayer.report))
+
+    with open(filename) as fh:
+        lines = fh.read().split("\n")
+
+    for line_num, line in enumerate(lines, start=1):
+        if not line:
+            continue
+        try:
+            name, attributes = json.loads(line)
+        except ValueError:
+            if line_num == len(lines):
+                break  # truncated last line
+            raise InvalidReportFile("Invalid journal line #%d" % line_num)
+        event = replayer.make_event(name, attributes)
+        if event:
+            event_manager.fire(event)
+
+    return replayer.report
+
+
+def get_journal_path(report_dir):
+    # type: (str) -> Optional[str]
+    path = os.path.join(report_dir, JOURNAL_FILENAME)
+    return path if os.path.exists(path) else None
@@ -109,5 +109,8 @@ def replay_report_events(report, eventmgr):
         if report.test_session_teardown.end_time:
             eventmgr.fire(events.TestSessionTeardownEndEvent(report.test_session_teardown.end_time))
 
+    if report.task_traces:
+        eventmgr.fire(events.TaskTracesEvent(report.task_traces))
+
     if report.end_time:
         eventmgr.fire(events.TestSessionEndEvent(report, report.end_time))
@@ -5,19 +5,23 @@ Created on Mar 26, 2016
 '''
 
 import time
-import re
+import threading
+import copy
+import array
 from decimal import Decimal
-from functools import reduce
-from typing import Union, List, Tuple, Generator, Iterable
+from typing import Union, List, Tuple, Generator, Iterable, Callable
+
+from six.moves import intern
 
 from lemoncheesecake.consts import LOG_LEVEL_ERROR, LOG_LEVEL_WARN
 from lemoncheesecake.helpers.time import humanize_duration
-from lemoncheesecake.testtree import BaseTest, BaseSuite, flatten_tests, flatten_suites, find_test, find_suite, TreeLocation
+from lemoncheesecake.testtree import BaseTest, BaseSuite, flatten_tests, flatten_suites, find_test, find_suite, \
+    TreeLocation, _normalize_node_hierarchy
 from lemoncheesecake.suite.core import Test
 
 __all__ = (
     "Log", "Check", "Attachment", "Url", "Step", "TestResult",
-    "SuiteResult", "SetupResult", "Report"
+    "SuiteResult", "SetupResult", "TaskTrace", "Report"
 )
 
 TEST_STATUSES = "passed", "failed", "skipped", "disabled"
@@ -28,7 +32,48 @@ DEFAULT_REPORT_TITLE = "Test Report"
 # datetime.isoformat(sep=' ', timespec='milliseconds')
 # unfortunately, the timespec argument is only available since Python 3.6
 
+_TIMESTAMP_SECONDS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class _TimestampCodec(object):
+    """
+    Format and parse the "YYYY-MM-DD HH:MM:SS.mmm" timestamps of the reports. The timestamps of a report
+    mostly come in sequence, the formatting of the last formatted second and the parsing of the last parsed
+    second are then kept, so that strftime/strptime are only called once per second of the report.
+    """
+    def __init__(self):
+        # the cache entries are replaced as a whole, so that the codec can be shared by several threads
+        self._formatted_second = None, None  # (seconds since epoch, formatted seconds)
+        self._parsed_second = None, None  # (formatted seconds, seconds since epoch)
+
+    def format(self, ts):
+        # type: (float) -> str
+        # the rounding gives the same milliseconds as Decimal(repr(round(ts, 3))) % 1 * 1000 would
+        seconds, milliseconds = divmod(int(round(round(ts, 3) * 1000)), 1000)
+        cached_seconds, formatted_seconds = self._formatted_second
+        if seconds != cached_seconds:
+            formatted_seconds = time.strftime(_TIMESTAMP_SECONDS_FORMAT, time.localtime(seconds))
+            self._formatted_second = seconds, formatted_seconds
+        return "%s.%03d" % (formatted_seconds, milliseconds)
+
+    def parse(self, s):
+        # type: (str) -> float
+        formatted_seconds, _, milliseconds = s.rpartition(".")
+        if not formatted_seconds or not milliseconds.isdigit():
+            raise ValueError("s is not valid datetime representation with milliseconds precision")
+        cached_formatted_seconds, seconds = self._parsed_second
+        if formatted_seconds != cached_formatted_seconds:
+            seconds = time.mktime(time.strptime(formatted_seconds, _TIMESTAMP_SECONDS_FORMAT))
+            self._parsed_second = formatted_seconds, seconds
+        return seconds + float(int(milliseconds)) / 1000
+
+
+_timestamp_codec = _TimestampCodec()
+
+
 def format_timestamp(ts, date_time_sep=" ", skip_milliseconds=False):
+    if date_time_sep == " " and not skip_milliseconds:
+        return _timestamp_codec.format(ts)
     ts = round(ts, 3)
     result = time.strftime("%Y-%m-%d{sep}%H:%M:%S".format(sep=date_time_sep), time.localtime(ts))
     if not skip_milliseconds:
@@ -41,13 +86,7 @@ def format_timestamp_as_iso_8601(ts):
 
 
 def parse_timestamp(s):
-    m = re.compile(r"(.+)\.(\d+)").match(s)
-    if not m:
-        raise ValueError("s is not valid datetime representation with milliseconds precision")
-
-    dt, milliseconds = m.group(1), int(m.group(2))
-
-    return time.mktime(time.strptime(dt, "%Y-%m-%d %H:%M:%S")) + float(milliseconds) / 1000
+    return _timestamp_codec.parse(s)
 
 
 def _get_duration(start_time, end_time):
@@ -104,17 +143,119 @@ class Url(object):
         return True
 
 
+def _intern(value):
+    return intern(value) if type(value) is str else value
+
+
+class CompactStepEntries(object):
+    """
+    A list-like container of step entries that stores them column-wise (kinds, flags and times in arrays, texts in
+    lists with the descriptions and log levels interned) instead of keeping one object per entry.
+
+    The entries are handed out as new Log, Check, Attachment and Url objects each time they are accessed:
+    an entry that has been modified must be assigned back (entries[i] = entry) for the change to be kept.
+    """
+    _LOG, _CHECK, _ATTACHMENT, _URL = range(4)
+
+    def __init__(self, entries=()):
+        self._kinds = array.array("b")
+        # check outcome (1, 0, or -1 for None) or attachment's as_image
+        self._flags = array.array("b")
+        self._times = array.array("d")
+        # log message or entry description
+        self._texts = []
+        # log level, check details, attachment filename or url
+        self._extras = []
+        self._nb_failures = 0
+        self.extend(entries)
+
+    def _pack(self, entry):
+        if isinstance(entry, Log):
+            return self._LOG, 0, entry.message, _intern(entry.level)
+        elif isinstance(entry, Check):
+            return self._CHECK, -1 if entry.outcome is None else int(bool(entry.outcome)), \
+                _intern(entry.description), entry.details
+        elif isinstance(entry, Attachment):
+            return self._ATTACHMENT, int(bool(entry.as_image)), _intern(entry.description), entry.filename
+        elif isinstance(entry, Url):
+            return self._URL, 0, _intern(entry.description), entry.url
+        else:
+            raise TypeError("Unsupported step entry %r" % entry)
+
+    def _unpack(self, index):
+        kind, flag, ts = self._kinds[index], self._flags[index], self._times[index]
+        text, extra = self._texts[index], self._extras[index]
+        if kind == self._LOG:
+            return Log(extra, text, ts)
+        elif kind == self._CHECK:
+            return Check(text, None if flag == -1 else bool(flag), extra, ts)
+        elif kind == self._ATTACHMENT:
+            return Attachment(text, extra, bool(flag), ts)
+        else:
+            return Url(text, extra, ts)
+
+    def append(self, entry):
+        kind, flag, text, extra = self._pack(entry)
+        self._kinds.append(kind)
+        self._flags.append(flag)
+        self._times.append(entry.time)
+        self._texts.append(text)
+        self._extras.append(extra)
+        if not entry.is_successful():
+            self._nb_failures += 1
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def is_successful(self):
+        # type: () -> bool
+        return self._nb_failures == 0
+
+    def __len__(self):
+        return len(self._kinds)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._unpack(index)
+
+    def __reversed__(self):
+        for index in reversed(range(len(self))):
+            yield self._unpack(index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._unpack(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("step entry index out of range")
+        return self._unpack(index)
+
+    def __setitem__(self, index, entry):
+        previous_entry = self[index]
+        if index < 0:
+            index += len(self)
+        kind, flag, text, extra = self._pack(entry)
+        self._kinds[index], self._flags[index], self._times[index] = kind, flag, entry.time
+        self._texts[index], self._extras[index] = text, extra
+        self._nb_failures += int(not entry.is_successful()) - int(not previous_entry.is_successful())
+
+
 class Step(object):
-    def __init__(self, description, detached=False):
-        # type: (str, bool) -> None
+    def __init__(self, description, detached=False, compact=False):
+        # type: (str, bool, bool) -> None
         self.description = description
         self._detached = detached  # this attribute is runtime only is not intended to be serialized
-        self.entries = []  # type: List[Union[Log, Check, Attachment, Url]]
+        # a list of Log, Check, Attachment and Url or, for compact steps, a CompactStepEntries
+        self.entries = CompactStepEntries() if compact else []
         self.start_time = None  # type: Union[None, float]
         self.end_time = None  # type: Union[None, float]
 
     def is_successful(self):
         # type: () -> bool
+        if isinstance(self.entries, CompactStepEntries):
+            return self.entries.is_successful()
         return all(entry.is_successful() for entry in self.entries)
 
     @property
@@ -125,10 +266,33 @@ class Step(object):
 
 class Result(object):
     def __init__(self):
-        self.steps = []  # type: List[Step]
+        self._steps = []  # type: List[Step]
+        # a function that builds the steps, called when the steps are first accessed (see set_lazy_steps)
+        self._steps_loader = None
         self.start_time = None  # type: Union[None, float]
         self.end_time = None  # type: Union[None, float]
 
+    @property
+    def steps(self):
+        # type: () -> List[Step]
+        if self._steps_loader is not None:
+            self._steps = self._steps_loader()
+            self._steps_loader = None
+        return self._steps
+
+    @steps.setter
+    def steps(self, steps):
+        # type: (List[Step]) -> None
+        self._steps = steps
+        self._steps_loader = None
+
+    def set_lazy_steps(self, loader):
+        # type: (Callable[[], List[Step]]) -> None
+        """
+        Defer the building of the steps until they are accessed: loader is then called to get them.
+        """
+        self._steps_loader = loader
+
     def is_successful(self):
         # type: () -> bool
         return all(step.is_successful() for step in self.steps)
@@ -148,6 +312,18 @@ class TestResult(BaseTest, Result):
         # non-serialized attributes (only set in-memory during test execution)
         self.rank = 0
 
+    @property
+    def rank(self):
+        # type: () -> int
+        return self._rank
+
+    @rank.setter
+    def rank(self, rank):
+        # type: (int) -> None
+        self._rank = rank
+        if self.parent_suite is not None:
+            self.parent_suite._sorted_tests = None
+
     @classmethod
     def from_test(cls, test):
         # type: (Test) -> TestResult
@@ -189,28 +365,160 @@ class SuiteResult(BaseSuite):
         self.end_time = None  # type: Union[None, float]
         self.suite_setup = None  # type: Union[None, SetupResult]
         self.suite_teardown = None  # type: Union[None, SetupResult]
+        # the index of the report the suite belongs to (if any)
+        self._report_index = None  # type: Union[None, _ReportIndex]
+        self._reset_caches()
         # non-serialized attributes (only set in-memory during test execution)
         self.rank = 0
 
+    def _reset_caches(self):
+        # the tests and suites sorted by rank, reset when a test or suite is added or when its rank changes
+        # (they are also rebuilt if the underlying lists have been changed behind the suite's back)
+        self._sorted_tests = None  # type: Union[None, List[TestResult]]
+        self._sorted_suites = None  # type: Union[None, List[SuiteResult]]
+        # whether the suite has tests (in itself or its sub suites), tests are never removed from a suite
+        self._has_tests = False
+        # the duration of the suite, only cached once the suite and all its results are ended
+        self._duration = None  # type: Union[None, float]
+
+    @property
+    def rank(self):
+        # type: () -> int
+        return self._rank
+
+    @rank.setter
+    def rank(self, rank):
+        # type: (int) -> None
+        self._rank = rank
+        if self.parent_suite is not None:
+            self.parent_suite._sorted_suites = None
+        elif self._report_index is not None:
+            self._report_index.sorted_suites = None
+
+    def _on_subtree_changed(self, has_tests):
+        suite = self
+        while suite is not None:
+            suite._duration = None
+            if has_tests:
+                suite._has_tests = True
+            suite = suite.parent_suite
+
+    def add_test(self, test):
+        # type: (TestResult) -> None
+        BaseSuite.add_test(self, test)
+        self._sorted_tests = None
+        self._on_subtree_changed(has_tests=True)
+        if self._report_index is not None:
+            self._report_index.add_test(test)
+
+    def add_suite(self, suite):
+        # type: (SuiteResult) -> None
+        BaseSuite.add_suite(self, suite)
+        self._sorted_suites = None
+        self._on_subtree_changed(has_tests=suite._has_tests)
+        if self._report_index is not None:
+            self._report_index.add_suite(suite)
+
+    def pull_node(self):
+        # type: () -> SuiteResult
+        node = BaseSuite.pull_node(self)
+        node._report_index = None
+        node._reset_caches()
+        return node
+
+    def _compute_duration(self):
+        # type: () -> Tuple[float, bool]
+        # result.duration is None if the corresponding testish is in progress
+        results = [self.suite_setup] + self.get_tests() + [self.suite_teardown]
+        durations = [result.duration for result in results if result]
+        duration = sum(d or 0 for d in durations)
+        is_ended = self.end_time is not None and None not in durations
+        for suite in self.get_suites():
+            duration += suite.duration
+            is_ended = is_ended and suite._duration is not None
+        return duration, is_ended
+
     @property
     def duration(self):
         # type: () -> Union[None, float]
-        return reduce(
-            lambda x, y: x + y,
-            # result.duration is None if the corresponding testish is in progress
-            [result.duration or 0 for result in flatten_results_from_suites([self])],
-            0
-        )
+        if self._duration is not None:
+            return self._duration
+        duration, is_ended = self._compute_duration()
+        if is_ended:
+            self._duration = duration
+        return duration
+
+    def is_empty(self):
+        # type: () -> bool
+        return not self._has_tests
 
     def get_tests(self):
         # type: () -> List[TestResult]
-        tests = super(SuiteResult, self).get_tests()
-        return sorted(tests, key=lambda t: t.rank)
+        # NB: the returned list is cached, it must not be modified
+        if self._sorted_tests is None or len(self._sorted_tests) != len(self._tests):
+            self._sorted_tests = sorted(BaseSuite.get_tests(self), key=lambda t: t.rank)
+        return self._sorted_tests
 
     def get_suites(self, include_empty_suites=False):
         # type: (bool) -> List[SuiteResult]
-        suites = super(SuiteResult, self).get_suites(include_empty_suites)
-        return sorted(suites, key=lambda s: s.rank)
+        if self._sorted_suites is None or len(self._sorted_suites) != len(self._suites):
+            self._sorted_suites = sorted(BaseSuite.get_suites(self, include_empty_suites=True), key=lambda s: s.rank)
+        if include_empty_suites:
+            return self._sorted_suites
+        else:
+            return [suite for suite in self._sorted_suites if suite._has_tests]
+
+
+class TaskTrace(object):
+    """
+    The scheduling data of a task run during the test session: when it became ready to be run (all its
+    dependencies being completed), when it has been started and ended and the worker (thread) that ran it.
+    Dependencies are the indexes of the traces of the task's dependencies in the report's task traces.
+    """
+    def __init__(self, name, category, ready_time, start_time, end_time, worker, dependencies=()):
+        # type: (str, str, Union[None, float], float, float, str, Iterable[int]) -> None
+        self.name = name
+        self.category = category
+        self.ready_time = ready_time
+        self.start_time = start_time
+        self.end_time = end_time
+        self.worker = worker
+        self.dependencies = list(dependencies)
+
+    @property
+    def duration(self):
+        # type: () -> float
+        return _get_duration(self.start_time, self.end_time)
+
+    @property
+    def queue_wait(self):
+        # type: () -> float
+        return _get_duration(self.ready_time, self.start_time) if self.ready_time is not None else 0
+
+
+class _ReportIndex(object):
+    """
+    The suites and tests of a report indexed by hierarchy (a tuple of node names), the index is updated
+    as suites and tests are added to the report (or to its suites). It also caches the root suites of
+    the report sorted by rank.
+    """
+    def __init__(self):
+        self.suites = {}
+        self.tests = {}
+        self.sorted_suites = None  # type: Union[None, List[SuiteResult]]
+
+    def add_suite(self, suite):
+        # type: (SuiteResult) -> None
+        suite._report_index = self
+        self.suites[_normalize_node_hierarchy(suite)] = suite
+        for test in suite.get_tests():
+            self.add_test(test)
+        for sub_suite in suite.get_suites(include_empty_suites=True):
+            self.add_suite(sub_suite)
+
+    def add_test(self, test):
+        # type: (TestResult) -> None
+        self.tests[_normalize_node_hierarchy(test)] = test
 
 
 class _Stats(object):
@@ -241,24 +549,30 @@ class _Stats(object):
             description += " (parallelization speedup factor is %.1f)" % (float(self.duration_cumulative) / self.duration)
         return description
 
+    def add_result_duration(self, result):
+        if result.duration is not None:
+            self.duration_cumulative += result.duration
+
+    def add_entry(self, entry):
+        if isinstance(entry, Check):
+            self.checks += 1
+            if entry.outcome == True:
+                self.check_successes += 1
+            elif entry.outcome == False:
+                self.check_failures += 1
+        if isinstance(entry, Log):
+            if entry.level == LOG_LEVEL_WARN:
+                self.warning_logs += 1
+            elif entry.level == LOG_LEVEL_ERROR:
+                self.error_logs += 1
+
 
 def _update_stats_from_results(stats, results):
     for result in results:
-        if result.duration is not None:
-            stats.duration_cumulative += result.duration
+        stats.add_result_duration(result)
         for step in result.steps:
             for entry in step.entries:
-                if isinstance(entry, Check):
-                    stats.checks += 1
-                    if entry.outcome == True:
-                        stats.check_successes += 1
-                    elif entry.outcome == False:
-                        stats.check_failures += 1
-                if isinstance(entry, Log):
-                    if entry.level == LOG_LEVEL_WARN:
-                        stats.warning_logs += 1
-                    elif entry.level == LOG_LEVEL_ERROR:
-                        stats.error_logs += 1
+                stats.add_entry(entry)
 
 
 def _update_stats_from_tests(stats, tests):
@@ -294,6 +608,12 @@ class Report:
         self.report_generation_time = None  # type: Union[None, float]
         self.title = DEFAULT_REPORT_TITLE
         self.nb_threads = 1
+        self.task_traces = []  # type: List[TaskTrace]
+        self._index = _ReportIndex()
+        # held by the report writer while it updates the report, so that other threads can read a consistent report
+        self.lock = threading.RLock()
+        # stats updated as the report is built (see enable_incremental_stats)
+        self._incremental_stats = None  # type: Union[None, _Stats]
 
     @property
     def duration(self):
@@ -303,6 +623,8 @@ class Report:
     @property
     def nb_tests(self):
         # type: () -> int
+        if self._incremental_stats is not None:
+            return self._incremental_stats.tests
         return len(list(self.all_tests()))
 
     @property
@@ -317,18 +639,38 @@ class Report:
     def add_suite(self, suite):
         # type: (SuiteResult) -> None
         self._suites.append(suite)
+        self._index.add_suite(suite)
+        self._index.sorted_suites = None
     
+    def add_task_traces(self, traces, worker_prefix=""):
+        # type: (List[TaskTrace], str) -> None
+        # the dependencies of the traces are indexes relative to the given traces
+        offset = len(self.task_traces)
+        for trace in traces:
+            self.task_traces.append(TaskTrace(
+                trace.name, trace.category, trace.ready_time, trace.start_time, trace.end_time,
+                worker_prefix + trace.worker, [dependency + offset for dependency in trace.dependencies]
+            ))
+
     def get_suites(self):
         # type: () -> List[SuiteResult]
-        return sorted(self._suites, key=lambda s: s.rank)
+        # NB: the returned list is cached, it must not be modified
+        if self._index.sorted_suites is None or len(self._index.sorted_suites) != len(self._suites):
+            self._index.sorted_suites = sorted(self._suites, key=lambda s: s.rank)
+        return self._index.sorted_suites
 
     def get_suite(self, hierarchy):
         # type: (List[str]) -> SuiteResult
-        return find_suite(self._suites, hierarchy)
+        hierarchy = _normalize_node_hierarchy(hierarchy)
+        suite = self._index.suites.get(hierarchy)
+        # fallback on a lookup through the suites for nodes that have been added behind the index's back
+        return suite if suite is not None else find_suite(self._suites, hierarchy)
 
     def get_test(self, hierarchy):
         # type: (List[str]) -> TestResult
-        return find_test(self._suites, hierarchy)
+        hierarchy = _normalize_node_hierarchy(hierarchy)
+        test = self._index.tests.get(hierarchy)
+        return test if test is not None else find_test(self._suites, hierarchy)
 
     def get(self, location):
         # type: (TreeLocation) -> Union[SetupResult, SuiteResult, TestResult]
@@ -349,10 +691,25 @@ class Report:
 
     def is_successful(self):
         # type: () -> bool
+        if self._incremental_stats is not None:
+            stats = self._incremental_stats
+            return stats.test_statuses["passed"] + stats.test_statuses["disabled"] == stats.tests
         return all(test.status in ("passed", "disabled") for test in self.all_tests())
 
-    def stats(self):
+    def enable_incremental_stats(self):
         # type: () -> _Stats
+        """
+        Make stats(), is_successful() and nb_tests use stats that are updated as the report is being built
+        (by ReportWriter, which updates the returned stats) instead of walking the whole report.
+        """
+        self._incremental_stats = self.compute_stats()
+        return self._incremental_stats
+
+    def compute_stats(self):
+        # type: () -> _Stats
+        """
+        Compute the stats by walking the whole report, whether incremental stats are enabled or not.
+        """
         stats = _Stats()
 
         if self.end_time is not None:
@@ -362,6 +719,15 @@ class Report:
 
         return stats
 
+    def stats(self):
+        # type: () -> _Stats
+        if self._incremental_stats is None:
+            return self.compute_stats()
+
+        stats = copy.deepcopy(self._incremental_stats)
+        stats.duration = self.end_time - self.start_time if self.end_time is not None else None
+        return stats
+
     def serialize_stats(self):
         # type: () -> Tuple
         stats = self.stats()
@@ -14,6 +14,13 @@ import shutil
 DEFAULT_REPORT_DIR_NAME = "report"
 
 
+def get_last_report_dir(top_dir):
+    # with both report directory creation methods, the last report is accessible through "report"
+    # (either the directory itself or a symlink to the archived directory)
+    report_dir = os.path.join(top_dir, DEFAULT_REPORT_DIR_NAME)
+    return report_dir if os.path.exists(report_dir) else None
+
+
 def archive_dirname_datetime(ts, archives_dir):
     return time.strftime("report-%Y%m%d-%H%M%S", time.localtime(ts))
 
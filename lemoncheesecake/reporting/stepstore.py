@@ -0,0 +1,186 @@
+'''
+Out-of-core storage of the steps of the tests: once a test is ended and the reporting sessions have handled
+its end, its steps are written into segment files in the report directory and dropped from memory,
+they are then read back from the disk each time they are accessed.
+'''
+
+import os
+import os.path as osp
+import json
+import threading
+import array
+
+from lemoncheesecake import events
+from lemoncheesecake.reporting.report import Log, Check, Attachment, Url, Step
+
+STEP_STORE_DIR = "spilled-steps"
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+
+
+def _serialize_entry(entry):
+    if isinstance(entry, Log):
+        return ["log", entry.level, entry.message, entry.time]
+    elif isinstance(entry, Check):
+        return ["check", entry.description, entry.outcome, entry.details, entry.time]
+    elif isinstance(entry, Attachment):
+        return ["attachment", entry.description, entry.filename, entry.as_image, entry.time]
+    elif isinstance(entry, Url):
+        return ["url", entry.description, entry.url, entry.time]
+    else:
+        raise TypeError("Unsupported step entry %r" % entry)
+
+
+_ENTRY_CLASSES = {"log": Log, "check": Check, "attachment": Attachment, "url": Url}
+
+
+def _serialize_step(step):
+    return [step.description, step.start_time, step.end_time, [_serialize_entry(entry) for entry in step.entries]]
+
+
+def _unserialize_step(serialized_step):
+    description, start_time, end_time, entries = serialized_step
+    step = Step(description)
+    step.start_time = start_time
+    step.end_time = end_time
+    step.entries.extend(_ENTRY_CLASSES[entry[0]](*entry[1:]) for entry in entries)
+    return step
+
+
+class SpilledSteps(object):
+    """
+    The steps of a test that have been written into a StepStore: a read-only sequence that reads
+    the steps from the disk each time they are accessed. Each step being stored as its own record,
+    indexing a step only reads this step and iterating reads the steps one after the other.
+    """
+    def __init__(self, store, segment, offset, step_ends):
+        self._store = store
+        self._segment = segment
+        self._offset = offset
+        # the end offset of each step record, relative to the offset of the first one
+        self._step_ends = step_ends
+
+    def load(self):
+        return list(self)
+
+    def __len__(self):
+        return len(self._step_ends)
+
+    def __iter__(self):
+        return self._store.iter_steps(self._segment, self._offset, len(self._step_ends))
+
+    def __reversed__(self):
+        return (self[index] for index in range(len(self) - 1, -1, -1))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("step index out of range")
+        start = self._step_ends[index - 1] if index > 0 else 0
+        return self._store.read_step(self._segment, self._offset + start, self._step_ends[index] - start)
+
+
+class StepStore(object):
+    """
+    An append-only store of steps made of segment files (a new segment being started once the current
+    one exceeds segment_size bytes), each record being a step as a JSON line.
+    """
+    def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        self._segment = 0
+        self._segment_used_size = 0
+        self._lock = threading.Lock()
+
+    def _get_segment_path(self, segment):
+        return osp.join(self.directory, "segment-%04d.jsonl" % segment)
+
+    def write(self, steps):
+        # type: (list) -> SpilledSteps
+        records = [(json.dumps(_serialize_step(step)) + "\n").encode("utf-8") for step in steps]
+        step_ends = array.array("l")
+        size = 0
+        for record in records:
+            size += len(record)
+            step_ends.append(size)
+        with self._lock:
+            if self._segment == 0 or self._segment_used_size >= self.segment_size:
+                if not osp.exists(self.directory):
+                    os.mkdir(self.directory)
+                self._segment += 1
+                self._segment_used_size = 0
+            offset = self._segment_used_size
+            with open(self._get_segment_path(self._segment), "ab") as fh:
+                fh.write(b"".join(records))
+            self._segment_used_size += size
+            return SpilledSteps(self, self._segment, offset, step_ends)
+
+    def read_step(self, segment, offset, length):
+        with open(self._get_segment_path(segment), "rb") as fh:
+            fh.seek(offset)
+            data = fh.read(length)
+        return _unserialize_step(json.loads(data.decode("utf-8")))
+
+    def iter_steps(self, segment, offset, nb_steps):
+        with open(self._get_segment_path(segment), "rb") as fh:
+            fh.seek(offset)
+            for _ in range(nb_steps):
+                yield _unserialize_step(json.loads(fh.readline().decode("utf-8")))
+
+
+class _TestEndAcknowledger(object):
+    def __init__(self, spiller):
+        self.spiller = spiller
+
+    def on_events(self, batch):
+        for event in batch:
+            if isinstance(event, events.TestEndEvent):
+                self.spiller.acknowledge_test_end(event.test.path)
+
+
+class StepSpiller(object):
+    """
+    Event listener that moves the steps of the ended tests of the report into a StepStore. The steps of a test
+    are moved once the test end has been handled by every watched event channel (those of the reporting sessions,
+    which may need the steps of the test when it ends).
+
+    The spiller must be added to the event manager after the ReportWriter and before the watched channels.
+    """
+    def __init__(self, report, store):
+        self.report = report
+        self.store = store
+        self._nb_channels = 0
+        # test path => number of channels that have still to handle the test end
+        self._pending_tests = {}
+        self._lock = threading.Lock()
+
+    def watch_channel(self, channel):
+        self._nb_channels += 1
+        channel.add_batch_listener(_TestEndAcknowledger(self))
+
+    def _spill(self, test_path):
+        test_data = self.report.get_test(test_path)
+        if test_data.steps:
+            spilled_steps = self.store.write(test_data.steps)
+            with self.report.lock:
+                test_data.steps = spilled_steps
+
+    def acknowledge_test_end(self, test_path):
+        with self._lock:
+            self._pending_tests[test_path] -= 1
+            if self._pending_tests[test_path] > 0:
+                return
+            del self._pending_tests[test_path]
+        self._spill(test_path)
+
+    def on_events(self, batch):
+        for event in batch:
+            if isinstance(event, events.TestEndEvent):
+                if self._nb_channels:
+                    with self._lock:
+                        self._pending_tests[event.test.path] = self._nb_channels
+                else:
+                    self._spill(event.test.path)
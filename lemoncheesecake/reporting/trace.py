@@ -0,0 +1,105 @@
+'''
+Analyze the task traces of a report (how the tasks of the test session have been scheduled over the worker
+threads) and export them as Chrome trace events (as understood by chrome://tracing or Perfetto).
+'''
+
+from typing import List, Tuple, Dict
+
+from lemoncheesecake.reporting.report import TaskTrace
+
+
+def get_workers(traces):
+    # type: (List[TaskTrace]) -> List[str]
+    """
+    Return the workers that ran the traced tasks, sorted by the time they started their first task.
+    """
+    workers = []
+    for trace in sorted(traces, key=lambda t: t.start_time):
+        if trace.worker not in workers:
+            workers.append(trace.worker)
+    return workers
+
+
+def get_traces_time_span(traces):
+    # type: (List[TaskTrace]) -> Tuple[float, float]
+    return min(trace.start_time for trace in traces), max(trace.end_time for trace in traces)
+
+
+def get_worker_utilizations(traces):
+    # type: (List[TaskTrace]) -> List[Tuple[str, int, float, float]]
+    """
+    Return for each worker: its name, the number of tasks it ran, the time it spent running them and
+    the ratio of this busy time to the time span of the traces.
+    """
+    start_time, end_time = get_traces_time_span(traces)
+    span = end_time - start_time
+    stats = {}  # type: Dict[str, List]
+    for trace in traces:
+        worker_stats = stats.setdefault(trace.worker, [0, 0.0])
+        worker_stats[0] += 1
+        worker_stats[1] += trace.duration
+
+    return [
+        (worker, stats[worker][0], stats[worker][1], stats[worker][1] / span if span else 1.0)
+        for worker in get_workers(traces)
+    ]
+
+
+def get_traces_by_queue_wait(traces):
+    # type: (List[TaskTrace]) -> List[TaskTrace]
+    return sorted(traces, key=lambda trace: trace.queue_wait, reverse=True)
+
+
+def get_critical_path(traces):
+    # type: (List[TaskTrace]) -> List[TaskTrace]
+    """
+    Return the chain of tasks that determined the end of the session: starting from the last completed task,
+    walk back through the dependency that completed last (the one that made the task ready).
+    """
+    if not traces:
+        return []
+
+    path = [max(traces, key=lambda trace: trace.end_time)]
+    while path[-1].dependencies:
+        path.append(max((traces[idx] for idx in path[-1].dependencies), key=lambda trace: trace.end_time))
+
+    return list(reversed(path))
+
+
+def get_trace_label(trace):
+    # type: (TaskTrace) -> str
+    return trace.name if trace.category == "test" else "%s (%s)" % (trace.name, trace.category)
+
+
+def _to_microseconds(value):
+    return int(round(value * 1000000))
+
+
+def build_chrome_trace(traces):
+    # type: (List[TaskTrace]) -> dict
+    """
+    Build a Chrome trace (as a JSON-serializable dict) where each worker is a thread and each task a complete event.
+    """
+    origin, _ = get_traces_time_span(traces)
+    worker_ids = {worker: worker_id for worker_id, worker in enumerate(get_workers(traces), start=1)}
+
+    events = [
+        {"name": "thread_name", "ph": "M", "pid": 1, "tid": worker_id, "args": {"name": worker}}
+        for worker, worker_id in sorted(worker_ids.items(), key=lambda item: item[1])
+    ]
+    for trace in traces:
+        events.append({
+            "name": get_trace_label(trace),
+            "cat": trace.category,
+            "ph": "X",
+            "pid": 1,
+            "tid": worker_ids[trace.worker],
+            "ts": _to_microseconds(trace.start_time - origin),
+            "dur": _to_microseconds(trace.duration),
+            "args": {
+                "queue_wait_ms": round(trace.queue_wait * 1000, 3),
+                "dependencies": [get_trace_label(traces[idx]) for idx in trace.dependencies]
+            }
+        })
+
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -4,15 +4,29 @@ Created on Jan 24, 2016
 @author: nicolas
 '''
 
+import functools
+
 from lemoncheesecake.reporting.report import *
 from lemoncheesecake.exceptions import ProgrammingError
 
 __all__ = "ReportWriter",
 
 
+def _locked(method):
+    # the event handlers update the report while holding its lock (see Report.lock)
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.report.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class ReportWriter:
-    def __init__(self, report):
+    def __init__(self, report, compact_entries=False):
         self.report = report
+        # whether the steps store their entries in a compact form (see CompactStepEntries)
+        self.compact_entries = compact_entries
+        self._stats = report.enable_incremental_stats()
 
     def _get_test_data(self, test):
         return self.report.get_test(test)
@@ -28,6 +42,7 @@ class ReportWriter:
         if step.end_time:
             raise ProgrammingError("Cannot update step '%s', it is already ended" % step.description)
         step.entries.append(entry)
+        self._stats.add_entry(entry)
 
     @staticmethod
     def _start_hook(ts):
@@ -35,11 +50,11 @@ class ReportWriter:
         hook_data.start_time = ts
         return hook_data
 
-    @staticmethod
-    def _end_hook(hook_data, ts):
+    def _end_hook(self, hook_data, ts):
         if hook_data:
             hook_data.end_time = ts
             hook_data.outcome = hook_data.is_successful()
+            self._stats.add_result_duration(hook_data)
 
     @staticmethod
     def _lookup_step(steps, step):
@@ -71,16 +86,20 @@ class ReportWriter:
                 # remove empty step
                 steps.remove(step)
 
+    @_locked
     def on_test_session_start(self, event):
         self.report.start_time = event.time
 
+    @_locked
     def on_test_session_end(self, event):
         self.report.end_time = event.time
         self.report.report_generation_time = self.report.end_time
 
+    @_locked
     def on_test_session_setup_start(self, event):
         self.report.test_session_setup = self._start_hook(event.time)
 
+    @_locked
     def on_test_session_setup_end(self, event):
         self._finalize_steps(self.report.test_session_setup.steps, event.time)
 
@@ -89,9 +108,11 @@ class ReportWriter:
         else:
             self._end_hook(self.report.test_session_setup, event.time)
 
+    @_locked
     def on_test_session_teardown_start(self, event):
         self.report.test_session_teardown = self._start_hook(event.time)
 
+    @_locked
     def on_test_session_teardown_end(self, event):
         self._finalize_steps(self.report.test_session_teardown.steps, event.time)
 
@@ -100,6 +121,11 @@ class ReportWriter:
         else:
             self._end_hook(self.report.test_session_teardown, event.time)
 
+    @_locked
+    def on_task_traces(self, event):
+        self.report.add_task_traces(event.traces, event.worker_prefix)
+
+    @_locked
     def on_suite_start(self, event):
         suite = event.suite
         suite_data = SuiteResult(suite.name, suite.description)
@@ -114,14 +140,17 @@ class ReportWriter:
         else:
             self.report.add_suite(suite_data)
 
+    @_locked
     def on_suite_end(self, event):
         suite_data = self._get_suite_data(event.suite)
         suite_data.end_time = event.time
 
+    @_locked
     def on_suite_setup_start(self, event):
         suite_data = self._get_suite_data(event.suite)
         suite_data.suite_setup = self._start_hook(event.time)
 
+    @_locked
     def on_suite_setup_end(self, event):
         suite_data = self._get_suite_data(event.suite)
         self._finalize_steps(suite_data.suite_setup.steps, event.time)
@@ -131,11 +160,13 @@ class ReportWriter:
         else:
             self._end_hook(suite_data.suite_setup, event.time)
 
+    @_locked
     def on_suite_teardown_start(self, event):
         suite_data = self._get_suite_data(event.suite)
 
         suite_data.suite_teardown = self._start_hook(event.time)
 
+    @_locked
     def on_suite_teardown_end(self, event):
         suite_data = self._get_suite_data(event.suite)
         self._finalize_steps(suite_data.suite_teardown.steps, event.time)
@@ -145,6 +176,7 @@ class ReportWriter:
         else:
             self._end_hook(suite_data.suite_teardown, event.time)
 
+    @_locked
     def on_test_start(self, event):
         test = event.test
 
@@ -153,13 +185,17 @@ class ReportWriter:
 
         suite_data = self._get_suite_data(event.test.parent_suite)
         suite_data.add_test(test_data)
+        self._stats.tests += 1
 
+    @_locked
     def on_test_end(self, event):
         test_data = self._get_test_data(event.test)
         self._finalize_steps(test_data.steps, event.time)
 
         test_data.status = "passed" if test_data.is_successful() else "failed"
         test_data.end_time = event.time
+        self._stats.test_statuses[test_data.status] += 1
+        self._stats.add_result_duration(test_data)
 
     def _bypass_test(self, test, status, status_details, time):
         test_data = TestResult.from_test(test)
@@ -169,23 +205,30 @@ class ReportWriter:
 
         suite_data = self._get_suite_data(test.parent_suite)
         suite_data.add_test(test_data)
+        self._stats.tests += 1
+        self._stats.test_statuses[status] += 1
+        self._stats.add_result_duration(test_data)
 
+    @_locked
     def on_test_skipped(self, event):
         self._bypass_test(event.test, "skipped", event.skipped_reason, event.time)
 
+    @_locked
     def on_test_disabled(self, event):
         self._bypass_test(event.test, "disabled", "", event.time)
 
+    @_locked
     def on_step(self, event):
         report_node_data = self.report.get(event.location)
         current_step = self._lookup_current_step(report_node_data.steps)
         if current_step:
             current_step.end_time = event.time
 
-        new_step = Step(event.step_description, detached=event.detached)
+        new_step = Step(event.step_description, detached=event.detached, compact=self.compact_entries)
         new_step.start_time = event.time
         report_node_data.steps.append(new_step)
 
+    @_locked
     def on_step_end(self, event):
         report_node_data = self.report.get(event.location)
         step = self._lookup_step(report_node_data.steps, event.step)
@@ -194,21 +237,25 @@ class ReportWriter:
         if step._detached:
             step.end_time = event.time
 
+    @_locked
     def on_log(self, event):
         self._add_step_entry(
             Log(event.log_level, event.log_message, event.time), event
         )
 
+    @_locked
     def on_check(self, event):
         self._add_step_entry(
             Check(event.check_description, event.check_outcome, event.check_details, event.time), event
         )
 
+    @_locked
     def on_log_attachment(self, event):
         self._add_step_entry(
             Attachment(event.attachment_description, event.attachment_path, event.as_image, event.time), event
         )
 
+    @_locked
     def on_log_url(self, event):
         self._add_step_entry(
             Url(event.url_description, event.url, event.time), event
@@ -4,6 +4,7 @@ Created on Jan 24, 2016
 @author: nicolas
 '''
 
+import os
 import traceback
 import threading
 import itertools
@@ -12,13 +13,17 @@ import six
 
 from lemoncheesecake.runtime import initialize_runtime, initialize_fixtures_cache, set_runtime_location,\
     is_location_successful, is_everything_successful, mark_location_as_failed, get_report,\
-    log_error, set_step
+    log_error, set_step, get_local_state, set_local_state
 from lemoncheesecake.exceptions import AbortTest, AbortSuite, AbortAllTests, FixtureError, \
     UserError, TaskFailure, serialize_current_exception
 from lemoncheesecake import events
 from lemoncheesecake.testtree import TreeLocation, flatten_tests
-from lemoncheesecake.task import BaseTask, run_tasks
-from lemoncheesecake.reporting import Report, ReportWriter
+from lemoncheesecake.task import BaseTask, TaskSuspension, run_tasks
+from lemoncheesecake.coroutines import is_coroutine, submit_coroutine, resolve_coroutine, get_max_concurrency, \
+    shutdown_event_loop
+from lemoncheesecake.reporting import Report, ReportWriter, TaskTrace
+from lemoncheesecake.reporting.journal import EventJournal, JOURNAL_FILENAME
+from lemoncheesecake.reporting.stepstore import StepStore, StepSpiller, STEP_STORE_DIR
 
 
 class RunContext(object):
@@ -63,7 +68,7 @@ class RunContext(object):
         for setup_func, teardown_func in funcs:
             if setup_func:
                 try:
-                    setup_func()
+                    resolve_coroutine(setup_func())
                 except Exception as e:
                     self.handle_exception(e)
                     break
@@ -80,7 +85,7 @@ class RunContext(object):
         for teardown_func in teardown_funcs:
             if teardown_func:
                 try:
-                    teardown_func()
+                    resolve_coroutine(teardown_func())
                 except Exception as e:
                     self.handle_exception(e)
 
@@ -116,6 +121,12 @@ class TestTask(BaseTask):
     def get_on_success_dependencies(self):
         return self.dependencies
 
+    def get_resources(self):
+        return self.test.get_resources()
+
+    def get_group(self):
+        return self.test.parent_suite
+
     def skip(self, context, reason=""):
         context.event_manager.fire(events.TestSkippedEvent(self.test, "Test skipped because %s" % reason))
         mark_location_as_failed(TreeLocation.in_test(self.test))
@@ -143,14 +154,14 @@ class TestTask(BaseTask):
 
         if suite.has_hook("setup_test"):
             def setup_test_wrapper():
-                suite.get_hook("setup_test")(self.test)
+                return suite.get_hook("setup_test")(self.test)
         else:
             setup_test_wrapper = None
 
         if suite.has_hook("teardown_test"):
             def teardown_test_wrapper():
                 status_so_far = "passed" if is_location_successful(TreeLocation.in_test(self.test)) else "failed"
-                suite.get_hook("teardown_test")(self.test, status_so_far)
+                return suite.get_hook("teardown_test")(self.test, status_so_far)
         else:
             teardown_test_wrapper = None
 
@@ -175,10 +186,30 @@ class TestTask(BaseTask):
             test_func_params = scheduled_fixtures.get_fixture_results(self.test.get_fixtures())
             set_step(self.test.description)
             try:
-                self.test.callback(**test_func_params)
+                result = self.test.callback(**test_func_params)
+                if is_coroutine(result):
+                    # the task's thread is released while the test coroutine is run on the event loop
+                    local_state = get_local_state()
+                    return TaskSuspension(
+                        submit_coroutine(result),
+                        lambda future: self._resume(context, future, local_state, teardown_funcs)
+                    )
             except Exception as e:
                 context.handle_exception(e, suite)
 
+        self._end(context, teardown_funcs)
+
+    def _resume(self, context, future, local_state, teardown_funcs):
+        # the task is resumed in another thread than the one it has been started in
+        set_local_state(local_state)
+        try:
+            future.result()
+        except Exception as e:
+            context.handle_exception(e, self.test.parent_suite)
+
+        self._end(context, teardown_funcs)
+
+    def _end(self, context, teardown_funcs):
         ###
         # Teardown
         ###
@@ -236,8 +267,9 @@ def build_suite_tasks(
     ###
     # Build sub suite tasks
     ###
+    sub_suites = suite.get_suites()
     sub_suite_tasks = []
-    for sub_suite in suite.get_suites():
+    for sub_suite in sub_suites:
         sub_suite_tasks.extend(
             build_suite_tasks(
                 sub_suite, fixture_registry, session_scheduled_fixtures, test_session_setup_task, suite_beginning_task
@@ -252,7 +284,7 @@ def build_suite_tasks(
     if suite_teardown_task:
         suite_ending_dependencies.append(suite_teardown_task)
     suite_ending_dependencies.extend(
-        task for task in sub_suite_tasks if isinstance(task, SuiteEndingTask) and task.suite in suite.get_suites()
+        task for task in sub_suite_tasks if isinstance(task, SuiteEndingTask) and task.suite in sub_suites
     )
     suite_ending_task = build_suite_ending_task(suite, suite_ending_dependencies)
 
@@ -273,6 +305,9 @@ class SuiteBeginningTask(BaseTask):
         self.suite = suite
         self._dependencies = dependencies
 
+    def get_group(self):
+        return self.suite
+
     def get_on_success_dependencies(self):
         return self._dependencies
 
@@ -301,6 +336,13 @@ class SuiteInitializationTask(BaseTask):
     def get_on_success_dependencies(self):
         return self._dependencies
 
+    def get_group(self):
+        return self.suite
+
+    def opens_group(self):
+        # the suite scheduled fixtures are set up by this task
+        return True
+
     def run(self, context):
         if any(setup for setup, _ in self.setup_teardown_funcs):
             # before actual initialization
@@ -330,7 +372,7 @@ def wrap_setup_suite(suite, scheduled_fixtures):
     fixtures_names = suite.get_hook_params("setup_suite")
     def wrapper():
         fixtures = scheduled_fixtures.get_fixture_results(fixtures_names)
-        setup_suite(**fixtures)
+        return setup_suite(**fixtures)
 
     return wrapper
 
@@ -362,6 +404,9 @@ class SuiteEndingTask(BaseTask):
         self.suite = suite
         self._dependencies = dependencies
 
+    def get_group(self):
+        return self.suite
+
     def get_on_success_dependencies(self):
         return self._dependencies
 
@@ -389,6 +434,12 @@ class SuiteTeardownTask(BaseTask):
     def get_on_completion_dependencies(self):
         return self._dependencies
 
+    def get_group(self):
+        return self.suite
+
+    def closes_group(self):
+        return True
+
     def run(self, context):
         if any(self.suite_setup_task.teardown_funcs):
             # before actual teardown
@@ -467,11 +518,39 @@ def build_test_session_teardown_task(test_session_setup_task, dependencies):
     return TestSessionTeardownTask(test_session_setup_task, dependencies) if test_session_setup_task else None
 
 
-def lookup_test_task(tasks, test_path):
-    try:
-        return next(task for task in tasks if isinstance(task, TestTask) and task.test.path == test_path)
-    except StopIteration:
-        raise LookupError("Cannot find test '%s' in tasks" % test_path)
+def build_suites_tasks(suites, fixture_registry, session_scheduled_fixtures, test_session_setup_task=None):
+    """
+    Build the tasks of the given suites, their session scheduled fixtures must be set up either by
+    test_session_setup_task or beforehand.
+    """
+    ###
+    # Build suite tasks
+    ###
+    tasks = []
+    for suite in suites:
+        tasks.extend(
+            build_suite_tasks(suite, fixture_registry, session_scheduled_fixtures, test_session_setup_task)
+        )
+
+    ###
+    # Add extra dependencies in tasks for tests that depend on other tests
+    ###
+    test_tasks = {task.test.path: task for task in tasks if isinstance(task, TestTask)}
+    for test in flatten_tests(suites):
+        if not test.dependencies:
+            continue
+        test_task = test_tasks[test.path]
+        for dep_test_path in test.dependencies:
+            try:
+                dep_test = test_tasks[dep_test_path]
+            except KeyError:
+                raise UserError(
+                    "Cannot find dependency test '%s' for '%s', "
+                    "either the test does not exist or is not going to be run" % (dep_test_path, test.path)
+                )
+            test_task.dependencies.append(dep_test)
+
+    return tasks
 
 
 def build_tasks(suites, fixture_registry, session_scheduled_fixtures):
@@ -483,11 +562,7 @@ def build_tasks(suites, fixture_registry, session_scheduled_fixtures):
     ###
     # Build suite tasks
     ###
-    suite_tasks = []
-    for suite in suites:
-        suite_tasks.extend(
-            build_suite_tasks(suite, fixture_registry, session_scheduled_fixtures, test_session_setup_task)
-        )
+    suite_tasks = build_suites_tasks(suites, fixture_registry, session_scheduled_fixtures, test_session_setup_task)
 
     ###
     # Build test session teardown task
@@ -503,48 +578,132 @@ def build_tasks(suites, fixture_registry, session_scheduled_fixtures):
         test_session_teardown_task = None
 
     ###
-    # Get all effective tasks (task != None)
+    # Return all effective tasks (task != None)
     ###
     task_iter = itertools.chain((test_session_setup_task,), suite_tasks, (test_session_teardown_task,))
-    tasks = list(filter(bool, task_iter))
+    return list(filter(bool, task_iter))
 
-    ###
-    # Add extra dependencies in tasks for tests that depend on other tests
-    ###
-    for test in flatten_tests(suites):
-        if not test.dependencies:
-            continue
-        test_task = lookup_test_task(tasks, test.path)
-        for dep_test_path in test.dependencies:
-            try:
-                dep_test = lookup_test_task(tasks, dep_test_path)
-            except LookupError:
-                raise UserError(
-                    "Cannot find dependency test '%s' for '%s', "
-                    "either the test does not exist or is not going to be run" % (dep_test_path, test.path)
-                )
-            test_task.dependencies.append(dep_test)
 
-    ###
-    # Return tasks
-    ###
-    return tasks
+def _get_result_duration(result):
+    return (result.duration or 0) if result else 0
+
+
+def get_task_durations_from_report(tasks, report):
+    """
+    Get the durations of the given tasks from a previous report. Tests that cannot be found in the report
+    are considered as lasting the average test duration.
+    """
+    test_durations = {test.path: test.duration for test in report.all_tests() if test.duration is not None}
+    suite_results = {suite.path: suite for suite in report.all_suites()}
+    default_test_duration = float(sum(test_durations.values())) / len(test_durations) if test_durations else 0
+
+    durations = {}
+    for task in tasks:
+        if isinstance(task, TestTask):
+            durations[task] = test_durations.get(task.test.path, default_test_duration)
+        elif isinstance(task, SuiteInitializationTask):
+            suite_result = suite_results.get(task.suite.path)
+            durations[task] = _get_result_duration(suite_result.suite_setup if suite_result else None)
+        elif isinstance(task, SuiteTeardownTask):
+            suite_result = suite_results.get(task.suite.path)
+            durations[task] = _get_result_duration(suite_result.suite_teardown if suite_result else None)
+        elif isinstance(task, TestSessionSetupTask):
+            durations[task] = _get_result_duration(report.test_session_setup)
+        elif isinstance(task, TestSessionTeardownTask):
+            durations[task] = _get_result_duration(report.test_session_teardown)
+
+    return durations
+
+
+def _get_task_trace_name_and_category(task):
+    if isinstance(task, TestTask):
+        return task.test.path, "test"
+    elif isinstance(task, SuiteBeginningTask):
+        return task.suite.path, "suite_beginning"
+    elif isinstance(task, SuiteInitializationTask):
+        return task.suite.path, "suite_setup"
+    elif isinstance(task, SuiteTeardownTask):
+        return task.suite.path, "suite_teardown"
+    elif isinstance(task, SuiteEndingTask):
+        return task.suite.path, "suite_ending"
+    elif isinstance(task, TestSessionSetupTask):
+        return "test_session", "test_session_setup"
+    elif isinstance(task, TestSessionTeardownTask):
+        return "test_session", "test_session_teardown"
+    else:
+        return str(task), "task"
+
+
+def build_task_traces(tasks):
+    """
+    Build the TaskTrace's of the given (run) tasks. Worker threads are named after the order in which they
+    started their first task.
+    """
+    tasks = [task for task in tasks if task.start_time is not None and task.end_time is not None]
+    task_indexes = {task: idx for idx, task in enumerate(tasks)}
+    workers = {}
+    for task in sorted(tasks, key=lambda t: t.start_time):
+        if task.thread_name not in workers:
+            workers[task.thread_name] = "thread-%d" % (len(workers) + 1)
+
+    traces = []
+    for task in tasks:
+        name, category = _get_task_trace_name_and_category(task)
+        traces.append(TaskTrace(
+            name, category, task.ready_time, task.start_time, task.end_time, workers[task.thread_name],
+            sorted(set(task_indexes[dep] for dep in task.get_all_dependencies() if dep in task_indexes))
+        ))
+    return traces
 
 
 def run_session(suites, fixture_registry, prerun_session_scheduled_fixtures, event_manager,
-                force_disabled=False, stop_on_failure=False, nb_threads=1):
+                force_disabled=False, stop_on_failure=False, nb_threads=1, nb_processes=1, previous_report=None,
+                resource_limits=None, suite_affinity=False, max_open_suites=None, coordinator=None):
     # build tasks and run context
-    session_scheduled_fixtures = fixture_registry.get_fixtures_scheduled_for_session(
-        suites, prerun_session_scheduled_fixtures
-    )
-    tasks = build_tasks(suites, fixture_registry, session_scheduled_fixtures)
+    if coordinator:
+        tasks = coordinator.build_tasks(
+            suites, fixture_registry, prerun_session_scheduled_fixtures, nb_threads,
+            resource_limits, suite_affinity, max_open_suites
+        )
+        nb_parallel_tasks = len(tasks)
+        task_durations = None
+        # resource limits (split over the workers) and suite affinity are handled by each worker
+        resource_limits = None
+        suite_affinity, max_open_suites = False, None
+    elif nb_processes > 1:
+        from lemoncheesecake.processes import build_worker_process_tasks, start_worker_processes
+        tasks = build_worker_process_tasks(
+            suites, fixture_registry, prerun_session_scheduled_fixtures, nb_processes, nb_threads, previous_report,
+            resource_limits, suite_affinity, max_open_suites
+        )
+        nb_parallel_tasks = len(tasks)
+        task_durations = None
+        # resource limits (split over the worker processes) and suite affinity are handled by each worker process
+        resource_limits = None
+        suite_affinity, max_open_suites = False, None
+    else:
+        session_scheduled_fixtures = fixture_registry.get_fixtures_scheduled_for_session(
+            suites, prerun_session_scheduled_fixtures
+        )
+        tasks = build_tasks(suites, fixture_registry, session_scheduled_fixtures)
+        nb_parallel_tasks = nb_threads
+        task_durations = get_task_durations_from_report(tasks, previous_report) if previous_report else None
     context = RunContext(event_manager, fixture_registry, force_disabled, stop_on_failure)
+    if nb_processes > 1 and not coordinator:
+        # the worker processes are forked before the event manager and the tasks start their threads
+        start_worker_processes(tasks, context)
 
     report = get_report()
 
     with event_manager.handle_events():
         event_manager.fire(events.TestSessionStartEvent(report))
-        run_tasks(tasks, context, nb_threads, context.watchdog)
+        run_tasks(
+            tasks, context, nb_parallel_tasks, context.watchdog, task_durations, resource_limits,
+            suite_affinity, max_open_suites, get_max_concurrency()
+        )
+        # in multi-process and distributed modes, the task traces are sent by the workers
+        if nb_processes <= 1 and not coordinator:
+            event_manager.fire(events.TaskTracesEvent(build_task_traces(tasks)))
         event_manager.fire(events.TestSessionEndEvent(report))
 
     exception, serialized_exception = event_manager.get_pending_failure()
@@ -554,14 +713,16 @@ def run_session(suites, fixture_registry, prerun_session_scheduled_fixtures, eve
     return report
 
 
-def run_suites(suites, fixture_registry, event_manager, force_disabled=False, stop_on_failure=False, nb_threads=1):
+def run_suites(suites, fixture_registry, event_manager, force_disabled=False, stop_on_failure=False, nb_threads=1,
+               nb_processes=1, previous_report=None, resource_limits=None, suite_affinity=False, max_open_suites=None,
+               coordinator=None):
     fixture_teardowns = []
 
-    # setup pre_session fixtures
+    # setup pre_session fixtures (in distributed mode, they are set up by each worker)
     errors = []
     scheduled_fixtures = fixture_registry.get_fixtures_scheduled_for_session_prerun(suites)
     initialize_fixtures_cache(scheduled_fixtures)
-    for setup, teardown in scheduled_fixtures.get_setup_teardown_pairs():
+    for setup, teardown in scheduled_fixtures.get_setup_teardown_pairs() if not coordinator else ():
         try:
             setup()
         except UserError:
@@ -576,7 +737,9 @@ def run_suites(suites, fixture_registry, event_manager, force_disabled=False, st
     if not errors:
         report = run_session(
             suites, fixture_registry, scheduled_fixtures, event_manager,
-            force_disabled=force_disabled, stop_on_failure=stop_on_failure, nb_threads=nb_threads
+            force_disabled=force_disabled, stop_on_failure=stop_on_failure, nb_threads=nb_threads,
+            nb_processes=nb_processes, previous_report=previous_report, resource_limits=resource_limits,
+            suite_affinity=suite_affinity, max_open_suites=max_open_suites, coordinator=coordinator
         )
     else:
         report = None
@@ -592,26 +755,62 @@ def run_suites(suites, fixture_registry, event_manager, force_disabled=False, st
                 serialize_current_exception(show_stacktrace=True)
             ))
 
+    # the event loop of async tests, hooks and fixtures (if any) is no longer needed
+    shutdown_event_loop()
+
     if errors:
         raise FixtureError("\n".join(errors))
 
     return report.is_successful() if report else False
 
 
-def initialize_event_manager(suites, reporting_backends, report_dir, report_saving_strategy, nb_threads):
+def _handles_event_batches(session):
+    return getattr(session, "handles_event_batches", False)
+
+
+def build_event_channel(backend, session):
+    policy = getattr(session, "event_channel_policy", None)
+    if policy is None:
+        # sessions that handle events by batch (such as report savers) prefer bigger batches over waiting
+        policy = events.EventChannel.COALESCE if _handles_event_batches(session) else events.EventChannel.BLOCK
+    return events.EventChannel(getattr(backend, "name", backend.__class__.__name__), policy=policy)
+
+
+def initialize_event_manager(suites, reporting_backends, report_dir, report_saving_strategy, nb_threads,
+                             journal=False, compact_report=False, spill_steps=False):
     event_manager = events.AsyncEventManager.load()
 
     report = Report()
     report.nb_threads = nb_threads
-    writer = ReportWriter(report)
+    writer = ReportWriter(report, compact_entries=compact_report)
     event_manager.add_listener(writer)
 
+    if spill_steps:
+        spiller = StepSpiller(report, StepStore(os.path.join(report_dir, STEP_STORE_DIR)))
+        event_manager.add_batch_listener(spiller)
+    else:
+        spiller = None
+
+    if journal:
+        event_manager.add_batch_listener(
+            EventJournal(os.path.join(report_dir, JOURNAL_FILENAME)), channel=events.EventChannel("journal")
+        )
+
     initialize_runtime(event_manager, report_dir, report)
 
     nb_tests = len(list(flatten_tests(suites)))
     parallelized = nb_threads > 1 and nb_tests > 1
     for backend in reporting_backends:
         session = backend.create_reporting_session(report_dir, report, parallelized, report_saving_strategy)
-        event_manager.add_listener(session)
+        # the report writer must stay real-time: reporting sessions (that may save files or make network calls)
+        # are run in their own event channel
+        channel = build_event_channel(backend, session)
+        if _handles_event_batches(session):
+            event_manager.add_batch_listener(session, channel=channel)
+        else:
+            event_manager.add_listener(session, channel=channel)
+        if spiller:
+            # the steps of a test must not be spilled before the reporting sessions have handled its end
+            spiller.watch_channel(channel)
 
     return event_manager
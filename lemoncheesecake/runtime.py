@@ -12,6 +12,11 @@ import traceback
 
 import six
 
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
 from lemoncheesecake.exceptions import LemonCheesecakeInternalError
 from lemoncheesecake.consts import ATTACHEMENT_DIR, \
     LOG_LEVEL_DEBUG, LOG_LEVEL_ERROR, LOG_LEVEL_INFO, LOG_LEVEL_WARN
@@ -32,9 +37,9 @@ _runtime = None  # type: _Runtime
 _scheduled_fixtures = None  # type: ScheduledFixtures
 
 
-def initialize_runtime(event_manager, report_dir, report):
+def initialize_runtime(event_manager, report_dir, report, attachment_prefix=""):
     global _runtime
-    _runtime = _Runtime(event_manager, report_dir, report)
+    _runtime = _Runtime(event_manager, report_dir, report, attachment_prefix)
     event_manager.add_listener(_runtime)
 
 
@@ -43,18 +48,48 @@ def initialize_fixtures_cache(scheduled_fixtures):
     _scheduled_fixtures = scheduled_fixtures
 
 
+class _ThreadLocal(threading.local):
+    location = None
+    step = None
+
+
+class _ContextLocal(object):
+    """
+    Unlike a threading.local, the location and step are also local to each asyncio task
+    (which inherits them from the thread that submitted it).
+    """
+    def __init__(self):
+        self._location = contextvars.ContextVar("location", default=None)
+        self._step = contextvars.ContextVar("step", default=None)
+
+    @property
+    def location(self):
+        return self._location.get()
+
+    @location.setter
+    def location(self, location):
+        self._location.set(location)
+
+    @property
+    def step(self):
+        return self._step.get()
+
+    @step.setter
+    def step(self, step):
+        self._step.set(step)
+
+
 class _Runtime(object):
-    def __init__(self, event_manager, report_dir, report):
+    def __init__(self, event_manager, report_dir, report, attachment_prefix=""):
         self.event_manager = event_manager
         self.report_dir = report_dir
         self.report = report
         self.attachments_dir = os.path.join(self.report_dir, ATTACHEMENT_DIR)
+        self.attachment_prefix = attachment_prefix
         self.attachment_count = 0
         self._attachment_lock = threading.Lock()
         self._failures = set()
-        self._local = threading.local()
-        self._local.location = None
-        self._local.step = None
+        self._local = _ContextLocal() if contextvars else _ThreadLocal()
 
     def set_location(self, location):
         self._local.location = location
@@ -63,6 +98,12 @@ class _Runtime(object):
     def location(self):
         return self._local.location
 
+    def get_local_state(self):
+        return self._local.location, self._local.step
+
+    def set_local_state(self, state):
+        self._local.location, self._local.step = state
+
     def mark_location_as_failed(self, location):
         self._failures.add(location)
 
@@ -98,10 +139,15 @@ class _Runtime(object):
     @contextmanager
     def prepare_attachment(self, filename, description, as_image=False, step=None):
         with self._attachment_lock:
-            attachment_filename = "%04d_%s" % (self.attachment_count + 1, filename)
+            attachment_filename = "%s%04d_%s" % (self.attachment_prefix, self.attachment_count + 1, filename)
             self.attachment_count += 1
             if not os.path.exists(self.attachments_dir):
-                os.mkdir(self.attachments_dir)
+                try:
+                    os.mkdir(self.attachments_dir)
+                except OSError:
+                    # the directory may have been created meanwhile by another process
+                    if not os.path.isdir(self.attachments_dir):
+                        raise
 
         yield os.path.join(self.attachments_dir, attachment_filename)
 
@@ -286,6 +332,14 @@ def set_runtime_location(location):
     get_runtime().set_location(location)
 
 
+def get_local_state():
+    return get_runtime().get_local_state()
+
+
+def set_local_state(state):
+    get_runtime().set_local_state(state)
+
+
 def mark_location_as_failed(location):
     get_runtime().mark_location_as_failed(location)
 
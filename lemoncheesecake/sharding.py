@@ -0,0 +1,200 @@
+'''
+Split the tests of a project into several shards (for instance to run them on several machines) and merge
+the reports of these shards back into a single report.
+'''
+
+from lemoncheesecake.filter import FromTestsFilter, filter_suites
+from lemoncheesecake.reporting.report import Report, SuiteResult, SetupResult
+from lemoncheesecake.testtree import flatten_suites, flatten_tests
+from lemoncheesecake.exceptions import UserError
+
+
+def parse_shard(value):
+    """
+    Parse a "K/N" shard expression (K being 1-based) into a (K, N) tuple.
+    """
+    index, count = map(int, value.split("/"))  # raise ValueError if the expression is malformed
+    if not 1 <= index <= count:
+        raise ValueError("Shard index %d is out of range" % index)
+    return index, count
+
+
+def _get_durations_from_report(report):
+    test_durations = {test.path: test.duration for test in report.all_tests() if test.duration is not None}
+    suite_setup_durations = {
+        suite.path: suite.suite_setup.duration for suite in report.all_suites()
+        if suite.suite_setup and suite.suite_setup.duration is not None
+    }
+    return test_durations, suite_setup_durations
+
+
+def split_tests_into_shards(suites, nb_shards, previous_report=None):
+    """
+    Deterministically split the tests of suites into nb_shards lists of tests balanced by duration (the tests
+    durations are taken from previous_report if any, otherwise every test is considered as lasting the same time).
+
+    Tests linked by a dependency and tests of a suite whose setup is expensive (its setup lasted longer than
+    an average test in previous_report, or the suite has a setup_suite hook if the suite has no history) are kept
+    within the same shard.
+    """
+    if previous_report:
+        test_durations, suite_setup_durations = _get_durations_from_report(previous_report)
+    else:
+        test_durations, suite_setup_durations = {}, {}
+    default_test_duration = \
+        float(sum(test_durations.values())) / len(test_durations) if test_durations else 1.0
+
+    tests = list(flatten_tests(suites))
+    test_ranks = {test.path: rank for rank, test in enumerate(tests)}
+
+    # group linked tests using a union-find structure
+    parents = {test.path: test.path for test in tests}
+
+    def find(path):
+        while parents[path] != path:
+            parents[path] = parents[parents[path]]
+            path = parents[path]
+        return path
+
+    def union(path1, path2):
+        root1, root2 = find(path1), find(path2)
+        if root1 != root2:
+            # always keep the first test (in tests order) as root to make the split deterministic
+            if test_ranks[root1] < test_ranks[root2]:
+                parents[root2] = root1
+            else:
+                parents[root1] = root2
+
+    for test in tests:
+        for dep_test_path in test.dependencies:
+            # an unknown dependency will be reported when building the run tasks
+            if dep_test_path in parents:
+                union(test.path, dep_test_path)
+
+    expensive_suite_setup_durations = {}
+    for suite in flatten_suites(suites):
+        if suite.path in suite_setup_durations:
+            if suite_setup_durations[suite.path] <= default_test_duration:
+                continue
+        elif not suite.has_hook("setup_suite"):
+            continue
+        expensive_suite_setup_durations[suite.path] = suite_setup_durations.get(suite.path, default_test_duration)
+        suite_tests = list(flatten_tests([suite]))
+        for test in suite_tests[1:]:
+            union(suite_tests[0].path, test.path)
+
+    units = {}
+    for test in tests:
+        units.setdefault(find(test.path), []).append(test)
+
+    # then distribute these units over the shards, longest unit first
+    def get_unit_duration(unit):
+        duration = sum(test_durations.get(test.path, default_test_duration) for test in unit)
+        unit_suite_paths = set(suite.path for test in unit for suite in test.parent_suite.hierarchy)
+        duration += sum(
+            expensive_suite_setup_durations[path] for path in unit_suite_paths if path in expensive_suite_setup_durations
+        )
+        return duration
+
+    unit_durations = {root: get_unit_duration(unit) for root, unit in units.items()}
+    shards = [[] for _ in range(nb_shards)]
+    loads = [0] * nb_shards
+    for root in sorted(units, key=lambda root: (-unit_durations[root], test_ranks[root])):
+        idx = loads.index(min(loads))
+        shards[idx].extend(units[root])
+        loads[idx] += unit_durations[root]
+
+    return [sorted(shard, key=lambda test: test_ranks[test.path]) for shard in shards]
+
+
+def get_shard_suites(suites, shard_index, nb_shards, previous_report=None):
+    """
+    Return the suites filtered so that they only contain the tests of the shard shard_index (1-based) among
+    nb_shards shards.
+    """
+    shard_tests = split_tests_into_shards(suites, nb_shards, previous_report)[shard_index - 1]
+    if not shard_tests:
+        raise UserError("Shard %d/%d does not contain any test" % (shard_index, nb_shards))
+    return filter_suites(suites, FromTestsFilter(shard_tests))
+
+
+def _merge_setup_results(results):
+    results = [result for result in results if result]
+    if not results:
+        return None
+    if len(results) == 1:
+        return results[0]
+
+    merged = SetupResult()
+    merged.start_time = min(result.start_time for result in results)
+    merged.end_time = None if any(result.end_time is None for result in results) else \
+        max(result.end_time for result in results)
+    merged.outcome = all(result.outcome for result in results)
+    for result in results:
+        merged.steps.extend(result.steps)
+    return merged
+
+
+def _merge_suite_results(suites):
+    merged = SuiteResult(suites[0].name, suites[0].description)
+    merged.tags = suites[0].tags
+    merged.properties = suites[0].properties
+    merged.links = suites[0].links
+    merged.start_time = min(suite.start_time for suite in suites)
+    merged.end_time = None if any(suite.end_time is None for suite in suites) else \
+        max(suite.end_time for suite in suites)
+    merged.suite_setup = _merge_setup_results([suite.suite_setup for suite in suites])
+    merged.suite_teardown = _merge_setup_results([suite.suite_teardown for suite in suites])
+    merged.rank = min(suite.rank for suite in suites)
+
+    # the tests are added as copies (adding them as-is would move them out of the shards reports) and in
+    # the order they have in the original suite
+    tests = [test for suite in suites for test in suite.get_tests()]
+    for test in sorted(tests, key=lambda test: test.rank):
+        merged.add_test(test.pull_node())
+
+    for sub_suites in _group_suites_by_name([suite.get_suites() for suite in suites]):
+        merged.add_suite(_merge_suite_results(sub_suites))
+
+    return merged
+
+
+def _group_suites_by_name(suites_lists):
+    groups = {}
+    names = []
+    for suites in suites_lists:
+        for suite in suites:
+            if suite.name not in groups:
+                groups[suite.name] = []
+                names.append(suite.name)
+            groups[suite.name].append(suite)
+    return [groups[name] for name in names]
+
+
+def merge_reports(reports):
+    """
+    Merge the reports of several shards (of the same project) into a single report, the shards reports
+    are left unchanged.
+    """
+    merged = Report()
+    merged.title = reports[0].title
+    for report in reports:
+        for name, value in report.info:
+            if [name, value] not in merged.info:
+                merged.add_info(name, value)
+    merged.start_time = min(report.start_time for report in reports)
+    merged.end_time = None if any(report.end_time is None for report in reports) else \
+        max(report.end_time for report in reports)
+    merged.report_generation_time = merged.end_time
+    # the shards have been run concurrently, the sum of their threads is what the report is about
+    merged.nb_threads = sum(report.nb_threads for report in reports)
+
+    merged.test_session_setup = _merge_setup_results([report.test_session_setup for report in reports])
+    for suites in _group_suites_by_name([report.get_suites() for report in reports]):
+        merged.add_suite(_merge_suite_results(suites))
+    merged.test_session_teardown = _merge_setup_results([report.test_session_teardown for report in reports])
+
+    for shard_num, report in enumerate(reports, start=1):
+        merged.add_task_traces(report.task_traces, worker_prefix="shard-%d/" % shard_num)
+
+    return merged
@@ -23,6 +23,7 @@ class Test(BaseTest):
         self.disabled = False
         self.rank = 0
         self.dependencies = []
+        self.resources = {}
 
     def is_disabled(self):
         node = self
@@ -32,6 +33,13 @@ class Test(BaseTest):
             node = node.parent_suite
         return False
 
+    def get_resources(self):
+        # resources used by the suites are inherited by their tests
+        resources = {}
+        for node in self.hierarchy:
+            resources.update(node.resources)
+        return resources
+
     def get_fixtures(self):
         return get_callable_args(self.callback)
 
@@ -62,6 +70,7 @@ class Suite(BaseSuite):
         self._hooks = {}
         self._injected_fixtures = _load_injected_fixtures(obj)
         self.disabled = False
+        self.resources = {}
 
     def add_hook(self, hook_name, func):
         _assert_valid_hook_name(hook_name)
@@ -11,7 +11,7 @@ from lemoncheesecake.suite.core import InjectedFixture
 from lemoncheesecake.exceptions import ProgrammingError
 
 __all__ = "add_test_into_suite", "add_test_in_suite", "add_tests_in_suite", "get_metadata", \
-    "suite", "test", "tags", "prop", "link", "disabled", "conditional", "hidden", "depends_on", "inject_fixture"
+    "suite", "test", "tags", "prop", "link", "disabled", "conditional", "hidden", "depends_on", "uses_resource", "inject_fixture"
 
 
 class Metadata(object):
@@ -27,6 +27,7 @@ class Metadata(object):
         self.links = []
         self.rank = 0
         self.dependencies = []
+        self.resources = {}
         self.disabled = False
         self.condition = None
 
@@ -170,5 +171,23 @@ def depends_on(*deps):
     return wrapper
 
 
+def uses_resource(name, weight=1):
+    """
+    Decorator, indicate that a test (or all the tests of a suite) use a shared resource whose capacity
+    is limited by the project (see ``ProjectConfiguration.get_resource_limits``).
+
+    :param name: the resource name
+    :param weight: the number of resource tokens taken by the test while it runs
+    """
+    if weight < 1:
+        raise ProgrammingError("Invalid weight %s for resource '%s', it must be at least 1" % (weight, name))
+
+    def wrapper(obj):
+        md = get_metadata(obj)
+        md.resources[name] = weight
+        return obj
+    return wrapper
+
+
 def inject_fixture(fixture_name=None):
     return InjectedFixture(fixture_name)
\ No newline at end of file
@@ -45,6 +45,7 @@ def load_test(obj):
     test.disabled = md.disabled
     test.rank = md.rank
     test.dependencies.extend(md.dependencies)
+    test.resources.update(md.resources)
     return test
 
 
@@ -122,6 +123,7 @@ def load_suite_from_class(class_):
     suite.links.extend(md.links)
     suite.rank = md.rank
     suite.disabled = md.disabled
+    suite.resources.update(md.resources)
 
     for hook_name in SUITE_HOOKS:
         if hasattr(suite_obj, hook_name):
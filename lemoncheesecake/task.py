@@ -1,3 +1,6 @@
+import time
+import heapq
+import threading
 from multiprocessing.dummy import Pool, Queue
 
 from lemoncheesecake.exceptions import TaskFailure, TasksExecutionFailure, CircularDependencyError, \
@@ -7,9 +10,10 @@ DEBUG = 0
 _KEYBOARD_INTERRUPT_ERROR_MESSAGE = "all tests have been interrupted by the user"
 
 
-def _debug(msg):
+def _debug(msg, *args):
+    # the message is only formatted when debugging, _debug being called for each task
     if DEBUG:
-        print(msg)
+        print(msg % args)
 
 
 class TaskResultSuccess(object):
@@ -30,9 +34,37 @@ class TaskResultException(object):
         self.stacktrace = stacktrace
 
 
+class TaskSuspension(object):
+    """
+    Returned by BaseTask.run when the task has to wait for an operation (such as a coroutine run on an event loop)
+    that does not need the task's thread: the thread is released and, once the future (a concurrent.futures.Future
+    like object) is done, resume is called with the future in a thread of the pool to finish the task. Like
+    BaseTask.run, resume may raise TaskFailure or return another TaskSuspension.
+    """
+    def __init__(self, future, resume):
+        self.future = future
+        self.resume = resume
+
+
+class _ThreadUsageChange(object):
+    """
+    Put into the completed tasks queue when a task releases its thread (it is suspended, delta is -1) or takes
+    a thread again (it is resumed, delta is 1).
+    """
+    def __init__(self, task, delta):
+        self.task = task
+        self.delta = delta
+
+
 class BaseTask(object):
     def __init__(self):
         self.result = None
+        # scheduling instrumentation (filled by run_tasks): the times when the task became ready (its dependencies
+        # being completed), when it has been started and when it has been completed and the thread that ran it
+        self.ready_time = None
+        self.start_time = None
+        self.end_time = None
+        self.thread_name = None
 
     def get_all_dependencies(self):
         return self.get_on_completion_dependencies() + self.get_on_success_dependencies()
@@ -43,6 +75,30 @@ class BaseTask(object):
     def get_on_completion_dependencies(self):
         return []
 
+    def get_resources(self):
+        """
+        Return a dict mapping the name of each resource used by the task to the number of tokens it takes.
+        """
+        return {}
+
+    def get_group(self):
+        """
+        Return the group (such as a suite) the task belongs to, if any.
+        """
+        return None
+
+    def opens_group(self):
+        """
+        Return whether the task opens its group (it allocates what the other tasks of the group share).
+        """
+        return False
+
+    def closes_group(self):
+        """
+        Return whether the task closes its group (it releases what has been allocated by the opening task).
+        """
+        return False
+
     def run(self, context):
         pass
 
@@ -50,33 +106,278 @@ class BaseTask(object):
         pass
 
 
-def pop_runnable_tasks(remaining_tasks, completed_tasks, nb_tasks):
-    runnable_tasks = [
-        task for task in remaining_tasks if set(task.get_all_dependencies()).issubset(completed_tasks)
-    ]
-
-    for task in runnable_tasks[:nb_tasks]:
-        remaining_tasks.remove(task)
-        _debug("pop runnable task %s" % task)
-        yield task
+class TaskScheduler(object):
+    """
+    Keep track of which tasks are ready to be run.
+
+    The dependency graph is walked once at construction time to compute, for each task, its number of
+    pending dependencies and the tasks that depend on it. Then, each task completion only decrements
+    the counters of its dependents and pushes onto the ready queue those that have no pending dependency anymore.
+    Ready tasks are popped following their order in the initial task list, or, if priorities are given,
+    by decreasing priority first.
+
+    If resource limits are given (a dict mapping a resource name to its number of tokens), a ready task is only
+    popped if the tokens of the resources it uses are available, otherwise it is put aside in the waiting queue
+    of the first resource lacking tokens. When a task releases the tokens of a resource, only the tasks waiting
+    for this resource are queued again, and only as long as the released tokens are enough for them.
+    A task cannot take more tokens than the resource limit, resources without limit are ignored.
+
+    With group affinity, the ready tasks of the group of the task that has just been completed (see
+    pop_ready_tasks) are popped first and tasks closing a group are popped before any other task. If max_open_groups
+    is given, a task opening a group is put aside while max_open_groups groups are open, a task waiting to open
+    its group being queued again each time a group is closed or when no task is running anymore (the tasks of the
+    open groups may depend on the tasks of a group that is not open yet).
+
+    The dependency graph (as returned by build_task_graph) can be passed to avoid querying the tasks
+    dependencies again.
+    """
+    def __init__(self, tasks, graph=None, priorities=None, resource_limits=None, group_affinity=False,
+                 max_open_groups=None):
+        if graph is None:
+            graph = build_task_graph(tasks)
+        self._priorities = priorities or {}
+        self._task_ranks = {}
+        self._dependents = {}
+        self._pending_dependencies = {}
+        self._ready_tasks = []
+        self._queued_tasks = set()
+        self._scheduled_tasks = set()
+        self._running_tasks = set()
+        self._available_resources = dict(resource_limits or {})
+        self._task_resources = {}
+        self._tasks_holding_resources = set()
+        # resource name => heap of the entries of the tasks waiting for tokens of this resource
+        self._tasks_waiting_for_resource = {}
+        # the tasks queued again after a resource release and the resource they were waiting for, the tokens
+        # they need are reserved until they are popped so that a release does not queue again more tasks than
+        # the available tokens allow
+        self._woken_tasks = {}
+        self._reserved_resources = {}
+        # heap of the entries of the tasks waiting for a group to be closed to open their own group
+        self._tasks_waiting_for_group = []
+        self._group_affinity = group_affinity
+        self._ready_tasks_by_group = {}
+        self._max_open_groups = max_open_groups
+        self._open_groups = set()
+
+        for rank, task in enumerate(tasks):
+            self._task_ranks[task] = rank
+            dependencies = set(graph[task])
+            self._pending_dependencies[task] = len(dependencies)
+            for dependency in dependencies:
+                self._dependents.setdefault(dependency, []).append(task)
+            if self._available_resources:
+                resources = {
+                    name: min(weight, self._available_resources[name])
+                    for name, weight in task.get_resources().items() if name in self._available_resources
+                }
+                if resources:
+                    self._task_resources[task] = resources
+            if not dependencies:
+                self._push_ready_task(task)
+
+    @property
+    def nb_running_tasks(self):
+        return len(self._running_tasks)
+
+    def _push_ready_task(self, task):
+        task.ready_time = time.time()
+        closing_first = 0 if self._group_affinity and task.closes_group() else 1
+        self._push_entry((closing_first, -self._priorities.get(task, 0), self._task_ranks[task], task))
+
+    def _push_entry(self, entry):
+        task = entry[-1]
+        self._queued_tasks.add(task)
+        heapq.heappush(self._ready_tasks, entry)
+        if self._group_affinity and task.get_group() is not None:
+            heapq.heappush(self._ready_tasks_by_group.setdefault(task.get_group(), []), entry)
+
+    def _peek_entry(self, heap):
+        # a task is queued in both the main heap and its group heap, the entry found in the other heap is stale
+        # once the task has been popped
+        while heap and heap[0][-1] not in self._queued_tasks:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def _pop_entry(self, preferred_group):
+        entry = self._peek_entry(self._ready_tasks)
+        if entry is None:
+            return None
+        if preferred_group is not None and entry[0] != 0:
+            entry = self._peek_entry(self._ready_tasks_by_group.get(preferred_group, [])) or entry
+        self._queued_tasks.remove(entry[-1])
+        return entry
+
+    def _wait_for_resource(self, entry, name):
+        heapq.heappush(self._tasks_waiting_for_resource.setdefault(name, []), entry)
+
+    def _wake_tasks_waiting_for_resource(self, name):
+        waiting_tasks = self._tasks_waiting_for_resource.get(name)
+        available = self._available_resources[name] - self._reserved_resources.get(name, 0)
+        # the waiting tasks are queued again in order, the first one that does not fit in the available
+        # tokens stops the wake-up so that a heavy task cannot be starved by lighter ones
+        while waiting_tasks:
+            task = waiting_tasks[0][-1]
+            weight = self._task_resources[task][name]
+            if weight > available:
+                break
+            available -= weight
+            self._woken_tasks[task] = name
+            self._reserved_resources[name] = self._reserved_resources.get(name, 0) + weight
+            self._push_entry(heapq.heappop(waiting_tasks))
+
+    def _unreserve_resource(self, task):
+        name = self._woken_tasks.pop(task, None)
+        if name is not None:
+            self._reserved_resources[name] -= self._task_resources[task][name]
+        return name
+
+    def _wake_task_waiting_for_group(self):
+        if self._tasks_waiting_for_group:
+            self._push_entry(heapq.heappop(self._tasks_waiting_for_group))
+
+    def _can_open_group(self, task):
+        if self._max_open_groups is None or not task.opens_group():
+            return True
+        return len(self._open_groups) < self._max_open_groups or not self._running_tasks
+
+    def _acquire_resources(self, task):
+        """
+        Take the tokens of the resources used by the task, return the name of the first resource lacking
+        tokens (no token is taken then) or None.
+        """
+        resources = self._task_resources.get(task)
+        if not resources:
+            return None
+        for name, weight in resources.items():
+            if self._available_resources[name] - self._reserved_resources.get(name, 0) < weight:
+                return name
+        for name, weight in resources.items():
+            self._available_resources[name] -= weight
+        self._tasks_holding_resources.add(task)
+        return None
+
+    def _release_resources(self, task):
+        if task not in self._tasks_holding_resources:
+            return
+        self._tasks_holding_resources.remove(task)
+        for name, weight in self._task_resources[task].items():
+            self._available_resources[name] += weight
+            # the tasks that were waiting for this resource may now be runnable
+            self._wake_tasks_waiting_for_resource(name)
+
+    def mark_task_as_completed(self, task):
+        self._running_tasks.discard(task)
+        self._release_resources(task)
+        if task.closes_group() and task.get_group() in self._open_groups:
+            self._open_groups.remove(task.get_group())
+            self._ready_tasks_by_group.pop(task.get_group(), None)
+            # a task that was waiting for a group to be closed may now be runnable
+            self._wake_task_waiting_for_group()
+        for dependent in self._dependents.get(task, ()):
+            self._pending_dependencies[dependent] -= 1
+            if self._pending_dependencies[dependent] == 0 and dependent not in self._scheduled_tasks:
+                self._push_ready_task(dependent)
+
+    def pop_ready_tasks(self, nb_tasks, preferred_group=None):
+        """
+        Pop (at most) nb_tasks ready tasks, with group affinity the tasks of preferred_group are popped first.
+        """
+        if not self._group_affinity:
+            preferred_group = None
+        if not self._running_tasks:
+            # the tasks put aside because of max_open_groups can no longer wait for a running task
+            self._wake_task_waiting_for_group()
+            for name in self._tasks_waiting_for_resource:
+                self._wake_tasks_waiting_for_resource(name)
+        while nb_tasks > 0:
+            entry = self._pop_entry(preferred_group)
+            if entry is None:
+                break
+            task = entry[-1]
+            woken_resource = self._unreserve_resource(task)
+            if not self._can_open_group(task):
+                _debug("task %s is waiting for a group to be closed", task)
+                heapq.heappush(self._tasks_waiting_for_group, entry)
+            else:
+                missing_resource = self._acquire_resources(task)
+                if missing_resource is None:
+                    if task.opens_group():
+                        self._open_groups.add(task.get_group())
+                    self._scheduled_tasks.add(task)
+                    self._running_tasks.add(task)
+                    nb_tasks -= 1
+                    _debug("pop runnable task %s", task)
+                    yield task
+                    continue
+                _debug("task %s is waiting for resource %s", task, missing_resource)
+                self._wait_for_resource(entry, missing_resource)
+            if woken_resource is not None:
+                # the tokens reserved for the task can be used by the other tasks waiting for the resource
+                self._wake_tasks_waiting_for_resource(woken_resource)
+
+    def pop_remaining_tasks(self, tasks):
+        remaining_tasks = [task for task in tasks if task not in self._scheduled_tasks]
+        self._scheduled_tasks.update(remaining_tasks)
+        self._ready_tasks = []
+        self._queued_tasks = set()
+        self._ready_tasks_by_group = {}
+        self._tasks_waiting_for_resource = {}
+        self._woken_tasks = {}
+        self._reserved_resources = {}
+        self._tasks_waiting_for_group = []
+        return remaining_tasks
+
+
+def _mark_task_as_started(task):
+    if task.start_time is None:
+        task.start_time = time.time()
+        task.thread_name = threading.current_thread().name
+
+
+def _mark_task_as_ended(task, completed_task_queue):
+    task.end_time = time.time()
+    completed_task_queue.put(task)
 
 
-def run_task(task, context, completed_task_queue):
-    _debug("run task %s" % task)
+def _run_task_step(task, step, completed_task_queue, pool):
     try:
-        task.run(context)
+        suspension = step()
     except TaskFailure as excp:
         task.result = TaskResultFailure(str(excp))
     except Exception:
         task.result = TaskResultException(serialize_current_exception())
     else:
+        if isinstance(suspension, TaskSuspension):
+            _debug("suspend task %s", task)
+            # the suspension must be known before the resumption, which may happen as soon as the callback is added
+            completed_task_queue.put(_ThreadUsageChange(task, -1))
+            suspension.future.add_done_callback(
+                lambda future: _resume_task(task, suspension, future, completed_task_queue, pool)
+            )
+            return
         task.result = TaskResultSuccess()
 
-    completed_task_queue.put(task)
+    _mark_task_as_ended(task, completed_task_queue)
+
+
+def _resume_task(task, suspension, future, completed_task_queue, pool):
+    # this function is called by whatever thread completes the future, the task is finished in a thread of the pool
+    _debug("resume task %s", task)
+    completed_task_queue.put(_ThreadUsageChange(task, 1))
+    pool.apply_async(
+        _run_task_step, args=(task, lambda: suspension.resume(future), completed_task_queue, pool)
+    )
+
 
+def run_task(task, context, completed_task_queue, pool):
+    _debug("run task %s", task)
+    _run_task_step(task, lambda: task.run(context), completed_task_queue, pool)
 
-def handle_task(task, watchdogs, context, completed_task_queue):
-    _debug("handle task %s" % task)
+
+def handle_task(task, watchdogs, context, completed_task_queue, pool):
+    _debug("handle task %s", task)
+    _mark_task_as_started(task)
     for dep_task in task.get_on_success_dependencies():
         if not isinstance(dep_task.result, TaskResultSuccess):
             reason = None
@@ -91,16 +392,20 @@ def handle_task(task, watchdogs, context, completed_task_queue):
             skip_task(task, context, completed_task_queue, reason=error)
             return
 
-    run_task(task, context, completed_task_queue)
+    run_task(task, context, completed_task_queue, pool)
 
 
 def schedule_tasks_to_be_run(tasks, watchdogs, context, pool, completed_tasks_queue):
+    nb_tasks = 0
     for task in tasks:
-        pool.apply_async(handle_task, args=(task, watchdogs, context, completed_tasks_queue))
+        pool.apply_async(handle_task, args=(task, watchdogs, context, completed_tasks_queue, pool))
+        nb_tasks += 1
+    return nb_tasks
 
 
 def skip_task(task, context, completed_task_queue, reason=""):
-    _debug("skip task %s" % task)
+    _debug("skip task %s", task)
+    _mark_task_as_started(task)
     try:
         task.skip(context, reason)
     except Exception:
@@ -108,7 +413,7 @@ def skip_task(task, context, completed_task_queue, reason=""):
     else:
         task.result = TaskResultSkipped()
 
-    completed_task_queue.put(task)
+    _mark_task_as_ended(task, completed_task_queue)
 
 
 def schedule_tasks_to_be_skipped(tasks, context, pool, completed_tasks_queue, reason=""):
@@ -116,47 +421,74 @@ def schedule_tasks_to_be_skipped(tasks, context, pool, completed_tasks_queue, re
         pool.apply_async(skip_task, args=(task, context, completed_tasks_queue, reason))
 
 
-def skip_all_tasks(tasks, remaining_tasks, completed_tasks, context, pool, completed_tasks_queue, reason):
-    schedule_tasks_to_be_skipped(remaining_tasks, context, pool, completed_tasks_queue, reason)
+def skip_all_tasks(tasks, scheduler, completed_tasks, context, pool, completed_tasks_queue, reason):
+    schedule_tasks_to_be_skipped(scheduler.pop_remaining_tasks(tasks), context, pool, completed_tasks_queue, reason)
     while len(completed_tasks) != len(tasks):
         completed_task = completed_tasks_queue.get()
-        completed_tasks.append(completed_task)
+        if not isinstance(completed_task, _ThreadUsageChange):
+            completed_tasks.append(completed_task)
 
 
-def run_tasks(tasks, context=None, nb_threads=1, watchdog=None):
+def run_tasks(tasks, context=None, nb_threads=1, watchdog=None, task_durations=None, resource_limits=None,
+              group_affinity=False, max_open_groups=None, max_suspended_tasks=None):
+    """
+    Run the tasks using nb_threads threads. A task being suspended (see TaskSuspension) does not take a thread,
+    new tasks are however no longer started while there are max_suspended_tasks suspended tasks (if given).
+    """
     got_keyboard_interrupt = False
     watchdogs = [lambda _: _KEYBOARD_INTERRUPT_ERROR_MESSAGE if got_keyboard_interrupt else None]
     if watchdog:
         watchdogs.append(watchdog)
 
-    for task in tasks:
-        check_task_dependencies(task)
-
-    remaining_tasks = list(tasks)
+    graph = build_task_graph(tasks)
+    if task_durations:
+        # start first the tasks that are on the longest chains of tasks
+        priorities = compute_critical_path_durations(graph, task_durations)
+    else:
+        priorities = None
+    scheduler = TaskScheduler(tasks, graph, priorities, resource_limits, group_affinity, max_open_groups)
     completed_tasks = list()
 
     pool = Pool(nb_threads)
     completed_tasks_queue = Queue()
 
+    # the suspended tasks are running tasks for the scheduler but they do not take a thread
+    nb_busy_threads = 0
+    nb_suspended_tasks = 0
+
     try:
-        schedule_tasks_to_be_run(
-            pop_runnable_tasks(remaining_tasks, completed_tasks, nb_threads),
-            watchdogs, context, pool, completed_tasks_queue
+        nb_busy_threads += schedule_tasks_to_be_run(
+            scheduler.pop_ready_tasks(nb_threads), watchdogs, context, pool, completed_tasks_queue
         )
 
         while len(completed_tasks) != len(tasks):
-            # wait for one task to complete
+            # wait for one task to complete, to be suspended or to be resumed
             completed_task = completed_tasks_queue.get()
-            completed_tasks.append(completed_task)
-
-            # schedule tasks to be run waiting for task success or simple completion
-            tasks_to_be_run = pop_runnable_tasks(remaining_tasks, completed_tasks, nb_threads)
-            schedule_tasks_to_be_run(tasks_to_be_run, watchdogs, context, pool, completed_tasks_queue)
+            if isinstance(completed_task, _ThreadUsageChange):
+                nb_busy_threads += completed_task.delta
+                nb_suspended_tasks -= completed_task.delta
+                preferred_group = completed_task.task.get_group()
+            else:
+                completed_tasks.append(completed_task)
+                nb_busy_threads -= 1
+                scheduler.mark_task_as_completed(completed_task)
+                preferred_group = completed_task.get_group()
+
+            # schedule tasks to be run waiting for task success or simple completion, only for the threads
+            # that are free so that the scheduler can choose the next tasks with the latest state
+            if max_suspended_tasks is not None and nb_suspended_tasks >= max_suspended_tasks:
+                nb_free_threads = 0
+            else:
+                nb_free_threads = max(nb_threads - nb_busy_threads, 0)
+            tasks_to_be_run = scheduler.pop_ready_tasks(nb_free_threads, preferred_group)
+            nb_busy_threads += schedule_tasks_to_be_run(
+                tasks_to_be_run, watchdogs, context, pool, completed_tasks_queue
+            )
 
     except KeyboardInterrupt:
         got_keyboard_interrupt = True
         skip_all_tasks(
-            tasks, remaining_tasks, completed_tasks, context, pool, completed_tasks_queue,
+            tasks, scheduler, completed_tasks, context, pool, completed_tasks_queue,
             _KEYBOARD_INTERRUPT_ERROR_MESSAGE
         )
 
@@ -168,10 +500,88 @@ def run_tasks(tasks, context=None, nb_threads=1, watchdog=None):
         raise TasksExecutionFailure("Caught exceptions:\n%s" % "\n".join(exceptions))
 
 
-def check_task_dependencies(task, task_path=()):
-    for task_in_path in task_path:
-        if task_in_path in task.get_all_dependencies():
-            raise CircularDependencyError("Task %s has a circular dependency on task %s" % (task, task_in_path))
+_VISITING = 1
+_VISITED = 2
+
+
+def _format_dependency_cycle(cycle):
+    return " -> ".join(map(str, cycle))
+
+
+def build_task_graph(tasks):
+    """
+    Walk (iteratively) the dependencies of the given tasks and return a dict mapping each task reachable from
+    them to its dependencies. Each task is visited once, making the walk linear in tasks plus dependencies.
+    A CircularDependencyError listing every detected dependency cycle is raised if the graph is not acyclic.
+    """
+    graph = {}
+    states = {}
+    cycles = []
+
+    for root_task in tasks:
+        if root_task in states:
+            continue
+
+        states[root_task] = _VISITING
+        graph[root_task] = tuple(root_task.get_all_dependencies())
+        path = [root_task]
+        dependency_iterators = [iter(graph[root_task])]
+
+        while dependency_iterators:
+            for dependency in dependency_iterators[-1]:
+                state = states.get(dependency)
+                if state is None:
+                    states[dependency] = _VISITING
+                    graph[dependency] = tuple(dependency.get_all_dependencies())
+                    path.append(dependency)
+                    dependency_iterators.append(iter(graph[dependency]))
+                    break
+                elif state == _VISITING:
+                    cycles.append(path[path.index(dependency):] + [dependency])
+            else:
+                states[path.pop()] = _VISITED
+                dependency_iterators.pop()
+
+    if cycles:
+        raise CircularDependencyError(
+            "Found circular dependencies between tasks:\n%s" % "\n".join(
+                "- " + _format_dependency_cycle(cycle) for cycle in cycles
+            )
+        )
+
+    return graph
+
+
+def check_task_dependencies(task):
+    build_task_graph((task,))
+
+
+def compute_critical_path_durations(graph, task_durations):
+    """
+    Return a dict mapping each task of the graph to the duration of the longest chain of tasks that
+    starts with this task and ends with a task that has no dependent. Durations of tasks missing from
+    task_durations are considered as null.
+    """
+    dependents = {}
+    pending_dependencies = {}
+    for task, dependencies in graph.items():
+        dependencies = set(dependencies)
+        pending_dependencies[task] = len(dependencies)
+        for dependency in dependencies:
+            dependents.setdefault(dependency, []).append(task)
+
+    # sort tasks topologically (a task always comes after its dependencies)
+    sorted_tasks = [task for task in graph if pending_dependencies[task] == 0]
+    for task in sorted_tasks:
+        for dependent in dependents.get(task, ()):
+            pending_dependencies[dependent] -= 1
+            if pending_dependencies[dependent] == 0:
+                sorted_tasks.append(dependent)
+
+    critical_path_durations = {}
+    for task in reversed(sorted_tasks):
+        critical_path_durations[task] = task_durations.get(task, 0) + max(
+            [critical_path_durations[dependent] for dependent in dependents.get(task, ())] or [0]
+        )
 
-    for dependency in task.get_all_dependencies():
-        check_task_dependencies(dependency, task_path=(task,) + task_path)
+    return critical_path_durations
@@ -6,11 +6,55 @@ Created on Jun 16, 2017
 
 import copy
 
+from six.moves import intern
+
 from lemoncheesecake.helpers.orderedset import OrderedSet
 from lemoncheesecake.exceptions import CannotFindTreeNode
 
 
+def _intern(value):
+    return intern(value) if type(value) is str else value
+
+
+class _HierarchyData(object):
+    """
+    The data of a node that depend on its ancestors, they are computed on first access and discarded
+    (along with those of the node's descendants) when the node is re-parented.
+    """
+    def __init__(self, node, parent_data):
+        self.parent_data = parent_data
+        self.node = node
+        if parent_data:
+            self.path_tuple = parent_data.path_tuple + (node.name,)
+            self.path = _intern(parent_data.path + "." + node.name)
+            self.paths = parent_data.paths + (self.path,)
+        else:
+            self.path_tuple = (node.name,)
+            self.path = _intern(node.name)
+            self.paths = (self.path,)
+        self._tags = None
+        self._properties = None
+
+    @property
+    def tags(self):
+        if self._tags is None:
+            tags = OrderedSet(self.parent_data.tags) if self.parent_data else OrderedSet()
+            tags.update(self.node.tags)
+            self._tags = tags
+        return self._tags
+
+    @property
+    def properties(self):
+        if self._properties is None:
+            properties = dict(self.parent_data.properties) if self.parent_data else {}
+            properties.update(self.node.properties)
+            self._properties = properties
+        return self._properties
+
+
 class BaseTreeNode(object):
+    _hierarchy_data = None
+
     def __init__(self, name, description):
         self.parent_suite = None
         self.name = name
@@ -19,6 +63,18 @@ class BaseTreeNode(object):
         self.properties = {}
         self.links = []
 
+    def _get_hierarchy_data(self):
+        # NB: the hierarchy data of a node are cached, the name, tags and properties of a node are not supposed
+        # to be changed once it has been added to its parent suite
+        data = self._hierarchy_data
+        if data is None:
+            parent_data = self.parent_suite._get_hierarchy_data() if self.parent_suite is not None else None
+            data = self._hierarchy_data = _HierarchyData(self, parent_data)
+        return data
+
+    def _reset_hierarchy_data(self):
+        self._hierarchy_data = None
+
     @property
     def hierarchy(self):
         if self.parent_suite is not None:
@@ -28,15 +84,19 @@ class BaseTreeNode(object):
 
     @property
     def hierarchy_depth(self):
-        return len(list(self.hierarchy)) - 1
+        return len(self._get_hierarchy_data().path_tuple) - 1
 
     @property
     def path(self):
-        return ".".join(s.name for s in self.hierarchy)
+        return self._get_hierarchy_data().path
+
+    @property
+    def path_tuple(self):
+        return self._get_hierarchy_data().path_tuple
 
     @property
     def hierarchy_paths(self):
-        return (node.path for node in self.hierarchy)
+        return iter(self._get_hierarchy_data().paths)
 
     @property
     def hierarchy_descriptions(self):
@@ -44,17 +104,12 @@ class BaseTreeNode(object):
 
     @property
     def hierarchy_tags(self):
-        tags = OrderedSet()
-        for node in self.hierarchy:
-            tags.update(node.tags)
-        return tags
+        # NB: the merged tags and properties are cached, they must not be modified
+        return self._get_hierarchy_data().tags
 
     @property
     def hierarchy_properties(self):
-        properties = {}
-        for node in self.hierarchy:
-            properties.update(node.properties)
-        return properties
+        return self._get_hierarchy_data().properties
 
     @property
     def hierarchy_links(self):
@@ -66,6 +121,7 @@ class BaseTreeNode(object):
     def pull_node(self):
         node = copy.copy(self)
         node.parent_suite = None
+        node._hierarchy_data = None
         return node
 
     def __str__(self):
@@ -74,7 +130,7 @@ class BaseTreeNode(object):
 
 def _normalize_node_hierarchy(value):
     if isinstance(value, BaseTreeNode):
-        return tuple(p.name for p in value.hierarchy)
+        return value.path_tuple
     elif type(value) in (list, tuple):
         return tuple(value)
     else:  # assume str
@@ -142,13 +198,24 @@ class BaseSuite(BaseTreeNode):
 
     def add_test(self, test):
         test.parent_suite = self
+        test._reset_hierarchy_data()
         self._tests.append(test)
 
     def get_tests(self):
         return self._tests
 
+    def _reset_hierarchy_data(self):
+        # the descendants can only have hierarchy data if their parent has
+        if self._hierarchy_data is not None:
+            BaseTreeNode._reset_hierarchy_data(self)
+            for test in self._tests:
+                test._reset_hierarchy_data()
+            for suite in self._suites:
+                suite._reset_hierarchy_data()
+
     def add_suite(self, suite):
         suite.parent_suite = self
+        suite._reset_hierarchy_data()
         self._suites.append(suite)
 
     def get_suites(self, include_empty_suites=False):
@@ -312,6 +312,23 @@ def assert_report(actual, expected):
 
     assert_hook_data(actual.test_session_teardown, expected.test_session_teardown)
 
+    assert len(actual.task_traces) == len(expected.task_traces)
+    for actual_trace, expected_trace in zip(actual.task_traces, expected.task_traces):
+        assert_task_trace(actual_trace, expected_trace)
+
+
+def assert_task_trace(actual, expected):
+    assert actual.name == expected.name
+    assert actual.category == expected.category
+    if expected.ready_time is None:
+        assert actual.ready_time is None
+    else:
+        assert_time(actual.ready_time, expected.ready_time)
+    assert_time(actual.start_time, expected.start_time)
+    assert_time(actual.end_time, expected.end_time)
+    assert actual.worker == expected.worker
+    assert actual.dependencies == expected.dependencies
+
 
 def assert_steps_data(steps):
     for step in steps:
@@ -387,3 +404,14 @@ def assert_report_stats(report,
     assert stats.check_failures == expected_failed_checks
     assert stats.error_logs == expected_error_logs
     assert stats.warning_logs == expected_warning_logs
+
+
+def assert_report_stats_consistency(report):
+    # the stats maintained incrementally by the ReportWriter must match the stats computed from the whole report
+    actual = report.stats()
+    expected = report.compute_stats()
+    assert actual.duration_cumulative == pytest.approx(expected.duration_cumulative)
+    actual.duration_cumulative = expected.duration_cumulative = None
+    assert vars(actual) == vars(expected)
+    assert report.nb_tests == len(list(report.all_tests()))
+    assert report.is_successful() == all(test.status in ("passed", "disabled") for test in report.all_tests())
@@ -17,6 +17,8 @@ from lemoncheesecake.cli import main
 from lemoncheesecake.suite import load_suite_from_class
 import lemoncheesecake.api as lcc
 
+from helpers.report import assert_report_stats_consistency
+
 
 def build_test_module(name="mysuite"):
     return """
@@ -100,7 +102,8 @@ def build_fixture_registry(*funcs):
 
 
 def run_suites(suites, fixtures=None, backends=None, tmpdir=None, force_disabled=False, stop_on_failure=False,
-               report_saving_strategy=None):
+               report_saving_strategy=None, nb_threads=1, nb_processes=1, resource_limits=None,
+               suite_affinity=False, max_open_suites=None, compact_report=False, spill_steps=False):
     if fixtures is None:
         fixture_registry = FixtureRegistry()
     else:
@@ -114,38 +117,47 @@ def run_suites(suites, fixtures=None, backends=None, tmpdir=None, force_disabled
 
     if tmpdir:
         event_manager = runner.initialize_event_manager(
-            suites, backends, tmpdir.strpath, report_saving_strategy, nb_threads=1
+            suites, backends, tmpdir.strpath, report_saving_strategy, nb_threads=nb_threads,
+            compact_report=compact_report, spill_steps=spill_steps
         )
         runner.run_suites(
             suites, fixture_registry, event_manager,
-            force_disabled=force_disabled, stop_on_failure=stop_on_failure
+            force_disabled=force_disabled, stop_on_failure=stop_on_failure,
+            nb_threads=nb_threads, nb_processes=nb_processes, resource_limits=resource_limits,
+            suite_affinity=suite_affinity, max_open_suites=max_open_suites
         )
     else:
         report_dir = tempfile.mkdtemp()
         event_manager = runner.initialize_event_manager(
-            suites, backends, report_dir, report_saving_strategy, nb_threads=1
+            suites, backends, report_dir, report_saving_strategy, nb_threads=nb_threads,
+            compact_report=compact_report, spill_steps=spill_steps
         )
         try:
             runner.run_suites(
                 suites, fixture_registry, event_manager,
-                force_disabled=force_disabled, stop_on_failure=stop_on_failure
+                force_disabled=force_disabled, stop_on_failure=stop_on_failure,
+                nb_threads=nb_threads, nb_processes=nb_processes, resource_limits=resource_limits,
+                suite_affinity=suite_affinity, max_open_suites=max_open_suites
             )
         finally:
             shutil.rmtree(report_dir)
 
     report = get_runtime().report
     dump_report(report)
+    assert_report_stats_consistency(report)
 
     return report
 
 
 def run_suite_classes(suite_classes, fixtures=None, backends=None, tmpdir=None,
-                      force_disabled=False, stop_on_failure=False, report_saving_strategy=None):
+                      force_disabled=False, stop_on_failure=False, report_saving_strategy=None, nb_processes=1,
+                      compact_report=False, spill_steps=False):
     suites = load_suites_from_classes(suite_classes)
     return run_suites(
         suites, fixtures=fixtures, backends=backends, tmpdir=tmpdir,
         force_disabled=force_disabled, stop_on_failure=stop_on_failure,
-        report_saving_strategy=report_saving_strategy
+        report_saving_strategy=report_saving_strategy, nb_processes=nb_processes,
+        compact_report=compact_report, spill_steps=spill_steps
     )
 
 
@@ -0,0 +1,51 @@
+import os.path as osp
+
+from helpers.testtreemockup import report_mockup, suite_mockup, tst_mockup, make_report_from_mockup
+from helpers.report import assert_test_statuses
+
+from lemoncheesecake.cli import main
+from lemoncheesecake.reporting import load_report
+from lemoncheesecake.reporting.backends.json_ import save_report_into_file
+
+
+def _save_shard_report(tmpdir, filename, suite):
+    path = tmpdir.join(filename).strpath
+    save_report_into_file(make_report_from_mockup(report_mockup().add_suite(suite)), path)
+    return path
+
+
+def test_merge_reports_cmd(tmpdir):
+    report_1_path = _save_shard_report(
+        tmpdir, "report_1.json", suite_mockup("mysuite").add_test(tst_mockup("mytest1", status="passed"))
+    )
+    report_2_path = _save_shard_report(
+        tmpdir, "report_2.json", suite_mockup("mysuite").add_test(tst_mockup("mytest2", status="failed"))
+    )
+    output_dir = tmpdir.join("merged").strpath
+
+    assert main(["merge-reports", report_1_path, report_2_path, "-o", output_dir, "--format", "json", "xml"]) == 0
+
+    assert osp.exists(osp.join(output_dir, "report.js"))
+    assert osp.exists(osp.join(output_dir, "report.xml"))
+    report = load_report(output_dir)
+    assert_test_statuses(report, passed=["mysuite.mytest1"], failed=["mysuite.mytest2"])
+
+
+def test_merge_reports_cmd_invalid_report(tmpdir):
+    report_path = _save_shard_report(
+        tmpdir, "report.json", suite_mockup("mysuite").add_test(tst_mockup("mytest1"))
+    )
+
+    assert "Cannot load report" in main(
+        ["merge-reports", report_path, tmpdir.join("doesnotexist.json").strpath, "-o", tmpdir.join("merged").strpath]
+    )
+
+
+def test_merge_reports_cmd_unknown_format(tmpdir):
+    report_path = _save_shard_report(
+        tmpdir, "report.json", suite_mockup("mysuite").add_test(tst_mockup("mytest1"))
+    )
+
+    assert "Unknown reporting backend" in main(
+        ["merge-reports", report_path, "-o", tmpdir.join("merged").strpath, "--format", "foo"]
+    )
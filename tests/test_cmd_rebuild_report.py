@@ -0,0 +1,50 @@
+import os
+import os.path as osp
+
+import pytest
+
+from lemoncheesecake.cli import main
+from lemoncheesecake.reporting import load_report
+
+from helpers.runner import generate_project, run_main
+from helpers.report import assert_test_statuses
+
+TEST_MODULE = """import lemoncheesecake.api as lcc
+
+@lcc.suite("My Suite")
+class mysuite:
+    @lcc.test("My Test 1")
+    def mytest1(self):
+        lcc.log_error("failure")
+
+    @lcc.test("My Test 2")
+    def mytest2(self):
+        pass
+"""
+
+
+@pytest.fixture()
+def project(tmpdir):
+    generate_project(tmpdir.strpath, "mysuite", TEST_MODULE)
+    old_cwd = os.getcwd()
+    os.chdir(tmpdir.strpath)
+    yield tmpdir
+    os.chdir(old_cwd)
+
+
+def test_rebuild_report_cmd(project):
+    assert run_main(["run", "--journal", "--reporting", "json"]) == 0
+    report_dir = project.join("report").strpath
+    os.unlink(osp.join(report_dir, "report.js"))
+
+    assert main(["rebuild-report", report_dir, "--format", "json", "xml"]) == 0
+
+    assert osp.exists(osp.join(report_dir, "report.xml"))
+    report = load_report(osp.join(report_dir, "report.js"))
+    assert_test_statuses(report, passed=["mysuite.mytest2"], failed=["mysuite.mytest1"])
+
+
+def test_rebuild_report_cmd_without_journal(project):
+    assert run_main(["run", "--reporting", "json"]) == 0
+
+    assert "Cannot find events.journal" in main(["rebuild-report", project.join("report").strpath])
@@ -1,14 +1,19 @@
 import os
+import socket
+
 import pytest
 
 from lemoncheesecake.project import Project, HasPreRunHook, HasPostRunHook
 from lemoncheesecake.cli import build_cli_args
 from lemoncheesecake.cli.commands.run import run_project
+from lemoncheesecake.reporting import load_report
 from lemoncheesecake import events
+from lemoncheesecake.processes import is_multiprocessing_available, _multiprocessing
 
 from helpers.runner import generate_project, run_main
 from helpers.cli import assert_run_output, cmdout
 from helpers.project import DummyProjectConfiguration, DUMMY_SUITE
+from helpers.report import assert_test_statuses
 
 
 TEST_MODULE = """import lemoncheesecake.api as lcc
@@ -84,6 +89,98 @@ def test_project_with_fixtures(project_with_fixtures, cmdout):
     assert_run_output(cmdout, "mysuite", successful_tests=["mytest1"])
 
 
+def test_run_with_processes(project, cmdout):
+    assert run_main(["run", "--processes", "2"]) == 0
+    cmdout.assert_substrs_anywhere(["KO", "mysuite.mytest1"])
+    cmdout.assert_substrs_anywhere(["OK", "mysuite.mytest2"])
+
+
+def test_run_with_async_concurrency(project, cmdout):
+    assert run_main(["run", "--async-concurrency", "4"]) == 0
+    assert_run_output(cmdout, "mysuite", successful_tests=["mytest2"], failed_tests=["mytest1"])
+
+
+def test_run_with_max_open_suites(project, cmdout):
+    assert run_main(["run", "--threads", "2", "--max-open-suites", "1"]) == 0
+    cmdout.assert_substrs_anywhere(["OK", "mysuite.mytest2"])
+
+
+def test_run_with_suite_affinity(project, cmdout):
+    assert run_main(["run", "--threads", "2", "--suite-affinity"]) == 0
+    cmdout.assert_substrs_anywhere(["OK", "mysuite.mytest2"])
+
+
+def test_run_with_invalid_max_open_suites(project):
+    assert "Invalid value '0' for --max-open-suites" in run_main(["run", "--max-open-suites", "0"])
+
+
+def _get_free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@pytest.mark.skipif(not is_multiprocessing_available(), reason="requires os.fork")
+def test_run_with_coordinator(project, cmdout):
+    address = "127.0.0.1:%d" % _get_free_port()
+    worker = _multiprocessing.Process(target=run_main, args=(["worker", "--connect", address],))
+    worker.start()
+    try:
+        assert run_main(["run", "--coordinator", address, "--workers", "1"]) == 0
+    finally:
+        worker.join()
+    cmdout.assert_substrs_anywhere(["KO", "mysuite.mytest1"])
+    cmdout.assert_substrs_anywhere(["OK", "mysuite.mytest2"])
+
+
+def test_run_with_coordinator_without_workers(project):
+    assert "--coordinator requires --workers" in run_main(["run", "--coordinator", "127.0.0.1:0"])
+
+
+def test_run_with_invalid_coordinator(project):
+    assert "Invalid value 'foo' for --coordinator" in run_main(["run", "--coordinator", "foo", "--workers", "1"])
+
+
+def test_run_longest_first(project, cmdout):
+    assert run_main(["run"]) == 0
+    assert run_main(["run", "--longest-first", "--threads", "2"]) == 0
+    cmdout.assert_substrs_anywhere(["OK", "mysuite.mytest2"])
+
+
+def test_run_longest_first_without_history(project, cmdout):
+    assert run_main(["run", "--longest-first"]) == 0
+    assert_run_output(cmdout, "mysuite", successful_tests=["mytest2"], failed_tests=["mytest1"])
+
+
+def test_run_longest_first_with_invalid_durations_report(project):
+    assert "Cannot load durations report" in run_main(["run", "--longest-first", "--durations-from", "doesnotexist"])
+
+
+def test_run_shard(project, cmdout):
+    assert run_main(["run", "--shard", "2/2"]) == 0
+    assert_run_output(cmdout, "mysuite", successful_tests=["mytest2"])
+
+
+def test_run_shard_invalid(project):
+    assert "Invalid value '3/2' for --shard" in run_main(["run", "--shard", "3/2"])
+
+
+def test_run_shard_then_merge_reports(project, tmpdir):
+    assert run_main(["run", "--shard", "1/2", "--report-dir", "shard1"]) == 0
+    assert run_main(["run", "--shard", "2/2", "--report-dir", "shard2"]) == 0
+    assert run_main(["merge-reports", "shard1", "shard2", "--output", "merged"]) == 0
+
+    report = load_report(tmpdir.join("merged").strpath)
+    assert_test_statuses(report, passed=["mysuite.mytest2"], failed=["mysuite.mytest1"])
+
+
+def test_run_with_compact_report(project, cmdout):
+    assert run_main(["run", "--compact-report"]) == 0
+    assert_run_output(cmdout, "mysuite", failed_tests=["mytest1"], successful_tests=["mytest2"])
+
+
 def test_stop_on_failure(project, cmdout):
     assert run_main(["run", "--stop-on-failure"]) == 0
     assert_run_output(cmdout, "mysuite", failed_tests=["mytest1"], skipped_tests=["mytest2"])
@@ -0,0 +1,93 @@
+import json
+
+from lemoncheesecake.cli import main
+from lemoncheesecake.cli.commands.trace import TraceCommand
+from lemoncheesecake.reporting import TaskTrace
+from lemoncheesecake.reporting.trace import get_workers, get_worker_utilizations, get_traces_by_queue_wait, \
+    get_critical_path, build_chrome_trace
+from lemoncheesecake.reporting.backends.json_ import save_report_into_file
+
+from helpers.cli import cmdout
+from helpers.testtreemockup import report_mockup, suite_mockup, tst_mockup, make_report_from_mockup, NOW
+
+
+def _make_traces():
+    #            0    1    2    3    4
+    # thread-1:  [setup] [test1         ]
+    # thread-2:          .  [test2]
+    return [
+        TaskTrace("suite", "suite_setup", NOW, NOW, NOW + 1, "thread-1"),
+        TaskTrace("suite.test1", "test", NOW + 1, NOW + 1, NOW + 4, "thread-1", [0]),
+        TaskTrace("suite.test2", "test", NOW + 1, NOW + 1.5, NOW + 2.5, "thread-2", [0]),
+    ]
+
+
+def _save_report(tmpdir, traces):
+    report = make_report_from_mockup(
+        report_mockup().add_suite(
+            suite_mockup("suite").add_test(tst_mockup("test1")).add_test(tst_mockup("test2"))
+        )
+    )
+    report.task_traces = traces
+    report_path = tmpdir.join("report.json").strpath
+    save_report_into_file(report, report_path)
+    return report_path
+
+
+def test_get_workers():
+    assert get_workers(_make_traces()) == ["thread-1", "thread-2"]
+
+
+def test_get_worker_utilizations():
+    assert get_worker_utilizations(_make_traces()) == [
+        ("thread-1", 2, 4.0, 1.0), ("thread-2", 1, 1.0, 0.25)
+    ]
+
+
+def test_get_traces_by_queue_wait():
+    assert [trace.name for trace in get_traces_by_queue_wait(_make_traces())][0] == "suite.test2"
+
+
+def test_get_critical_path():
+    assert [trace.name for trace in get_critical_path(_make_traces())] == ["suite", "suite.test1"]
+
+
+def test_build_chrome_trace():
+    trace = build_chrome_trace(_make_traces())
+
+    metadata_events = [event for event in trace["traceEvents"] if event["ph"] == "M"]
+    assert [event["args"]["name"] for event in metadata_events] == ["thread-1", "thread-2"]
+    events = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert events[0]["name"] == "suite (suite_setup)"
+    assert events[2] == {
+        "name": "suite.test2", "cat": "test", "ph": "X", "pid": 1, "tid": 2, "ts": 1500000, "dur": 1000000,
+        "args": {"queue_wait_ms": 500.0, "dependencies": ["suite (suite_setup)"]}
+    }
+
+
+def test_get_summary_entries():
+    summary = dict(TraceCommand.get_summary_entries(_make_traces()))
+
+    assert summary["Duration"] == "4.000s"
+    assert summary["Workers"] == "2"
+    assert summary["Workers utilization"] == "62%"
+    assert summary["Max queue wait"] == "0.500s"
+    assert summary["Critical path tasks duration"] == "4.000s"
+
+
+def test_trace_cmd(tmpdir, cmdout):
+    report_path = _save_report(tmpdir, _make_traces())
+    trace_path = tmpdir.join("trace.json").strpath
+
+    assert main(["trace", report_path, "--output", trace_path]) == 0
+
+    cmdout.assert_substrs_anywhere(["Critical path"])
+    cmdout.assert_substrs_anywhere(["suite.test1", "thread-1", "3.000s"])
+    with open(trace_path) as fh:
+        assert len(json.load(fh)["traceEvents"]) == 5
+
+
+def test_trace_cmd_without_traces(tmpdir):
+    report_path = _save_report(tmpdir, [])
+
+    assert "does not contain any task trace" in main(["trace", report_path])
@@ -1,4 +1,10 @@
-from lemoncheesecake.events import AsyncEventManager, SyncEventManager, Event
+import time
+import threading
+
+import pytest
+
+from lemoncheesecake.events import AsyncEventManager, SyncEventManager, Event, EventChannel, LogEvent
+from lemoncheesecake.testtree import TreeLocation
 
 
 class MyEvent(Event):
@@ -41,3 +47,257 @@ def test_unsubscribe():
     with eventmgr.handle_events():
         eventmgr.fire(MyEvent(42))
     assert not i_got_called
+
+
+class MyOtherEvent(MyEvent):
+    pass
+
+
+def test_get_name():
+    assert MyEvent.get_name() == "my"
+    assert MyOtherEvent.get_name() == "my_other"
+
+
+def test_add_listener():
+    class MyListener(object):
+        def __init__(self):
+            self.values = []
+
+        def on_my(self, event):
+            self.values.append(event.val)
+
+    listener = MyListener()
+    eventmgr = AsyncEventManager()
+    eventmgr.register_event(MyEvent, MyOtherEvent)
+    eventmgr.add_listener(listener)
+    with eventmgr.handle_events():
+        for i in range(100):
+            eventmgr.fire(MyEvent(i))
+        eventmgr.fire(MyOtherEvent(100))
+    assert listener.values == list(range(100))
+
+
+def test_add_batch_listener():
+    class MyBatchListener(object):
+        def __init__(self):
+            self.batches = []
+
+        def on_my(self, event):
+            raise AssertionError("on_my must not be called on a batch listener")
+
+        def on_events(self, batch):
+            self.batches.append([event.val for event in batch])
+
+    listener = MyBatchListener()
+    eventmgr = AsyncEventManager()
+    eventmgr.register_event(MyEvent)
+    eventmgr.add_batch_listener(listener)
+    with eventmgr.handle_events():
+        for i in range(100):
+            eventmgr.fire(MyEvent(i))
+    assert all(listener.batches)
+    assert [val for batch in listener.batches for val in batch] == list(range(100))
+
+
+def test_batch_listener_is_called_after_handlers():
+    calls = []
+    eventmgr = SyncEventManager()
+    eventmgr.register_event(MyEvent)
+
+    class MyBatchListener(object):
+        def on_events(self, batch):
+            calls.append(("batch", [event.val for event in batch]))
+
+    eventmgr.add_batch_listener(MyBatchListener())
+    eventmgr.subscribe_to_event(MyEvent, lambda event: calls.append(("event", event.val)))
+    eventmgr.fire(MyEvent(42))
+    assert calls == [("event", 42), ("batch", [42])]
+
+
+def test_listener_with_on_events_is_not_a_batch_listener():
+    class MyListener(object):
+        def __init__(self):
+            self.values = []
+
+        def on_my(self, event):
+            self.values.append(event.val)
+
+        def on_events(self, batch):
+            raise AssertionError("on_events must only be called on batch listeners")
+
+    listener = MyListener()
+    eventmgr = SyncEventManager()
+    eventmgr.register_event(MyEvent)
+    eventmgr.add_listener(listener)
+    eventmgr.handle_event_batch([MyEvent(1), MyEvent(2)])
+    assert listener.values == [1, 2]
+
+
+def test_event_batch_ordering():
+    calls = []
+
+    class MyListener(object):
+        def __init__(self, name):
+            self.name = name
+
+        def on_my(self, event):
+            calls.append((self.name, event.val))
+
+    class MyBatchListener(object):
+        def on_events(self, batch):
+            calls.append(("batch", [event.val for event in batch]))
+
+    eventmgr = SyncEventManager()
+    eventmgr.register_event(MyEvent)
+    eventmgr.add_listener(MyListener("listener_1"))
+    eventmgr.add_batch_listener(MyBatchListener())
+    eventmgr.add_listener(MyListener("listener_2"))
+    eventmgr.handle_event_batch([MyEvent(1), MyEvent(2)])
+
+    # the per-event listeners are interleaved as if the events were handled one by one,
+    # the batch listeners are called once the whole batch has been handled by them
+    assert calls == [
+        ("listener_1", 1), ("listener_2", 1), ("listener_1", 2), ("listener_2", 2), ("batch", [1, 2])
+    ]
+
+
+def test_async_handler_failure():
+    def handler(event):
+        raise ValueError(event.val)
+    eventmgr = AsyncEventManager()
+    eventmgr.register_event(MyEvent)
+    eventmgr.subscribe_to_event(MyEvent, handler)
+    with eventmgr.handle_events():
+        eventmgr.fire(MyEvent(42))
+        eventmgr.fire(MyEvent(43))
+    exception, _ = eventmgr.get_pending_failure()
+    assert isinstance(exception, ValueError)
+
+
+def _fire_in_channel(channel, nb_events, block_until=None):
+    handled = []
+    eventmgr = AsyncEventManager()
+    eventmgr.register_event(MyEvent)
+    eventmgr.subscribe_to_event(MyEvent, lambda event: handled.append(event.val))
+
+    class MyBatchListener(object):
+        def __init__(self):
+            self.batches = []
+
+        def on_events(self, batch):
+            if block_until:
+                block_until.wait()
+            self.batches.append([event.val for event in batch])
+
+    listener = MyBatchListener()
+    eventmgr.add_batch_listener(listener, channel=channel)
+    with eventmgr.handle_events():
+        for i in range(nb_events):
+            eventmgr.fire(MyEvent(i))
+        if block_until:
+            # the main handler is not stalled by the blocked channel
+            while len(handled) < nb_events:
+                time.sleep(0.01)
+            block_until.set()
+    return handled, listener.batches
+
+
+def test_channel():
+    handled, batches = _fire_in_channel(EventChannel("test"), 100)
+    assert handled == list(range(100))
+    assert [val for batch in batches for val in batch] == list(range(100))
+
+
+def test_channel_coalesce():
+    handled, batches = _fire_in_channel(
+        EventChannel("test", max_size=1, policy=EventChannel.COALESCE), 100, threading.Event()
+    )
+    assert handled == list(range(100))
+    assert [val for batch in batches for val in batch] == list(range(100))
+
+
+def test_channel_drop_debug_logs():
+    logs = []
+    unblock = threading.Event()
+
+    class MyListener(object):
+        def on_log(self, event):
+            unblock.wait()
+            logs.append(event.log_message)
+
+    eventmgr = SyncEventManager.load()
+    channel = EventChannel("test", max_size=1, policy=EventChannel.DROP_DEBUG_LOGS)
+    eventmgr.add_listener(MyListener(), channel=channel)
+    location = TreeLocation.in_test_session_setup()
+    channel.start()
+    try:
+        eventmgr.fire(LogEvent(location, "step", "info", "message 1"))
+        # wait for the listener to be blocked on the first log
+        while channel._batches:
+            time.sleep(0.01)
+        eventmgr.fire(LogEvent(location, "step", "info", "message 2"))
+        # the queue is now full
+        eventmgr.fire(LogEvent(location, "step", "debug", "message 3"))
+    finally:
+        unblock.set()
+        channel.stop()
+    assert logs == ["message 1", "message 2"]
+
+
+def test_channel_failure():
+    class MyListener(object):
+        def on_my(self, event):
+            raise ValueError(event.val)
+
+    eventmgr = AsyncEventManager()
+    eventmgr.register_event(MyEvent)
+    eventmgr.add_listener(MyListener(), channel=EventChannel("test", max_size=1))
+    with eventmgr.handle_events():
+        for i in range(100):
+            eventmgr.fire(MyEvent(i))
+    exception, _ = eventmgr.get_pending_failure()
+    assert isinstance(exception, ValueError)
+
+
+def test_channel_outside_handle_events():
+    values = []
+
+    class MyListener(object):
+        def on_my(self, event):
+            values.append(event.val)
+
+    eventmgr = SyncEventManager()
+    eventmgr.register_event(MyEvent)
+    eventmgr.add_listener(MyListener(), channel=EventChannel("test"))
+    eventmgr.fire(MyEvent(42))
+    assert values == [42]
+
+
+def test_channel_invalid_policy():
+    with pytest.raises(ValueError):
+        EventChannel("test", policy="foo")
+
+
+def test_event_has_no_dict():
+    event = LogEvent(TreeLocation.in_test_session_setup(), "step", "info", "message")
+    assert not hasattr(event, "__dict__")
+
+
+def test_event_get_attributes():
+    event = LogEvent(TreeLocation.in_test_session_setup(), "step", "info", "message", event_time=1.0)
+    assert event.get_attributes() == {
+        "time": 1.0, "location": TreeLocation.in_test_session_setup(), "step": "step",
+        "log_level": "info", "log_message": "message"
+    }
+
+
+def test_event_get_attributes_without_slots():
+    event = MyEvent(42)
+    assert event.get_attributes() == {"time": event.time, "val": 42}
+
+
+def test_event_from_attributes():
+    event = LogEvent(TreeLocation.in_test_session_setup(), "step", "info", "message")
+    other_event = LogEvent.from_attributes(event.get_attributes())
+    assert isinstance(other_event, LogEvent)
+    assert other_event.get_attributes() == event.get_attributes()
@@ -7,6 +7,7 @@ from lemoncheesecake.reporting.replay import replay_report_events
 from lemoncheesecake.reporting import ReportWriter
 
 from helpers.reporttests import *  # import the actual tests against JSON serialization
+from helpers.report import assert_report_stats_consistency
 
 
 def _test_serialization(suites_or_report, _, __, fixtures=(), report_saving_strategy=None):
@@ -30,6 +31,7 @@ def _test_serialization(suites_or_report, _, __, fixtures=(), report_saving_stra
     replay_report_events(report, event_manager)
 
     assert_report(new_report, report)
+    assert_report_stats_consistency(new_report)
 
 
 @pytest.fixture(scope="function")
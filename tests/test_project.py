@@ -8,7 +8,7 @@ from lemoncheesecake.project import Project, SimpleProjectConfiguration, \
     find_project_file
 from lemoncheesecake.suite import load_suite_from_class
 from lemoncheesecake.validators import MetadataPolicy
-from lemoncheesecake.exceptions import InvalidMetadataError
+from lemoncheesecake.exceptions import InvalidMetadataError, ProjectError
 
 from helpers.runner import build_test_module, build_fixture_module
 
@@ -49,6 +49,17 @@ def test_get_fixtures_with_fixtures(tmpdir):
     assert len(fixtures) == 1 and fixtures[0].name == "fixt"
 
 
+def test_get_resource_limits(tmpdir):
+    project = Project(SimpleProjectConfiguration(tmpdir.strpath, resource_limits={"db": 4}), tmpdir.strpath)
+    assert project.get_resource_limits() == {"db": 4}
+
+
+def test_get_resource_limits_invalid(tmpdir):
+    project = Project(SimpleProjectConfiguration(tmpdir.strpath, resource_limits={"db": 0}), tmpdir.strpath)
+    with pytest.raises(ProjectError):
+        project.get_resource_limits()
+
+
 def test_create_report_dir(tmpdir):
     project = make_test_project(tmpdir)
     report_dir = project.create_report_dir()
@@ -1,11 +1,20 @@
 import time
+from decimal import Decimal
+
+import pytest
 
 from lemoncheesecake.reporting.report import format_timestamp, parse_timestamp, \
-    TestResult as TstData, Step
+    TestResult as TstData, SuiteResult, Step
+from lemoncheesecake.reporting.report import Report, CompactStepEntries, Log, Check, Attachment, Url
+from lemoncheesecake.reporting.writer import ReportWriter
+from lemoncheesecake.reporting.replay import replay_report_events
+from lemoncheesecake.events import SyncEventManager
+from lemoncheesecake.testtree import TreeLocation
+from lemoncheesecake.exceptions import CannotFindTreeNode
 
 from helpers.testtreemockup import tst_mockup, suite_mockup, step_mockup, report_mockup, hook_mockup, \
     make_suite_data_from_mockup, make_report_from_mockup
-from helpers.report import assert_report_stats
+from helpers.report import assert_report_stats, assert_report_stats_consistency
 
 NOW = time.time()
 
@@ -34,6 +43,35 @@ def test_format_and_parse_timestamp_5():
     _test_timestamp_round(1485105524.353112, 1485105524.353)
 
 
+def _format_timestamp_without_codec(ts):
+    ts = round(ts, 3)
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)) + ".%03d" % (Decimal(repr(ts)) % 1 * 1000)
+
+
+def test_format_timestamp_same_as_without_codec():
+    base = 1485093460
+    for ts in [base + i / 1000.0 + delta for i in range(2000) for delta in (0, 0.0004, 0.0005, 0.0006)]:
+        assert format_timestamp(ts) == _format_timestamp_without_codec(ts)
+
+
+def test_format_timestamp_other_formats():
+    assert format_timestamp(1485093460.874194, date_time_sep="T", skip_milliseconds=True) == \
+        time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(1485093460))
+
+
+def test_parse_timestamp_same_second():
+    assert parse_timestamp("2017-01-22 15:57:40.874") - parse_timestamp("2017-01-22 15:57:40.123") == \
+        pytest.approx(0.751)
+    assert parse_timestamp("2017-01-22 15:57:41.000") - parse_timestamp("2017-01-22 15:57:40.874") == \
+        pytest.approx(0.126)
+
+
+def test_parse_timestamp_invalid():
+    for value in "2017-01-22 15:57:40", "2017-01-22 15:57:40.", "2017-01-22 15:57:40.abc", "foo.123":
+        with pytest.raises(ValueError):
+            parse_timestamp(value)
+
+
 def test_report_stats_simple():
     mockup = report_mockup()
     mockup.add_suite(suite_mockup().add_test(tst_mockup().add_step(
@@ -122,4 +160,217 @@ def test_suite_duration_with_teardown():
     )
     assert suite.duration == 2
 
+
+def _make_test_data(name, rank, start_time=None, end_time=None):
+    test = TstData(name, name)
+    test.rank = rank
+    test.start_time = start_time
+    test.end_time = end_time
+    return test
+
+
+def test_suite_duration_while_running():
+    suite = SuiteResult("suite", "Suite")
+    suite.start_time = NOW
+    suite.add_test(_make_test_data("test_1", 1, NOW, NOW + 1))
+    suite.add_test(_make_test_data("test_2", 2, NOW + 1))
+    assert suite.duration == 1
+
+    suite.get_tests()[1].end_time = NOW + 3
+    assert suite.duration == 3
+
+    suite.end_time = NOW + 3
+    assert suite.duration == 3
+    assert suite._duration == 3
+
+
+def test_suite_duration_after_new_test():
+    suite = SuiteResult("suite", "Suite")
+    sub_suite = SuiteResult("sub_suite", "Sub suite")
+    suite.add_suite(sub_suite)
+    sub_suite.add_test(_make_test_data("test_1", 1, NOW, NOW + 1))
+    sub_suite.end_time = suite.end_time = NOW + 1
+    assert suite.duration == 1
+
+    sub_suite.add_test(_make_test_data("test_2", 2, NOW + 1, NOW + 3))
+    assert suite.duration == 3
+
+
+def test_suite_get_tests_and_suites_sorted_by_rank():
+    suite = SuiteResult("suite", "Suite")
+    suite.add_test(_make_test_data("test_1", 2))
+    suite.add_test(_make_test_data("test_2", 1))
+    sub_suite_1 = SuiteResult("sub_suite_1", "Sub suite 1")
+    sub_suite_1.rank = 2
+    sub_suite_1.add_test(_make_test_data("test", 1))
+    sub_suite_2 = SuiteResult("sub_suite_2", "Sub suite 2")
+    sub_suite_2.rank = 1
+    suite.add_suite(sub_suite_1)
+    suite.add_suite(sub_suite_2)
+    assert [test.name for test in suite.get_tests()] == ["test_2", "test_1"]
+    assert [s.name for s in suite.get_suites(include_empty_suites=True)] == ["sub_suite_2", "sub_suite_1"]
+    assert [s.name for s in suite.get_suites()] == ["sub_suite_1"]
+
+    # rank changes, insertions and new tests in sub suites are taken into account
+    suite.get_tests()[0].rank = 3
+    suite.add_test(_make_test_data("test_3", 0))
+    sub_suite_2.add_test(_make_test_data("test", 1))
+    sub_suite_1.rank = 0
+    assert [test.name for test in suite.get_tests()] == ["test_3", "test_1", "test_2"]
+    assert [s.name for s in suite.get_suites()] == ["sub_suite_1", "sub_suite_2"]
+
+
+def test_suite_is_empty():
+    suite = SuiteResult("suite", "Suite")
+    sub_suite = SuiteResult("sub_suite", "Sub suite")
+    suite.add_suite(sub_suite)
+    assert suite.is_empty()
+
+    sub_suite.add_test(_make_test_data("test", 1))
+    assert not suite.is_empty()
+    assert suite.pull_node().is_empty()
+
+
+def test_report_get_suites_sorted_by_rank():
+    report = Report()
+    for name, rank in ("suite_1", 2), ("suite_2", 1):
+        suite = SuiteResult(name, name)
+        suite.rank = rank
+        report.add_suite(suite)
+    assert [suite.name for suite in report.get_suites()] == ["suite_2", "suite_1"]
+
+    report.get_suite("suite_1").rank = 0
+    assert [suite.name for suite in report.get_suites()] == ["suite_1", "suite_2"]
+
+
+def test_report_incremental_stats_while_building_report():
+    mockup = report_mockup()
+    mockup.add_suite(
+        suite_mockup().add_setup(hook_mockup()).add_test(
+            tst_mockup(status="failed").add_step(
+                step_mockup().add_check(True).add_check(False).add_error_log()
+            )
+        ).add_test(tst_mockup(status="skipped")).add_test(
+            tst_mockup().add_step(step_mockup().add_check(True))
+        )
+    )
+    report = make_report_from_mockup(mockup)
+
+    new_report = Report()
+    event_manager = SyncEventManager.load()
+    event_manager.add_listener(ReportWriter(new_report))
+    checked_events = []
+
+    class StatsChecker(object):
+        def on_events(self, events):
+            assert_report_stats_consistency(new_report)
+            checked_events.extend(events)
+
+    event_manager.add_batch_listener(StatsChecker())
+    replay_report_events(report, event_manager)
+
+    assert checked_events
+    assert_report_stats(
+        new_report, expected_passed_tests=1, expected_failed_tests=1, expected_skipped_tests=1,
+        expected_succeeded_checks=2, expected_failed_checks=1, expected_error_logs=1
+    )
+    assert not new_report.is_successful()
+
+
+
+def _make_entries():
+    return [
+        Log("info", "message", NOW), Check("description", True, "details", NOW + 1),
+        Check("other description", None, None, NOW + 2), Attachment("attachment", "file.txt", True, NOW + 3),
+        Url("url", "http://example.com", NOW + 4), Log("error", "error message", NOW + 5)
+    ]
+
+
+def _assert_entries(actual, expected):
+    assert [(entry.__class__, vars(entry)) for entry in actual] == \
+        [(entry.__class__, vars(entry)) for entry in expected]
+
+
+def test_compact_step_entries():
+    entries = CompactStepEntries(_make_entries())
+
+    assert len(entries) == 6
+    _assert_entries(entries, _make_entries())
+    _assert_entries(reversed(entries), reversed(_make_entries()))
+    _assert_entries(entries[1:3], _make_entries()[1:3])
+    _assert_entries([entries[-1]], [_make_entries()[-1]])
+    with pytest.raises(IndexError):
+        entries[6]
+
+
+def test_compact_step_entries_set_item():
+    entries = CompactStepEntries([Log("info", "message", NOW), Log("error", "error message", NOW)])
+    assert not entries.is_successful()
+
+    entry = entries[-1]
+    entry.level = "info"
+    entries[-1] = entry
+
+    assert entries[-1].level == "info"
+    assert entries.is_successful()
+
+
+def test_compact_step_is_successful():
+    step = Step("step", compact=True)
+    assert step.is_successful()
+    step.entries.append(Check("description", True, None, NOW))
+    assert step.is_successful()
+    step.entries.append(Check("description", False, None, NOW))
+    assert not step.is_successful()
+
+
+def test_compact_step_entries_unsupported_entry():
+    with pytest.raises(TypeError):
+        CompactStepEntries().append("foo")
+
+
 # TODO: report_stats lake tests
+
+
+def test_report_get_test_and_suite():
+    report = make_report_from_mockup(
+        report_mockup().add_suite(
+            suite_mockup("suite").add_test(tst_mockup("test")).add_suite(
+                suite_mockup("sub_suite").add_test(tst_mockup("test"))
+            )
+        )
+    )
+
+    assert report.get_suite("suite").name == "suite"
+    assert report.get_suite(("suite", "sub_suite")).path == "suite.sub_suite"
+    assert report.get_test("suite.test").path == "suite.test"
+    assert report.get_test(["suite", "sub_suite", "test"]).path == "suite.sub_suite.test"
+
+
+def test_report_get_test_added_to_suite_afterwards():
+    report = make_report_from_mockup(report_mockup().add_suite(suite_mockup("suite")))
+    suite = report.get_suite("suite")
+    suite.add_suite(SuiteResult("sub_suite", "Sub suite"))
+    report.get_suite("suite.sub_suite").add_test(TstData("test", "Test"))
+
+    assert report.get_test("suite.sub_suite.test").path == "suite.sub_suite.test"
+    assert report._index.tests[("suite", "sub_suite", "test")] is report.get_test("suite.sub_suite.test")
+
+
+def test_report_get_unknown_test():
+    report = make_report_from_mockup(report_mockup().add_suite(suite_mockup("suite").add_test(tst_mockup("test"))))
+
+    with pytest.raises(CannotFindTreeNode):
+        report.get_test("suite.other_test")
+
+
+def test_report_get_location():
+    report = make_report_from_mockup(
+        report_mockup().add_suite(
+            suite_mockup("suite").add_setup(hook_mockup()).add_test(tst_mockup("test"))
+        )
+    )
+    suite = report.get_suite("suite")
+
+    assert report.get(TreeLocation.in_suite_setup(suite)) is suite.suite_setup
+    assert report.get(TreeLocation.in_test("suite.test")) is report.get_test("suite.test")
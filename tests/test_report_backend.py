@@ -77,3 +77,133 @@ else:
         assert_report(reports[1], sample_report)
         assert "json" in [r.backend.name for r in reports]
         assert "xml" in [r.backend.name for r in reports]
+
+
+def _make_file_report_backend():
+    from lemoncheesecake.reporting.backend import FileReportBackend
+
+    class MyBackend(FileReportBackend):
+        def __init__(self):
+            self.nb_savings = 0
+
+        def get_report_filename(self):
+            return "report"
+
+        def serialize_report(self, report):
+            self.nb_savings += 1
+            return "report #%d" % self.nb_savings
+
+    return MyBackend()
+
+
+def test_file_report_session_saves_once_per_batch(tmpdir, sample_report):
+    from lemoncheesecake.reporting.savingstrategy import make_report_saving_strategy
+    from lemoncheesecake.testtree import TreeLocation
+    from lemoncheesecake import events
+
+    backend = _make_file_report_backend()
+    session = backend.create_reporting_session(
+        tmpdir.strpath, sample_report, False, make_report_saving_strategy("at_each_event")
+    )
+    location = TreeLocation.in_test_session_setup()
+
+    session.on_events([events.LogEvent(location, "step", "info", "message %d" % i) for i in range(10)])
+    session._saver.wait()
+    assert backend.nb_savings == 1
+
+    session.on_events([events.StepEvent(location, "step")])
+    session._saver.wait()
+    assert backend.nb_savings == 1
+
+    session.on_events([events.TestSessionEndEvent(sample_report)])
+    assert backend.nb_savings == 2
+    assert tmpdir.join("report").read() == "report #2"
+    assert tmpdir.listdir() == [tmpdir.join("report")]
+
+
+def test_file_report_session_coalesces_savings(tmpdir, sample_report):
+    from lemoncheesecake.reporting.savingstrategy import make_report_saving_strategy
+    from lemoncheesecake.testtree import TreeLocation
+    from lemoncheesecake import events
+
+    backend = _make_file_report_backend()
+    session = backend.create_reporting_session(
+        tmpdir.strpath, sample_report, False, make_report_saving_strategy("at_each_event")
+    )
+    location = TreeLocation.in_test_session_setup()
+
+    # the report is locked out (as if the report writer was updating it): the saver is stuck on the first save
+    with sample_report.lock:
+        for i in range(10):
+            session.on_events([events.LogEvent(location, "step", "info", "message %d" % i)])
+    session.on_events([events.TestSessionEndEvent(sample_report)])
+
+    assert backend.nb_savings <= 3
+    assert tmpdir.join("report").read() == "report #%d" % backend.nb_savings
+
+
+def test_file_report_session_saving_failure(tmpdir, sample_report):
+    from lemoncheesecake import events
+
+    class MyException(Exception):
+        pass
+
+    backend = _make_file_report_backend()
+
+    def serialize_report(report):
+        raise MyException()
+    backend.serialize_report = serialize_report
+
+    session = backend.create_reporting_session(tmpdir.strpath, sample_report, False)
+    with pytest.raises(MyException):
+        session.on_events([events.TestSessionEndEvent(sample_report)])
+    assert tmpdir.listdir() == []
+
+
+def test_file_report_session_without_background_saving(tmpdir, sample_report):
+    from lemoncheesecake.reporting.backend import FileReportSession
+    from lemoncheesecake import events
+
+    backend = _make_file_report_backend()
+    session = FileReportSession(
+        tmpdir.join("report").strpath, sample_report, backend, None, background_saving=False
+    )
+    session.on_events([events.TestSessionEndEvent(sample_report)])
+
+    assert session._saver is None
+    assert tmpdir.join("report").read() == "report #1"
+
+
+def test_file_report_session_serializes_snapshot_without_lock(tmpdir, sample_report):
+    import threading
+    from lemoncheesecake.reporting.backends.json_ import IncrementalJsonReportSession
+    from lemoncheesecake import events
+
+    lock_states = []
+
+    def is_report_locked():
+        # the report's lock is reentrant, it must be checked from another thread
+        acquired = []
+        def try_acquire():
+            acquired.append(sample_report.lock.acquire(False))
+            if acquired[0]:
+                sample_report.lock.release()
+        thread = threading.Thread(target=try_acquire)
+        thread.start()
+        thread.join()
+        return not acquired[0]
+
+    class MySession(IncrementalJsonReportSession):
+        def _snapshot_report(self):
+            lock_states.append(("snapshot", is_report_locked()))
+            return IncrementalJsonReportSession._snapshot_report(self)
+
+        def _write_snapshot(self, snapshot, fh):
+            lock_states.append(("write", is_report_locked()))
+            IncrementalJsonReportSession._write_snapshot(self, snapshot, fh)
+
+    session = MySession(tmpdir.join("report.js").strpath, sample_report, JsonBackend(), None)
+    session.on_events([events.TestSessionEndEvent(sample_report)])
+
+    assert lock_states == [("snapshot", True), ("write", False)]
+    assert_report(load_report(tmpdir.join("report.js").strpath), sample_report)
@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+import lemoncheesecake.api as lcc
+from lemoncheesecake import runner
+from lemoncheesecake.runtime import get_runtime
+from lemoncheesecake.fixtures import FixtureRegistry
+from lemoncheesecake.suite.loader import load_suites_from_classes
+from lemoncheesecake.reporting.journal import load_report_from_journal, get_journal_path
+from lemoncheesecake.exceptions import InvalidReportFile
+
+from helpers.runner import build_fixture_registry
+from helpers.report import assert_report
+
+
+@lcc.fixture(scope="session")
+def fixt():
+    lcc.log_info("session setup")
+    yield 42
+    lcc.log_info("session teardown")
+
+
+@lcc.suite("My Suite")
+@lcc.tags("foo")
+class mysuite:
+    @lcc.test("Test 1")
+    @lcc.prop("foo", "bar")
+    @lcc.link("http://www.example.com", "example")
+    def test1(self, fixt):
+        lcc.set_step("step 1")
+        lcc.log_info("info")
+        lcc.log_debug("debug")
+        lcc.check_that("value", fixt, lcc.equal_to(42))
+        lcc.log_url("http://www.example.com", "example")
+        lcc.save_attachment_content("content", "file.txt")
+
+    @lcc.test("Test 2")
+    def test2(self):
+        lcc.log_error("error")
+
+    @lcc.test("Test 3")
+    @lcc.disabled()
+    def test3(self):
+        pass
+
+    @lcc.suite("Sub Suite")
+    class sub_suite:
+        def setup_suite(self):
+            lcc.log_info("suite setup")
+
+        @lcc.test("Test 4")
+        @lcc.depends_on("mysuite.test2")
+        def test4(self):
+            pass
+
+
+def run_with_journal(suite_classes, tmpdir, fixtures=(), nb_threads=1):
+    suites = load_suites_from_classes(suite_classes)
+    fixture_registry = build_fixture_registry(*fixtures) if fixtures else FixtureRegistry()
+    event_manager = runner.initialize_event_manager(
+        suites, [], tmpdir.strpath, None, nb_threads=nb_threads, journal=True
+    )
+    runner.run_suites(suites, fixture_registry, event_manager, nb_threads=nb_threads)
+    return get_runtime().report
+
+
+def test_rebuild_report(tmpdir):
+    report = run_with_journal([mysuite], tmpdir, fixtures=[fixt])
+
+    rebuilt_report = load_report_from_journal(get_journal_path(tmpdir.strpath))
+
+    assert_report(rebuilt_report, report)
+
+
+def test_rebuild_report_with_threads(tmpdir):
+    report = run_with_journal([mysuite], tmpdir, fixtures=[fixt], nb_threads=4)
+
+    rebuilt_report = load_report_from_journal(get_journal_path(tmpdir.strpath))
+
+    assert_report(rebuilt_report, report)
+
+
+def test_rebuild_report_of_interrupted_run(tmpdir):
+    run_with_journal([mysuite], tmpdir, fixtures=[fixt])
+    journal_path = get_journal_path(tmpdir.strpath)
+    with open(journal_path) as fh:
+        lines = fh.readlines()
+    # simulate a test run killed while writing the line of the event that starts "Test 2"
+    idx = next(i for i, line in enumerate(lines) if '"mysuite.test2"' in line and line.startswith('["test_start"'))
+    with open(journal_path, "w") as fh:
+        fh.writelines(lines[:idx])
+        fh.write(lines[idx][:10])
+
+    rebuilt_report = load_report_from_journal(journal_path)
+
+    assert rebuilt_report.get_test("mysuite.test1").status == "passed"
+    assert rebuilt_report.get_suite("mysuite").end_time is None
+    assert rebuilt_report.end_time is None
+    with pytest.raises(Exception):
+        rebuilt_report.get_test("mysuite.test2")
+
+
+def test_rebuild_report_with_invalid_journal(tmpdir):
+    journal_path = tmpdir.join("events.journal").strpath
+    with open(journal_path, "w") as fh:
+        fh.write("foo\n[]\n")
+
+    with pytest.raises(InvalidReportFile):
+        load_report_from_journal(journal_path)
+
+
+def test_get_journal_path_without_journal(tmpdir):
+    assert get_journal_path(tmpdir.strpath) is None
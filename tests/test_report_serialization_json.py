@@ -4,12 +4,22 @@ Created on Nov 19, 2016
 @author: nicolas
 '''
 
+import json
+import time
+
 import pytest
 
-from lemoncheesecake.reporting.backends.json_ import JsonBackend, load_report_from_file
+from lemoncheesecake.reporting import Report, ReportWriter
+from lemoncheesecake.reporting.backends.json_ import JsonBackend, load_report_from_file, \
+    serialize_report_into_json, serialize_report_into_string, IncrementalJsonSerializer, \
+    IncrementalJsonReportSession, REPORT_VERSION, EPOCH_TIMESTAMPS_REPORT_VERSION, _JsonFragmentStore
+from lemoncheesecake.reporting.replay import replay_report_events
+from lemoncheesecake.events import SyncEventManager
 from lemoncheesecake.exceptions import InvalidReportFile
 
 from helpers.reporttests import *  # import the actual tests against JSON serialization
+from helpers.testtreemockup import tst_mockup, suite_mockup, step_mockup, report_mockup, hook_mockup, \
+    make_report_from_mockup
 
 
 @pytest.fixture(scope="function")
@@ -33,4 +43,214 @@ def test_load_report_bad_json(tmpdir):
     file = tmpdir.join("report.xml")
     file.write("{'foo': 'bar'}")
     with pytest.raises(InvalidReportFile):
-        load_report_from_file(file.strpath)
\ No newline at end of file
+        load_report_from_file(file.strpath)
+
+def test_incremental_serializer_while_building_report():
+    report = make_report_from_mockup(
+        report_mockup().add_suite(
+            suite_mockup("suite").add_setup(hook_mockup()).add_test(
+                tst_mockup("test_1", status="failed").add_step(step_mockup().add_check(False).add_error_log())
+            ).add_test(tst_mockup("test_2", status="skipped")).add_suite(
+                suite_mockup("sub_suite").add_test(tst_mockup("test").add_step(step_mockup().add_check(True)))
+            )
+        ).add_suite(
+            suite_mockup("other_suite").add_test(tst_mockup("test")).add_teardown(hook_mockup())
+        )
+    )
+
+    new_report = Report()
+    serializer = IncrementalJsonSerializer()
+    event_manager = SyncEventManager.load()
+    event_manager.add_listener(ReportWriter(new_report))
+    serializations = []
+
+    class SerializationChecker(object):
+        def on_events(self, events):
+            serialized = serializer.serialize(new_report)
+            assert serialized == json.dumps(serialize_report_into_json(new_report))
+            serializations.append(serialized)
+
+    event_manager.add_batch_listener(SerializationChecker())
+    replay_report_events(report, event_manager)
+
+    assert len(serializations) > 1
+    assert serializer._cache  # the root suites are ended
+    assert all(node.parent_suite is None for node in serializer._cache)
+
+
+def test_incremental_serializer_snapshot_is_independent_of_the_report():
+    report = make_report_from_mockup(
+        report_mockup().add_suite(
+            suite_mockup("suite").add_test(
+                tst_mockup("test_1").add_step(step_mockup().add_check(True).add_info_log())
+            ).add_test(tst_mockup("test_2", status="failed").add_step(step_mockup().add_check(False)))
+        ).add_suite(
+            suite_mockup("other_suite").add_test(tst_mockup("test")).add_teardown(hook_mockup())
+        )
+    )
+
+    new_report = Report()
+    serializer = IncrementalJsonSerializer()
+    event_manager = SyncEventManager.load()
+    event_manager.add_listener(ReportWriter(new_report))
+    snapshots = []
+
+    class SnapshotTaker(object):
+        def on_events(self, events):
+            snapshots.append(
+                (serializer.snapshot(new_report), json.dumps(serialize_report_into_json(new_report)))
+            )
+
+    event_manager.add_batch_listener(SnapshotTaker())
+    replay_report_events(report, event_manager)
+
+    # the snapshots are serialized once the report is complete, they must give the report as it was
+    # when they were taken
+    assert len(snapshots) > 1
+    for snapshot, expected in snapshots:
+        assert snapshot.text == expected
+
+
+def test_incremental_serializer_with_fragment_store(tmpdir):
+    report = make_report_from_mockup(
+        report_mockup().add_suite(
+            suite_mockup("suite").add_test(
+                tst_mockup("test_1").add_step(step_mockup().add_check(True).add_info_log())
+            ).add_test(tst_mockup("test_2", status="failed").add_step(step_mockup().add_check(False)))
+        ).add_suite(
+            suite_mockup("other_suite").add_test(tst_mockup("test")).add_teardown(hook_mockup())
+        )
+    )
+
+    new_report = Report()
+    store = _JsonFragmentStore(tmpdir.join("report.js.fragments").strpath)
+    serializer = IncrementalJsonSerializer(fragment_store=store)
+    event_manager = SyncEventManager.load()
+    event_manager.add_listener(ReportWriter(new_report))
+
+    class SerializationChecker(object):
+        def on_events(self, events):
+            assert serializer.serialize(new_report) == json.dumps(serialize_report_into_json(new_report))
+
+    event_manager.add_batch_listener(SerializationChecker())
+    replay_report_events(report, event_manager)
+
+    # the JSON of the ended tests is in the store and no longer in memory
+    assert tmpdir.join("report.js.fragments").size() > 0
+    assert serializer.serialize(new_report) == json.dumps(serialize_report_into_json(new_report))
+
+    store.close()
+    assert not tmpdir.join("report.js.fragments").exists()
+
+
+def test_incremental_saving_session(tmpdir):
+    report = Report()
+    assert isinstance(
+        JsonBackend().create_reporting_session(tmpdir.strpath, report, False), IncrementalJsonReportSession
+    )
+    assert not isinstance(
+        JsonBackend(incremental_saving=False).create_reporting_session(tmpdir.strpath, report, False),
+        IncrementalJsonReportSession
+    )
+    assert not isinstance(
+        JsonBackend(pretty_formatting=True).create_reporting_session(tmpdir.strpath, report, False),
+        IncrementalJsonReportSession
+    )
+
+
+def _save_report_with_steps(tmpdir, javascript_compatibility=True, epoch_timestamps=False):
+    now = time.time()
+    report = make_report_from_mockup(
+        report_mockup().add_suite(
+            suite_mockup("suite").add_setup(hook_mockup()).add_test(
+                tst_mockup("test", status="failed").add_step(
+                    step_mockup(start_time=now, end_time=now).add_check(False).add_error_log()
+                )
+            )
+        )
+    )
+    filename = tmpdir.join("report.js").strpath
+    JsonBackend(
+        javascript_compatibility=javascript_compatibility, epoch_timestamps=epoch_timestamps
+    ).save_report(filename, report)
+    return report, filename
+
+
+def test_load_report_with_lazy_steps(tmpdir):
+    report, filename = _save_report_with_steps(tmpdir)
+
+    loaded_report = load_report_from_file(filename)
+    test = loaded_report.get_test("suite.test")
+    assert test._steps_loader is not None
+    assert loaded_report.get_suite("suite").suite_setup._steps_loader is not None
+    assert test.status == "failed"
+
+    assert_report(loaded_report, report)
+    assert test._steps_loader is None
+    assert test.steps is test.steps
+
+
+def test_load_report_without_lazy_steps(tmpdir):
+    report, filename = _save_report_with_steps(tmpdir)
+
+    loaded_report = load_report_from_file(filename, lazy_steps=False)
+    assert loaded_report.get_test("suite.test")._steps_loader is None
+    assert_report(loaded_report, report)
+
+
+def test_load_report_without_javascript_compatibility(tmpdir):
+    report, filename = _save_report_with_steps(tmpdir, javascript_compatibility=False)
+    assert_report(load_report_from_file(filename), report)
+
+
+def test_load_report_extra_data(tmpdir):
+    _, filename = _save_report_with_steps(tmpdir)
+    with open(filename, "a") as fh:
+        fh.write("foobar")
+    with pytest.raises(InvalidReportFile):
+        load_report_from_file(filename)
+
+
+def test_serialize_report_with_epoch_timestamps():
+    now = time.time()
+    report = make_report_from_mockup(
+        report_mockup().add_suite(
+            suite_mockup("suite").add_test(
+                tst_mockup("test", start_time=now, end_time=now + 1).add_step(
+                    step_mockup(start_time=now, end_time=now + 1).add_info_log()
+                )
+            )
+        )
+    )
+
+    serialized = serialize_report_into_json(report, epoch_timestamps=True)
+    assert serialized["lemoncheesecake_report_version"] == EPOCH_TIMESTAMPS_REPORT_VERSION
+    js_test = serialized["suites"][0]["tests"][0]
+    assert js_test["start_time"] == now
+    assert js_test["end_time"] == now + 1
+    assert isinstance(js_test["steps"][0]["entries"][0]["time"], float)
+
+    assert serialize_report_into_json(report)["lemoncheesecake_report_version"] == REPORT_VERSION
+
+
+def test_incremental_serializer_with_epoch_timestamps():
+    report = make_report_from_mockup(report_mockup().add_suite(suite_mockup("suite").add_test(tst_mockup())))
+    assert IncrementalJsonSerializer(epoch_timestamps=True).serialize(report) == \
+        json.dumps(serialize_report_into_json(report, epoch_timestamps=True))
+
+
+def test_load_report_with_epoch_timestamps(tmpdir):
+    report, filename = _save_report_with_steps(tmpdir, epoch_timestamps=True)
+
+    loaded_report = load_report_from_file(filename)
+    assert_report(loaded_report, report)
+    assert loaded_report.start_time == report.start_time
+    assert loaded_report.get_test("suite.test").steps[0].start_time == report.get_test("suite.test").steps[0].start_time
+
+
+def test_epoch_timestamps_backend(tmpdir):
+    backend = JsonBackend(epoch_timestamps=True)
+    report = make_report_from_mockup(report_mockup().add_suite(suite_mockup("suite").add_test(tst_mockup())))
+    assert backend.serialize_report(report) == serialize_report_into_string(report, epoch_timestamps=True)
+    session = backend.create_reporting_session(tmpdir.strpath, report, False)
+    assert session.serializer.epoch_timestamps
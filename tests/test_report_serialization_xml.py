@@ -1,3 +1,5 @@
+# -*- coding: utf-8 -*-
+
 '''
 Created on Nov 17, 2016
 
@@ -35,4 +37,75 @@ else:
         file = tmpdir.join("report.xml")
         file.write("<value>foobar</value>")
         with pytest.raises(InvalidReportFile):
-            load_report_from_file(file.strpath)
\ No newline at end of file
+            load_report_from_file(file.strpath)
+
+    def test_load_report_truncated_xml(tmpdir):
+        file = tmpdir.join("report.xml")
+        file.write("<lemoncheesecake-report nb-threads=\"1\"><title>foobar</title>")
+        with pytest.raises(InvalidReportFile):
+            load_report_from_file(file.strpath)
+
+    def _run_sample_suites():
+        @lcc.suite("My Suite")
+        @lcc.tags("suite_tag")
+        @lcc.prop("suite_prop", "value")
+        @lcc.link("http://example.com", "suite link")
+        class mysuite:
+            def setup_suite(self):
+                lcc.log_info(u"message é")
+
+            @lcc.test("Test 1")
+            @lcc.tags("test_tag")
+            @lcc.prop("test_prop", "value")
+            @lcc.link("http://example.com/1")
+            def test_1(self):
+                lcc.check_that("value", 1, lcc.equal_to(2))
+
+            @lcc.suite("My Sub Suite")
+            class mysubsuite:
+                @lcc.test("Test 2")
+                def test_2(self):
+                    lcc.set_step("some step")
+                    lcc.log_url("http://example.com", "some url")
+
+                @lcc.test("Test 3")
+                @lcc.disabled()
+                def test_3(self):
+                    pass
+
+        return run_suite_class(mysuite)
+
+    def test_streamed_report_same_as_tree(tmpdir):
+        from lxml import etree
+        from lemoncheesecake.reporting.backends.xml import serialize_report_as_tree, save_report_into_file, \
+            indent_xml
+
+        report = _run_sample_suites()
+        assert report.task_traces
+
+        tree = serialize_report_as_tree(report)
+        indent_xml(tree)
+        save_report_into_file(report, tmpdir.join("report.xml").strpath)
+        streamed_tree = etree.parse(tmpdir.join("report.xml").strpath).getroot()
+
+        assert etree.tostring(streamed_tree, method="c14n") == etree.tostring(tree, method="c14n")
+
+    def test_saved_report_starts_with_xml_declaration(tmpdir):
+        from lemoncheesecake.reporting.backends.xml import save_report_into_file
+
+        save_report_into_file(_run_sample_suites(), tmpdir.join("report.xml").strpath)
+
+        assert tmpdir.join("report.xml").read_binary().startswith(b"<?xml version=")
+
+    def test_load_tree_based_report(tmpdir):
+        from lxml import etree
+        from lemoncheesecake.reporting.backends.xml import serialize_report_as_tree
+
+        report = _run_sample_suites()
+        tree = serialize_report_as_tree(report)
+        tmpdir.join("report.xml").write_binary(etree.tostring(tree, xml_declaration=True, encoding="utf-8"))
+
+        loaded_report = load_report_from_file(tmpdir.join("report.xml").strpath)
+
+        assert_report(loaded_report, report)
+        assert len(loaded_report.task_traces) == len(report.task_traces)
\ No newline at end of file
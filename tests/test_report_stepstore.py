@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+import os.path as osp
+import time
+
+import pytest
+
+import lemoncheesecake.api as lcc
+from lemoncheesecake.reporting.report import Step, Log, Check, Attachment, Url
+from lemoncheesecake.reporting.stepstore import StepStore, SpilledSteps, STEP_STORE_DIR
+from lemoncheesecake.reporting.backends.json_ import JsonBackend, load_report_from_file, _JsonValue, _JsonText
+from lemoncheesecake.reporting.savingstrategy import save_at_each_test_strategy
+
+from helpers.runner import run_suite_classes
+from helpers.report import get_last_test, assert_test_statuses
+
+NOW = time.time()
+
+
+def _make_steps():
+    step_1 = Step("step 1")
+    step_1.start_time = NOW
+    step_1.end_time = NOW + 1
+    step_1.entries.extend([
+        Log("info", u"message é", NOW), Check("description", False, "details", NOW + 0.5),
+        Check("other description", None, None, NOW + 0.6)
+    ])
+    step_2 = Step("step 2")
+    step_2.start_time = NOW + 1
+    step_2.end_time = NOW + 2
+    step_2.entries.extend([
+        Attachment("attachment", "attachments/file.txt", True, NOW + 1), Url("url", "http://example.com", NOW + 2)
+    ])
+    return [step_1, step_2]
+
+
+def _serialize_steps(steps):
+    return [
+        (step.description, step.start_time, step.end_time,
+         [(entry.__class__, vars(entry)) for entry in step.entries])
+        for step in steps
+    ]
+
+
+def test_step_store(tmpdir):
+    store = StepStore(tmpdir.join("store").strpath)
+
+    spilled_steps = store.write(_make_steps())
+
+    assert isinstance(spilled_steps, SpilledSteps)
+    assert len(spilled_steps) == 2
+    assert _serialize_steps(spilled_steps) == _serialize_steps(_make_steps())
+    assert spilled_steps[1].description == "step 2"
+    assert [step.description for step in reversed(spilled_steps)] == ["step 2", "step 1"]
+
+
+def test_spilled_steps_indexing(tmpdir):
+    store = StepStore(tmpdir.strpath)
+
+    spilled_steps = store.write(_make_steps())
+
+    assert _serialize_steps([spilled_steps[0]]) == _serialize_steps(_make_steps()[:1])
+    assert spilled_steps[-1].description == "step 2"
+    assert [step.description for step in spilled_steps[::-1]] == ["step 2", "step 1"]
+    with pytest.raises(IndexError):
+        spilled_steps[2]
+
+
+class StepStoreRecordingReads(StepStore):
+    def __init__(self, directory):
+        StepStore.__init__(self, directory)
+        self.read_lengths = []
+
+    def read_step(self, segment, offset, length):
+        self.read_lengths.append(length)
+        return StepStore.read_step(self, segment, offset, length)
+
+
+def test_spilled_steps_read_one_step_per_access(tmpdir):
+    store = StepStoreRecordingReads(tmpdir.strpath)
+    spilled_steps = store.write(_make_steps() * 100)
+
+    for i in range(len(spilled_steps)):
+        assert spilled_steps[i].description == ("step 1" if i % 2 == 0 else "step 2")
+
+    assert len(store.read_lengths) == 200
+    # each access only reads the record of the accessed step
+    assert max(store.read_lengths) < 500
+
+
+def test_spilled_steps_iteration_is_streamed(tmpdir):
+    store = StepStore(tmpdir.strpath)
+    spilled_steps = store.write(_make_steps())
+
+    steps = iter(spilled_steps)
+    assert next(steps).description == "step 1"
+    assert _serialize_steps(spilled_steps) == _serialize_steps(_make_steps())
+
+
+def test_step_store_segments(tmpdir):
+    store = StepStore(tmpdir.strpath, segment_size=1)
+
+    spilled_steps = [store.write(_make_steps()) for _ in range(3)]
+
+    assert sorted(tmpdir.listdir()) == [tmpdir.join("segment-%04d.jsonl" % i) for i in (1, 2, 3)]
+    for steps in spilled_steps:
+        assert _serialize_steps(steps) == _serialize_steps(_make_steps())
+
+
+@lcc.suite("My Suite")
+class mysuite:
+    @lcc.test("Test 1")
+    def test_1(self):
+        lcc.log_info("some message")
+        lcc.check_that("value", 1, lcc.equal_to(1))
+
+    @lcc.test("Test 2")
+    def test_2(self):
+        lcc.set_step("some step")
+        lcc.check_that("value", 1, lcc.equal_to(2))
+
+    @lcc.test("Test 3")
+    @lcc.disabled()
+    def test_3(self):
+        pass
+
+
+def test_run_with_spilled_steps(tmpdir):
+    report = run_suite_classes([mysuite], tmpdir=tmpdir, spill_steps=True)
+
+    assert_test_statuses(report, passed=["mysuite.test_1"], failed=["mysuite.test_2"], disabled=["mysuite.test_3"])
+    test = get_last_test(report)
+    assert isinstance(report.get_test("mysuite.test_1").steps, SpilledSteps)
+    assert report.get_test("mysuite.test_1").steps[0].entries[0].message == "some message"
+    assert report.get_test("mysuite.test_2").steps[0].description == "some step"
+    assert test.steps == []
+    assert osp.exists(tmpdir.join(STEP_STORE_DIR).strpath)
+
+
+def test_run_with_spilled_steps_and_reporting_backend(tmpdir):
+    report = run_suite_classes([mysuite], tmpdir=tmpdir, spill_steps=True, backends=[JsonBackend()])
+
+    assert isinstance(report.get_test("mysuite.test_1").steps, SpilledSteps)
+    saved_report = load_report_from_file(tmpdir.join("report.js").strpath)
+    assert saved_report.get_test("mysuite.test_1").steps[0].entries[0].message == "some message"
+    assert saved_report.get_test("mysuite.test_2").steps[0].entries[0].outcome is False
+
+
+def _iter_json_texts(value):
+    if isinstance(value, _JsonText):
+        yield value
+    elif isinstance(value, _JsonValue):
+        for item in value._value.values():
+            if isinstance(item, list):
+                for sub_item in item:
+                    for json_text in _iter_json_texts(sub_item):
+                        yield json_text
+
+
+def test_run_with_spilled_steps_and_incremental_json_backend(tmpdir):
+    sessions = []
+
+    class MyJsonBackend(JsonBackend):
+        def create_reporting_session(self, *args, **kwargs):
+            session = JsonBackend.create_reporting_session(self, *args, **kwargs)
+            sessions.append(session)
+            return session
+
+    def make_test_func(i):
+        def test_func():
+            lcc.log_info(("message %d " % i) * 10000)
+        return test_func
+
+    @lcc.suite("suite")
+    class suite(object):
+        def __init__(self):
+            for i in range(10):
+                lcc.add_test_into_suite(lcc.Test("test_%d" % i, "Test %d" % i, make_test_func(i)), self)
+
+    report = run_suite_classes(
+        [suite], tmpdir=tmpdir, spill_steps=True, backends=[MyJsonBackend()],
+        report_saving_strategy=save_at_each_test_strategy
+    )
+
+    # the JSON of the ended tests is not kept in memory by the incremental serializer, their steps having been
+    # spilled, the memory used by the ended tests does not grow with their number of log entries
+    assert isinstance(report.get_test("suite.test_0").steps, SpilledSteps)
+    serializer = sessions[0].serializer
+    json_texts = [
+        json_text for serialized in serializer._cache.values() for json_text in _iter_json_texts(serialized)
+    ]
+    assert len(json_texts) == 10
+    assert all(json_text.is_stored for json_text in json_texts)
+    assert all(json_text._text is None and json_text._value is None for json_text in json_texts)
+    # the fragment file is removed at the end of the test session
+    assert not osp.exists(tmpdir.join("report.js.fragments").strpath)
+
+    saved_report = load_report_from_file(tmpdir.join("report.js").strpath)
+    assert saved_report.get_test("suite.test_9").steps[0].entries[0].message == ("message 9 " * 10000)
@@ -12,6 +12,8 @@ import time
 import six
 
 import lemoncheesecake.api as lcc
+from lemoncheesecake.reporting.report import CompactStepEntries
+from lemoncheesecake.reporting.backends.json_ import serialize_report_into_json
 
 from helpers.runner import run_suite_class, run_suite_classes, run_func_in_test
 from helpers.report import assert_report_from_suite, assert_report_from_suites, get_last_test, get_last_attachment, \
@@ -779,3 +781,31 @@ def test_add_report_info():
     report = run_suite_class(mysuite)
 
     assert report.info[-1] == ["some info", "some data"]
+
+
+def test_compact_report(tmpdir):
+    @lcc.suite("MySuite")
+    class mysuite:
+        @lcc.test("Some test")
+        def sometest(self):
+            lcc.log_info("some message")
+            lcc.set_step("other step")
+            lcc.check_that("value", 1, lcc.equal_to(2))
+            lcc.log_url("http://example.com", "example")
+            lcc.save_attachment_content("some content", "file.txt")
+
+    report = run_suite_classes([mysuite], tmpdir=tmpdir, compact_report=True)
+
+    test = get_last_test(report)
+    assert test.status == "failed"
+    first_step, second_step = test.steps
+    assert isinstance(first_step.entries, CompactStepEntries)
+    assert first_step.entries[0].message == "some message"
+    assert first_step.entries[0].level == "info"
+    check, url, attachment = second_step.entries
+    assert check.outcome is False and "value" in check.description
+    assert url.url == "http://example.com" and url.description == "example"
+    assert attachment.filename.endswith("file.txt")
+
+    serialized_test = serialize_report_into_json(report)["suites"][0]["tests"][0]
+    assert [entry["type"] for entry in serialized_test["steps"][1]["entries"]] == ["check", "url", "attachment"]
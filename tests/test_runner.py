@@ -1401,3 +1401,202 @@ def test_depends_on_failed_and_subsuite():
     report = run_suite_class(suite1)
 
     assert_test_statuses(report, failed=["suite1.test1"], skipped=["suite1.suite2.test2"])
+
+
+def test_get_task_durations_from_report():
+    from lemoncheesecake.runner import build_tasks, get_task_durations_from_report, TestTask, SuiteInitializationTask
+    from lemoncheesecake.fixtures import FixtureRegistry
+    from lemoncheesecake.suite.loader import load_suites_from_classes
+    from lemoncheesecake.reporting import SetupResult
+
+    @lcc.suite("MySuite")
+    class mysuite:
+        def setup_suite(self):
+            pass
+
+        @lcc.test("Test 1")
+        def test1(self):
+            pass
+
+        @lcc.test("Test 2")
+        def test2(self):
+            pass
+
+    report = run_suite_class(mysuite)
+    report.get_test("mysuite.test1").end_time = report.get_test("mysuite.test1").start_time + 3
+    report.get_suite("mysuite").suite_setup = SetupResult()
+    report.get_suite("mysuite").suite_setup.start_time = 0
+    report.get_suite("mysuite").suite_setup.end_time = 2
+    # test2 is not in the report, it is considered as lasting the average test duration:
+    report.get_suite("mysuite")._tests.remove(report.get_test("mysuite.test2"))
+
+    registry = FixtureRegistry()
+    suites = load_suites_from_classes([mysuite])
+    tasks = build_tasks(suites, registry, registry.get_fixtures_scheduled_for_session(suites, None))
+    durations = get_task_durations_from_report(tasks, report)
+
+    test_durations = {task.test.name: duration for task, duration in durations.items() if isinstance(task, TestTask)}
+    assert test_durations == {"test1": 3, "test2": 3}
+    assert [duration for task, duration in durations.items() if isinstance(task, SuiteInitializationTask)] == [2]
+
+
+def test_run_with_resource_limits():
+    import threading
+    import time
+    from lemoncheesecake.suite.loader import load_suites_from_classes
+    from helpers.runner import run_suites
+
+    lock = threading.Lock()
+    counters = {"running": 0, "max_running": 0}
+
+    def use_db():
+        with lock:
+            counters["running"] += 1
+            counters["max_running"] = max(counters["max_running"], counters["running"])
+        time.sleep(0.01)
+        with lock:
+            counters["running"] -= 1
+
+    @lcc.suite("MySuite")
+    @lcc.uses_resource("db")
+    class mysuite:
+        @lcc.test("Test 1")
+        def test1(self):
+            use_db()
+
+        @lcc.test("Test 2")
+        def test2(self):
+            use_db()
+
+        @lcc.test("Test 3")
+        def test3(self):
+            use_db()
+
+        @lcc.test("Test 4")
+        def test4(self):
+            use_db()
+
+    report = run_suites(load_suites_from_classes([mysuite]), nb_threads=4, resource_limits={"db": 1})
+
+    assert_test_statuses(report, passed=["mysuite.test1", "mysuite.test2", "mysuite.test3", "mysuite.test4"])
+    assert counters["max_running"] == 1
+
+
+def test_task_traces():
+    @lcc.suite("MySuite")
+    class mysuite:
+        def setup_suite(self):
+            pass
+
+        @lcc.test("Test 1")
+        def test1(self):
+            pass
+
+        @lcc.test("Test 2")
+        def test2(self):
+            pass
+
+    report = run_suite_class(mysuite)
+
+    traces = {(trace.category, trace.name): trace for trace in report.task_traces}
+    assert sorted(traces) == [
+        ("suite_beginning", "mysuite"), ("suite_ending", "mysuite"), ("suite_setup", "mysuite"),
+        ("suite_teardown", "mysuite"), ("test", "mysuite.test1"), ("test", "mysuite.test2")
+    ]
+    test_trace = traces[("test", "mysuite.test1")]
+    assert [report.task_traces[idx] for idx in test_trace.dependencies] == [traces[("suite_setup", "mysuite")]]
+    assert test_trace.ready_time <= test_trace.start_time <= test_trace.end_time
+    assert test_trace.worker == "thread-1"
+
+
+def test_run_with_max_open_suites():
+    import threading
+    from lemoncheesecake.suite.loader import load_suites_from_classes
+    from helpers.runner import run_suites
+
+    lock = threading.Lock()
+    counters = {"open": 0, "max_open": 0}
+
+    class BaseSuite(object):
+        def setup_suite(self):
+            with lock:
+                counters["open"] += 1
+                counters["max_open"] = max(counters["max_open"], counters["open"])
+
+        def teardown_suite(self):
+            with lock:
+                counters["open"] -= 1
+
+        @lcc.test("Test 1")
+        def test1(self):
+            pass
+
+        @lcc.test("Test 2")
+        def test2(self):
+            pass
+
+    @lcc.suite("Suite 1")
+    class suite1(BaseSuite):
+        pass
+
+    @lcc.suite("Suite 2")
+    class suite2(BaseSuite):
+        pass
+
+    @lcc.suite("Suite 3")
+    class suite3(BaseSuite):
+        pass
+
+    report = run_suites(
+        load_suites_from_classes([suite1, suite2, suite3]), nb_threads=4, suite_affinity=True, max_open_suites=1
+    )
+
+    assert counters["max_open"] == 1
+    assert all(test.status == "passed" for test in report.all_tests())
+
+
+def test_reporting_session_reads_report_while_it_is_being_written(tmpdir):
+    from lemoncheesecake.suite.loader import load_suites_from_classes
+    from lemoncheesecake.reporting.backends.json_ import serialize_report_into_json
+    from helpers.runner import run_suites
+
+    errors = []
+
+    class ReportReadingSession(ReportingSession):
+        def __init__(self, report):
+            self.report = report
+
+        def _read_report(self):
+            try:
+                with self.report.lock:
+                    serialize_report_into_json(self.report)
+                    self.report.stats()
+            except Exception as excp:
+                errors.append(excp)
+
+        def on_log(self, event):
+            self._read_report()
+
+        def on_test_end(self, event):
+            self._read_report()
+
+    class ReportReadingBackend(ReportingBackend):
+        def create_reporting_session(self, report_dir, report, parallel, saving_strategy):
+            return ReportReadingSession(report)
+
+    @lcc.suite("MySuite")
+    class mysuite:
+        def __init__(self):
+            def test_func():
+                for i in range(5):
+                    lcc.log_info("log %d" % i)
+                    lcc.check_that("value", i, lcc.equal_to(i))
+            for i in range(100):
+                add_test_into_suite(lcc.Test("test_%d" % i, "Test %d" % i, test_func), self)
+
+    report = run_suites(
+        load_suites_from_classes([mysuite]), backends=[ReportReadingBackend()], tmpdir=tmpdir, nb_threads=8
+    )
+
+    assert errors == []
+    assert all(test.status == "passed" for test in report.all_tests())
@@ -0,0 +1,222 @@
+import sys
+
+import pytest
+import six
+
+import lemoncheesecake.api as lcc
+from lemoncheesecake.coroutines import set_max_concurrency, DEFAULT_MAX_CONCURRENCY
+
+from helpers.runner import run_suite, run_suites, build_suite_from_module, build_fixture_registry
+from helpers.report import assert_test_passed, assert_test_failed, get_last_test
+
+
+# "async def" is a syntax error on Python < 3.5, the async code is then kept within strings
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 5), reason="requires async/await syntax")
+
+
+def build_fixture_registry_from_code(code):
+    namespace = {"lcc": lcc}
+    six.exec_("import asyncio\n" + code, namespace)
+    return build_fixture_registry(*[obj for obj in namespace.values() if hasattr(obj, "_lccfixtureinfo")])
+
+
+def test_async_test():
+    suite = build_suite_from_module("""
+import asyncio
+
+@lcc.test("Some test")
+async def sometest():
+    await asyncio.sleep(0)
+    lcc.log_info("some log")
+""")
+
+    report = run_suite(suite)
+
+    assert_test_passed(report)
+    assert get_last_test(report).steps[0].entries[0].message == "some log"
+
+
+def test_async_test_failure():
+    suite = build_suite_from_module("""
+@lcc.test("Some test")
+async def sometest():
+    raise Exception("something bad happened")
+""")
+
+    report = run_suite(suite)
+
+    assert_test_failed(report)
+
+
+def test_async_hooks():
+    suite = build_suite_from_module("""
+import asyncio
+
+marker = []
+
+async def setup_suite():
+    await asyncio.sleep(0)
+    marker.append("setup_suite")
+
+async def setup_test(test):
+    marker.append("setup_test")
+
+async def teardown_test(test, status):
+    marker.append("teardown_test")
+
+async def teardown_suite():
+    marker.append("teardown_suite")
+    lcc.log_info("teardown: %s" % ",".join(marker))
+
+@lcc.test("Some test")
+async def sometest():
+    marker.append("test")
+""")
+
+    report = run_suite(suite)
+
+    assert_test_passed(report)
+    assert report.get_suites()[0].suite_teardown.steps[0].entries[0].message == \
+        "teardown: setup_suite,setup_test,test,teardown_test,teardown_suite"
+
+
+def test_async_fixtures():
+    fixtures = build_fixture_registry_from_code("""
+@lcc.fixture(scope="session")
+async def fixt1():
+    await asyncio.sleep(0)
+    return 21
+
+@lcc.fixture()
+async def fixt2(fixt1):
+    yield fixt1 * 2
+    lcc.log_info("teardown fixt2")
+""")
+    suite = build_suite_from_module("""
+@lcc.test("Some test")
+def sometest(fixt2):
+    lcc.check_that("value", fixt2, lcc.equal_to(42))
+""")
+
+    report = run_suite(suite, fixtures=fixtures)
+
+    assert_test_passed(report)
+    assert get_last_test(report).steps[-1].entries[0].message == "teardown fixt2"
+
+
+def test_async_generator_fixture_yielding_twice():
+    fixtures = build_fixture_registry_from_code("""
+@lcc.fixture()
+async def fixt():
+    yield 1
+    yield 2
+""")
+    suite = build_suite_from_module("""
+@lcc.test("Some test")
+def sometest(fixt):
+    pass
+""")
+
+    report = run_suite(suite, fixtures=fixtures)
+
+    assert_test_failed(report)
+
+
+def test_async_tests_share_the_same_event_loop():
+    # test1 can only complete if test2 runs on the same event loop at the same time
+    suite = build_suite_from_module("""
+import asyncio
+
+events = {}
+
+def get_event():
+    return events.setdefault("event", asyncio.Event())
+
+@lcc.test("Test 1")
+async def test1():
+    await asyncio.wait_for(get_event().wait(), 5)
+
+@lcc.test("Test 2")
+async def test2():
+    get_event().set()
+""")
+
+    report = run_suites([suite], nb_threads=2)
+
+    assert all(test.status == "passed" for test in report.all_tests())
+
+
+def test_async_tests_max_concurrency():
+    suite = build_suite_from_module("""
+import asyncio
+
+counters = {"in_flight": 0, "max_in_flight": 0}
+
+async def run():
+    counters["in_flight"] += 1
+    counters["max_in_flight"] = max(counters["max_in_flight"], counters["in_flight"])
+    await asyncio.sleep(0.01)
+    counters["in_flight"] -= 1
+
+@lcc.test("Test 1")
+async def test1():
+    await run()
+
+@lcc.test("Test 2")
+async def test2():
+    await run()
+
+@lcc.test("Test 3")
+async def test3():
+    await run()
+    lcc.log_info(str(counters["max_in_flight"]))
+""")
+
+    set_max_concurrency(1)
+    try:
+        report = run_suites([suite], nb_threads=3)
+    finally:
+        set_max_concurrency(DEFAULT_MAX_CONCURRENCY)
+
+    assert list(report.all_tests())[-1].steps[0].entries[0].message == "1"
+
+
+def test_async_tests_more_concurrent_tests_than_threads():
+    # the tests can only complete if they are all run at the same time on the event loop, while there is only
+    # one thread to run them
+    suite = build_suite_from_module("""
+import asyncio
+
+state = {"nb_started": 0}
+
+def get_event():
+    return state.setdefault("event", asyncio.Event())
+
+async def wait_for_all_tests():
+    state["nb_started"] += 1
+    if state["nb_started"] == 4:
+        get_event().set()
+    await asyncio.wait_for(get_event().wait(), 5)
+    lcc.log_info("done")
+
+@lcc.test("Test 1")
+async def test1():
+    await wait_for_all_tests()
+
+@lcc.test("Test 2")
+async def test2():
+    await wait_for_all_tests()
+
+@lcc.test("Test 3")
+async def test3():
+    await wait_for_all_tests()
+
+@lcc.test("Test 4")
+async def test4():
+    await wait_for_all_tests()
+""")
+
+    report = run_suites([suite], nb_threads=1)
+
+    assert all(test.status == "passed" for test in report.all_tests())
+    assert all(test.steps[0].entries[0].message == "done" for test in report.all_tests())
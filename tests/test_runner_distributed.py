@@ -0,0 +1,478 @@
+import os
+import io
+import time
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+import lemoncheesecake.api as lcc
+from lemoncheesecake import runner
+from lemoncheesecake import events
+from lemoncheesecake.distributed import Coordinator, run_worker, parse_address, _SocketEventManager, _recv_message, \
+    _recv_exactly, _sign, _MESSAGE_UNIT, _NONCE_SIZE, _SIGNATURE_SIZE
+from lemoncheesecake.testtree import TreeLocation
+from lemoncheesecake.processes import is_multiprocessing_available, _multiprocessing
+from lemoncheesecake.runtime import get_runtime
+from lemoncheesecake.fixtures import FixtureRegistry
+from lemoncheesecake.reporting import Attachment
+from lemoncheesecake.suite.loader import load_suites_from_classes
+from lemoncheesecake.exceptions import UserError, TasksExecutionFailure, ProtocolError
+
+from helpers.runner import build_fixture_registry
+from helpers.report import assert_test_statuses
+
+
+pytestmark = pytest.mark.skipif(not is_multiprocessing_available(), reason="requires os.fork")
+
+
+def run_suite_classes_on_workers(suite_classes, nb_workers=2, fixtures=None, nb_threads=1, stop_on_failure=False,
+                                 worker_suite_classes=None, secret=None):
+    fixture_registry = build_fixture_registry(*fixtures) if fixtures else FixtureRegistry()
+    suites = load_suites_from_classes(suite_classes)
+
+    coordinator = Coordinator("127.0.0.1", 0, nb_workers, secret)
+    host, port = coordinator.address
+    workers = [
+        _multiprocessing.Process(
+            target=run_worker,
+            args=(
+                host, port, load_suites_from_classes(worker_suite_classes or suite_classes), fixture_registry,
+                60, secret
+            )
+        )
+        for _ in range(nb_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    report_dir = tempfile.mkdtemp()
+    try:
+        coordinator.wait_for_workers(timeout=30)
+        event_manager = runner.initialize_event_manager(suites, [], report_dir, None, nb_threads=nb_threads)
+        runner.run_suites(
+            suites, fixture_registry, event_manager,
+            nb_threads=nb_threads, stop_on_failure=stop_on_failure, coordinator=coordinator
+        )
+        attachments = os.listdir(os.path.join(report_dir, "attachments")) \
+            if os.path.exists(os.path.join(report_dir, "attachments")) else []
+    finally:
+        coordinator.close()
+        for worker in workers:
+            worker.join()
+        shutil.rmtree(report_dir)
+
+    return get_runtime().report, attachments
+
+
+@lcc.suite("Suite 1")
+class suite1:
+    @lcc.test("Test 1")
+    def test1(self):
+        lcc.log_info(str(os.getpid()))
+
+    @lcc.test("Test 2")
+    def test2(self):
+        lcc.check_that("value", 1, lcc.equal_to(2))
+
+
+@lcc.suite("Suite 2")
+class suite2:
+    @lcc.test("Test 3")
+    def test3(self):
+        lcc.log_info(str(os.getpid()))
+
+    @lcc.suite("Sub suite")
+    class sub_suite:
+        @lcc.test("Test 4")
+        def test4(self):
+            pass
+
+
+def test_parse_address():
+    assert parse_address("localhost:1234") == ("localhost", 1234)
+
+
+def test_parse_address_without_port():
+    with pytest.raises(ValueError):
+        parse_address("localhost")
+
+
+def test_parse_address_with_default_host():
+    assert parse_address("1234", default_host="127.0.0.1") == ("127.0.0.1", 1234)
+    assert parse_address("localhost:1234", default_host="127.0.0.1") == ("localhost", 1234)
+
+
+def _run_worker_in_thread(coordinator, secret=None):
+    # return the list the exception raised by the worker (if any) is appended to
+    host, port = coordinator.address
+    errors = []
+
+    def run():
+        try:
+            run_worker(host, port, load_suites_from_classes([suite1]), FixtureRegistry(), 10, secret)
+        except Exception as excp:
+            errors.append(excp)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, errors
+
+
+def test_wait_for_workers_rejects_worker_with_another_secret():
+    coordinator = Coordinator("127.0.0.1", 0, 1, b"secret")
+    try:
+        thread, errors = _run_worker_in_thread(coordinator, b"other secret")
+        with pytest.raises(UserError, match="1 connection\\(s\\) rejected"):
+            coordinator.wait_for_workers(timeout=2)
+        thread.join()
+    finally:
+        coordinator.close()
+
+    assert len(errors) == 1 and isinstance(errors[0], ProtocolError)
+
+
+def test_worker_rejects_coordinator_with_another_secret():
+    coordinator = Coordinator("127.0.0.1", 0, 1, b"other secret")
+    try:
+        thread, errors = _run_worker_in_thread(coordinator, b"secret")
+        # play the coordinator's part of the handshake, the worker being accepted whatever its signature
+        coordinator._server.settimeout(10)
+        connection, _ = coordinator._server.accept()
+        try:
+            connection.sendall(b"x" * _NONCE_SIZE)
+            worker_nonce = _recv_exactly(connection, _NONCE_SIZE)
+            _recv_exactly(connection, _SIGNATURE_SIZE)
+            connection.sendall(_sign(coordinator.secret, b"coordinator", worker_nonce))
+            thread.join()
+        finally:
+            connection.close()
+    finally:
+        coordinator.close()
+
+    assert len(errors) == 1 and isinstance(errors[0], ProtocolError)
+
+
+def test_worker_with_unexpected_message():
+    coordinator = Coordinator("127.0.0.1", 0, 1)
+    try:
+        thread, errors = _run_worker_in_thread(coordinator)
+        coordinator.wait_for_workers(timeout=10)
+        coordinator._connections[0].send(_MESSAGE_UNIT, [])
+        thread.join()
+    finally:
+        coordinator.close()
+
+    assert len(errors) == 1 and isinstance(errors[0], ProtocolError)
+    assert "session" in str(errors[0])
+
+
+def test_wait_for_workers_timeout():
+    coordinator = Coordinator("127.0.0.1", 0, 1)
+    try:
+        with pytest.raises(UserError):
+            coordinator.wait_for_workers(timeout=0.1)
+    finally:
+        coordinator.close()
+
+
+def test_coordinator_splits_resource_limits():
+    @lcc.suite("Suite 3")
+    @lcc.uses_resource("db")
+    class suite3:
+        @lcc.test("Test 5")
+        def test5(self):
+            pass
+
+    coordinator = Coordinator("127.0.0.1", 0, 3)
+    try:
+        coordinator._connections = [None, None, None]
+        tasks = coordinator.build_tasks(
+            load_suites_from_classes([suite1, suite2, suite3]), FixtureRegistry(), None, 1,
+            resource_limits={"db": 4, "unused": 1}
+        )
+        # any worker may run suite3
+        assert [task.resource_limits for task in tasks[:-1]] == [{"db": 2}, {"db": 1}, {"db": 1}]
+
+        with pytest.raises(UserError, match="db"):
+            coordinator.build_tasks(
+                load_suites_from_classes([suite3]), FixtureRegistry(), None, 1, resource_limits={"db": 2}
+            )
+    finally:
+        coordinator._connections = []
+        coordinator.close()
+
+
+def test_run_on_workers():
+    report, _ = run_suite_classes_on_workers([suite1, suite2])
+
+    assert_test_statuses(
+        report,
+        passed=["suite1.test1", "suite2.test3", "suite2.sub_suite.test4"],
+        failed=["suite1.test2"]
+    )
+    pid_1 = report.get_test("suite1.test1").steps[0].entries[0].message
+    pid_2 = report.get_test("suite2.test3").steps[0].entries[0].message
+    assert str(os.getpid()) not in (pid_1, pid_2)
+
+
+def test_run_on_workers_with_secret():
+    report, _ = run_suite_classes_on_workers([suite1, suite2], secret=b"secret")
+
+    assert_test_statuses(
+        report, passed=["suite1.test1", "suite2.test3", "suite2.sub_suite.test4"], failed=["suite1.test2"]
+    )
+
+
+def test_run_on_workers_with_threads():
+    report, _ = run_suite_classes_on_workers([suite1, suite2], nb_threads=2)
+
+    assert_test_statuses(
+        report,
+        passed=["suite1.test1", "suite2.test3", "suite2.sub_suite.test4"],
+        failed=["suite1.test2"]
+    )
+
+
+def test_run_on_workers_with_more_workers_than_units():
+    report, _ = run_suite_classes_on_workers([suite1], nb_workers=3)
+
+    assert_test_statuses(report, passed=["suite1.test1"], failed=["suite1.test2"])
+
+
+def test_run_on_workers_with_dependency():
+    @lcc.suite("Suite 3")
+    class suite3:
+        @lcc.test("Test 5")
+        @lcc.depends_on("suite1.test2")
+        def test5(self):
+            pass
+
+    report, _ = run_suite_classes_on_workers([suite1, suite2, suite3])
+
+    assert_test_statuses(
+        report,
+        passed=["suite1.test1", "suite2.test3", "suite2.sub_suite.test4"],
+        failed=["suite1.test2"],
+        skipped=["suite3.test5"]
+    )
+
+
+def test_run_on_workers_with_suite_fixture():
+    @lcc.fixture(scope="suite")
+    def fixt():
+        return os.getpid()
+
+    @lcc.suite("Suite")
+    class suite:
+        @lcc.test("Test 1")
+        def test1(self, fixt):
+            lcc.log_info("%s %s" % (fixt, os.getpid()))
+
+        @lcc.test("Test 2")
+        def test2(self, fixt):
+            lcc.log_info("%s %s" % (fixt, os.getpid()))
+
+    report, _ = run_suite_classes_on_workers([suite], fixtures=[fixt], nb_threads=2)
+
+    messages = set(report.get_test(path).steps[0].entries[0].message for path in ("suite.test1", "suite.test2"))
+    assert len(messages) == 1
+    fixt_pid, test_pid = messages.pop().split()
+    assert fixt_pid == test_pid
+
+
+def test_run_on_workers_with_session_fixture():
+    @lcc.fixture(scope="session")
+    def fixt():
+        lcc.log_info("setup")
+        yield 42
+        lcc.log_info("teardown")
+
+    @lcc.suite("Suite A")
+    class suite_a:
+        @lcc.test("Test")
+        def test(self, fixt):
+            lcc.check_that("value", fixt, lcc.equal_to(42))
+
+    @lcc.suite("Suite B")
+    class suite_b:
+        @lcc.test("Test")
+        def test(self, fixt):
+            lcc.check_that("value", fixt, lcc.equal_to(42))
+
+    report, _ = run_suite_classes_on_workers([suite_a, suite_b], fixtures=[fixt])
+
+    assert_test_statuses(report, passed=["suite_a.test", "suite_b.test"])
+    assert report.test_session_setup.end_time is not None
+    assert report.test_session_teardown.end_time is not None
+
+
+def test_run_on_workers_with_failing_session_fixture():
+    @lcc.fixture(scope="session")
+    def fixt():
+        1 / 0
+
+    @lcc.suite("Suite A")
+    class suite_a:
+        @lcc.test("Test")
+        def test(self, fixt):
+            pass
+
+    report, _ = run_suite_classes_on_workers([suite_a], fixtures=[fixt])
+
+    assert_test_statuses(report, skipped=["suite_a.test"])
+    assert report.test_session_setup.outcome is False
+
+
+def test_run_on_workers_with_attachment():
+    @lcc.suite("Suite")
+    class suite:
+        @lcc.test("Test")
+        def test(self):
+            lcc.save_attachment_content("some content", "file.txt")
+
+    report, attachments = run_suite_classes_on_workers([suite])
+
+    attachment = [entry for entry in report.get_test("suite.test").steps[0].entries if isinstance(entry, Attachment)][0]
+    assert attachment.filename.startswith("attachments/w")
+    assert attachments == [attachment.filename.split("/")[1]]
+
+
+def test_run_on_workers_with_unknown_test_on_worker():
+    @lcc.suite("Suite 3")
+    class suite3:
+        @lcc.test("Test 5")
+        def test5(self):
+            pass
+
+    # the worker does not know suite3 (it has not the same version of the project as the coordinator)
+    with pytest.raises(TasksExecutionFailure, match="suite3"):
+        run_suite_classes_on_workers([suite1, suite3], nb_workers=1, worker_suite_classes=[suite1])
+
+    report = get_runtime().report
+    assert_test_statuses(
+        report, passed=["suite1.test1"], failed=["suite1.test2"], skipped=["suite3.test5"]
+    )
+
+
+def test_run_on_workers_with_worker_dying_mid_unit():
+    @lcc.suite("Suite A")
+    class suite_a:
+        @lcc.test("Test 1")
+        def test_1(self):
+            pass
+
+        @lcc.test("Test 2")
+        def test_2(self):
+            # let the worker send the events of test_1 and test_2's start before dying
+            time.sleep(0.5)
+            os._exit(1)
+
+        @lcc.test("Test 3")
+        def test_3(self):
+            pass
+
+        @lcc.suite("Sub suite")
+        class sub_suite:
+            @lcc.test("Test 4")
+            def test_4(self):
+                pass
+
+    @lcc.suite("Suite B")
+    class suite_b:
+        @lcc.test("Test")
+        def test(self):
+            pass
+
+    with pytest.raises(TasksExecutionFailure, match="Worker #1"):
+        run_suite_classes_on_workers([suite_a, suite_b], nb_workers=1)
+
+    report = get_runtime().report
+    assert_test_statuses(
+        report, passed=["suite_a.test_1"], failed=["suite_a.test_2"],
+        skipped=["suite_a.test_3", "suite_a.sub_suite.test_4", "suite_b.test"]
+    )
+    assert "worker #1 failed" in report.get_test("suite_a.test_2").steps[-1].entries[0].message
+    assert all(suite.end_time is not None for suite in report.all_suites())
+
+
+def test_run_on_workers_task_traces():
+    report, _ = run_suite_classes_on_workers([suite1, suite2])
+
+    tests = [trace for trace in report.task_traces if trace.category == "test"]
+    assert sorted(trace.name for trace in tests) == \
+        ["suite1.test1", "suite1.test2", "suite2.sub_suite.test4", "suite2.test3"]
+    assert all(trace.worker.startswith("worker-") for trace in tests)
+
+
+def test_run_on_workers_with_stop_on_failure(tmpdir):
+    marker = tmpdir.join("started").strpath
+
+    @lcc.suite("Suite A")
+    class suite_a:
+        @lcc.test("Test")
+        def test(self):
+            # the failure happens once the other worker has started its tests
+            deadline = time.time() + 5
+            while not os.path.exists(marker) and time.time() < deadline:
+                time.sleep(0.01)
+            lcc.log_error("something bad happened")
+
+    @lcc.suite("Suite B")
+    class suite_b:
+        @lcc.test("Test 1")
+        def test_1(self):
+            open(marker, "w").close()
+            # leave some time to the coordinator to get the failure of the other worker
+            time.sleep(1)
+
+        @lcc.test("Test 2")
+        def test_2(self):
+            pass
+
+    report, _ = run_suite_classes_on_workers([suite_a, suite_b], stop_on_failure=True)
+
+    assert_test_statuses(report, failed=["suite_a.test"], passed=["suite_b.test_1"], skipped=["suite_b.test_2"])
+
+
+class _RecordingConnection(object):
+    def __init__(self):
+        self.sent = []
+        self.unblocked = threading.Event()
+
+    def sendall(self, data):
+        # the first sending is blocked until the test unblocks it
+        self.unblocked.wait(5)
+        self.sent.append(data)
+
+
+class _BytesConnection(object):
+    def __init__(self, data):
+        self._fh = io.BytesIO(data)
+
+    def recv(self, size):
+        return self._fh.read(size)
+
+
+def test_socket_event_manager_sends_events_by_batches(tmpdir):
+    connection = _RecordingConnection()
+    event_manager = _SocketEventManager(connection, tmpdir.strpath)
+    location = TreeLocation.in_test_session_setup()
+    fired_events = [events.LogEvent(location, "step", "info", "message %d" % i) for i in range(100)]
+
+    event_manager.fire(fired_events[0])
+    # wait for the sending thread to be blocked on the first event, then fire the other events meanwhile
+    while not event_manager._pending_messages == []:
+        time.sleep(0.01)
+    for event in fired_events[1:]:
+        event_manager.fire(event)
+    connection.unblocked.set()
+    event_manager.close()
+
+    assert len(connection.sent) == 2
+    received = _BytesConnection(b"".join(connection.sent))
+    assert [_recv_message(received) for _ in fired_events] == [
+        ("event", events.serialize_event(event)) for event in fired_events
+    ]
+    assert event_manager.get_pending_failure() == (None, None)
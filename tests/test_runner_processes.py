@@ -0,0 +1,342 @@
+import os
+import time
+import threading
+
+import pytest
+
+import lemoncheesecake.api as lcc
+from lemoncheesecake.processes import split_suites, is_multiprocessing_available, split_resource_limits, \
+    build_worker_process_tasks
+from lemoncheesecake.fixtures import FixtureRegistry
+from lemoncheesecake.suite.loader import load_suites_from_classes
+from lemoncheesecake.exceptions import UserError, TasksExecutionFailure
+from lemoncheesecake.runtime import get_runtime
+from lemoncheesecake.reporting.backend import ReportingBackend, ReportingSession
+
+from helpers.runner import run_suites, run_suite_classes, build_fixture_registry
+from helpers.report import assert_test_statuses
+
+
+pytestmark = pytest.mark.skipif(not is_multiprocessing_available(), reason="requires os.fork")
+
+
+@lcc.suite("Suite 1")
+class suite1:
+    @lcc.test("Test 1")
+    def test1(self):
+        lcc.log_info(str(os.getpid()))
+
+    @lcc.test("Test 2")
+    def test2(self):
+        lcc.check_that("value", 1, lcc.equal_to(2))
+
+
+@lcc.suite("Suite 2")
+class suite2:
+    @lcc.test("Test 3")
+    def test3(self):
+        lcc.log_info(str(os.getpid()))
+
+    @lcc.suite("Sub suite")
+    class sub_suite:
+        @lcc.test("Test 4")
+        def test4(self):
+            pass
+
+
+def test_split_suites():
+    suites = load_suites_from_classes([suite1, suite2])
+
+    groups = split_suites(suites, 2)
+
+    assert sorted([[suite.name for suite in group] for group in groups]) == [["suite1"], ["suite2"]]
+
+
+def test_split_suites_more_groups_than_suites():
+    suites = load_suites_from_classes([suite1, suite2])
+
+    assert len(split_suites(suites, 8)) == 2
+
+
+def test_split_suites_with_dependency():
+    @lcc.suite("Suite 3")
+    class suite3:
+        @lcc.test("Test 5")
+        @lcc.depends_on("suite1.test1")
+        def test5(self):
+            pass
+
+    suites = load_suites_from_classes([suite1, suite2, suite3])
+
+    groups = split_suites(suites, 3)
+
+    assert sorted([[suite.name for suite in group] for group in groups]) == [["suite1", "suite3"], ["suite2"]]
+
+
+def test_split_suites_with_unknown_dependency():
+    @lcc.suite("Suite 3")
+    class suite3:
+        @lcc.test("Test 5")
+        @lcc.depends_on("suite1.unknown")
+        def test5(self):
+            pass
+
+    with pytest.raises(UserError):
+        split_suites(load_suites_from_classes([suite3]), 2)
+
+
+def test_split_resource_limits():
+    assert split_resource_limits({"db": 4, "api": 2}, [{"db", "api"}, {"db"}, {"db", "api"}]) == [
+        {"db": 2, "api": 1}, {"db": 1}, {"db": 1, "api": 1}
+    ]
+
+
+def test_split_resource_limits_unused_resource():
+    assert split_resource_limits({"db": 1}, [set(), set()]) == [{}, {}]
+
+
+def test_split_resource_limits_lower_than_the_number_of_workers():
+    with pytest.raises(UserError, match="db"):
+        split_resource_limits({"db": 1}, [{"db"}, {"db"}])
+
+
+def test_build_worker_process_tasks_with_resource_limits():
+    @lcc.suite("Suite 3")
+    @lcc.uses_resource("db")
+    class suite3:
+        @lcc.test("Test 5")
+        def test5(self):
+            pass
+
+    suites = load_suites_from_classes([suite1, suite2, suite3])
+    tasks = build_worker_process_tasks(suites, FixtureRegistry(), None, 3, 1, resource_limits={"db": 3})
+
+    # only the worker running suite3 uses the resource, it gets all its tokens
+    assert sorted(
+        ([suite.name for suite in task.suites], task.resource_limits) for task in tasks
+    ) == [(["suite1"], {}), (["suite2"], {}), (["suite3"], {"db": 3})]
+
+
+def test_run_in_processes():
+    report = run_suite_classes([suite1, suite2], nb_processes=2)
+
+    assert_test_statuses(
+        report,
+        passed=["suite1.test1", "suite2.test3", "suite2.sub_suite.test4"],
+        failed=["suite1.test2"]
+    )
+    pid_1 = report.get_test("suite1.test1").steps[0].entries[0].message
+    pid_2 = report.get_test("suite2.test3").steps[0].entries[0].message
+    assert pid_1 != pid_2
+    assert str(os.getpid()) not in (pid_1, pid_2)
+
+
+def test_run_in_processes_with_session_fixture():
+    @lcc.fixture(scope="session")
+    def fixt():
+        lcc.log_info("setup in %s" % os.getpid())
+        yield 42
+        lcc.log_info("teardown in %s" % os.getpid())
+
+    @lcc.suite("Suite A")
+    class suite_a:
+        @lcc.test("Test")
+        def test(self, fixt):
+            lcc.check_that("value", fixt, lcc.equal_to(42))
+
+    @lcc.suite("Suite B")
+    class suite_b:
+        @lcc.test("Test")
+        def test(self, fixt):
+            lcc.check_that("value", fixt, lcc.equal_to(42))
+
+    report = run_suite_classes([suite_a, suite_b], fixtures=[fixt], nb_processes=2)
+
+    assert_test_statuses(report, passed=["suite_a.test", "suite_b.test"])
+    setup_logs = [entry.message for step in report.test_session_setup.steps for entry in step.entries]
+    teardown_logs = [entry.message for step in report.test_session_teardown.steps for entry in step.entries]
+    assert len(set(setup_logs)) == 2
+    assert len(set(teardown_logs)) == 2
+    assert report.test_session_setup.end_time is not None
+    assert report.test_session_teardown.end_time is not None
+
+
+def test_run_in_processes_with_failing_session_fixture():
+    @lcc.fixture(scope="session")
+    def fixt():
+        1 / 0
+
+    @lcc.suite("Suite A")
+    class suite_a:
+        @lcc.test("Test")
+        def test(self, fixt):
+            pass
+
+    @lcc.suite("Suite B")
+    class suite_b:
+        @lcc.test("Test")
+        def test(self):
+            pass
+
+    report = run_suite_classes([suite_a, suite_b], fixtures=[fixt], nb_processes=2)
+
+    assert_test_statuses(report, skipped=["suite_a.test"], passed=["suite_b.test"])
+    assert report.test_session_setup.outcome is False
+
+
+def test_run_in_processes_with_worker_process_exiting_unexpectedly():
+    @lcc.suite("Suite A")
+    class suite_a:
+        @lcc.test("Test 1")
+        def test_1(self):
+            pass
+
+        @lcc.test("Test 2")
+        def test_2(self):
+            # let the worker send the events of test_1 and test_2's start before exiting
+            time.sleep(0.5)
+            os._exit(1)
+
+        @lcc.test("Test 3")
+        def test_3(self):
+            pass
+
+        @lcc.suite("Sub suite")
+        class sub_suite:
+            @lcc.test("Test 4")
+            def test_4(self):
+                pass
+
+    @lcc.suite("Suite B")
+    class suite_b:
+        @lcc.test("Test")
+        def test(self):
+            pass
+
+    with pytest.raises(TasksExecutionFailure, match="exited unexpectedly"):
+        run_suite_classes([suite_a, suite_b], nb_processes=2)
+
+    report = get_runtime().report
+    assert_test_statuses(
+        report, passed=["suite_a.test_1", "suite_b.test"], failed=["suite_a.test_2"],
+        skipped=["suite_a.test_3", "suite_a.sub_suite.test_4"]
+    )
+    assert "worker process #1 failed" in report.get_test("suite_a.test_2").steps[-1].entries[0].message
+    assert all(suite.end_time is not None for suite in report.all_suites())
+
+
+def test_run_in_processes_task_traces():
+    report = run_suite_classes([suite1, suite2], nb_processes=2)
+
+    tests = [trace for trace in report.task_traces if trace.category == "test"]
+    assert sorted(trace.name for trace in tests) == \
+        ["suite1.test1", "suite1.test2", "suite2.sub_suite.test4", "suite2.test3"]
+    assert len(set(trace.worker.split("/")[0] for trace in tests)) == 2
+    for trace in report.task_traces:
+        for dependency in trace.dependencies:
+            assert report.task_traces[dependency].worker.split("/")[0] == trace.worker.split("/")[0]
+
+
+def test_run_in_processes_with_stop_on_failure(tmpdir):
+    marker = tmpdir.join("started").strpath
+
+    @lcc.suite("Suite A")
+    class suite_a:
+        @lcc.test("Test")
+        def test(self):
+            # the failure happens once the other worker has started its tests
+            deadline = time.time() + 5
+            while not os.path.exists(marker) and time.time() < deadline:
+                time.sleep(0.01)
+            lcc.log_error("something bad happened")
+
+    @lcc.suite("Suite B")
+    class suite_b:
+        @lcc.test("Test 1")
+        def test_1(self):
+            open(marker, "w").close()
+            # leave some time to the parent process to get the failure of the other worker
+            time.sleep(1)
+
+        @lcc.test("Test 2")
+        def test_2(self):
+            pass
+
+    report = run_suite_classes([suite_a, suite_b], nb_processes=2, stop_on_failure=True)
+
+    assert_test_statuses(report, failed=["suite_a.test"], passed=["suite_b.test_1"], skipped=["suite_b.test_2"])
+
+
+def test_run_in_processes_forks_before_threads_are_started(tmpdir):
+    # the lock is taken by a thread of the parent process once the test session has started, the workers
+    # must not inherit it
+    lock = threading.Lock()
+
+    class LockingSession(ReportingSession):
+        def on_test_session_start(self, event):
+            lock.acquire()
+
+        def on_test_session_end(self, event):
+            lock.release()
+
+    class LockingBackend(ReportingBackend):
+        def create_reporting_session(self, report_dir, report, parallel, saving_strategy):
+            return LockingSession()
+
+    @lcc.suite("Suite A")
+    class suite_a:
+        @lcc.test("Test")
+        def test(self):
+            lcc.check_that("lock acquired", lock.acquire(False), lcc.is_true())
+
+    @lcc.suite("Suite B")
+    class suite_b:
+        @lcc.test("Test")
+        def test(self):
+            lcc.check_that("lock acquired", lock.acquire(False), lcc.is_true())
+
+    report = run_suite_classes(
+        [suite_a, suite_b], backends=[LockingBackend()], tmpdir=tmpdir, nb_processes=2
+    )
+
+    assert_test_statuses(report, passed=["suite_a.test", "suite_b.test"])
+
+
+def test_run_in_processes_with_resource_limits(tmpdir):
+    def use_db(name):
+        # each test using the resource creates a file while running and logs the number of running tests
+        marker = tmpdir.join(name)
+        marker.write("")
+        time.sleep(0.3)
+        lcc.log_info(str(len(tmpdir.listdir())))
+        marker.remove()
+
+    @lcc.suite("Suite A")
+    @lcc.uses_resource("db")
+    class suite_a:
+        @lcc.test("Test 1")
+        def test_1(self):
+            use_db("a1")
+
+        @lcc.test("Test 2")
+        def test_2(self):
+            use_db("a2")
+
+    @lcc.suite("Suite B")
+    @lcc.uses_resource("db")
+    class suite_b:
+        @lcc.test("Test 1")
+        def test_1(self):
+            use_db("b1")
+
+        @lcc.test("Test 2")
+        def test_2(self):
+            use_db("b2")
+
+    report = run_suites(
+        load_suites_from_classes([suite_a, suite_b]), nb_processes=2, nb_threads=2, resource_limits={"db": 2}
+    )
+
+    assert_test_statuses(report, passed=["suite_a.test_1", "suite_a.test_2", "suite_b.test_1", "suite_b.test_2"])
+    # each worker process gets one token: no more than 2 tests use the resource at the same time
+    assert max(int(test.steps[0].entries[0].message) for test in report.all_tests()) <= 2
@@ -0,0 +1,269 @@
+import pytest
+
+import lemoncheesecake.api as lcc
+from lemoncheesecake.sharding import parse_shard, split_tests_into_shards, get_shard_suites, merge_reports
+from lemoncheesecake.suite.loader import load_suites_from_classes
+from lemoncheesecake.testtree import flatten_tests
+from lemoncheesecake.exceptions import UserError
+from lemoncheesecake.reporting import TaskTrace
+from lemoncheesecake.reporting.backends import JsonBackend, XmlBackend
+
+from helpers.runner import run_suites
+from helpers.testtreemockup import report_mockup, suite_mockup, tst_mockup, hook_mockup, step_mockup, \
+    make_report_from_mockup, NOW
+
+
+@lcc.suite("Suite 1")
+class suite1:
+    @lcc.test("Test 1")
+    def test1(self):
+        pass
+
+    @lcc.test("Test 2")
+    def test2(self):
+        pass
+
+    @lcc.test("Test 3")
+    def test3(self):
+        pass
+
+
+@lcc.suite("Suite 2")
+class suite2:
+    @lcc.test("Test 4")
+    def test4(self):
+        pass
+
+
+def _shards_paths(shards):
+    return [[test.path for test in shard] for shard in shards]
+
+
+def test_parse_shard():
+    assert parse_shard("2/3") == (2, 3)
+
+
+@pytest.mark.parametrize("value", ("foo", "1", "0/2", "3/2", "1/2/3"))
+def test_parse_shard_invalid(value):
+    with pytest.raises(ValueError):
+        parse_shard(value)
+
+
+def test_split_tests_into_shards_without_history():
+    suites = load_suites_from_classes([suite1, suite2])
+
+    shards = split_tests_into_shards(suites, 2)
+
+    assert _shards_paths(shards) == [
+        ["suite1.test1", "suite1.test3"], ["suite1.test2", "suite2.test4"]
+    ]
+
+
+def test_split_tests_into_shards_is_deterministic():
+    suites = load_suites_from_classes([suite1, suite2])
+
+    assert _shards_paths(split_tests_into_shards(suites, 3)) == _shards_paths(split_tests_into_shards(suites, 3))
+
+
+def test_split_tests_into_shards_with_history():
+    suites = load_suites_from_classes([suite1, suite2])
+    report = make_report_from_mockup(
+        report_mockup().
+            add_suite(
+                suite_mockup("suite1").
+                    add_test(tst_mockup("test1", start_time=NOW, end_time=NOW + 10)).
+                    add_test(tst_mockup("test2", start_time=NOW, end_time=NOW + 1)).
+                    add_test(tst_mockup("test3", start_time=NOW, end_time=NOW + 1))
+            ).
+            add_suite(
+                suite_mockup("suite2").
+                    add_test(tst_mockup("test4", start_time=NOW, end_time=NOW + 1))
+            )
+    )
+
+    shards = split_tests_into_shards(suites, 2, report)
+
+    assert _shards_paths(shards) == [
+        ["suite1.test1"], ["suite1.test2", "suite1.test3", "suite2.test4"]
+    ]
+
+
+def test_split_tests_into_shards_with_dependency():
+    @lcc.suite("Suite 3")
+    class suite3:
+        @lcc.test("Test 5")
+        @lcc.depends_on("suite2.test4")
+        def test5(self):
+            pass
+
+    suites = load_suites_from_classes([suite1, suite2, suite3])
+
+    shards = split_tests_into_shards(suites, 3)
+
+    assert any(
+        "suite2.test4" in paths and "suite3.test5" in paths for paths in _shards_paths(shards)
+    )
+
+
+def test_split_tests_into_shards_with_setup_suite():
+    @lcc.suite("Suite")
+    class suite:
+        def setup_suite(self):
+            pass
+
+        @lcc.test("Test 1")
+        def test1(self):
+            pass
+
+        @lcc.test("Test 2")
+        def test2(self):
+            pass
+
+    suites = load_suites_from_classes([suite, suite2])
+
+    shards = split_tests_into_shards(suites, 2)
+
+    assert _shards_paths(shards) == [["suite.test1", "suite.test2"], ["suite2.test4"]]
+
+
+def test_split_tests_into_shards_with_cheap_setup_suite_in_history():
+    @lcc.suite("Suite")
+    class suite:
+        def setup_suite(self):
+            pass
+
+        @lcc.test("Test 1")
+        def test1(self):
+            pass
+
+        @lcc.test("Test 2")
+        def test2(self):
+            pass
+
+    suites = load_suites_from_classes([suite])
+    report = make_report_from_mockup(
+        report_mockup().add_suite(
+            suite_mockup("suite").
+                add_setup(hook_mockup(start_time=NOW, end_time=NOW + 0.1)).
+                add_test(tst_mockup("test1", start_time=NOW, end_time=NOW + 1)).
+                add_test(tst_mockup("test2", start_time=NOW, end_time=NOW + 1))
+        )
+    )
+
+    shards = split_tests_into_shards(suites, 2, report)
+
+    assert _shards_paths(shards) == [["suite.test1"], ["suite.test2"]]
+
+
+def test_get_shard_suites():
+    suites = load_suites_from_classes([suite1, suite2])
+
+    shard_suites = get_shard_suites(suites, 2, 2)
+
+    assert [test.path for test in flatten_tests(shard_suites)] == ["suite1.test2", "suite2.test4"]
+
+
+def test_get_shard_suites_empty_shard():
+    suites = load_suites_from_classes([suite2])
+
+    with pytest.raises(UserError):
+        get_shard_suites(suites, 2, 2)
+
+
+def test_merge_reports():
+    report_1 = make_report_from_mockup(
+        report_mockup().
+            add_suite(
+                suite_mockup("suite1").
+                    add_setup(hook_mockup().add_step(step_mockup().add_check(True))).
+                    add_test(tst_mockup("test1", status="passed")).
+                    add_suite(suite_mockup("sub_suite").add_test(tst_mockup("test2", status="failed")))
+            )
+    )
+    report_1.start_time, report_1.end_time = NOW, NOW + 10
+    report_2 = make_report_from_mockup(
+        report_mockup().
+            add_suite(
+                suite_mockup("suite1").
+                    add_setup(hook_mockup().add_step(step_mockup().add_check(False))).
+                    add_test(tst_mockup("test3", status="skipped"))
+            ).
+            add_suite(suite_mockup("suite2").add_test(tst_mockup("test4", status="passed")))
+    )
+    report_2.start_time, report_2.end_time = NOW + 1, NOW + 20
+    report_2.nb_threads = 2
+
+    report = merge_reports([report_1, report_2])
+
+    assert [test.path for test in report.all_tests()] == \
+        ["suite1.test1", "suite1.test3", "suite1.sub_suite.test2", "suite2.test4"]
+    assert report.start_time == NOW
+    assert report.end_time == NOW + 20
+    assert report.nb_threads == 3
+    assert report.get_suite("suite1").suite_setup.outcome is False
+    stats = report.stats()
+    assert stats.tests == 4
+    assert stats.test_statuses["passed"] == 2
+    assert stats.test_statuses["failed"] == 1
+    assert stats.test_statuses["skipped"] == 1
+    assert stats.checks == 2
+    assert stats.duration == 20
+
+
+def test_merge_reports_keeps_shards_reports_unchanged():
+    report_1 = make_report_from_mockup(report_mockup().add_suite(suite_mockup("suite1").add_test(tst_mockup("test1"))))
+    report_2 = make_report_from_mockup(report_mockup().add_suite(suite_mockup("suite1").add_test(tst_mockup("test2"))))
+    report_1.start_time = report_2.start_time = NOW
+    test_1, test_2 = report_1.get_test("suite1.test1"), report_2.get_test("suite1.test2")
+
+    merged = merge_reports([report_1, report_2])
+
+    assert test_1.parent_suite is report_1.get_suite("suite1")
+    assert test_2.parent_suite is report_2.get_suite("suite1")
+    assert [test.path for test in report_1.all_tests()] == ["suite1.test1"]
+    assert [test.path for test in report_2.all_tests()] == ["suite1.test2"]
+    assert merged.get_test("suite1.test1") is not test_1
+    assert merged.get_test("suite1.test1").parent_suite is merged.get_suite("suite1")
+
+
+def test_merge_reports_preserves_tests_order():
+    suites = load_suites_from_classes([suite1, suite2])
+    shard_1, shard_2 = [run_suites(get_shard_suites(suites, index, 2)) for index in (1, 2)]
+
+    report = merge_reports([shard_1, shard_2])
+
+    assert [test.path for test in report.all_tests()] == [test.path for test in flatten_tests(suites)]
+
+
+@pytest.mark.parametrize("backend", [JsonBackend()] + ([XmlBackend()] if XmlBackend().is_available() else []))
+def test_merge_reports_preserves_tests_order_of_saved_reports(backend, tmpdir):
+    suites = load_suites_from_classes([suite1, suite2])
+    shards = []
+    for index in (1, 2):
+        filename = tmpdir.join("report-%d" % index).strpath
+        backend.save_report(filename, run_suites(get_shard_suites(suites, index, 2)))
+        shards.append(backend.load_report(filename))
+
+    report = merge_reports(shards)
+
+    assert [test.path for test in report.all_tests()] == [test.path for test in flatten_tests(suites)]
+
+
+def test_merge_reports_task_traces():
+    report_1 = make_report_from_mockup(report_mockup().add_suite(suite_mockup("suite1").add_test(tst_mockup("test1"))))
+    report_1.task_traces = [
+        TaskTrace("suite1", "suite_beginning", NOW, NOW, NOW + 1, "thread-1"),
+        TaskTrace("suite1.test1", "test", NOW + 1, NOW + 1, NOW + 2, "thread-1", [0])
+    ]
+    report_2 = make_report_from_mockup(report_mockup().add_suite(suite_mockup("suite2").add_test(tst_mockup("test2"))))
+    report_2.task_traces = [
+        TaskTrace("suite2", "suite_beginning", NOW, NOW, NOW + 1, "thread-1"),
+        TaskTrace("suite2.test2", "test", NOW + 1, NOW + 1, NOW + 2, "thread-1", [0])
+    ]
+
+    report = merge_reports([report_1, report_2])
+
+    assert [(trace.name, trace.worker, trace.dependencies) for trace in report.task_traces] == [
+        ("suite1", "shard-1/thread-1", []), ("suite1.test1", "shard-1/thread-1", [0]),
+        ("suite2", "shard-2/thread-1", []), ("suite2.test2", "shard-2/thread-1", [2])
+    ]
@@ -1,10 +1,12 @@
 import time
+import threading
 from functools import reduce
 
 import pytest
 
 from lemoncheesecake.task import BaseTask, TasksExecutionFailure, run_tasks, check_task_dependencies, \
-    TaskResultSuccess, TaskResultFailure
+    TaskResultSuccess, TaskResultFailure, TaskResultSkipped, TaskScheduler, TaskSuspension, build_task_graph, \
+    compute_critical_path_durations
 from lemoncheesecake.exceptions import TaskFailure, CircularDependencyError
 
 
@@ -232,3 +234,469 @@ def test_check_task_dependencies_ko_indirect_dependency_2():
 
     with pytest.raises(CircularDependencyError):
         check_task_dependencies(c)
+
+
+def test_task_scheduler_pop_ready_tasks():
+    a = DummyTask("a", 1)
+    b = DummyTask("b", 2, [a])
+    c = DummyTask("c", 3, on_completion_dependencies=[a])
+    d = DummyTask("d", 4, [b, c])
+    scheduler = TaskScheduler((a, b, c, d))
+
+    assert list(scheduler.pop_ready_tasks(2)) == [a]
+    assert list(scheduler.pop_ready_tasks(2)) == []
+
+    scheduler.mark_task_as_completed(a)
+    assert list(scheduler.pop_ready_tasks(1)) == [b]
+    assert list(scheduler.pop_ready_tasks(1)) == [c]
+
+    scheduler.mark_task_as_completed(b)
+    assert list(scheduler.pop_ready_tasks(2)) == []
+    scheduler.mark_task_as_completed(c)
+    assert list(scheduler.pop_ready_tasks(2)) == [d]
+
+
+def test_task_scheduler_pop_remaining_tasks():
+    a = DummyTask("a", 1)
+    b = DummyTask("b", 2, [a])
+    c = DummyTask("c", 3, [a])
+    scheduler = TaskScheduler((a, b, c))
+
+    assert list(scheduler.pop_ready_tasks(1)) == [a]
+    assert scheduler.pop_remaining_tasks((a, b, c)) == [b, c]
+    scheduler.mark_task_as_completed(a)
+    assert list(scheduler.pop_ready_tasks(2)) == []
+
+
+def test_run_tasks_many_threads():
+    a = DummyTask("a", 1)
+    others = [DummyTask(str(i), 1, [a]) for i in range(20)]
+    z = DummyTask("z", 1, others)
+
+    run_tasks([a] + others + [z], nb_threads=4)
+
+    assert z.output == 41
+
+
+def test_check_task_dependencies_ko_cycle_path():
+    a = DummyTask("a", 1, [])
+    b = DummyTask("b", 2, [a])
+    c = DummyTask("c", 3, [b])
+    a.on_completion_dependencies.append(c)
+
+    with pytest.raises(CircularDependencyError) as excinfo:
+        check_task_dependencies(c)
+
+    assert "<task c> -> <task b> -> <task a> -> <task c>" in str(excinfo.value)
+
+
+def test_build_task_graph_ko_several_cycles():
+    a = DummyTask("a", 1, [])
+    b = DummyTask("b", 2, [a])
+    a.on_success_dependencies.append(b)
+    c = DummyTask("c", 3, [])
+    d = DummyTask("d", 4, [c])
+    c.on_success_dependencies.append(d)
+
+    with pytest.raises(CircularDependencyError) as excinfo:
+        build_task_graph((a, b, c, d))
+
+    assert "<task a> -> <task b> -> <task a>" in str(excinfo.value)
+    assert "<task c> -> <task d> -> <task c>" in str(excinfo.value)
+
+
+def test_build_task_graph_deep_chain():
+    tasks = [DummyTask("0", 0)]
+    for i in range(1, 5000):
+        tasks.append(DummyTask(str(i), i, [tasks[-1]]))
+
+    graph = build_task_graph(reversed(tasks))
+
+    assert len(graph) == len(tasks)
+    assert graph[tasks[1]] == (tasks[0],)
+
+
+def test_run_tasks_circular_dependency():
+    a = DummyTask("a", 1, [])
+    b = DummyTask("b", 2, [a])
+    a.on_success_dependencies.append(b)
+
+    with pytest.raises(CircularDependencyError):
+        run_tasks((a, b))
+
+
+def test_compute_critical_path_durations():
+    a = DummyTask("a", 1)
+    b = DummyTask("b", 2, [a])
+    c = DummyTask("c", 3, [a])
+    d = DummyTask("d", 4, [b, c])
+    e = DummyTask("e", 5)
+
+    durations = compute_critical_path_durations(build_task_graph((a, b, c, d, e)), {a: 1, b: 10, c: 2, d: 1, e: 3})
+
+    assert durations == {a: 12, b: 11, c: 3, d: 1, e: 3}
+
+
+def test_task_scheduler_with_priorities():
+    a = DummyTask("a", 1)
+    b = DummyTask("b", 2)
+    c = DummyTask("c", 3)
+    scheduler = TaskScheduler((a, b, c), priorities={b: 10, c: 5})
+
+    assert list(scheduler.pop_ready_tasks(3)) == [b, c, a]
+
+
+def test_run_tasks_with_task_durations():
+    tasks_order = []
+
+    class OrderedTask(DummyTask):
+        def run(self, context):
+            tasks_order.append(self)
+
+    a = OrderedTask("a", 1)
+    b = OrderedTask("b", 1)
+    c = OrderedTask("c", 1, [b])
+
+    run_tasks((a, b, c), task_durations={a: 5, b: 3, c: 3})
+
+    assert tasks_order == [b, a, c]
+
+
+class ResourceTask(DummyTask):
+    def __init__(self, name, resources, on_success_dependencies=None):
+        DummyTask.__init__(self, name, 1, on_success_dependencies)
+        self.resources = resources
+
+    def get_resources(self):
+        return self.resources
+
+
+def test_task_scheduler_with_resource_limits():
+    a = ResourceTask("a", {"db": 1})
+    b = ResourceTask("b", {"db": 1})
+    c = ResourceTask("c", {"db": 1})
+    d = ResourceTask("d", {})
+    scheduler = TaskScheduler((a, b, c, d), resource_limits={"db": 2})
+
+    assert list(scheduler.pop_ready_tasks(4)) == [a, b, d]
+    assert list(scheduler.pop_ready_tasks(4)) == []
+
+    scheduler.mark_task_as_completed(d)
+    assert list(scheduler.pop_ready_tasks(4)) == []
+
+    scheduler.mark_task_as_completed(a)
+    assert list(scheduler.pop_ready_tasks(4)) == [c]
+
+
+def test_task_scheduler_with_resource_weight():
+    a = ResourceTask("a", {"db": 2})
+    b = ResourceTask("b", {"db": 1})
+    c = ResourceTask("c", {"db": 10})
+    scheduler = TaskScheduler((a, b, c), resource_limits={"db": 2})
+
+    assert list(scheduler.pop_ready_tasks(3)) == [a]
+    scheduler.mark_task_as_completed(a)
+    assert list(scheduler.pop_ready_tasks(3)) == [b]
+    scheduler.mark_task_as_completed(b)
+    # a task cannot take more tokens than the resource limit
+    assert list(scheduler.pop_ready_tasks(3)) == [c]
+
+
+def test_task_scheduler_with_unlimited_resource():
+    a = ResourceTask("a", {"db": 1})
+    b = ResourceTask("b", {"db": 1})
+    scheduler = TaskScheduler((a, b), resource_limits={"other": 1})
+
+    assert list(scheduler.pop_ready_tasks(2)) == [a, b]
+
+
+def test_task_scheduler_with_resource_limits_only_wakes_released_tokens():
+    a = ResourceTask("a", {"db": 1})
+    b = ResourceTask("b", {"db": 1})
+    c = ResourceTask("c", {"db": 1})
+    d = ResourceTask("d", {"other": 1})
+    e = ResourceTask("e", {"other": 1})
+    scheduler = TaskScheduler((a, b, c, d, e), resource_limits={"db": 1, "other": 1})
+
+    assert list(scheduler.pop_ready_tasks(5)) == [a, d]
+    scheduler.mark_task_as_completed(d)
+    # releasing "other" does not wake the tasks waiting for "db"
+    assert [entry[-1] for entry in scheduler._ready_tasks] == [e]
+    assert list(scheduler.pop_ready_tasks(5)) == [e]
+    scheduler.mark_task_as_completed(a)
+    assert list(scheduler.pop_ready_tasks(5)) == [b]
+
+
+class CountingTaskScheduler(TaskScheduler):
+    def __init__(self, *args, **kwargs):
+        self.nb_pushed_entries = 0
+        TaskScheduler.__init__(self, *args, **kwargs)
+
+    def _push_entry(self, entry):
+        self.nb_pushed_entries += 1
+        TaskScheduler._push_entry(self, entry)
+
+
+def _count_scheduling_pushes(nb_tasks):
+    tasks = [ResourceTask(str(i), {"db": 1}) for i in range(nb_tasks)]
+    scheduler = CountingTaskScheduler(tasks, resource_limits={"db": 4})
+    running = list(scheduler.pop_ready_tasks(8))
+    while running:
+        scheduler.mark_task_as_completed(running.pop(0))
+        running.extend(scheduler.pop_ready_tasks(8 - scheduler.nb_running_tasks))
+    assert all(task in scheduler._scheduled_tasks for task in tasks)
+    return scheduler.nb_pushed_entries
+
+
+def test_task_scheduler_with_resource_limits_scales_linearly():
+    # each task waiting for a resource is only queued again when tokens are released for it
+    assert _count_scheduling_pushes(1000) <= 2 * 1000
+    assert _count_scheduling_pushes(4000) <= 2 * 4000
+
+
+def test_run_tasks_with_resource_limits():
+    lock = threading.Lock()
+    counters = {"running": 0, "max_running": 0}
+
+    class CountingTask(ResourceTask):
+        def run(self, context):
+            with lock:
+                counters["running"] += 1
+                counters["max_running"] = max(counters["max_running"], counters["running"])
+            time.sleep(0.01)
+            with lock:
+                counters["running"] -= 1
+
+    tasks = [CountingTask(str(i), {"db": 1}) for i in range(8)]
+
+    run_tasks(tasks, nb_threads=4, resource_limits={"db": 2})
+
+    assert counters["max_running"] == 2
+    assert all(isinstance(task.result, TaskResultSuccess) for task in tasks)
+
+
+def test_run_tasks_timings():
+    a = DummyTask("a", 1, [])
+    b = DummyTask("b", 2, [a])
+    c = DummyTask("c", 3, [a])
+
+    run_tasks((a, b, c), nb_threads=2)
+
+    for task in a, b, c:
+        assert task.ready_time <= task.start_time <= task.end_time
+        assert task.thread_name is not None
+    assert b.ready_time >= a.end_time
+    assert c.ready_time >= a.end_time
+
+
+def test_run_tasks_timings_of_skipped_task():
+    a = ExceptionTask("a", TaskFailure(), [])
+    b = DummyTask("b", 2, [a])
+
+    run_tasks((a, b), nb_threads=1)
+
+    assert b.skipped
+    assert b.ready_time <= b.start_time <= b.end_time
+
+
+class GroupTask(BaseTestTask):
+    def __init__(self, name, group, on_success_dependencies=None, on_completion_dependencies=None,
+                 opening=False, closing=False):
+        BaseTestTask.__init__(self, name, on_success_dependencies, on_completion_dependencies)
+        self.group = group
+        self.opening = opening
+        self.closing = closing
+
+    def get_group(self):
+        return self.group
+
+    def opens_group(self):
+        return self.opening
+
+    def closes_group(self):
+        return self.closing
+
+
+def _make_group_tasks(group):
+    setup = GroupTask(group + "_setup", group, opening=True)
+    tests = [GroupTask("%s_test%d" % (group, i), group, [setup]) for i in (1, 2)]
+    teardown = GroupTask(group + "_teardown", group, on_completion_dependencies=tests, closing=True)
+    return [setup] + tests + [teardown]
+
+
+def test_task_scheduler_with_group_affinity():
+    a = GroupTask("a", "group1")
+    b = GroupTask("b", "group2")
+    c = GroupTask("c", "group1")
+    scheduler = TaskScheduler((a, b, c), group_affinity=True)
+
+    assert list(scheduler.pop_ready_tasks(1)) == [a]
+    scheduler.mark_task_as_completed(a)
+    assert list(scheduler.pop_ready_tasks(1, preferred_group="group1")) == [c]
+    assert list(scheduler.pop_ready_tasks(1, preferred_group="group1")) == [b]
+
+
+def test_task_scheduler_with_group_affinity_closing_task_first():
+    a = GroupTask("a", "group1")
+    b = GroupTask("b", "group2")
+    c = GroupTask("c", "group1", closing=True)
+    scheduler = TaskScheduler((a, b, c), group_affinity=True)
+
+    assert list(scheduler.pop_ready_tasks(1, preferred_group="group2")) == [c]
+
+
+def test_task_scheduler_with_max_open_groups():
+    group1 = _make_group_tasks("group1")
+    group2 = _make_group_tasks("group2")
+    scheduler = TaskScheduler(group1 + group2, group_affinity=True, max_open_groups=1)
+
+    assert list(scheduler.pop_ready_tasks(4)) == [group1[0]]
+    scheduler.mark_task_as_completed(group1[0])
+    assert list(scheduler.pop_ready_tasks(4, preferred_group="group1")) == group1[1:3]
+    scheduler.mark_task_as_completed(group1[1])
+    scheduler.mark_task_as_completed(group1[2])
+    assert list(scheduler.pop_ready_tasks(4, preferred_group="group1")) == [group1[3]]
+    scheduler.mark_task_as_completed(group1[3])
+    assert list(scheduler.pop_ready_tasks(4, preferred_group="group1")) == [group2[0]]
+
+
+def test_task_scheduler_with_max_open_groups_without_running_task():
+    # the tests of group1 depend on a test of group2: group2 must be opened even if group1 is still open
+    group2 = _make_group_tasks("group2")
+    setup1 = GroupTask("group1_setup", "group1", opening=True)
+    test1 = GroupTask("group1_test", "group1", [setup1, group2[1]])
+    teardown1 = GroupTask("group1_teardown", "group1", on_completion_dependencies=[test1], closing=True)
+    scheduler = TaskScheduler([setup1, test1, teardown1] + group2, group_affinity=True, max_open_groups=1)
+
+    assert list(scheduler.pop_ready_tasks(2)) == [setup1]
+    scheduler.mark_task_as_completed(setup1)
+    assert list(scheduler.pop_ready_tasks(2)) == [group2[0]]
+
+
+def test_run_tasks_with_max_open_groups():
+    lock = threading.Lock()
+    counters = {"open": 0, "max_open": 0}
+
+    class SetupTask(GroupTask):
+        def run(self, context):
+            with lock:
+                counters["open"] += 1
+                counters["max_open"] = max(counters["max_open"], counters["open"])
+
+    class TeardownTask(GroupTask):
+        def run(self, context):
+            with lock:
+                counters["open"] -= 1
+
+    tasks = []
+    for group in "group1", "group2", "group3":
+        setup = SetupTask(group + "_setup", group, opening=True)
+        tests = [GroupTask("%s_test%d" % (group, i), group, [setup]) for i in range(4)]
+        teardown = TeardownTask(group + "_teardown", group, on_completion_dependencies=tests, closing=True)
+        tasks.extend([setup] + tests + [teardown])
+
+    run_tasks(tasks, nb_threads=4, group_affinity=True, max_open_groups=2)
+
+    assert counters["max_open"] <= 2
+    assert all(isinstance(task.result, TaskResultSuccess) for task in tasks)
+
+
+class ManualFuture(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._done = False
+
+    def add_done_callback(self, callback):
+        with self._lock:
+            if not self._done:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def set_done(self):
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class SuspendingTask(BaseTestTask):
+    def __init__(self, name, on_suspension, on_success_dependencies=None, failing=False):
+        BaseTestTask.__init__(self, name, on_success_dependencies)
+        self.on_suspension = on_suspension
+        self.failing = failing
+        self.resumed = False
+
+    def run(self, context):
+        future = ManualFuture()
+        self.on_suspension(future)
+        return TaskSuspension(future, self.resume)
+
+    def resume(self, future):
+        self.resumed = True
+        if self.failing:
+            raise TaskFailure("task %s failed" % self.name)
+
+
+def test_run_tasks_suspended_tasks_do_not_take_a_thread():
+    lock = threading.Lock()
+    futures = []
+
+    def on_suspension(future):
+        with lock:
+            futures.append(future)
+            all_suspended = len(futures) == 4
+        if all_suspended:
+            for future in futures:
+                future.set_done()
+
+    # the futures are only completed once the 4 tasks are suspended at the same time,
+    # the timer avoids a freeze if it were not the case
+    tasks = [SuspendingTask("task_%d" % i, on_suspension) for i in range(4)]
+    timer = threading.Timer(5, lambda: [future.set_done() for future in list(futures)])
+    timer.start()
+    try:
+        run_tasks(tasks, nb_threads=1)
+    finally:
+        timer.cancel()
+
+    assert len(futures) == 4
+    assert all(isinstance(task.result, TaskResultSuccess) for task in tasks)
+    assert all(task.resumed for task in tasks)
+
+
+def test_run_tasks_suspended_task_failure():
+    a = SuspendingTask("a", lambda future: future.set_done(), failing=True)
+    b = DummyTask("b", 1, [a])
+
+    run_tasks((a, b), nb_threads=2)
+
+    assert isinstance(a.result, TaskResultFailure)
+    assert isinstance(b.result, TaskResultSkipped)
+
+
+def test_run_tasks_with_max_suspended_tasks():
+    lock = threading.Lock()
+    counters = {"suspended": 0, "max_suspended": 0}
+
+    class MyTask(SuspendingTask):
+        def resume(self, future):
+            with lock:
+                counters["suspended"] -= 1
+            SuspendingTask.resume(self, future)
+
+    def on_suspension(future):
+        with lock:
+            counters["suspended"] += 1
+            counters["max_suspended"] = max(counters["max_suspended"], counters["suspended"])
+        threading.Timer(0.01, future.set_done).start()
+
+    tasks = [MyTask("task_%d" % i, on_suspension) for i in range(4)]
+    run_tasks(tasks, nb_threads=1, max_suspended_tasks=1)
+
+    assert counters["max_suspended"] == 1
+    assert all(isinstance(task.result, TaskResultSuccess) for task in tasks)
@@ -444,3 +444,29 @@ def test_depends_on_suite():
             @lcc.test("My Test")
             def test(self):
                 pass
+
+
+def test_uses_resource():
+    @lcc.suite("suite")
+    @lcc.uses_resource("db", weight=2)
+    class suite:
+        @lcc.test("Test 1")
+        @lcc.uses_resource("api")
+        def test1(self):
+            pass
+
+        @lcc.test("Test 2")
+        @lcc.uses_resource("db", weight=1)
+        def test2(self):
+            pass
+
+    suite = load_suite_from_class(suite)
+    test1, test2 = suite.get_tests()
+
+    assert test1.get_resources() == {"db": 2, "api": 1}
+    assert test2.get_resources() == {"db": 1}
+
+
+def test_uses_resource_invalid_weight():
+    with pytest.raises(ProgrammingError):
+        lcc.uses_resource("db", weight=0)
@@ -2,7 +2,7 @@ import pytest
 
 import lemoncheesecake.api as lcc
 from lemoncheesecake.suite import load_suites_from_classes, load_suite_from_class
-from lemoncheesecake.testtree import find_suite, find_test, flatten_suites, flatten_tests
+from lemoncheesecake.testtree import find_suite, find_test, flatten_suites, flatten_tests, BaseSuite, BaseTest
 from lemoncheesecake.exceptions import CannotFindTreeNode
 
 
@@ -390,3 +390,51 @@ def test_pull_test_suite():
 
     assert sub_suite.parent_suite is not None
     assert len(sub_suite.get_tests()) == 1
+
+
+def _build_tree():
+    root = BaseSuite("root", "Root")
+    sub_suite = BaseSuite("sub_suite", "Sub suite")
+    root.add_suite(sub_suite)
+    test = BaseTest("test", "Test")
+    sub_suite.add_test(test)
+    return root, sub_suite, test
+
+
+def test_cached_path_after_reparenting():
+    root, sub_suite, test = _build_tree()
+    assert test.path == "root.sub_suite.test"
+    assert test.path_tuple == ("root", "sub_suite", "test")
+
+    other_root = BaseSuite("other_root", "Other root")
+    other_root.add_suite(sub_suite)
+
+    assert test.path == "other_root.sub_suite.test"
+    assert list(test.hierarchy_paths) == ["other_root", "other_root.sub_suite", "other_root.sub_suite.test"]
+    assert test.hierarchy_depth == 2
+
+
+def test_cached_path_after_pull_node():
+    root, sub_suite, test = _build_tree()
+    assert test.path == "root.sub_suite.test"
+
+    pulled_test = test.pull_node()
+
+    assert pulled_test.path == "test"
+    assert test.path == "root.sub_suite.test"
+
+
+def test_cached_hierarchy_tags_and_properties_after_reparenting():
+    root, sub_suite, test = _build_tree()
+    root.tags.append("foo")
+    root.properties["foo"] = "bar"
+    assert list(test.hierarchy_tags) == ["foo"]
+    assert test.hierarchy_properties == {"foo": "bar"}
+
+    other_root = BaseSuite("other_root", "Other root")
+    other_root.tags.append("bar")
+    other_root.properties["bar"] = "baz"
+    other_root.add_suite(sub_suite)
+
+    assert list(test.hierarchy_tags) == ["bar"]
+    assert test.hierarchy_properties == {"bar": "baz"}